@@ -95,7 +95,7 @@ class CoreMain(object):
                 patch_installer = container.get('patch_installer')
                 patch_installation_successful = patch_installer.start_installation()
                 patch_assessment_successful = False
-                patch_assessment_successful = patch_assessor.start_assessment()
+                patch_assessment_successful = patch_assessor.start_assessment(post_installation=True)
 
                 # PatchInstallationSummary to be marked as completed successfully only after the implicit (i.e. 2nd) assessment is completed, as per CRP's restrictions
                 if patch_assessment_successful and patch_installation_successful:
@@ -131,7 +131,10 @@ class CoreMain(object):
             composite_logger.log_debug("Completed exception handling.\n")
 
         finally:
+            bootstrapper.env_layer.set_command_deadline(None)  # in case installation did not complete
+
             if status_handler is not None:
+                status_handler.flush_status_file()
                 status_handler.log_truncated_patches()
 
             if package_manager is not None:
@@ -147,6 +150,7 @@ class CoreMain(object):
                 lifecycle_manager.update_core_sequence(completed=True)
 
             telemetry_writer.write_event("Completed Linux Patch core operation.", Constants.TelemetryEventLevel.Informational)
+            telemetry_writer.stop()
 
             stdout_file_mirror.stop()
             file_logger.close(message_at_close="\n<End of output>")
@@ -133,6 +133,11 @@ class Constants(object):
         SUCCEEDED = "succeeded"
         FAILED = "failed"
 
+    # Query access classification for the query scheduler
+    class QueryAccess(EnumBackport):
+        READ = "Read"       # only reads machine state, may run concurrently with other reads
+        WRITE = "Write"     # changes machine state or takes package manager locks, runs alone in the calling thread
+
     # Patch Modes for Configure Patching
     class PatchModes(EnumBackport):
         IMAGE_DEFAULT = "ImageDefault"
@@ -216,6 +221,7 @@ class Constants(object):
     PACKAGE_STATUS_REFRESH_RATE_IN_SECONDS = 10
     MAX_FILE_OPERATION_RETRY_COUNT = 5
     MAX_ASSESSMENT_RETRY_COUNT = 5
+    MAX_CONCURRENT_READ_QUERIES = 4
     MAX_INSTALLATION_RETRY_COUNT = 3
     MAX_IMDS_CONNECTION_RETRY_COUNT = 5
     MAX_ZYPPER_REPO_REFRESH_RETRY_COUNT = 5
@@ -227,17 +233,21 @@ class Constants(object):
     class PackageBatchConfig(EnumBackport):
         # Batch Patching Parameters
         MAX_BATCH_SIZE_FOR_PACKAGES = 300
-        MAX_PHASES_FOR_BATCH_PATCHING = 2
 
-        # Batch size decay factor is factor to which batch size is decreased in batch patching to install remaining packages in case there
-        # are some package install failures with original batch size.
-        BATCH_SIZE_DECAY_FACTOR = 10
+        # Weight of the latest batch outcome in the observed per-package install time and failure rate used to size the next batch.
+        # Failed packages of a batch are bisected and retried in smaller batches until each failure is isolated to a single package.
+        BATCH_OUTCOME_SMOOTHING_FACTOR = 0.5
+        MIN_PACKAGE_INSTALL_TIME_IN_SECONDS = 1
 
         # We need to keep some buffer time between calculation of batch size and starting batch patching because after calculating the batch size,
         # there would be little time taken before the batch patching is started. The function is_package_install_time_available is called before installing a batch.
         # If we do not keep buffer then is_package_install_time_available would return false.
         BUFFER_TIME_FOR_BATCH_PATCHING_START_IN_MINUTES = 5
 
+        # All selected packages are downloaded into the local package cache in one pass before the batches are installed, so network time
+        # is taken out of the per-batch maintenance window checks. Set to False to download as part of each install instead.
+        PREFETCH_PACKAGES_BEFORE_INSTALLATION = True
+
     class PackageClassification(EnumBackport):
         UNCLASSIFIED = 'Unclassified'
         CRITICAL = 'Critical'
@@ -282,15 +292,34 @@ class Constants(object):
         USER = "User"
         PLATFORM = "Platform"
 
+    # Repositories refreshed within this time are not refreshed again, unless their sources or package lists changed since
+    REPO_REFRESH_TTL_IN_MINUTES = 30
+    MACHINE_SOURCES = "MachineSources"      # source set of the repositories configured on the machine, as opposed to custom sources
+
+    # Repository metadata cached by yum/dnf is only read directly while younger than this (the default metadata_expire of yum; dnf defaults to 48 hours)
+    REPODATA_CACHE_MAX_AGE_IN_HOURS = 6
+
     # Maintenance Window
     PACKAGE_INSTALL_EXPECTED_MAX_TIME_IN_MINUTES = 5
 
+    # Install time model, learned from the install outcomes of past runs on the machine
+    INSTALL_TIME_MODEL_FILE = "InstallTimeModel.json"
+
+    class InstallTimeModelConfig(EnumBackport):
+        # Weight retained by the past observations every time a new install outcome is learned, so the model follows changes on the machine
+        HISTORY_DECAY_FACTOR = 0.95
+        # Packages (weighted by decay) to have been observed before predictions replace the static install time of the package manager
+        MIN_PACKAGES_OBSERVED_FOR_PREDICTION = 10
+        MAX_PACKAGE_SIZES_TRACKED = 2000
+
     # Package Manager Setting
     PACKAGE_MGR_SETTING_REPEAT_PATCH_OPERATION = "RepeatUpdateRun"
 
     # Settings for Error Objects logged in status file
     STATUS_ERROR_MSG_SIZE_LIMIT_IN_CHARACTERS = 128
     STATUS_ERROR_LIMIT = 5
+    STATUS_PATCHES_PLACEHOLDER = "<patches-e5a7f0b2>"  # stands in for the patch list while a summary is serialized, before the cached patch json is spliced in
+    STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = 5  # transitioning assessment and installation updates within this window are coalesced into a single status file write
 
     class PatchOperationTopLevelErrorCode(EnumBackport):
         SUCCESS = 0
@@ -320,6 +349,9 @@ class Constants(object):
     TELEMETRY_EVENT_COUNTER_MSG_SIZE_LIMIT_IN_CHARS = 15  # buffer for telemetry event counter text added at the end of every message sent to telemetry
     TELEMETRY_MAX_EVENT_COUNT_THROTTLE = 360
     TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE = 300
+    TELEMETRY_EVENT_BATCH_MAX_COUNT = 100  # events held in memory before they are flushed to a new event file
+    TELEMETRY_EVENT_BATCH_MAX_AGE_IN_SECONDS = 10  # max time an event can be held in memory before the background flusher writes it out, unless the event count throttle applies
+    TELEMETRY_EVENT_QUEUE_MAX_COUNT = 1000  # max events held in memory awaiting a flush, after which new events are dropped. Error events replace older non-error events instead
 
     # Telemetry Event Level
     class TelemetryEventLevel(EnumBackport):
@@ -348,6 +380,10 @@ class Constants(object):
         PRIVILEGED_OP_MARKER = "Privileged_Op_e6df678d-d09b-436a-a08a-65f2f70a6798"
         PRIVILEGED_OP_REBOOT = PRIVILEGED_OP_MARKER + "Reboot_Exception"
         PRIVILEGED_OP_EXIT = PRIVILEGED_OP_MARKER + "Exit_"
+        MAX_RETAINED_COMMAND_OUTPUT_SIZE_IN_BYTES = 32 * 1024 * 1024    # older output lines are dropped beyond this, streamed consumers still see all of it
+        COMMAND_DEADLINE_EXCEEDED_CODE = 124                            # same as coreutils timeout
+        COMMAND_TERMINATION_GRACE_PERIOD_IN_SECONDS = 10                # between SIGTERM and SIGKILL for commands past the deadline
+        COMMAND_DEADLINE_PASSED = "Command not run as the command deadline has passed."
 
     # Supported Package Architectures - if this is changed, review YumPackageManage
     SUPPORTED_PACKAGE_ARCH = ['.x86_64', '.noarch', '.i686', '.aarch64']
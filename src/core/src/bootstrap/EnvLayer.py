@@ -16,6 +16,7 @@
 
 from __future__ import print_function
 import base64
+import collections
 import datetime
 import glob
 import json
@@ -23,9 +24,11 @@ import os
 import re
 import platform
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 from core.src.bootstrap.Constants import Constants
 from core.src.external_dependencies import distro
@@ -60,6 +63,10 @@ class EnvLayer(object):
         # Constant paths
         self.etc_environment_file_path = "/etc/environment"
 
+        # Commands run within the command deadline and still running past this point in time (seconds since epoch) are terminated, if set
+        self.__command_deadline = None
+        self.__command_deadline_scope = threading.local()   # depth > 0 while run_within_command_deadline is running a function in the thread
+
     def get_package_manager(self):
         """ Detects package manager type """
         ret = None
@@ -147,86 +154,139 @@ class EnvLayer(object):
             if raise_if_not_success:
                 raise
 
-    def run_command_output(self, cmd, no_output=False, chk_err=False):
+    def run_command_output(self, cmd, no_output=False, chk_err=False, output_consumers=None):
         operation = "RUN_CMD_OUT"
         if not self.__emulator_enabled:
             start = time.time()
-            code, output = self.__run_command_output_raw(cmd, no_output, chk_err)
+            code, output = self.__run_command_output_raw(cmd, no_output, chk_err, output_consumers)
             self.__write_record(operation, code, output, delay=(time.time()-start))
             return code, output
         else:
             return self.__read_record(operation)
 
-    def __run_command_output_raw(self, cmd, no_output, chk_err=True):
-        """
-        Wrapper for subprocess.check_output. Execute 'cmd'.
-        Returns return code and STDOUT, trapping expected exceptions.
-        Reports exceptions to Error if chk_err parameter is True
-        """
+    def set_command_deadline(self, deadline=None):
+        """ Commands run within the command deadline and still running at the deadline (seconds since epoch) are terminated. None removes the deadline. """
+        self.__command_deadline = deadline
 
-        def check_output(*popenargs, **kwargs):
-            """
-            Backport from subprocess module from python 2.7
-            """
-            if 'stdout' in kwargs:
-                raise ValueError('stdout argument not allowed, it will be overridden.')
+    def run_within_command_deadline(self, function, *args):
+        """ Runs function(*args), terminating the commands it runs in this thread if still running at the command deadline. Threads it starts are
+            only bounded if they run their functions through this as well (see is_within_command_deadline).
+            Only for read-only queries and simulations - an install or download terminated midway can leave the package database in need of repair.
+            Raises COMMAND_DEADLINE_PASSED instead of running any command once the deadline has passed. """
+        self.__raise_if_command_deadline_passed()
+        return self.__run_with_command_deadline_scope_depth(self.__get_command_deadline_scope_depth() + 1, function, *args)
 
-            no_output = False
-            if type(popenargs[0]) is bool:
-                no_output = popenargs[0]
-                popenargs = popenargs[1:]
+    def run_outside_command_deadline(self, function, *args):
+        """ Runs function(*args) without terminating the commands it runs in this thread at the command deadline, for installs of prerequisites within queries """
+        return self.__run_with_command_deadline_scope_depth(0, function, *args)
 
-            if no_output is True:
-                out_file = None
-            else:
-                out_file = subprocess.PIPE
-
-            process = subprocess.Popen(stdout=out_file, *popenargs, **kwargs)
-            output, unused_err = process.communicate()
-            retcode = process.poll()
-
-            if retcode:
-                cmd = kwargs.get("args")
-                if cmd is None:
-                    cmd = popenargs[0]
-                raise subprocess.CalledProcessError(retcode, cmd, output=output)
-            return output
-
-        # noinspection PyShadowingNames,PyShadowingNames
-        class CalledProcessError(Exception):
-            """Exception classes used by this module."""
-
-            def __init__(self, return_code, cmd, output=None):
-                self.return_code = return_code
-                self.cmd = cmd
-                self.output = output
-
-            def __str__(self):
-                return "Command '%s' returned non-zero exit status %d" \
-                       % (self.cmd, self.return_code)
-
-        subprocess.check_output = check_output
-        subprocess.CalledProcessError = CalledProcessError
+    def is_within_command_deadline(self):
+        """ Returns True if commands run in this thread are terminated at the command deadline """
+        return self.__get_command_deadline_scope_depth() > 0
+
+    def __get_command_deadline_scope_depth(self):
+        return getattr(self.__command_deadline_scope, 'depth', 0)
+
+    def __run_with_command_deadline_scope_depth(self, depth, function, *args):
+        command_deadline_scope_depth = self.__get_command_deadline_scope_depth()
+        self.__command_deadline_scope.depth = depth
         try:
-            output = subprocess.check_output(no_output, cmd, stderr=subprocess.STDOUT, shell=True)
-        except subprocess.CalledProcessError as e:
-            if chk_err:
-                print("Error: CalledProcessError.  Error Code is: " + str(e.returncode), file=sys.stdout)
-                print("Error: CalledProcessError.  Command string was: " + e.cmd, file=sys.stdout)
-                print("Error: CalledProcessError.  Command result was: " + self.__convert_process_output_to_ascii(e.output[:-1]), file=sys.stdout)
-            if no_output:
-                return e.return_code, None
-            else:
-                return e.return_code, self.__convert_process_output_to_ascii(e.output)
+            return function(*args)
+        finally:
+            self.__command_deadline_scope.depth = command_deadline_scope_depth
+
+    def __raise_if_command_deadline_passed(self):
+        if self.__command_deadline is not None and time.time() >= self.__command_deadline:
+            raise Exception(Constants.EnvLayer.COMMAND_DEADLINE_PASSED)
+
+    def __run_command_output_raw(self, cmd, no_output, chk_err=True, output_consumers=None):
+        """
+        Executes 'cmd' in a shell, streaming its combined STDOUT and STDERR line by line to any output consumers (callables taking a line).
+        Returns return code and STDOUT, of which only the most recent MAX_RETAINED_COMMAND_OUTPUT_SIZE_IN_BYTES are retained.
+        Commands run within the command deadline and still running at the deadline are terminated. Reports errors to stdout if chk_err parameter is True
+        """
+        timeout_in_seconds = None
+        if self.__command_deadline is not None and self.is_within_command_deadline():
+            self.__raise_if_command_deadline_passed()
+            timeout_in_seconds = self.__command_deadline - time.time()
+
+        # own session and process group, so that the whole command tree can be terminated at the deadline. preexec_fn can deadlock the child while
+        # other threads are running, so it is only used on Python 2.7, which has no start_new_session
+        if self.get_python_major_version() >= 3:
+            new_session_args = {'start_new_session': True}
+        else:
+            new_session_args = {'preexec_fn': os.setsid if hasattr(os, 'setsid') else None}
+        try:
+            process = subprocess.Popen(cmd, stdout=None if no_output else subprocess.PIPE, stderr=subprocess.STDOUT, shell=True, **new_session_args)
         except Exception as error:
-            message = "Exception during cmd execution. [Exception={0}][Cmd={1}]".format(repr(error),str(cmd))
+            message = "Exception during cmd execution. [Exception={0}][Cmd={1}]".format(repr(error), str(cmd))
             print(message)
-            raise message
+            raise Exception(message)
+
+        deadline_exceeded = []  # appended to by the deadline timer thread
+        deadline_timer = None
+        if timeout_in_seconds is not None:
+            deadline_timer = threading.Timer(timeout_in_seconds, self.__terminate_command, [process, deadline_exceeded])
+            deadline_timer.daemon = True
+            deadline_timer.start()
+
+        retained_output = collections.deque()
+        retained_output_size = 0
+        dropped_output_size = 0
+        try:
+            if not no_output:
+                for raw_line in iter(process.stdout.readline, b''):
+                    line = self.__convert_process_output_to_ascii(raw_line)
+                    for output_consumer in output_consumers or []:
+                        output_consumer(line)
+                    retained_output.append(line)
+                    retained_output_size += len(line)
+                    while retained_output_size > Constants.EnvLayer.MAX_RETAINED_COMMAND_OUTPUT_SIZE_IN_BYTES and len(retained_output) > 1:
+                        dropped_line = retained_output.popleft()
+                        retained_output_size -= len(dropped_line)
+                        dropped_output_size += len(dropped_line)
+                process.stdout.close()
+            code = process.wait()
+        finally:
+            if deadline_timer is not None:
+                deadline_timer.cancel()
+            if process.poll() is None:  # an output consumer failed
+                self.__terminate_command(process, [])
+
+        if len(deadline_exceeded) > 0:
+            code = Constants.EnvLayer.COMMAND_DEADLINE_EXCEEDED_CODE
+            retained_output.append("\nCommand terminated as it was still running at the deadline. [TimeoutInSeconds={0}]\n".format(str(int(timeout_in_seconds))))
+        if dropped_output_size > 0:
+            retained_output.appendleft("Earlier command output dropped as it exceeded the retained output size. [DroppedSizeInBytes={0}]\n".format(str(dropped_output_size)))
+        output = None if no_output else str().join(retained_output)
+
+        if code != 0 and chk_err:
+            print("Error: Command failed.  Error Code is: " + str(code), file=sys.stdout)
+            print("Error: Command failed.  Command string was: " + cmd, file=sys.stdout)
+            if output is not None:
+                print("Error: Command failed.  Command result was: " + output[:-1], file=sys.stdout)
 
-        if no_output:
-            return 0, None
-        else:
-            return 0, self.__convert_process_output_to_ascii(output)
+        return code, output
+
+    @staticmethod
+    def __terminate_command(process, deadline_exceeded):
+        """ Terminates the process group of a running command, forcefully if it has not exited by the end of the grace period """
+        if process.poll() is not None:
+            return
+        deadline_exceeded.append(True)
+        for termination_signal in [signal.SIGTERM, getattr(signal, 'SIGKILL', signal.SIGTERM)]:
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(process.pid, termination_signal)
+                else:
+                    process.terminate()
+            except OSError:
+                return  # already exited
+            grace_period_end = time.time() + Constants.EnvLayer.COMMAND_TERMINATION_GRACE_PERIOD_IN_SECONDS
+            while process.poll() is None and time.time() < grace_period_end:
+                time.sleep(0.1)
+            if process.poll() is not None:
+                return
 
     @staticmethod
     def __convert_process_output_to_ascii(output):
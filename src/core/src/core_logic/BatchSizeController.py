@@ -0,0 +1,55 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+"""Batch size control for batch patching"""
+from core.src.bootstrap.Constants import Constants
+
+
+class BatchSizeController(object):
+    """ Sizes package install batches from the outcomes of the batches installed so far: the per-package install time, tracked as an
+        exponentially weighted average, and the share of packages that failed to install on their own (isolated by bisection). """
+
+    def __init__(self, composite_logger, package_install_expected_avg_time_in_seconds):
+        self.composite_logger = composite_logger
+        self.package_install_time_in_secs = float(package_install_expected_avg_time_in_seconds)
+        self.attempted_package_count = 0
+        self.failed_package_count = 0
+
+    def record_batch_outcome(self, package_count, time_taken_in_secs, new_package_count, isolated_failure_count):
+        """ Folds the outcome of an installed batch in. New packages are the ones attempted for the first time (i.e. not a retry of failed packages),
+            and isolated failures are packages that failed when installed on their own. """
+        if package_count <= 0:
+            return
+
+        smoothing_factor = Constants.PackageBatchConfig.BATCH_OUTCOME_SMOOTHING_FACTOR
+        observed_package_install_time_in_secs = max(float(time_taken_in_secs) / package_count, Constants.PackageBatchConfig.MIN_PACKAGE_INSTALL_TIME_IN_SECONDS)
+        self.package_install_time_in_secs = (1 - smoothing_factor) * self.package_install_time_in_secs + smoothing_factor * observed_package_install_time_in_secs
+        self.attempted_package_count += new_package_count
+        self.failed_package_count += isolated_failure_count
+        self.composite_logger.log_debug("[BSC] Batch outcome recorded. [PackageCount={0}][TimeTakenInSecs={1}][PackageInstallTimeInSecs={2}][PackageFailureRate={3}]".format(
+                                        str(package_count), str(round(time_taken_in_secs, 2)), str(round(self.package_install_time_in_secs, 2)), str(round(self.get_package_failure_rate(), 3))))
+
+    def get_package_failure_rate(self):
+        return float(self.failed_package_count) / self.attempted_package_count if self.attempted_package_count > 0 else 0.0
+
+    def get_batch_size(self, max_batch_size_by_time):
+        """ Caps the batch size that fits in the maintenance window so that a batch is expected to contain at most one failing package,
+            as every failure in a batch costs a bisection of the failed packages """
+        batch_size = max_batch_size_by_time
+        package_failure_rate = self.get_package_failure_rate()
+        if package_failure_rate > 0:
+            batch_size = min(batch_size, max(1, int(1 / package_failure_rate)))
+        return batch_size
@@ -0,0 +1,175 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+"""Install time model, learned from the install outcomes on the machine"""
+import collections
+import json
+import math
+import os
+import re
+from core.src.bootstrap.Constants import Constants
+
+
+class InstallTimeModel(object):
+    """ Predicts per-package install times on the machine from the install outcomes of past runs, persisted in the config folder.
+        Per-package install time is fitted as a linear function of the per-package download size reported by the package manager,
+        and the last known download size of every package is retained to be used as the feature for its next installation. """
+
+    SIZE_UNIT_EXPONENTS = {'b': 0, 'k': 1, 'm': 2, 'g': 3}
+
+    def __init__(self, env_layer, composite_logger, model_file_path):
+        self.env_layer = env_layer
+        self.composite_logger = composite_logger
+        self.model_file_path = model_file_path
+
+        self.__reset()
+        self.__read_model()
+
+    # region Learning
+    def record_install_outcome(self, packages, package_size, time_taken_in_secs):
+        """ Learns from the successful installation of packages (together, in one package manager invocation). package_size is the download size
+            as reported by the package manager (e.g. '433 kB'), or Constants.UNKNOWN_PACKAGE_SIZE. """
+        if len(packages) == 0:
+            return
+
+        package_count = len(packages)
+        package_install_time_in_secs = float(time_taken_in_secs) / package_count
+        package_size_in_mb = self.get_size_in_mb(package_size)
+
+        decay_factor = Constants.InstallTimeModelConfig.HISTORY_DECAY_FACTOR
+        self.observed_package_count = decay_factor * self.observed_package_count + package_count
+        self.time_sum = decay_factor * self.time_sum + package_count * package_install_time_in_secs
+        self.time_square_sum = decay_factor * self.time_square_sum + package_count * package_install_time_in_secs ** 2
+
+        self.sized_package_count *= decay_factor
+        self.size_sum *= decay_factor
+        self.size_square_sum *= decay_factor
+        self.size_time_sum *= decay_factor
+        self.sized_time_sum *= decay_factor
+        if package_size_in_mb is not None:
+            package_size_in_mb /= package_count
+            self.sized_package_count += package_count
+            self.size_sum += package_count * package_size_in_mb
+            self.size_square_sum += package_count * package_size_in_mb ** 2
+            self.size_time_sum += package_count * package_size_in_mb * package_install_time_in_secs
+            self.sized_time_sum += package_count * package_install_time_in_secs
+
+            for package in packages:
+                self.package_sizes_in_mb.pop(package, None)
+                self.package_sizes_in_mb[package] = round(package_size_in_mb, 3)
+            while len(self.package_sizes_in_mb) > Constants.InstallTimeModelConfig.MAX_PACKAGE_SIZES_TRACKED:
+                self.package_sizes_in_mb.popitem(last=False)
+
+        self.composite_logger.log_debug("[ITM] Install outcome recorded. [PackageCount={0}][PackageSize={1}][TimeTakenInSecs={2}][ObservedPackageCount={3}]".format(
+                                        str(package_count), str(package_size), str(round(time_taken_in_secs, 2)), str(round(self.observed_package_count, 2))))
+        self.__write_model()
+
+    @staticmethod
+    def get_size_in_mb(package_size):
+        """ Converts a download size as reported by the package managers (e.g. '0 B', '433 kB', '15 M', '195.0 KiB', '1,024 kB') to MB. Returns None if unknown. """
+        match = re.match(r'^\s*([0-9][0-9,]*(?:\.[0-9]+)?)\s*([a-zA-Z]?)', str(package_size))
+        if match is None:
+            return None
+        unit = match.group(2).lower() if match.group(2) != "" else 'b'
+        if unit not in InstallTimeModel.SIZE_UNIT_EXPONENTS:
+            return None
+        return float(match.group(1).replace(',', '')) * (1024 ** InstallTimeModel.SIZE_UNIT_EXPONENTS[unit]) / (1024 ** 2)
+    # endregion
+
+    # region Prediction
+    def has_history(self):
+        return self.observed_package_count >= Constants.InstallTimeModelConfig.MIN_PACKAGES_OBSERVED_FOR_PREDICTION
+
+    def get_expected_avg_time_in_seconds(self, packages, fallback_avg_time_in_seconds):
+        """ Returns the expected average install time of the packages (or of any package, if packages is None), with a margin of the deviation seen in
+            the past outcomes. Falls back to fallback_avg_time_in_seconds until there is enough history on the machine. """
+        if not self.has_history():
+            return fallback_avg_time_in_seconds
+
+        mean_time = self.time_sum / self.observed_package_count
+        time_deviation = math.sqrt(max(self.time_square_sum / self.observed_package_count - mean_time ** 2, 0))
+        intercept, slope = self.__get_size_fit()
+
+        package_count = 1
+        expected_avg_time = mean_time
+        if packages is not None and len(packages) > 0:
+            package_count = len(packages)
+            expected_times = [intercept + slope * self.package_sizes_in_mb[package] if slope is not None and package in self.package_sizes_in_mb else mean_time for package in packages]
+            expected_avg_time = sum(expected_times) / package_count
+
+        return max(expected_avg_time + time_deviation / math.sqrt(package_count), Constants.PackageBatchConfig.MIN_PACKAGE_INSTALL_TIME_IN_SECONDS)
+
+    def __get_size_fit(self):
+        """ Least squares fit of per-package install time to per-package download size. Returns (None, None) if the sizes seen do not allow for a fit. """
+        if self.sized_package_count < Constants.InstallTimeModelConfig.MIN_PACKAGES_OBSERVED_FOR_PREDICTION:
+            return None, None
+
+        size_variance = self.sized_package_count * self.size_square_sum - self.size_sum ** 2
+        if size_variance <= 1e-9 * max(self.sized_package_count * self.size_square_sum, 1):
+            return None, None
+
+        slope = max((self.sized_package_count * self.size_time_sum - self.size_sum * self.sized_time_sum) / size_variance, 0)    # larger downloads never install faster
+        intercept = (self.sized_time_sum - slope * self.size_sum) / self.sized_package_count
+        return intercept, slope
+    # endregion
+
+    # region Persistence
+    def __read_model(self):
+        """ Reads the model learned in past runs. A missing or unreadable model file means no history. """
+        if not os.path.isfile(self.model_file_path):
+            self.composite_logger.log_debug("[ITM] No install time history available on the machine. [Path={0}]".format(self.model_file_path))
+            return
+
+        try:
+            model = json.loads(self.env_layer.file_system.read_with_retry(self.model_file_path), object_pairs_hook=collections.OrderedDict)['installTimeModel']
+            self.observed_package_count = float(model['observedPackageCount'])
+            self.time_sum = float(model['timeSum'])
+            self.time_square_sum = float(model['timeSquareSum'])
+            self.sized_package_count = float(model['sizedPackageCount'])
+            self.size_sum = float(model['sizeSum'])
+            self.size_square_sum = float(model['sizeSquareSum'])
+            self.size_time_sum = float(model['sizeTimeSum'])
+            self.sized_time_sum = float(model['sizedTimeSum'])
+            self.package_sizes_in_mb = collections.OrderedDict((str(package), float(size)) for package, size in model['packageSizesInMB'].items())
+        except Exception as error:
+            self.composite_logger.log_warning("[ITM] Install time history is unreadable and will be reset. [Path={0}][Error={1}]".format(self.model_file_path, repr(error)))
+            self.__reset()
+
+    def __reset(self):
+        # decayed sums over all outcomes, with per-package install time (y) weighted by package count
+        self.observed_package_count = 0.0
+        self.time_sum = 0.0
+        self.time_square_sum = 0.0
+
+        # decayed sums over the outcomes with a known download size, with per-package download size in MB (x)
+        self.sized_package_count = 0.0
+        self.size_sum = 0.0
+        self.size_square_sum = 0.0
+        self.size_time_sum = 0.0
+        self.sized_time_sum = 0.0
+
+        self.package_sizes_in_mb = collections.OrderedDict()  # package -> last known download size in MB, least recently installed first
+
+    def __write_model(self):
+        """ Persists the model for the next runs. Best effort, as it only improves install time predictions. """
+        model = collections.OrderedDict([('observedPackageCount', self.observed_package_count), ('timeSum', self.time_sum), ('timeSquareSum', self.time_square_sum),
+                             ('sizedPackageCount', self.sized_package_count), ('sizeSum', self.size_sum), ('sizeSquareSum', self.size_square_sum),
+                             ('sizeTimeSum', self.size_time_sum), ('sizedTimeSum', self.sized_time_sum), ('packageSizesInMB', self.package_sizes_in_mb)])
+        try:
+            self.env_layer.file_system.write_with_retry_using_temp_file(self.model_file_path, json.dumps({'installTimeModel': model}), mode='w+')
+        except Exception as error:
+            self.composite_logger.log_debug("[ITM] Unable to persist install time history. [Path={0}][Error={1}]".format(self.model_file_path, repr(error)))
+    # endregion
@@ -59,15 +59,15 @@ class MaintenanceWindow(object):
 
         return remaining_time_in_minutes
 
-    def is_package_install_time_available(self, package_manager, remaining_time_in_minutes=None, number_of_packages_in_batch=1):
-        """Check if time still available for package installation"""
+    def is_package_install_time_available(self, package_manager, remaining_time_in_minutes=None, number_of_packages_in_batch=1, packages_in_batch=None):
+        """Check if time still available for package installation. Install time of the packages in batch (if known) is predicted from the install history on the machine."""
         # In the extreme case, all the package installations in the batch might take the maximum time. 
         # But calculating cutoff time based on max time to install packages for all the packages will make cutoff time very huge 
         # as it is very unlikely that all the package installations take maximum time.
         # Assuming that one of the packages in the batch could take maximum time to install and rest of the packages take average time.
         cutoff_time_in_minutes = Constants.PACKAGE_INSTALL_EXPECTED_MAX_TIME_IN_MINUTES
         if number_of_packages_in_batch > 1:
-            package_install_expected_avg_time_in_minutes = package_manager.get_package_install_expected_avg_time_in_seconds() / 60
+            package_install_expected_avg_time_in_minutes = package_manager.get_package_install_expected_avg_time_in_seconds(packages_in_batch) / 60
             cutoff_time_in_minutes += package_install_expected_avg_time_in_minutes * (number_of_packages_in_batch - 1)
 
         if Constants.REBOOT_SETTINGS[self.execution_config.reboot_setting] != Constants.REBOOT_NEVER:
@@ -18,11 +18,46 @@
 
 from core.src.bootstrap.Constants import Constants
 import fnmatch
+import os
+import re
 
 
 class PackageFilter(object):
     """implements the Package filtering logic"""
 
+    class PackageMatcher(object):
+        """ Matches package names against a list of masks, which are compiled once. Exact-name masks are looked up in a hash table and
+            wildcard masks are merged into a single pattern that rules out non-matching names in one pass. Matches are memoized per package. """
+
+        def __init__(self, package_masks, package_version_masks=None):
+            self.package_masks = package_masks
+            self.package_version_masks = package_version_masks if package_version_masks else []
+            self.__exact_mask_indices = {}             # mask -> indices of that mask in package_masks
+            self.__wildcard_masks = []                 # (index, compiled mask)
+            self.__matching_mask_indices_cache = {}    # package -> indices of all matching masks, in order
+
+            wildcard_patterns = []
+            for index, package_mask in enumerate(package_masks):
+                normalized_mask = os.path.normcase(package_mask)   # same case handling as fnmatch.fnmatch
+                if any(wildcard in normalized_mask for wildcard in '*?['):
+                    pattern = fnmatch.translate(normalized_mask)
+                    self.__wildcard_masks.append((index, re.compile(pattern)))
+                    wildcard_patterns.append('(?:{0})'.format(pattern[:-len('(?ms)')] if pattern.endswith('(?ms)') else pattern))    # Python 2 appends the flags, which would be invalid mid-pattern
+                else:
+                    self.__exact_mask_indices.setdefault(normalized_mask, []).append(index)
+            self.__combined_wildcard_pattern = re.compile('(?ms)' + '|'.join(wildcard_patterns)) if wildcard_patterns else None
+
+        def get_matching_mask_indices(self, package):
+            """ Returns the indices of all masks matching the package, either with or without its architecture """
+            if package not in self.__matching_mask_indices_cache:
+                matching_mask_indices = set()
+                for name in set([os.path.normcase(package), os.path.normcase(PackageFilter.get_product_name_without_arch(package))]):
+                    matching_mask_indices.update(self.__exact_mask_indices.get(name, []))
+                    if self.__combined_wildcard_pattern is not None and self.__combined_wildcard_pattern.match(name):
+                        matching_mask_indices.update(index for index, compiled_mask in self.__wildcard_masks if compiled_mask.match(name))
+                self.__matching_mask_indices_cache[package] = sorted(matching_mask_indices)
+            return self.__matching_mask_indices_cache[package]
+
     def __init__(self, execution_config, composite_logger):
         self.execution_config = execution_config
         self.composite_logger = composite_logger
@@ -36,6 +71,7 @@ class PackageFilter(object):
         self.installation_included_package_masks = self.execution_config.included_package_name_mask_list
         self.installation_included_packages, self.installation_included_package_versions = self.get_packages_and_versions_from_masks(self.installation_included_package_masks)
         self.installation_included_classifications = [] if self.execution_config.included_classifications_list is None else self.execution_config.included_classifications_list
+        self.installation_included_package_matcher = self.PackageMatcher(self.installation_included_packages, self.installation_included_package_versions)
 
         # Neutralize global excluded packages, if customer explicitly includes the package
         packages_to_clear_from_global = []
@@ -44,6 +80,8 @@ class PackageFilter(object):
                 self.composite_logger.log_debug('Removing package from global exclusion list: ' + package)
                 packages_to_clear_from_global.append(package)
         self.global_excluded_packages = [x for x in self.global_excluded_packages if x not in packages_to_clear_from_global]
+        self.global_excluded_package_matcher = self.PackageMatcher(self.global_excluded_packages)
+        self.installation_excluded_package_matcher = self.PackageMatcher(self.installation_excluded_packages)
 
         # Logging
         self.composite_logger.log("\nAzure globally-excluded packages: " + str(self.global_excluded_packages))
@@ -67,8 +105,8 @@ class PackageFilter(object):
     # region Package exclusion checks
     def check_for_exclusion(self, one_or_more_packages):
         """Return true if package need to be excluded"""
-        return self.check_for_match(one_or_more_packages, self.installation_excluded_packages) or \
-               self.check_for_match(one_or_more_packages, self.global_excluded_packages)
+        return self.check_for_match(one_or_more_packages, self.installation_excluded_package_matcher) or \
+               self.check_for_match(one_or_more_packages, self.global_excluded_package_matcher)
     # endregion
 
     # region Package inclusion checks
@@ -78,41 +116,42 @@ class PackageFilter(object):
 
     def check_for_explicit_inclusion(self, package, package_version=Constants.DEFAULT_UNSPECIFIED_VALUE):
         """Return true if package should be included due to an explicit match to the inclusion list """
-        return self.check_for_match(package, self.installation_included_packages, package_version, self.installation_included_package_versions)
+        return self.check_for_match(package, self.installation_included_package_matcher, package_version)
     # endregion
 
     # region Inclusion / exclusion common match checker
-    def check_for_match(self, one_or_more_packages, matching_list, linked_package_versions=Constants.DEFAULT_UNSPECIFIED_VALUE, version_matching_list=Constants.DEFAULT_UNSPECIFIED_VALUE):
-        # type: (str, object, str, object) -> bool  # type hinting to remove a warning
+    def check_for_match(self, one_or_more_packages, package_matcher, linked_package_versions=Constants.DEFAULT_UNSPECIFIED_VALUE):
+        # type: (str, PackageFilter.PackageMatcher, str) -> bool  # type hinting to remove a warning
         """Return true if package(s) (with, optionally, linked version(s)) matches the filter list"""
-        if matching_list:
+        if package_matcher.package_masks:
             if type(one_or_more_packages) is str:
-                return self.single_package_check_for_match(one_or_more_packages, matching_list, linked_package_versions, version_matching_list)
+                return self.single_package_check_for_match(one_or_more_packages, package_matcher, linked_package_versions)
             else:
                 for index, each_package in enumerate(one_or_more_packages):
                     if type(linked_package_versions) is str:
-                        if self.single_package_check_for_match(each_package, matching_list, linked_package_versions, version_matching_list):
+                        if self.single_package_check_for_match(each_package, package_matcher, linked_package_versions):
                             return True
                     else:
-                        if self.single_package_check_for_match(each_package, matching_list, linked_package_versions[index], version_matching_list):
+                        if self.single_package_check_for_match(each_package, package_matcher, linked_package_versions[index]):
                             return True
         return False
 
-    def single_package_check_for_match(self, package, matching_list, package_version, version_matching_list):
+    def single_package_check_for_match(self, package, package_matcher, package_version):
         """Returns true if a single package (optionally, version) matches the filter list"""
-        for index, matching_package in enumerate(matching_list):
-            if fnmatch.fnmatch(package, matching_package) or fnmatch.fnmatch(self.get_product_name_without_arch(package), matching_package):
-                self.composite_logger.log_debug('    - [Package] {0} matches expression {1}'.format(package, matching_package))
-                if package_version == Constants.DEFAULT_UNSPECIFIED_VALUE or not version_matching_list or version_matching_list[index] == Constants.DEFAULT_UNSPECIFIED_VALUE:
-                    self.composite_logger.log_debug('    - [Version] Check skipped as not specified.')
-                    return True
-                elif len(version_matching_list) > index and fnmatch.fnmatch(package_version, version_matching_list[index]):
-                    self.composite_logger.log_debug('    - [Version] {0} matches expression {1}'.format(package, version_matching_list[index]))
-                    return True
-                elif len(version_matching_list) <= index:   # This should never happen - something has gone horribly wrong
-                    self.composite_logger.log_error('    - [Version] Index error - ({0} of {1})'.format(index + 1, len(version_matching_list)))
-                else:
-                    self.composite_logger.log_debug('    - Package {0} (version={1}) was found, but it did not match filter specified for version ({2})'.format(package, package_version, version_matching_list[index]))
+        version_matching_list = package_matcher.package_version_masks
+        for index in package_matcher.get_matching_mask_indices(package):
+            matching_package = package_matcher.package_masks[index]
+            self.composite_logger.log_debug('    - [Package] {0} matches expression {1}'.format(package, matching_package))
+            if package_version == Constants.DEFAULT_UNSPECIFIED_VALUE or not version_matching_list or version_matching_list[index] == Constants.DEFAULT_UNSPECIFIED_VALUE:
+                self.composite_logger.log_debug('    - [Version] Check skipped as not specified.')
+                return True
+            elif len(version_matching_list) > index and fnmatch.fnmatch(package_version, version_matching_list[index]):
+                self.composite_logger.log_debug('    - [Version] {0} matches expression {1}'.format(package, version_matching_list[index]))
+                return True
+            elif len(version_matching_list) <= index:   # This should never happen - something has gone horribly wrong
+                self.composite_logger.log_error('    - [Version] Index error - ({0} of {1})'.format(index + 1, len(version_matching_list)))
+            else:
+                self.composite_logger.log_debug('    - Package {0} (version={1}) was found, but it did not match filter specified for version ({2})'.format(package, package_version, version_matching_list[index]))
         return False
 
     @staticmethod
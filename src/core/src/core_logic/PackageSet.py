@@ -0,0 +1,87 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+""" Keyed set of packages with versions, for the parallel package/version lists used across the core """
+import collections
+
+
+class PackageSet(object):
+    """ Ordered set of package records keyed by package name. The first record for a package name is kept.
+        Membership, lookup and removal are constant time, so set algebra is linear in the number of packages. """
+
+    class Entry(object):
+        __slots__ = ('package', 'version')
+
+        def __init__(self, package, version):
+            self.package = package
+            self.version = version
+
+    def __init__(self, packages=None, package_versions=None):
+        self.__entries = collections.OrderedDict()
+        self.__entries_by_product_name = None   # product name (package name without architecture) -> entries, built on first use
+        self.__get_product_name = None
+        if packages is not None:
+            for package, version in zip(packages, package_versions):
+                self.add(package, version)
+
+    def __contains__(self, package):
+        return package in self.__entries
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __iter__(self):
+        return iter(list(self.__entries.values()))
+
+    def add(self, package, version):
+        """ Adds the package if not already present, and returns whether it was added """
+        if package in self.__entries:
+            return False
+        entry = self.Entry(package, version)
+        self.__entries[package] = entry
+        if self.__entries_by_product_name is not None:
+            self.__entries_by_product_name.setdefault(self.__get_product_name(package), []).append(entry)
+        return True
+
+    def remove(self, package):
+        """ Removes the package, and returns its record if it was present """
+        return self.__entries.pop(package, None)
+
+    def get_version(self, package, default=None):
+        entry = self.__entries.get(package)
+        return default if entry is None else entry.version
+
+    def get_packages_and_versions(self):
+        """ Returns the packages and their versions as parallel lists, in insertion order """
+        return [entry.package for entry in self.__entries.values()], [entry.version for entry in self.__entries.values()]
+
+    def difference(self, packages):
+        """ Returns a new set with the records whose package is not in packages (any collection of package names) """
+        packages = packages if isinstance(packages, (PackageSet, set, frozenset, dict)) else set(packages)
+        result = PackageSet()
+        for entry in self.__entries.values():
+            if entry.package not in packages:
+                result.add(entry.package, entry.version)
+        return result
+
+    def get_arch_siblings(self, package, get_product_name_without_arch):
+        """ Returns the records for the same product as package (i.e. the same package for any architecture), including package itself if present """
+        if self.__entries_by_product_name is None:
+            self.__get_product_name = get_product_name_without_arch
+            self.__entries_by_product_name = {}
+            for entry in self.__entries.values():
+                self.__entries_by_product_name.setdefault(get_product_name_without_arch(entry.package), []).append(entry)
+        return [entry for entry in self.__entries_by_product_name.get(get_product_name_without_arch(package), []) if self.__entries.get(entry.package) is entry]
@@ -22,6 +22,7 @@ import shutil
 import sys
 import time
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.QueryScheduler import QueryScheduler
 from core.src.core_logic.Stopwatch import Stopwatch
 
 
@@ -40,8 +41,8 @@ class PatchAssessor(object):
         self.assessment_state_file_path = os.path.join(self.execution_config.config_folder, Constants.ASSESSMENT_STATE_FILE)
         self.stopwatch = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
 
-    def start_assessment(self):
-        """ Start a patch assessment """
+    def start_assessment(self, post_installation=False):
+        """ Start a patch assessment. After installation, the pre-installation inventory is reconciled with the install outcomes instead of re-querying repositories, where possible. """
         self.status_handler.set_current_operation(Constants.ASSESSMENT)
         self.raise_if_telemetry_unsupported()
         self.raise_if_min_python_version_not_met()
@@ -60,8 +61,17 @@ class PatchAssessor(object):
 
         for i in range(0, Constants.MAX_ASSESSMENT_RETRY_COUNT):
             try:
-                self.composite_logger.log("\n\nGetting available patches...")
-                self.package_manager.refresh_repo()
+                # independent read-only queries run alongside the update queries
+                query_scheduler = QueryScheduler(self.env_layer, self.composite_logger)
+                reboot_pending_query = query_scheduler.schedule("Reboot pending check", self.package_manager.get_query_access('is_reboot_pending'), self.package_manager.is_reboot_pending)
+
+                # Reconciliation is only attempted once, retries fall back to a full assessment
+                post_installation_inventory = self.get_post_installation_inventory() if post_installation and i == 0 else None
+                if post_installation_inventory is None:
+                    self.composite_logger.log("\n\nGetting available patches...")
+                    self.package_manager.refresh_repo()
+                else:
+                    self.composite_logger.log("\n\nReconciling available patches with installation outcomes...")
                 self.status_handler.reset_assessment_data()
 
                 if self.lifecycle_manager is not None:
@@ -71,22 +81,23 @@ class PatchAssessor(object):
                 retry_count = retry_count + 1
                 
                 # All updates
-                packages, package_versions = self.package_manager.get_all_updates()
+                packages, package_versions = self.package_manager.get_all_updates() if post_installation_inventory is None else post_installation_inventory[0]
                 self.telemetry_writer.write_event("Full assessment: " + str(packages), Constants.TelemetryEventLevel.Verbose)
                 self.status_handler.set_package_assessment_status(packages, package_versions)
                 if self.lifecycle_manager is not None:
                     self.lifecycle_manager.lifecycle_status_check()     # may terminate the code abruptly, as designed
-                sec_packages, sec_package_versions = self.package_manager.get_security_updates()
+                sec_packages, sec_package_versions = self.package_manager.get_security_updates() if post_installation_inventory is None else post_installation_inventory[1]
 
                 # Tag security updates
                 self.telemetry_writer.write_event("Security assessment: " + str(sec_packages), Constants.TelemetryEventLevel.Verbose)
                 self.status_handler.set_package_assessment_status(sec_packages, sec_package_versions, Constants.PackageClassification.SECURITY)
+                self.package_manager.take_inventory_snapshot(packages, package_versions, sec_packages, sec_package_versions)
 
                 # Set the security-esm packages in status.
                 self.package_manager.set_security_esm_package_status(Constants.ASSESSMENT, packages=[])
 
                 # ensure reboot status is set
-                reboot_pending = self.package_manager.is_reboot_pending()
+                reboot_pending = query_scheduler.get_result(reboot_pending_query)
                 self.status_handler.set_reboot_pending(reboot_pending)
 
                 self.status_handler.set_assessment_substatus_json(status=Constants.STATUS_SUCCESS)
@@ -97,6 +108,7 @@ class PatchAssessor(object):
                     error_msg = 'Retriable error retrieving available patches: ' + repr(error)
                     self.composite_logger.log_warning(error_msg)
                     self.status_handler.add_error_to_status(error_msg, Constants.PatchOperationErrorCodes.DEFAULT_ERROR)
+                    self.package_manager.repo_freshness_tracker.invalidate()    # retries start from freshly refreshed repositories
                     time.sleep(2*(i + 1))
                 else:
                     error_msg = 'Error retrieving available patches: ' + repr(error)
@@ -112,6 +124,11 @@ class PatchAssessor(object):
         self.composite_logger.log("\nPatch assessment completed.\n")
         return True
 
+    def get_post_installation_inventory(self):
+        """ Available updates derived from the pre-installation inventory and install outcomes, or None if a full assessment is required """
+        installed_packages, installed_package_versions = self.status_handler.get_installation_packages_by_state(Constants.INSTALLED)
+        return self.package_manager.get_post_installation_inventory(installed_packages, installed_package_versions)
+
     def write_assessment_perf_logs(self, retry_count, task_status, error_msg):
         assessment_perf_log = "[{0}={1}][{2}={3}][{4}={5}][{6}={7}][{8}={9}][{10}={11}]".format(
                                Constants.PerfLogTrackerParams.TASK, Constants.ASSESSMENT, Constants.PerfLogTrackerParams.TASK_STATUS, str(task_status),
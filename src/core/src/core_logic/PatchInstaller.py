@@ -20,6 +20,8 @@ import math
 import sys
 import time
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.BatchSizeController import BatchSizeController
+from core.src.core_logic.PackageSet import PackageSet
 from core.src.core_logic.Stopwatch import Stopwatch
 
 class PatchInstaller(object):
@@ -39,8 +41,7 @@ class PatchInstaller(object):
         self.maintenance_window = maintenance_window
         self.reboot_manager = reboot_manager
 
-        self.last_still_needed_packages = None  # Used for 'Installed' status records
-        self.last_still_needed_package_versions = None
+        self.last_still_needed_updates = None  # PackageSet used for 'Installed' status records
         self.progress_template = "[Time available: {0} | A: {1}, S: {2}, F: {3} | D: {4}]\t {5}"
 
         self.attempted_parent_package_install_count = 0
@@ -49,6 +50,7 @@ class PatchInstaller(object):
         self.skipped_esm_packages = []
         self.skipped_esm_package_versions = []
         self.esm_packages_found_without_attach = False  # Flag used to record if esm packages excluded as ubuntu vm not attached.
+        self.dependency_graph = {}  # package -> dependencies the package manager resolved for installing that package alone. Filled while evaluating exclusions.
 
         self.stopwatch = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
 
@@ -70,8 +72,11 @@ class PatchInstaller(object):
         package_manager = self.package_manager
         reboot_manager = self.reboot_manager
 
+        # Package manager queries still running when the maintenance window ends are terminated, installs and downloads are left to complete
+        self.env_layer.set_command_deadline(time.time() + maintenance_window.get_remaining_time_in_minutes(None, False) * 60)
+
         # Early reboot if reboot is allowed by settings and required by the machine
-        reboot_pending = self.package_manager.is_reboot_pending()
+        reboot_pending = self.query_within_maintenance_window(self.package_manager.is_reboot_pending)
         self.status_handler.set_reboot_pending(reboot_pending)
         if reboot_pending:
             if reboot_manager.is_setting(Constants.REBOOT_NEVER):
@@ -114,6 +119,7 @@ class PatchInstaller(object):
         self.composite_logger.log("\nInstalled update count: " + str(installed_update_count) + " (including dependencies)")
 
         self.write_installer_perf_logs(update_run_successful, installed_update_count, retry_count, maintenance_window, maintenance_window_exceeded, Constants.TaskStatus.SUCCEEDED, "")
+        self.env_layer.set_command_deadline(None)
 
         # Reboot as per setting and environment state
         reboot_manager.start_reboot_if_required_and_time_available(maintenance_window.get_remaining_time_in_minutes(None, False))
@@ -174,10 +180,9 @@ class PatchInstaller(object):
         remaining_time = maintenance_window.get_remaining_time_in_minutes()
 
         try:
-            all_packages, all_package_versions = package_manager.get_all_updates(cached=False)
-            packages, package_versions = package_manager.get_security_updates()
-            self.last_still_needed_packages = list(all_packages)
-            self.last_still_needed_package_versions = list(all_package_versions)
+            all_packages, all_package_versions = self.query_within_maintenance_window(package_manager.get_all_updates, False)
+            packages, package_versions = self.query_within_maintenance_window(package_manager.get_security_updates)
+            self.last_still_needed_updates = PackageSet(all_packages, all_package_versions)
 
             not_included_packages, not_included_package_versions = self.get_not_included_updates(package_manager, packages)
             packages, package_versions, self.skipped_esm_packages, self.skipped_esm_package_versions, self.esm_packages_found_without_attach = package_manager.separate_out_esm_packages(packages, package_versions)
@@ -223,9 +228,13 @@ class PatchInstaller(object):
     def install_updates(self, maintenance_window, package_manager, simulate=False):
         """wrapper function of installing updates"""
         self.composite_logger.log("\n\nGetting available updates...")
-        package_manager.refresh_repo()
+        inventory_snapshot = package_manager.get_inventory_snapshot()
+        if inventory_snapshot is None:
+            package_manager.refresh_repo()
+        else:
+            self.composite_logger.log_debug("Reusing package inventory from assessment, as repositories and installed packages are unchanged since. [SnapshotVersion={0}]".format(str(inventory_snapshot['version'])))
 
-        packages, package_versions = package_manager.get_available_updates(self.package_filter)  # Initial, ignoring exclusions
+        packages, package_versions = self.query_within_maintenance_window(package_manager.get_available_updates, self.package_filter)  # Initial, ignoring exclusions
         self.telemetry_writer.write_event("Initial package list: " + str(packages), Constants.TelemetryEventLevel.Verbose)
 
         not_included_packages, not_included_package_versions = self.get_not_included_updates(package_manager, packages)
@@ -252,7 +261,8 @@ class PatchInstaller(object):
         self.status_handler.set_package_install_status(self.skipped_esm_packages, self.skipped_esm_package_versions, Constants.FAILED)
         self.composite_logger.log("\nList of packages to be updated: \n" + str(packages))
 
-        sec_packages, sec_package_versions = self.package_manager.get_security_updates()
+        inventory_snapshot = self.package_manager.get_inventory_snapshot()
+        sec_packages, sec_package_versions = self.query_within_maintenance_window(self.package_manager.get_security_updates) if inventory_snapshot is None else inventory_snapshot['security_updates']
         self.telemetry_writer.write_event("Security packages out of the final package list: " + str(sec_packages), Constants.TelemetryEventLevel.Verbose)
         self.status_handler.set_package_install_status_classification(sec_packages, sec_package_versions, classification="Security")
 
@@ -267,14 +277,16 @@ class PatchInstaller(object):
 
         patch_installation_successful = True
         maintenance_window_exceeded = False
-        all_packages, all_package_versions = package_manager.get_all_updates(cached=False)
+        inventory_snapshot = package_manager.get_inventory_snapshot()
+        all_packages, all_package_versions = self.query_within_maintenance_window(package_manager.get_all_updates, False) if inventory_snapshot is None else inventory_snapshot['all_updates']
         self.telemetry_writer.write_event("All available packages list: " + str(all_packages), Constants.TelemetryEventLevel.Verbose)
-        self.last_still_needed_packages = list(all_packages)
-        self.last_still_needed_package_versions = list(all_package_versions)
+        self.last_still_needed_updates = PackageSet(all_packages, all_package_versions)
+        all_updates = PackageSet(all_packages, all_package_versions)
 
-        packages, package_versions, install_update_count_in_batch_patching, patch_installation_successful = self.batch_patching(all_packages, all_package_versions,
-                                                                                                                packages, package_versions, maintenance_window,
-                                                                                                                package_manager)
+        if Constants.PackageBatchConfig.PREFETCH_PACKAGES_BEFORE_INSTALLATION:
+            self.prefetch_packages(maintenance_window, package_manager, packages, package_versions)
+
+        packages, package_versions, install_update_count_in_batch_patching, patch_installation_successful = self.batch_patching(all_updates, packages, package_versions, maintenance_window, package_manager)
 
         installed_update_count = install_update_count_in_batch_patching
         attempted_parent_package_install_count_in_batch_patching = self.attempted_parent_package_install_count
@@ -291,8 +303,9 @@ class PatchInstaller(object):
         stopwatch_for_sequential_install_process = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
         stopwatch_for_sequential_install_process.start()
 
+        selected_updates = PackageSet(packages, package_versions)
         for package, version in zip(packages, package_versions):
-            if package not in self.last_still_needed_packages:
+            if package not in self.last_still_needed_updates:
                 self.composite_logger.log("The following package is already installed, it could have been installed as dependent package of some other package: " + package)
                 self.attempted_parent_package_install_count += 1
                 self.successful_parent_package_install_count += 1
@@ -306,7 +319,7 @@ class PatchInstaller(object):
 
             # maintenance window check
             remaining_time = maintenance_window.get_remaining_time_in_minutes()
-            if maintenance_window.is_package_install_time_available(package_manager, remaining_time, number_of_packages_in_batch=1) is False:
+            if maintenance_window.is_package_install_time_available(package_manager, remaining_time, number_of_packages_in_batch=1, packages_in_batch=[package]) is False:
                 error_msg = "Stopped patch installation as it is past the maintenance window cutoff time."
                 self.composite_logger.log_error("\n" + error_msg)
                 self.status_handler.add_error_to_status(error_msg, Constants.PatchOperationErrorCodes.DEFAULT_ERROR)
@@ -325,13 +338,13 @@ class PatchInstaller(object):
             package_and_dependencies = [package]
             package_and_dependency_versions = [version]
             
-            self.include_dependencies(package_manager, [package], [version], all_packages, all_package_versions, packages, package_versions, package_and_dependencies, package_and_dependency_versions)
+            self.include_dependencies(package_manager, [package], [version], all_updates, selected_updates, package_and_dependencies, package_and_dependency_versions)
 
             # parent package install (+ dependencies) and parent package result management
             install_result = package_manager.install_update_and_dependencies_and_get_status(package_and_dependencies, package_and_dependency_versions, simulate)
 
             # Update reboot pending status in status_handler
-            self.status_handler.set_reboot_pending(self.package_manager.is_reboot_pending())
+            self.status_handler.set_reboot_pending(self.query_within_maintenance_window(self.package_manager.is_reboot_pending))
 
             if install_result == Constants.FAILED:
                 self.status_handler.set_package_install_status(package_manager.get_product_name(str(package_and_dependencies[0])), str(package_and_dependency_versions[0]), Constants.FAILED)
@@ -340,26 +353,23 @@ class PatchInstaller(object):
             elif install_result == Constants.INSTALLED:
                 self.status_handler.set_package_install_status(package_manager.get_product_name(str(package_and_dependencies[0])), str(package_and_dependency_versions[0]), Constants.INSTALLED)
                 self.successful_parent_package_install_count += 1
-                if package in self.last_still_needed_packages:
-                    index = self.last_still_needed_packages.index(package)
-                    self.last_still_needed_packages.pop(index)
-                    self.last_still_needed_package_versions.pop(index)
+                if self.last_still_needed_updates.remove(package) is not None:
                     installed_update_count += 1
             self.attempted_parent_package_install_count += 1
 
             number_of_dependencies_installed = 0
             number_of_dependencies_failed = 0
-            # dependency package result management
-            for dependency, dependency_version in zip(package_and_dependencies, package_and_dependency_versions):
-                if dependency not in self.last_still_needed_packages or dependency == package:
+            # dependency package result management - install state of all dependencies still needed is checked in one go
+            dependencies_to_check = [(dependency, dependency_version) for dependency, dependency_version in zip(package_and_dependencies, package_and_dependency_versions) if dependency in self.last_still_needed_updates and dependency != package]
+            dependencies_installed = package_manager.are_package_versions_installed([dependency for dependency, dependency_version in dependencies_to_check], [dependency_version for dependency, dependency_version in dependencies_to_check])
+            for (dependency, dependency_version), is_dependency_installed in zip(dependencies_to_check, dependencies_installed):
+                if dependency not in self.last_still_needed_updates:
                     continue
 
-                if package_manager.is_package_version_installed(dependency, dependency_version):
+                if is_dependency_installed:
                     self.composite_logger.log_debug(" - Marking dependency as succeeded: " + str(dependency) + "(" + str(dependency_version) + ")")
                     self.status_handler.set_package_install_status(package_manager.get_product_name(str(dependency)), str(dependency_version), Constants.INSTALLED)
-                    index = self.last_still_needed_packages.index(dependency)
-                    self.last_still_needed_packages.pop(index)
-                    self.last_still_needed_package_versions.pop(index)
+                    self.last_still_needed_updates.remove(dependency)
                     installed_update_count += 1
                     number_of_dependencies_installed += 1
                 else:
@@ -395,6 +405,24 @@ class PatchInstaller(object):
 
         return installed_update_count, patch_installation_successful, maintenance_window_exceeded
 
+    def prefetch_packages(self, maintenance_window, package_manager, packages, package_versions):
+        """ Downloads all packages selected for installation ahead of the install batches, if the maintenance window allows for it """
+        if len(packages) == 0:
+            return
+
+        remaining_time = maintenance_window.get_remaining_time_in_minutes()
+        if maintenance_window.is_package_install_time_available(package_manager, remaining_time, len(packages), packages) is False:
+            self.composite_logger.log_debug("Skipping package prefetch as the maintenance window does not allow for installing all packages in one batch. [RemainingTimeInMins={0}]".format(str(remaining_time)))
+            return
+
+        stopwatch_for_prefetch = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
+        stopwatch_for_prefetch.start()
+        self.composite_logger.log("\nDownloading " + str(len(packages)) + " packages ahead of installation...")
+        code = package_manager.download_updates(packages, package_versions)
+
+        prefetch_perf_log = "[{0}={1}][{2}={3}][{4}={5}]".format(Constants.PerfLogTrackerParams.TASK, "PrefetchPackages", "PackageCount", str(len(packages)), "Code", str(code))
+        stopwatch_for_prefetch.stop_and_write_telemetry(prefetch_perf_log)
+
     def log_final_metrics(self, maintenance_window, patch_installation_successful, maintenance_window_exceeded, installed_update_count):
         """
         logs the final metrics.
@@ -416,83 +444,52 @@ class PatchInstaller(object):
             self.status_handler.add_error_to_status(message, Constants.PatchOperationErrorCodes.OPERATION_FAILED)
             self.composite_logger.log_error(message)
 
-    def include_dependencies(self, package_manager, packages_in_batch, package_versions_in_batch, all_packages, all_package_versions, packages, package_versions, package_and_dependencies, package_and_dependency_versions):
+    def include_dependencies(self, package_manager, packages_in_batch, package_versions_in_batch, all_updates, selected_updates, package_and_dependencies, package_and_dependency_versions):
         """
         Add dependent packages in the list of packages to install i.e. package_and_dependencies.
         
         Parameters:
         package_manager (PackageManager): Package manager used.
         packages_in_batch (List of strings): List of packages to be installed in the current batch.
-        all_packages (List of strings): List of all available packages to install.
-        all_package_versions (List of strings): Versions of packages in all_packages.
-        packages (List of strings): List of all packages selected by user to install.
-        package_versions (List of strings): Versions of packages in packages list.
+        all_updates (PackageSet): All available packages to install, with their versions.
+        selected_updates (PackageSet): All packages selected by user to install, with their versions.
         package_and_dependencies (List of strings): List of packages selected by user along with packages they are dependent on. The input package_and_dependencies 
                                                     does not contain dependent packages. The dependent packages are added in the list in this function.
         package_and_dependency_versions (List of strings): Versions of packages in package_and_dependencies. Input list does not contain versions of the dependent packages.
                                                            The version of dependent packages are added in the list in this function.
         """
-        dependencies = package_manager.get_dependent_list(package_and_dependencies)
+        if len(package_and_dependencies) == 1 and package_and_dependencies[0] in self.dependency_graph:
+            # already resolved while evaluating exclusions, only dependencies that have not been installed since are still relevant
+            dependencies = [dependency for dependency in self.dependency_graph[package_and_dependencies[0]] if self.last_still_needed_updates is None or dependency in self.last_still_needed_updates]
+            self.composite_logger.log_debug("Reusing resolved dependencies for package '{0}': {1}".format(str(package_and_dependencies[0]), str(dependencies)))
+        else:
+            dependencies = self.query_within_maintenance_window(package_manager.get_dependent_list, package_and_dependencies)
 
         for dependency in dependencies:
-            if dependency not in all_packages:
+            if dependency not in all_updates:
                 continue
             package_and_dependencies.append(dependency)
-            version = all_package_versions[all_packages.index(dependency)] if dependency in all_packages else Constants.DEFAULT_UNSPECIFIED_VALUE
-            package_and_dependency_versions.append(version)
+            package_and_dependency_versions.append(all_updates.get_version(dependency))
 
         for package, version in zip(packages_in_batch, package_versions_in_batch):
-            package_manager.add_arch_dependencies(package_manager, package, version, packages, package_versions, package_and_dependencies, package_and_dependency_versions)
+            package_manager.add_arch_dependencies(package_manager, package, version, selected_updates, package_and_dependencies, package_and_dependency_versions)
 
-        package_and_dependencies, package_and_dependency_versions = package_manager.dedupe_update_packages(package_and_dependencies, package_and_dependency_versions)
+        package_and_dependencies[:], package_and_dependency_versions[:] = package_manager.dedupe_update_packages(package_and_dependencies, package_and_dependency_versions)
 
         self.composite_logger.log("Packages including dependencies are: " + str(package_and_dependencies))
 
-    def batch_patching(self, all_packages, all_package_versions, packages, package_versions, maintenance_window, package_manager):
+    def batch_patching(self, all_updates, packages, package_versions, maintenance_window, package_manager):
         stopwatch_for_batch_install_process = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
         stopwatch_for_batch_install_process.start()
 
-        total_packages_to_install_count = len(packages)
-        maintenance_window_batch_cutoff_reached = False
-        max_batch_size_for_packages = self.get_max_batch_size(maintenance_window, package_manager)
         installed_update_count_in_batch_patching = 0
         patch_installation_successful_in_batch_patching = True
+        maintenance_window_batch_cutoff_reached = False
 
-        for phase in range(Constants.PackageBatchConfig.MAX_PHASES_FOR_BATCH_PATCHING):
-            if len(packages) == 0:
-                break
-
-            if max_batch_size_for_packages <= 0:
-                maintenance_window_batch_cutoff_reached = True
-                break
-
-            stopwatch_for_phase = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
-            stopwatch_for_phase.start()
-
-            installed_update_count, patch_installation_successful, maintenance_window_batch_cutoff_reached, packages, package_versions = self.install_packages_in_batches(
-                all_packages, all_package_versions, packages, package_versions, maintenance_window, package_manager, max_batch_size_for_packages)
-
-            installed_update_count_in_batch_patching += installed_update_count
-
-            if patch_installation_successful is False:
-                patch_installation_successful_in_batch_patching = False
-
-            stopwatch_for_phase.stop()
-
-            batch_phase_processing_perf_log = "[{0}={1}][{2}={3}][{4}={5}][{6}={7}][{8}={9}][{10}={11}][{12}={13}][{14}={15}]".format(Constants.PerfLogTrackerParams.TASK, "InstallPackagesInBatchInDifferentPhases", 
-                                         "Phase", str(phase), "InstalledPackagesCount", str(installed_update_count), "SuccessfulParentPackageInstallCount", self.successful_parent_package_install_count, "FailedParentPackageInstallCount",
-                                         self.failed_parent_package_install_count, "RemainingPackagesToInstall", str(len(packages)), Constants.PerfLogTrackerParams.PATCH_OPERATION_SUCCESSFUL, str(patch_installation_successful),
-                                         "IsMaintenanceWindowBatchCutoffReached", str(maintenance_window_batch_cutoff_reached))
-
-            stopwatch_for_phase.write_telemetry_for_stopwatch(str(batch_phase_processing_perf_log))
-
-            max_batch_size_for_packages = int(max_batch_size_for_packages / Constants.PackageBatchConfig.BATCH_SIZE_DECAY_FACTOR)
-
-            if total_packages_to_install_count < max_batch_size_for_packages:
-                # All the packages will be attempted in single batch as max batch size is larger than total packages.
-                # All packages are already attempted in single batch as max batch size was higher than total packages in the last phase also.
-                # Avoiding same packages in a single batch again as the chances of failures is high.
-                break
+        if len(packages) > 0:
+            batch_size_controller = BatchSizeController(self.composite_logger, package_manager.get_package_install_expected_avg_time_in_seconds(packages))
+            installed_update_count_in_batch_patching, patch_installation_successful_in_batch_patching, maintenance_window_batch_cutoff_reached, packages, package_versions = self.install_packages_in_batches(
+                all_updates, packages, package_versions, maintenance_window, package_manager, batch_size_controller)
 
         stopwatch_for_batch_install_process.stop()
 
@@ -506,48 +503,43 @@ class PatchInstaller(object):
 
         return packages, package_versions, installed_update_count_in_batch_patching, patch_installation_successful_in_batch_patching
 
-    def install_packages_in_batches(self, all_packages, all_package_versions, packages, package_versions, maintenance_window, package_manager, max_batch_size_for_packages, simulate=False):
+    def install_packages_in_batches(self, all_updates, packages, package_versions, maintenance_window, package_manager, batch_size_controller, simulate=False):
         """
-        Install packages in batches.
-        
+        Install packages in batches. Each new batch is sized by the batch size controller from the time left in the maintenance window and the outcomes of the
+        batches so far. The failed packages of a batch are bisected and retried in smaller batches, until each failure is isolated to a single package.
+
         Parameters:
-        
-        all_packages (List of strings): List of all available packages to install.
-        all_package_versions (List of strings): Versions of the packages in the list all_packages.
+
+        all_updates (PackageSet): All available packages to install, with their versions.
         packages (List of strings): List of all packages selected by user to install.
         package_versions (List of strings): Versions of packages in the list packages.
         maintenance_window (MaintenanceWindow): Maintenance window for the job.
         package_manager (PackageManager): Package manager used.
-        max_batch_size_for_packages (Integer): Maximum batch size.
+        batch_size_controller (BatchSizeController): Sizes the batches from observed outcomes.
         simulate (bool): Whether this function is called from a test run.
-        
+
         Returns:
         installed_update_count (int): Number of packages installed through installing packages in batches.
         patch_installation_successful (bool): Whether package installation succeeded for all attempted packages.
         maintenance_window_batch_cutoff_reached (bool): Whether process of installing packages in batches stopped due to not enough time in maintenance window
                                                         to install packages in batch.
-        not_attempted_and_failed_packages (List of strings): List of packages which are (a) Not attempted due to not enough time in maintenance window to install in batch. 
-                                                             (b) Failed to install in batch patching.
-        not_attempted_and_failed_package_versions (List of strings): Versions of packages in the list not_attempted_and_failed_packages.
-        
+        not_attempted_packages (List of strings): List of packages not attempted, or whose failure in a batch was not isolated yet, due to not enough time
+                                                  in maintenance window to install them in batch.
+        not_attempted_package_versions (List of strings): Versions of packages in the list not_attempted_packages.
         """
-        number_of_batches = int(math.ceil(len(packages) / float(max_batch_size_for_packages)))
-        self.composite_logger.log("\nDividing package install in batches. \nNumber of packages to be installed: " + str(len(packages)) + "\nBatch Size: " + str(max_batch_size_for_packages) + "\nNumber of batches: " + str(number_of_batches))
+        self.composite_logger.log("\nInstalling packages in batches. Number of packages to be installed: " + str(len(packages)))
         installed_update_count = 0
         patch_installation_successful = True
         maintenance_window_batch_cutoff_reached = False
 
-        # remaining_packages are the packages which are not attempted to install due to there is not enough remaining time in maintenance window to install packages in batches.
-        # These packages will be attempted in sequential installation if there is enough time in maintenance window to install package sequentially.
-        remaining_packages = []
-        remaining_package_versions = []
-        
-        # failed_packages are the packages which are failed to install in batch patching. These packages will be attempted again in sequential patching if there is 
-        # enough time remaining in maintenance window.
-        failed_packages = []
-        failed_package_versions = []
+        selected_updates = PackageSet(packages, package_versions)
+        not_attempted_packages = []
+        not_attempted_package_versions = []
+        next_package_index = 0          # packages before this index have been placed in a batch
+        batches_to_retry = []           # stack of (packages, package_versions) of failed packages, bisected out of a failed batch
+        batch_index = 0
 
-        for batch_index in range(0, number_of_batches):
+        while next_package_index < len(packages) or len(batches_to_retry) > 0:
             per_batch_installation_stopwatch = Stopwatch(self.env_layer, self.telemetry_writer, self.composite_logger)
             per_batch_installation_stopwatch.start()
 
@@ -555,73 +547,82 @@ class PatchInstaller(object):
             if self.lifecycle_manager is not None:
                 self.lifecycle_manager.lifecycle_status_check()
 
-            begin_index = batch_index * max_batch_size_for_packages
-            end_index = begin_index + max_batch_size_for_packages - 1
-            end_index = min(end_index, len(packages) - 1)
-
-            packages_in_batch = []
-            package_versions_in_batch = []
-            already_installed_packages = []
+            is_retry_batch = len(batches_to_retry) > 0
+            if is_retry_batch:
+                packages_in_batch, package_versions_in_batch = batches_to_retry.pop()
+            else:
+                batch_size = batch_size_controller.get_batch_size(self.get_max_batch_size(maintenance_window, package_manager, batch_size_controller.package_install_time_in_secs))
+                if batch_size <= 0:
+                    self.composite_logger.log("Stopped installing packages in batches as the maintenance window does not allow for another batch.")
+                    maintenance_window_batch_cutoff_reached = True
+                    break
 
-            for index in range(begin_index, end_index + 1):
-                if packages[index] not in self.last_still_needed_packages:
-                    # Could have got installed as dependent package of some other package. Package installation status could also have been set.
-                    already_installed_packages.append(packages[index])
-                    self.attempted_parent_package_install_count += 1
-                    self.successful_parent_package_install_count += 1
-                else:
-                    packages_in_batch.append(packages[index])
-                    package_versions_in_batch.append(package_versions[index])
+                packages_in_batch = []
+                package_versions_in_batch = []
+                already_installed_packages = []
+                for package, version in zip(packages[next_package_index:next_package_index + batch_size], package_versions[next_package_index:next_package_index + batch_size]):
+                    if package not in self.last_still_needed_updates:
+                        # Could have got installed as dependent package of some other package. Package installation status could also have been set.
+                        already_installed_packages.append(package)
+                        self.attempted_parent_package_install_count += 1
+                        self.successful_parent_package_install_count += 1
+                    else:
+                        packages_in_batch.append(package)
+                        package_versions_in_batch.append(version)
+                next_package_index += batch_size
 
-            if len(already_installed_packages) > 0:
-                self.composite_logger.log("Following packages are already installed. Could have got installed as dependent package of some other package " + str(already_installed_packages))
+                if len(already_installed_packages) > 0:
+                    self.composite_logger.log("Following packages are already installed. Could have got installed as dependent package of some other package " + str(already_installed_packages))
 
-            if len(packages_in_batch) == 0:
-                continue
+                if len(packages_in_batch) == 0:
+                    continue
 
             remaining_time = maintenance_window.get_remaining_time_in_minutes()
 
-            if maintenance_window.is_package_install_time_available(package_manager, remaining_time, len(packages_in_batch)) is False:
+            if maintenance_window.is_package_install_time_available(package_manager, remaining_time, len(packages_in_batch), packages_in_batch) is False:
                 self.composite_logger.log("Stopped installing packages in batches as it is past the maintenance window cutoff time for installing in batches." +
                                            " Batch Index: {0}, remaining time: {1}, number of packages in batch: {2}".format(batch_index, remaining_time, str(len(packages_in_batch))))
                 maintenance_window_batch_cutoff_reached = True
-                remaining_packages = packages[begin_index:]
-                remaining_package_versions = package_versions[begin_index:]
+                if is_retry_batch:
+                    batches_to_retry.append((packages_in_batch, package_versions_in_batch))
+                else:
+                    not_attempted_packages, not_attempted_package_versions = packages_in_batch, package_versions_in_batch
                 break
 
             # point in time status
             progress_status = self.progress_template.format(str(datetime.timedelta(minutes=remaining_time)), str(self.attempted_parent_package_install_count), str(self.successful_parent_package_install_count), str(self.failed_parent_package_install_count), str(installed_update_count - self.successful_parent_package_install_count),
-                                                            "Processing batch index: " + str(batch_index) + ", Number of packages: " + str(len(packages_in_batch)) + "\nProcessing packages: " + str(packages_in_batch))
+                                                            "Processing batch index: " + str(batch_index) + ", Number of packages: " + str(len(packages_in_batch)) + (" (retry of failed packages)" if is_retry_batch else "") + "\nProcessing packages: " + str(packages_in_batch))
             self.composite_logger.log(progress_status)
 
             # package_and_dependencies initially conains only packages in batch. The dependencies are added in the list by method include_dependencies
             package_and_dependencies = list(packages_in_batch)
             package_and_dependency_versions = list(package_versions_in_batch)
 
-            self.include_dependencies(package_manager, packages_in_batch, package_versions_in_batch, all_packages, all_package_versions, packages, package_versions, package_and_dependencies, package_and_dependency_versions)
+            self.include_dependencies(package_manager, packages_in_batch, package_versions_in_batch, all_updates, selected_updates, package_and_dependencies, package_and_dependency_versions)
 
             parent_packages_installed_in_batch_count = 0
-            parent_packages_failed_in_batch_count = 0
             number_of_dependencies_installed = 0
             number_of_dependencies_failed = 0
+            failed_packages_in_batch = []
+            failed_package_versions_in_batch = []
 
             code, out, exec_cmd = package_manager.install_update_and_dependencies(package_and_dependencies, package_and_dependency_versions, simulate)
 
-            for package,version in zip(package_and_dependencies, package_and_dependency_versions):
+            for package, version in zip(package_and_dependencies, package_and_dependency_versions):
                 install_result = package_manager.get_installation_status(code, out, exec_cmd, package, version, simulate)
 
                 if install_result == Constants.FAILED:
                     if package in packages_in_batch:
-                        # parent package
-                        self.status_handler.set_package_install_status(package_manager.get_product_name(str(package)), str(version), Constants.FAILED)
-                        self.failed_parent_package_install_count += 1
-                        patch_installation_successful = False
-                        parent_packages_failed_in_batch_count += 1
-                        failed_packages.append(package)
-                        failed_package_versions.append(version)
+                        # parent package - only a failure of its own once isolated, otherwise it may have failed due to another package in the batch
+                        failed_packages_in_batch.append(package)
+                        failed_package_versions_in_batch.append(version)
+                        if len(packages_in_batch) == 1:
+                            self.status_handler.set_package_install_status(package_manager.get_product_name(str(package)), str(version), Constants.FAILED)
+                            self.failed_parent_package_install_count += 1
+                            patch_installation_successful = False
                     else:
                         # dependent package
-                        number_of_dependencies_failed +=1
+                        number_of_dependencies_failed += 1
                 elif install_result == Constants.INSTALLED:
                     self.status_handler.set_package_install_status(package_manager.get_product_name(str(package)), str(version), Constants.INSTALLED)
                     if package in packages_in_batch:
@@ -632,38 +633,48 @@ class PatchInstaller(object):
                         # dependent package
                         number_of_dependencies_installed += 1
 
-                    if package in self.last_still_needed_packages:
-                        index = self.last_still_needed_packages.index(package)
-                        self.last_still_needed_packages.pop(index)
-                        self.last_still_needed_package_versions.pop(index)
+                    if self.last_still_needed_updates.remove(package) is not None:
                         installed_update_count += 1
 
-            self.attempted_parent_package_install_count += len(packages_in_batch)
+            if not is_retry_batch:
+                self.attempted_parent_package_install_count += len(packages_in_batch)
+
+            per_batch_installation_stopwatch.stop()
+            batch_size_controller.record_batch_outcome(len(packages_in_batch), per_batch_installation_stopwatch.time_taken_in_secs, 0 if is_retry_batch else len(packages_in_batch),
+                                                       len(failed_packages_in_batch) if len(packages_in_batch) == 1 else 0)
+
+            # bisect the failed packages of a batch to isolate the packages failing on their own, instead of retrying them one by one
+            if len(packages_in_batch) > 1 and len(failed_packages_in_batch) > 0:
+                split_index = (len(failed_packages_in_batch) + 1) // 2
+                if len(failed_packages_in_batch) > 1:
+                    batches_to_retry.append((failed_packages_in_batch[split_index:], failed_package_versions_in_batch[split_index:]))
+                batches_to_retry.append((failed_packages_in_batch[:split_index], failed_package_versions_in_batch[:split_index]))
 
             # Update reboot pending status in status_handler
-            self.status_handler.set_reboot_pending(self.package_manager.is_reboot_pending())
+            self.status_handler.set_reboot_pending(self.query_within_maintenance_window(self.package_manager.is_reboot_pending))
 
             # dependency package result management fallback (not reliable enough to be used as primary, and will be removed; remember to retain last_still_needed refresh when you do that)
             installed_update_count += self.perform_status_reconciliation_conditionally(package_manager, condition=(self.attempted_parent_package_install_count % Constants.PACKAGE_STATUS_REFRESH_RATE_IN_SECONDS == 0))  # reconcile status after every 10 attempted installs
 
-            per_batch_install_perf_log = "[{0}={1}][{2}={3}][{4}={5}][{6}={7}][{8}={9}][{10}={11}][{12}={13}][{14}={15}]".format(Constants.PerfLogTrackerParams.TASK, "InstallBatchOfPackages",
+            per_batch_install_perf_log = "[{0}={1}][{2}={3}][{4}={5}][{6}={7}][{8}={9}][{10}={11}][{12}={13}][{14}={15}][{16}={17}]".format(Constants.PerfLogTrackerParams.TASK, "InstallBatchOfPackages",
                                          "PackagesInBatch", str(packages_in_batch), "PackageAndDependencies", str(package_and_dependencies), "PackageAndDependencyVersions", str(package_and_dependency_versions),
-                                         "NumberOfParentPackagesInstalled", str(parent_packages_installed_in_batch_count), "NumberOfParentPackagesFailed", str(parent_packages_failed_in_batch_count),
-                                         "NumberOfDependenciesInstalled", str(number_of_dependencies_installed), "NumberOfDependenciesFailed", str(number_of_dependencies_failed))
+                                         "NumberOfParentPackagesInstalled", str(parent_packages_installed_in_batch_count), "NumberOfParentPackagesFailed", str(len(failed_packages_in_batch)),
+                                         "NumberOfDependenciesInstalled", str(number_of_dependencies_installed), "NumberOfDependenciesFailed", str(number_of_dependencies_failed), "IsRetryOfFailedPackages", str(is_retry_batch))
 
-            per_batch_installation_stopwatch.stop_and_write_telemetry(str(per_batch_install_perf_log))
+            per_batch_installation_stopwatch.write_telemetry_for_stopwatch(str(per_batch_install_perf_log))
+            batch_index += 1
 
         # Performing reconciliation at the end to get accurate number of installed packages through this function.
         installed_update_count += self.perform_status_reconciliation_conditionally(package_manager, True)
 
-        # not_attempted_and_failed_packages is the list of packages including two kind of packages:
-        # (a) Not attempted due to not enough time in maintenance window to install packages in batches.
-        # (b) Failed to install in batch patching.
-        # These packages are attempted in the sequential patching if there is enough time remaining in maintenance window. The non attempted packages are in
-        # the front of the list than failed packages and hence non attempated packages are attempted first in sequential patching than the failed packages.
-        not_attempted_and_failed_packages = remaining_packages + failed_packages
-        not_attempted_and_failed_package_versions = remaining_package_versions + failed_package_versions
-        return installed_update_count, patch_installation_successful, maintenance_window_batch_cutoff_reached, not_attempted_and_failed_packages, not_attempted_and_failed_package_versions
+        # Packages not attempted due to not enough time in maintenance window to install packages in batches are attempted in the sequential patching if there is
+        # enough time remaining in maintenance window. Packages not attempted yet are in front of the packages whose failure in a batch was not isolated yet.
+        not_attempted_packages += packages[next_package_index:]
+        not_attempted_package_versions += package_versions[next_package_index:]
+        for packages_to_retry, package_versions_to_retry in reversed(batches_to_retry):
+            not_attempted_packages += packages_to_retry
+            not_attempted_package_versions += package_versions_to_retry
+        return installed_update_count, patch_installation_successful, maintenance_window_batch_cutoff_reached, not_attempted_packages, not_attempted_package_versions
 
     def mark_installation_completed(self):
         """ Marks Installation operation as completed by updating the status of PatchInstallationSummary as success and patch metadata to be sent to healthstore.
@@ -690,6 +701,20 @@ class PatchInstaller(object):
                 report_to_healthstore=True,
                 wait_after_update=False)
 
+    def query_within_maintenance_window(self, query_function, *args):
+        """ Runs a read-only package manager query or simulation, terminating its commands if they are still running when the maintenance window ends.
+            Once the maintenance window has ended, the query is not run and patch installation stops as the maintenance window was exceeded. """
+        try:
+            return self.env_layer.run_within_command_deadline(query_function, *args)
+        except Exception as error:
+            if Constants.EnvLayer.COMMAND_DEADLINE_PASSED not in repr(error):
+                raise
+            error_msg = "Stopped patch installation as the maintenance window was exceeded."
+            self.composite_logger.log_error("\n" + error_msg)
+            self.status_handler.add_error_to_status(error_msg, Constants.PatchOperationErrorCodes.DEFAULT_ERROR)
+            self.status_handler.set_maintenance_window_exceeded(True)
+            raise Exception(error_msg, "[{0}]".format(Constants.ERROR_ADDED_TO_STATUS))
+
     # region Installation Progress support
     def perform_status_reconciliation_conditionally(self, package_manager, condition=True):
         """Periodically based on the condition check, writes out success records as required; returns count of detected installs.
@@ -701,17 +726,11 @@ class PatchInstaller(object):
 
         self.composite_logger.log_verbose("\nStarting status reconciliation...")
         start_time = time.time()
-        still_needed_packages, still_needed_package_versions = package_manager.get_all_updates(cached=False)  # do not use cache
-        successful_packages = []
-        successful_package_versions = []
-        for i in range(0, len(self.last_still_needed_packages)):
-            if self.last_still_needed_packages[i] not in still_needed_packages:
-                successful_packages.append(self.last_still_needed_packages[i])
-                successful_package_versions.append(self.last_still_needed_package_versions[i])
+        still_needed_updates = PackageSet(*self.query_within_maintenance_window(package_manager.get_all_updates, False))  # do not use cache
+        successful_packages, successful_package_versions = self.last_still_needed_updates.difference(still_needed_updates).get_packages_and_versions()
 
         self.status_handler.set_package_install_status(successful_packages, successful_package_versions, Constants.INSTALLED)
-        self.last_still_needed_packages = still_needed_packages
-        self.last_still_needed_package_versions = still_needed_package_versions
+        self.last_still_needed_updates = still_needed_updates
         self.composite_logger.log_verbose("Completed status reconciliation. Time taken: " + str(time.time() - start_time) + " seconds.")
         return len(successful_packages)
     # endregion
@@ -720,13 +739,8 @@ class PatchInstaller(object):
     def get_not_included_updates(self, package_manager, included_packages):
         """Returns the list of updates not included given any list of packages that will be included"""
         self.composite_logger.log_debug("\nEvaluating for 'not included' packages...")
-        all_packages, all_package_versions = package_manager.get_all_updates(cached=True)  # cached is fine
-        not_included_packages = []
-        not_included_package_versions = []
-        for i in range(0, len(all_packages)):
-            if all_packages[i] not in included_packages:
-                not_included_packages.append(all_packages[i])
-                not_included_package_versions.append(all_package_versions[i])
+        all_packages, all_package_versions = self.query_within_maintenance_window(package_manager.get_all_updates, True)  # cached is fine
+        not_included_packages, not_included_package_versions = PackageSet(all_packages, all_package_versions).difference(included_packages).get_packages_and_versions()
 
         self.composite_logger.log_debug(str(len(not_included_packages)) + " out of " + str(len(all_packages)) + " packages will be 'not included'.")
         return not_included_packages, not_included_package_versions
@@ -740,27 +754,50 @@ class PatchInstaller(object):
         if not self.package_filter.is_exclusion_list_present():
             return excluded_packages, excluded_package_versions
 
-        for package, package_version in zip(packages, package_versions):
-            if self.package_filter.check_for_exclusion(package):
-                excluded_packages.append(package)  # package is excluded, no need to check for dependency exclusion
-                excluded_package_versions.append(package_version)
-                continue
+        # packages matching the exclusion list by name are excluded without needing their dependencies
+        packages_to_check_for_dependency_exclusion = [package for package in packages if not self.package_filter.check_for_exclusion(package)]
+        packages_with_excluded_dependencies = set(self.get_packages_with_excluded_dependencies(package_manager, packages_to_check_for_dependency_exclusion))
+        packages_to_check_for_dependency_exclusion = set(packages_to_check_for_dependency_exclusion)
 
-            dependency_list = package_manager.get_dependent_list([package])
-            if dependency_list and self.package_filter.check_for_exclusion(dependency_list):
-                self.composite_logger.log_debug(" - Exclusion list match on dependency list for package '{0}': {1}".format(str(package), str(dependency_list)))
-                excluded_packages.append(package)  # one of the package's dependencies are excluded, so exclude the package
+        for package, package_version in zip(packages, package_versions):
+            if package not in packages_to_check_for_dependency_exclusion or package in packages_with_excluded_dependencies:
+                excluded_packages.append(package)  # either the package or one of its dependencies is excluded
                 excluded_package_versions.append(package_version)
 
         self.composite_logger.log_debug(str(len(excluded_packages)) + " 'excluded' packages were found.")
         return excluded_packages, excluded_package_versions
 
+    def get_packages_with_excluded_dependencies(self, package_manager, packages):
+        """ Returns the packages that have a dependency on the exclusion list.
+            Dependencies are resolved for a group of packages at once, and only groups whose combined dependencies match the exclusion list are split further,
+            so with few exclusions most packages are cleared without a dependency resolution of their own. Packages resolved alone are recorded in the dependency graph. """
+        packages_with_excluded_dependencies = []
+        groups_to_check = [list(packages)] if len(packages) > 0 else []
+        while len(groups_to_check) > 0:
+            group = groups_to_check.pop()
+            dependency_list = self.query_within_maintenance_window(package_manager.get_dependent_list, group)
+            if len(group) == 1:
+                self.dependency_graph[group[0]] = list(dependency_list)
+
+            if not dependency_list or not self.package_filter.check_for_exclusion(dependency_list):
+                continue
+
+            if len(group) == 1:
+                self.composite_logger.log_debug(" - Exclusion list match on dependency list for package '{0}': {1}".format(str(group[0]), str(dependency_list)))
+                packages_with_excluded_dependencies.append(group[0])
+            else:
+                groups_to_check.append(group[len(group) // 2:])
+                groups_to_check.append(group[:len(group) // 2])
+
+        return packages_with_excluded_dependencies
+
     def filter_out_excluded_updates(self, included_packages, included_package_versions, excluded_packages):
         """Returns list of included packages with all the excluded packages removed"""
         self.composite_logger.log_debug("\nFiltering out 'excluded' packages from included packages...")
         new_included_packages = []
         new_included_package_versions = []
 
+        excluded_packages = set(excluded_packages)
         for package, version in zip(included_packages, included_package_versions):
             if package not in excluded_packages:
                 new_included_packages.append(package)
@@ -772,8 +809,8 @@ class PatchInstaller(object):
         return new_included_packages, new_included_package_versions
     # endregion
 
-    def get_max_batch_size(self, maintenance_window, package_manager):
-        """Returns maximum batch size for batch patching as per the time remaining in the maintenance window and time taken to install package by package manager"""
+    def get_max_batch_size(self, maintenance_window, package_manager, package_install_time_in_secs=None):
+        """Returns maximum batch size for batch patching as per the time remaining in the maintenance window and time taken to install package by package manager (or as observed)"""
         available_time_to_install_packages = maintenance_window.get_remaining_time_in_minutes()
 
         if Constants.REBOOT_SETTINGS[self.execution_config.reboot_setting] != Constants.REBOOT_NEVER:
@@ -791,7 +828,7 @@ class PatchInstaller(object):
             max_batch_size_for_packages += 1
 
             # Remaining packages take average expected time to install.
-            package_install_expected_avg_time_in_minutes = package_manager.get_package_install_expected_avg_time_in_seconds() / 60.0
+            package_install_expected_avg_time_in_minutes = (package_manager.get_package_install_expected_avg_time_in_seconds() if package_install_time_in_secs is None else package_install_time_in_secs) / 60.0
             max_batch_size_for_packages += int(math.floor(available_time_to_install_packages / package_install_expected_avg_time_in_minutes))
 
         if max_batch_size_for_packages > Constants.PackageBatchConfig.MAX_BATCH_SIZE_FOR_PACKAGES:
@@ -0,0 +1,87 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+""" Runs independent package manager and system queries concurrently, as per their read/write classification """
+import threading
+import time
+from core.src.bootstrap.Constants import Constants
+
+
+class QueryScheduler(object):
+    """ Read queries start on worker threads as soon as they are scheduled. Write queries run in the calling thread when their result is
+        requested, once all read queries scheduled so far have completed. Read queries must not depend on pending write queries.
+        Queries scheduled from within the command deadline have their commands terminated at the deadline, whichever thread they run in. """
+
+    class Query(object):
+        def __init__(self, name, access, query_function, args):
+            self.name = name
+            self.access = access
+            self.query_function = query_function
+            self.args = args
+            self.thread = None
+            self.completed = False
+            self.result = None
+            self.error = None
+            self.time_taken_in_secs = None
+
+        def run(self, scope_function=None):
+            start_time = time.time()
+            try:
+                self.result = self.query_function(*self.args) if scope_function is None else scope_function(self.query_function, *self.args)
+            except Exception as error:
+                self.error = error
+            self.time_taken_in_secs = time.time() - start_time
+            self.completed = True
+
+    def __init__(self, env_layer, composite_logger, max_concurrent_read_queries=Constants.MAX_CONCURRENT_READ_QUERIES):
+        self.env_layer = env_layer
+        self.composite_logger = composite_logger
+        self.__read_query_slots = threading.Semaphore(max_concurrent_read_queries)
+        self.__read_queries = []
+
+    def schedule(self, name, access, query_function, *args):
+        """ Schedules query_function(*args) and returns the query, whose result is obtained through get_result """
+        query = self.Query(name, access, query_function, args)
+        if access == Constants.QueryAccess.READ:
+            query.thread = threading.Thread(target=self.__run_read_query, args=(query, self.env_layer.is_within_command_deadline()))
+            query.thread.daemon = True
+            query.thread.start()
+            self.__read_queries.append(query)
+        self.composite_logger.log_verbose("[QS] Query scheduled. [Name={0}][Access={1}]".format(name, access))
+        return query
+
+    def get_result(self, query):
+        """ Waits for the query to complete and returns its result, raising any error the query raised """
+        if query.access == Constants.QueryAccess.READ:
+            query.thread.join()
+        elif not query.completed:
+            self.wait_for_read_queries()
+            query.run()
+
+        self.composite_logger.log_debug("[QS] Query completed. [Name={0}][Access={1}][TimeTakenInSecs={2}][Error={3}]".format(query.name, query.access, str(round(query.time_taken_in_secs, 3)), repr(query.error)))
+        if query.error is not None:
+            raise query.error
+        return query.result
+
+    def wait_for_read_queries(self):
+        """ Waits for all read queries scheduled so far to complete """
+        for query in self.__read_queries:
+            query.thread.join()
+        self.__read_queries = []
+
+    def __run_read_query(self, query, within_command_deadline):
+        with self.__read_query_slots:
+            query.run(self.env_layer.run_within_command_deadline if within_command_deadline else None)
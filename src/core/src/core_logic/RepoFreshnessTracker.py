@@ -0,0 +1,74 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+"""Repository freshness tracking, to skip redundant repository refreshes"""
+import glob
+import os
+from core.src.bootstrap.Constants import Constants
+
+
+class RepoFreshnessTracker(object):
+    """ Records when each source set (the machine's sources, or a set of custom sources) was last refreshed, with the fingerprint of its source
+        configuration and package lists/cache at that time. A source set is fresh until the TTL elapses or any of those files change, which includes
+        a refresh of another source set rewriting the shared package lists. """
+
+    def __init__(self, env_layer, composite_logger, ttl_in_minutes=Constants.REPO_REFRESH_TTL_IN_MINUTES):
+        self.env_layer = env_layer
+        self.composite_logger = composite_logger
+        self.ttl_in_minutes = ttl_in_minutes
+        self.__refreshes = {}   # source set -> (refresh time, fingerprint)
+
+    def is_fresh(self, source_set, fingerprint_paths):
+        """ Returns whether the source set was refreshed within the TTL, with its source configuration and package lists/cache unchanged since """
+        if source_set not in self.__refreshes:
+            return False
+
+        refresh_time, fingerprint = self.__refreshes[source_set]
+        age_in_minutes = self.env_layer.datetime.total_minutes_from_time_delta(self.env_layer.datetime.datetime_utcnow() - refresh_time)
+        if age_in_minutes < 0 or age_in_minutes >= self.ttl_in_minutes:
+            self.composite_logger.log_debug("[RFT] Repository refresh has expired. [SourceSet={0}][AgeInMins={1}]".format(source_set, str(round(age_in_minutes, 2))))
+            return False
+
+        if fingerprint != self.get_fingerprint(fingerprint_paths):
+            self.composite_logger.log_debug("[RFT] Sources or package lists changed since the last repository refresh. [SourceSet={0}]".format(source_set))
+            return False
+
+        return True
+
+    def record_refresh(self, source_set, fingerprint_paths):
+        """ Records a completed refresh of the source set. Refreshes whose files cannot be fingerprinted are not tracked. """
+        fingerprint = self.get_fingerprint(fingerprint_paths)
+        if fingerprint is None:
+            self.__refreshes.pop(source_set, None)
+            return
+        self.__refreshes[source_set] = (self.env_layer.datetime.datetime_utcnow(), fingerprint)
+
+    def invalidate(self):
+        """ Forgets all refreshes, so the next refresh of any source set goes through """
+        self.__refreshes = {}
+
+    @staticmethod
+    def get_fingerprint(path_patterns):
+        """ Returns (path, mtime, size) of the files matching path_patterns, or None if none of them are present """
+        fingerprint = []
+        for path_pattern in path_patterns:
+            for path in sorted(glob.glob(path_pattern)):
+                try:
+                    file_stat = os.stat(path)
+                    fingerprint.append((path, file_stat.st_mtime, file_stat.st_size))
+                except (IOError, OSError):
+                    continue
+        return tuple(fingerprint) if len(fingerprint) > 0 else None
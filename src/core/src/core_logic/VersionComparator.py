@@ -17,6 +17,8 @@ import re
 
 
 class VersionComparator(object):
+    DEBIAN_VERSION_RUNS_PATTERN = re.compile(r'(\D*)(\d*)')    # alternating non-digit and digit runs of a Debian version part
+    RPM_VERSION_SEGMENT_PATTERN = re.compile(r'[^a-zA-Z0-9~^]*(~|\^|[0-9]+|[a-zA-Z]+|$)')    # separators, then one segment of an rpm version part
 
     def compare_versions(self, version_a, version_b):
         # type (str, str) -> int
@@ -35,6 +37,33 @@ class VersionComparator(object):
         # If equal 27.13.4 vs 27.13.4, return 0
         return (len(parse_version_a) > len(parse_version_b)) - (len(parse_version_a) < len(parse_version_b))
 
+    @staticmethod
+    def compare_debian_versions(version_a, version_b):
+        # type (str, str) -> int
+        """ Compare two Debian package versions ([epoch:]upstream_version[-debian_revision]) the way dpkg does, return -1 (less), +1 (greater), 0 (equal).
+            Reference: man deb-version """
+        epoch_a, upstream_a, revision_a = VersionComparator.__split_debian_version(version_a)
+        epoch_b, upstream_b, revision_b = VersionComparator.__split_debian_version(version_b)
+        if epoch_a != epoch_b:
+            return 1 if epoch_a > epoch_b else -1
+        result = VersionComparator.__compare_debian_version_parts(upstream_a, upstream_b)
+        return result if result != 0 else VersionComparator.__compare_debian_version_parts(revision_a, revision_b)
+
+    @staticmethod
+    def compare_rpm_versions(version_a, version_b):
+        # type (str, str) -> int
+        """ Compare two rpm package versions ([epoch:]version-release) the way rpm does, return -1 (less), +1 (greater), 0 (equal).
+            Reference: rpmvercmp in rpmio/rpmvercmp.c """
+        epoch_a, version_a = version_a.split(':', 1) if ':' in version_a else ('0', version_a)
+        epoch_b, version_b = version_b.split(':', 1) if ':' in version_b else ('0', version_b)
+        epoch_a, epoch_b = int(epoch_a) if epoch_a.isdigit() else 0, int(epoch_b) if epoch_b.isdigit() else 0
+        if epoch_a != epoch_b:
+            return 1 if epoch_a > epoch_b else -1
+        upstream_a, release_a = version_a.rsplit('-', 1) if '-' in version_a else (version_a, str())
+        upstream_b, release_b = version_b.rsplit('-', 1) if '-' in version_b else (version_b, str())
+        result = VersionComparator.__compare_rpm_version_parts(upstream_a, upstream_b)
+        return result if result != 0 or release_a == str() or release_b == str() else VersionComparator.__compare_rpm_version_parts(release_a, release_b)
+
     @staticmethod
     def extract_version_from_os_version_nums(os_version):
         # type (str) -> str
@@ -78,3 +107,75 @@ class VersionComparator(object):
         # type (str) -> [any]
         """ Splits a version into numeric and non-numeric into components list: 27.13.4~18.04.1 -> [27][14][4] """
         return [int(x) if x.isdigit() else x for x in re.split(r'(\d+)', version) if x]
+
+    @staticmethod
+    def __split_debian_version(version):
+        # type (str) -> (int, str, str)
+        """ Splits a Debian package version into epoch, upstream version and revision: 1:2.35-0ubuntu3.7 -> (1, 2.35, 0ubuntu3.7) """
+        epoch, version = version.split(':', 1) if ':' in version else ('0', version)
+        upstream_version, revision = version.rsplit('-', 1) if '-' in version else (version, str())
+        return int(epoch) if epoch.isdigit() else 0, upstream_version, revision
+
+    @staticmethod
+    def __compare_debian_version_parts(part_a, part_b):
+        # type (str, str) -> int
+        """ Compares alternating non-digit and digit runs. In non-digit runs, '~' sorts before anything (even the end of the part) and letters before other characters. """
+        def order(char):
+            if char == '~':
+                return -1
+            if char.isalpha():
+                return ord(char)
+            return ord(char) + 256
+
+        runs_a, runs_b = VersionComparator.DEBIAN_VERSION_RUNS_PATTERN.findall(part_a), VersionComparator.DEBIAN_VERSION_RUNS_PATTERN.findall(part_b)
+        runs_a += [(str(), str())] * (len(runs_b) - len(runs_a))
+        runs_b += [(str(), str())] * (len(runs_a) - len(runs_b))
+        for (chars_a, digits_a), (chars_b, digits_b) in zip(runs_a, runs_b):
+            if chars_a != chars_b:
+                for index in range(0, max(len(chars_a), len(chars_b))):
+                    order_a = order(chars_a[index]) if index < len(chars_a) else 0
+                    order_b = order(chars_b[index]) if index < len(chars_b) else 0
+                    if order_a != order_b:
+                        return 1 if order_a > order_b else -1
+            number_a, number_b = int(digits_a or 0), int(digits_b or 0)
+            if number_a != number_b:
+                return 1 if number_a > number_b else -1
+        return 0
+
+    @staticmethod
+    def __compare_rpm_version_parts(part_a, part_b):
+        # type (str, str) -> int
+        """ Compares segments of digits or letters, ignoring separators. '~' sorts before anything (even the end of the part), '^' after the end of the part but before
+            anything else, and a numeric segment is newer than an alphabetic one. """
+        if part_a == part_b:
+            return 0
+
+        position_a, position_b = 0, 0
+        while True:
+            match_a, match_b = VersionComparator.RPM_VERSION_SEGMENT_PATTERN.match(part_a, position_a), VersionComparator.RPM_VERSION_SEGMENT_PATTERN.match(part_b, position_b)
+            segment_a, segment_b = match_a.group(1), match_b.group(1)
+            position_a, position_b = match_a.end(), match_b.end()
+
+            if segment_a == '~' or segment_b == '~':
+                if segment_a != segment_b:
+                    return -1 if segment_a == '~' else 1
+                continue
+            if segment_a == '^' or segment_b == '^':
+                if segment_a == str():
+                    return -1
+                if segment_b == str():
+                    return 1
+                if segment_a != segment_b:
+                    return 1 if segment_b == '^' else -1
+                continue
+            if segment_a == str() or segment_b == str():
+                return (segment_a != str()) - (segment_b != str())    # whichever part has segments left is newer
+
+            if segment_a.isdigit() != segment_b.isdigit():
+                return 1 if segment_a.isdigit() else -1
+            if segment_a.isdigit():
+                segment_a, segment_b = segment_a.lstrip('0'), segment_b.lstrip('0')
+                if len(segment_a) != len(segment_b):
+                    return 1 if len(segment_a) > len(segment_b) else -1
+            if segment_a != segment_b:
+                return 1 if segment_a > segment_b else -1
@@ -15,7 +15,11 @@
 # Requires Python 2.7+
 
 """The is Aptitude package manager implementation"""
+import functools
+import hashlib
+import itertools
 import json
+import mmap
 import os
 import re
 import shutil
@@ -23,12 +27,21 @@ import sys
 
 from core.src.package_managers.PackageManager import PackageManager
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.PackageSet import PackageSet
+from core.src.core_logic.QueryScheduler import QueryScheduler
+from core.src.core_logic.VersionComparator import VersionComparator
 from core.src.package_managers.UbuntuProClient import UbuntuProClient
 
 
 class AptitudePackageManager(PackageManager):
     """Implementation of Debian/Ubuntu based package management operations"""
 
+    # fields of Packages file stanzas needed for available versions; continuation lines of multi-line fields start with whitespace, so never match.
+    # past the first line, fields are matched with the line break before them rather than with '^', which lets the regex engine skip ahead to line breaks.
+    PACKAGES_FILE_FIELD_PATTERN = re.compile(b'(Package|Version|Architecture):[ \t]*(\\S+)')
+    PACKAGES_FILE_NEXT_LINE_FIELD_PATTERN = re.compile(b'\n' + PACKAGES_FILE_FIELD_PATTERN.pattern)
+    COMPRESSED_PACKAGES_FILE_EXTENSIONS = tuple('_Packages.' + extension for extension in ('gz', 'xz', 'bz2', 'lz4', 'lzma', 'zst'))
+
     # For more details, try `man apt-get` on any Debian/Ubuntu based box.
     def __init__(self, env_layer, execution_config, composite_logger, telemetry_writer, status_handler):
         super(AptitudePackageManager, self).__init__(env_layer, execution_config, composite_logger, telemetry_writer, status_handler)
@@ -38,11 +51,17 @@ class AptitudePackageManager(PackageManager):
         self.APT_SOURCES_DIR_PATH = '/etc/apt/sources.list.d/'
         self.APT_SOURCES_DIR_LIST_EXT = 'list'
         self.APT_SOURCES_DIR_SRC_EXT = 'sources'
+        self.APT_LISTS_DIR_PATH = '/var/lib/apt/lists'
 
         # Support to get packages and their dependencies
-        custom_source_timestamp = self.env_layer.datetime.timestamp().replace(":",".")
-        self.custom_source_list_template = os.path.join(execution_config.temp_folder, 'azgps-src-{0}-<FORMULA>.list'.format(str(custom_source_timestamp)))
-        self.custom_source_parts_dir_template = os.path.join(execution_config.temp_folder, 'azgps-src-{0}-<FORMULA>.d'.format(str(custom_source_timestamp)))
+        # Each distinct custom sources content gets a persistent state directory of its own, holding the sources and the package lists downloaded for them
+        self.custom_source_state_root_dir = os.path.join(execution_config.config_folder, 'azgps-apt-src')
+        self.custom_source_state_dir_template = os.path.join(self.custom_source_state_root_dir, '<HASH>')
+        self.custom_source_list_file_name = "azgps-src.list"
+        self.custom_source_parts_dir_name = "azgps-src.d"
+        self.custom_source_lists_dir_name = "lists"
+        self.custom_source_refreshed_marker_file_name = "azgps-src.refreshed"
+        self.max_custom_source_states_retained = 4  # all and security-only sources, with and without a max patch publish date
         self.current_source_parts_dir = self.current_source_list = self.current_source_formula = None
         self.current_source_parts_file_name = "azgps-src-parts.sources"
 
@@ -57,12 +76,20 @@ class AptitudePackageManager(PackageManager):
         self.cmd_single_package_check_versions_template = 'apt-cache madison <PACKAGE-NAME>'
         self.cmd_single_package_find_install_dpkg_template = 'sudo dpkg -s <PACKAGE-NAME>'
         self.cmd_single_package_find_install_apt_template = 'sudo apt list --installed <PACKAGE-NAME>'
+        self.dpkg_status_file_path = '/var/lib/dpkg/status'
+        self.__dpkg_status_index = None  # package name -> {architecture: (version, status)}, parsed from the dpkg status database
+        self.__dpkg_status_index_signature = None  # (inode, mtime, size) of the dpkg status database the index was built from
+        self.__apt_lists_indexes = {}  # package lists directory -> (signature, index); signature is (path, inode, mtime, size) of the Packages files the index was built from
+        self.inventory_fingerprint_paths = [self.APT_SOURCES_LIST_PATH, os.path.join(self.APT_SOURCES_DIR_PATH, '*'), self.APT_LISTS_DIR_PATH]
+        self.inventory_package_database_paths = [self.dpkg_status_file_path]
+        self.query_access = {'is_reboot_pending': Constants.QueryAccess.READ}  # only reads files and the Ubuntu Pro Client API
         self.single_package_upgrade_simulation_cmd = '''DEBIAN_FRONTEND=noninteractive ''' + optional_accept_eula_in_cmd + ''' LANG=en_US.UTF8 apt-get -y --only-upgrade true -s install '''
         self.single_package_dependency_resolution_template = 'DEBIAN_FRONTEND=noninteractive ' + optional_accept_eula_in_cmd + ' LANG=en_US.UTF8 apt-get -y --only-upgrade true -s install <PACKAGE-NAME> '
 
         # Package installation
         # --only-upgrade: upgrade only single package (only if it is installed)
         self.single_package_upgrade_cmd = '''sudo DEBIAN_FRONTEND=noninteractive LANG=en_US.UTF8 ''' + optional_accept_eula_in_cmd + ''' apt-get -y --only-upgrade true install '''
+        self.single_package_download_cmd = '''sudo DEBIAN_FRONTEND=noninteractive LANG=en_US.UTF8 apt-get -y --only-upgrade true --download-only install '''
         self.install_security_updates_azgps_coordinated_cmd = '''sudo DEBIAN_FRONTEND=noninteractive LANG=en_US.UTF8 ''' + optional_accept_eula_in_cmd + ''' apt-get -y --only-upgrade true dist-upgrade <SOURCES> '''
 
         # Package manager exit code(s)
@@ -88,6 +115,10 @@ class AptitudePackageManager(PackageManager):
 
         self.ubuntu_pro_client_all_updates_cached = []
         self.ubuntu_pro_client_all_updates_versions_cached = []
+
+        # Security updates classified from the last all updates simulation, with the fingerprint of what it read
+        self.security_updates_cached = None
+        self.security_updates_cached_fingerprint = None
         
         self.package_install_expected_avg_time_in_seconds = 90  # As per telemetry data, the average time to install package is around 81 seconds for apt.
 
@@ -107,45 +138,68 @@ class AptitudePackageManager(PackageManager):
             if self.current_source_formula == formula:
                 return self.current_source_parts_dir, self.current_source_list     # no need to refresh repo as state should match
 
-            # utilize caching with refresh repo if data exists but cache is not in the desired state
-            self.current_source_formula = formula
-            self.current_source_parts_dir = self.custom_source_parts_dir_template.replace("<FORMULA>", formula)
-            self.current_source_list = self.custom_source_list_template.replace("<FORMULA>", formula)
-            if os.path.exists(self.current_source_list) and os.path.isdir(self.current_source_parts_dir):
-                self.refresh_repo(source_parts_dir=self.current_source_parts_dir, source_list=self.current_source_list)     # refresh repo as requested state has changed
-                return self.current_source_parts_dir, self.current_source_list
-
-            # Produce data for combination not seen previously in this execution - source list
+            # Produce the sources content for the formula - source list, with lists in source parts appended, and source parts debstyle882-only
             source_list_content = self.__read_one_line_style_list_format(self.APT_SOURCES_LIST_PATH, max_patch_published_date, base_classification) if os.path.exists(self.APT_SOURCES_LIST_PATH) else str()
-            self.env_layer.file_system.write_with_retry(self.current_source_list, source_list_content, "w")
-            self.composite_logger.log_verbose("[APM] Source list content written. [List={0}][Content={1}]".format(self.current_source_list, source_list_content))
-
-            # Produce data for combination not seen previously in this execution - source parts
             source_parts_deb882_style_content, source_parts_list_content = self.__get_consolidated_source_parts_content(max_patch_published_date, base_classification)
             if len(source_parts_list_content) > 0:  # list(s) in source parts
-                self.env_layer.file_system.write_with_retry(self.current_source_list, "\n" + source_parts_list_content, "a")
-                self.composite_logger.log_verbose("[APM] Source parts list content appended. [List={0}][Content={1}]".format(self.current_source_list, source_parts_list_content))
+                source_list_content += "\n" + source_parts_list_content
 
-            # Source parts debstyle882-only initialization
-            current_source_parts_deb882_style_file = os.path.join(self.current_source_parts_dir, self.current_source_parts_file_name)
-            if os.path.isdir(self.current_source_parts_dir):
-                shutil.rmtree(self.current_source_parts_dir)
-
-            # Create the folder and write to it only if there is debstyle882 content to be written
-            if len(source_parts_deb882_style_content) > 0:
-                os.makedirs(self.current_source_parts_dir)
-                self.env_layer.file_system.write_with_retry(current_source_parts_deb882_style_file, source_parts_deb882_style_content, "w")
-                self.composite_logger.log_verbose("[APM] Source parts debstyle882 content written. [Dir={0}][Content={1}]".format(current_source_parts_deb882_style_file, source_parts_deb882_style_content))
+            # utilize the state directory of the same sources content, from this or an earlier execution, as is
+            source_state_dir = self.custom_source_state_dir_template.replace("<HASH>", hashlib.sha256((source_list_content + "\0" + source_parts_deb882_style_content).encode("utf-8")).hexdigest()[:16])
+            self.current_source_formula = formula
+            self.current_source_parts_dir = os.path.join(source_state_dir, self.custom_source_parts_dir_name)
+            self.current_source_list = os.path.join(source_state_dir, self.custom_source_list_file_name)
+            if os.path.exists(self.current_source_list):
+                self.composite_logger.log_debug("[APM] Reusing custom sources state. [Formula={0}][StateDir={1}]".format(formula, source_state_dir))
+                os.utime(source_state_dir, None)    # marks the state as recently used
+            else:
+                self.__write_custom_sources_state(source_state_dir, source_list_content, source_parts_deb882_style_content)
 
         except Exception as error:
             self.composite_logger.log_error("[APM] Error in modifying custom sources list. [Error={0}]".format(repr(error)))
+            self.current_source_formula = self.current_source_parts_dir = self.current_source_list = None
             return str(), str()    # defaults code to safety
 
-        # Refresh repo
-        self.refresh_repo(source_parts_dir=self.current_source_parts_dir, source_list=self.current_source_list)
+        # Refresh repo - snapshots of a max patch publish date do not change, so their package lists need to be downloaded only once
+        refreshed_marker_file = os.path.join(os.path.dirname(self.current_source_list), self.custom_source_refreshed_marker_file_name)
+        if max_patch_published_date != str() and os.path.exists(refreshed_marker_file):
+            self.composite_logger.log_debug("[APM] Skipping local repo refresh, as package lists of the snapshot were downloaded earlier. [Formula={0}]".format(formula))
+        else:
+            self.refresh_repo(source_parts_dir=self.current_source_parts_dir, source_list=self.current_source_list)
+            self.env_layer.file_system.write_with_retry(refreshed_marker_file, str(self.env_layer.datetime.timestamp()), "w")
 
         return self.current_source_parts_dir, self.current_source_list
 
+    def __write_custom_sources_state(self, source_state_dir, source_list_content, source_parts_deb882_style_content):
+        # type: (str, str, str) -> None
+        """ Writes a new state directory for custom sources. The source list is written last, marking the state as complete. """
+        self.__remove_least_recently_used_custom_sources_states()
+        if os.path.isdir(source_state_dir):
+            shutil.rmtree(source_state_dir)     # incomplete state
+        os.makedirs(os.path.join(source_state_dir, self.custom_source_lists_dir_name, "partial"))
+
+        # Create the source parts folder and write to it only if there is debstyle882 content to be written
+        if len(source_parts_deb882_style_content) > 0:
+            current_source_parts_deb882_style_file = os.path.join(self.current_source_parts_dir, self.current_source_parts_file_name)
+            os.makedirs(self.current_source_parts_dir)
+            self.env_layer.file_system.write_with_retry(current_source_parts_deb882_style_file, source_parts_deb882_style_content, "w")
+            self.composite_logger.log_verbose("[APM] Source parts debstyle882 content written. [Dir={0}][Content={1}]".format(current_source_parts_deb882_style_file, source_parts_deb882_style_content))
+
+        self.env_layer.file_system.write_with_retry(self.current_source_list, source_list_content, "w")
+        self.composite_logger.log_verbose("[APM] Source list content written. [List={0}][Content={1}]".format(self.current_source_list, source_list_content))
+
+    def __remove_least_recently_used_custom_sources_states(self):
+        # type: () -> None
+        """ Bounds the disk space used by the package lists of custom sources, making room for one more state """
+        if not os.path.isdir(self.custom_source_state_root_dir):
+            return
+
+        source_state_dirs = [os.path.join(self.custom_source_state_root_dir, name) for name in os.listdir(self.custom_source_state_root_dir)]
+        source_state_dirs = sorted([path for path in source_state_dirs if os.path.isdir(path)], key=os.path.getmtime)
+        for source_state_dir in source_state_dirs[:max(len(source_state_dirs) - self.max_custom_source_states_retained + 1, 0)]:
+            self.composite_logger.log_debug("[APM] Removing least recently used custom sources state. [StateDir={0}]".format(source_state_dir))
+            shutil.rmtree(source_state_dir, ignore_errors=True)
+
     def __get_consolidated_source_parts_content(self, max_patch_published_date, base_classification):
         # type: (str, str) -> (str, str)
         """ Consolidates all list and sources files into a consistent format single source list """
@@ -244,25 +298,45 @@ class AptitudePackageManager(PackageManager):
         return sources_content
 
     def refresh_repo(self, source_parts_dir=str(), source_list=str()):
+        # a refresh drops the package lists of sources not in the set, from the package lists directory it uses
+        if source_parts_dir == str() and source_list == str():
+            source_set, fingerprint_paths = Constants.MACHINE_SOURCES, self.inventory_fingerprint_paths
+        else:
+            source_set = "{0}|{1}".format(source_parts_dir, source_list)
+            fingerprint_paths = [source_list, os.path.join(source_parts_dir, '*'), self.__get_custom_sources_lists_dir(source_list) or self.APT_LISTS_DIR_PATH]
+
+        if self.repo_freshness_tracker.is_fresh(source_set, fingerprint_paths):
+            self.composite_logger.log_debug("[APM] Skipping local repo refresh, as it is still fresh. [SourcePartsDir={0}][SourceList={1}]".format(source_parts_dir, source_list))
+            return
+
         self.composite_logger.log("[APM] Refreshing local repo... [SourcePartsDir={0}][SourceList={1}]".format(source_parts_dir, source_list))
         self.invoke_package_manager(self.__generate_command_with_custom_sources(self.cmd_repo_refresh_template, source_parts_dir, source_list))
+        self.repo_freshness_tracker.record_refresh(source_set, fingerprint_paths)
 
-    @staticmethod
-    def __generate_command_with_custom_sources(command_template, source_parts=str(), source_list=str()):
+    def __generate_command_with_custom_sources(self, command_template, source_parts=str(), source_list=str()):
         # type: (str, str, str) -> str
         """ Prepares a standard command to use custom sources. Pre-requisite: Refresh repo post list change. """
         if source_parts == str() and source_list == str():
             return command_template.replace('<SOURCES>', str())
         else:
-            return command_template.replace('<SOURCES>', ('-oDir::Etc::SourceParts={0}/ -oDir::Etc::SourceList={1}'.format(str(source_parts) if source_parts != str() else "/dev/null",
-                                                                                                                          str(source_list) if source_list != str() else "/dev/null")))
+            sources = '-oDir::Etc::SourceParts={0}/ -oDir::Etc::SourceList={1}'.format(str(source_parts) if source_parts != str() else "/dev/null", str(source_list) if source_list != str() else "/dev/null")
+            source_lists_dir = self.__get_custom_sources_lists_dir(source_list)
+            if source_lists_dir != str():
+                sources += ' -oDir::State::Lists={0}/'.format(source_lists_dir)
+            return command_template.replace('<SOURCES>', sources)
+
+    def __get_custom_sources_lists_dir(self, source_list):
+        # type: (str) -> str
+        """ Returns the package lists directory in the state directory of custom sources, or an empty string if the source list has none """
+        source_lists_dir = os.path.join(os.path.dirname(source_list), self.custom_source_lists_dir_name) if source_list != str() else str()
+        return source_lists_dir if source_lists_dir != str() and os.path.isdir(source_lists_dir) else str()
     # endregion Sources Management
 
     # region Get Available Updates
-    def invoke_package_manager_advanced(self, command, raise_on_exception=True):
+    def invoke_package_manager_advanced(self, command, raise_on_exception=True, output_parser=None):
         """Get missing updates using the command input"""
         self.composite_logger.log_verbose('[APM] Invoking package manager. [Command={0}]'.format(command))
-        code, out = self.env_layer.run_command_output(command, False, False)
+        code, out = self.run_command_output_with_parser(command, output_parser)
 
         if code != self.apt_exitcode_ok and self.STR_DPKG_WAS_INTERRUPTED in out:
             self.composite_logger.log_error('[ERROR] YOU NEED TO TAKE ACTION TO PROCEED. The package manager on this machine is not in a healthy state, and '
@@ -323,11 +397,19 @@ class AptitudePackageManager(PackageManager):
         # when cached is False, query both default way and using Ubuntu Pro Client.
         source_parts, source_list = self.__get_custom_sources_to_spec(self.max_patch_publish_date, base_classification=str())
         cmd = self.__generate_command_with_custom_sources(command_template=self.cmd_dist_upgrade_simulation_template, source_parts=source_parts, source_list=source_list)
-        out = self.invoke_package_manager(cmd)
-        self.all_updates_cached, self.all_update_versions_cached = self.extract_packages_and_versions(out)
+        simulation_fingerprint = self.__get_simulation_fingerprint()
+        # the simulation and the Ubuntu Pro Client query only read the package lists refreshed above, so they run concurrently
+        query_scheduler = QueryScheduler(self.env_layer, self.composite_logger)
+        output_parser = self.SimulationOutputParser(self.ESM_MARKER)
+        simulation_query = query_scheduler.schedule("All updates simulation", Constants.QueryAccess.READ, self.invoke_package_manager, cmd, output_parser)
+        pro_client_query = query_scheduler.schedule("Ubuntu Pro Client all updates", Constants.QueryAccess.READ, self.ubuntu_pro_client.get_all_updates) if self.__pro_client_prereq_met else None
+        query_scheduler.get_result(simulation_query)
+        self.all_updates_cached, self.all_update_versions_cached = self.get_parsed_packages_and_versions(output_parser)
+        self.security_updates_cached = self.__classify_security_updates(output_parser, self.__get_custom_sources_lists_dir(source_list) or self.APT_LISTS_DIR_PATH)
+        self.security_updates_cached_fingerprint = simulation_fingerprint
 
         if self.__pro_client_prereq_met:
-            ubuntu_pro_client_all_updates_query_success, self.ubuntu_pro_client_all_updates_cached, self.ubuntu_pro_client_all_updates_versions_cached = self.ubuntu_pro_client.get_all_updates()
+            ubuntu_pro_client_all_updates_query_success, self.ubuntu_pro_client_all_updates_cached, self.ubuntu_pro_client_all_updates_versions_cached = query_scheduler.get_result(pro_client_query)
             pro_client_missed_updates = list(set(self.all_updates_cached) - set(self.ubuntu_pro_client_all_updates_cached))
             all_updates_missed_updates = list(set(self.ubuntu_pro_client_all_updates_cached) - set(self.all_updates_cached))
             self.composite_logger.log_debug("[APM-Pro] Get all updates : [DefaultAllPackagesCount={0}][UbuntuProClientQuerySuccess={1}][UbuntuProClientAllPackagesCount={2}]"
@@ -349,14 +431,28 @@ class AptitudePackageManager(PackageManager):
         ubuntu_pro_client_security_package_versions = []
 
         self.composite_logger.log_verbose("[APM] Discovering 'security' packages...")
-        source_parts, source_list = self.__get_custom_sources_to_spec(self.max_patch_publish_date, base_classification=Constants.PackageClassification.SECURITY)
-        cmd = self.__generate_command_with_custom_sources(self.cmd_dist_upgrade_simulation_template, source_parts=source_parts, source_list=source_list)
-        out = self.invoke_package_manager(cmd)
-        security_packages, security_package_versions = self.extract_packages_and_versions(out)
+        # security updates are classified from the all updates simulation, which is only run again if what it read changed since
+        simulation_fingerprint = self.__get_simulation_fingerprint()
+        if simulation_fingerprint is None or self.security_updates_cached_fingerprint != simulation_fingerprint:
+            self.get_all_updates()
+        else:
+            self.composite_logger.log_debug("[APM] Reusing the last all updates simulation, as its sources, package lists and installed packages are unchanged.")
+
+        query_scheduler = QueryScheduler(self.env_layer, self.composite_logger)
+        pro_client_query = query_scheduler.schedule("Ubuntu Pro Client security updates", Constants.QueryAccess.READ, self.ubuntu_pro_client.get_security_updates) if self.__pro_client_prereq_met else None
+        if self.security_updates_cached is not None:
+            security_packages, security_package_versions = self.security_updates_cached
+        else:   # the package lists could not be indexed, so only a simulation with the security sources alone tells security updates apart
+            source_parts, source_list = self.__get_custom_sources_to_spec(self.max_patch_publish_date, base_classification=Constants.PackageClassification.SECURITY)
+            cmd = self.__generate_command_with_custom_sources(self.cmd_dist_upgrade_simulation_template, source_parts=source_parts, source_list=source_list)
+            output_parser = self.SimulationOutputParser(self.ESM_MARKER)
+            simulation_query = query_scheduler.schedule("Security updates simulation", Constants.QueryAccess.READ, self.invoke_package_manager, cmd, output_parser)
+            query_scheduler.get_result(simulation_query)
+            security_packages, security_package_versions = self.get_parsed_packages_and_versions(output_parser)
         self.composite_logger.log_debug("[APM] Discovered 'security' packages. [Count={0}]".format(len(security_packages)))
 
         if self.__pro_client_prereq_met:
-            ubuntu_pro_client_security_updates_query_success, ubuntu_pro_client_security_packages, ubuntu_pro_client_security_package_versions = self.ubuntu_pro_client.get_security_updates()
+            ubuntu_pro_client_security_updates_query_success, ubuntu_pro_client_security_packages, ubuntu_pro_client_security_package_versions = query_scheduler.get_result(pro_client_query)
             pro_client_missed_updates = list(set(security_packages) - set(ubuntu_pro_client_security_packages))
             sec_updates_missed_updates = list(set(ubuntu_pro_client_security_packages) - set(security_packages))
             self.composite_logger.log_debug("[APM-Pro][Sec] Get Security Updates : [DefaultSecurityPackagesCount={0}][UbuntuProClientQuerySuccess={1}][UbuntuProClientSecurityPackagesCount={2}]".format(len(security_packages), ubuntu_pro_client_security_updates_query_success, len(ubuntu_pro_client_security_packages)))
@@ -370,6 +466,39 @@ class AptitudePackageManager(PackageManager):
         else:
             return security_packages, security_package_versions
 
+    def __get_simulation_fingerprint(self):
+        # type: () -> tuple
+        """ Fingerprint of the sources, package lists and installed packages the all updates simulation reads, or None if it cannot be tracked """
+        fingerprint = self.get_inventory_fingerprint()
+        return (self.max_patch_publish_date, fingerprint) if fingerprint is not None else None
+
+    def __classify_security_updates(self, output_parser, lists_dir):
+        # type: (AptitudePackageManager.SimulationOutputParser, str) -> (list, list) or None
+        """ Returns the updates in simulation output that a security pocket in the package lists the simulation read has a version of, newer than the one installed and no newer than the candidate.
+            Such an update is a security update even if its candidate comes from elsewhere, and its latest such version is reported, as a security-only simulation would.
+            ESM packages are always security updates. Returns None if the package lists could not be indexed. """
+        apt_lists_index = self.__get_apt_lists_index(lists_dir)
+        if apt_lists_index is None:
+            return None
+
+        security_packages = []
+        security_package_versions = []
+        for package, installed_version, candidate_version, architecture in zip(output_parser.packages, output_parser.installed_versions, output_parser.versions, output_parser.architectures):
+            security_version = None
+            for discovered_version, discovered_architecture, is_security_pocket in apt_lists_index.get(package.split(':', 1)[0], []):
+                if not is_security_pocket or discovered_architecture not in (architecture, 'all') \
+                        or (installed_version != str() and VersionComparator.compare_debian_versions(discovered_version, installed_version) <= 0) \
+                        or VersionComparator.compare_debian_versions(discovered_version, candidate_version) > 0:
+                    continue
+                if security_version is None or VersionComparator.compare_debian_versions(discovered_version, security_version) > 0:
+                    security_version = discovered_version
+            if security_version is not None:
+                security_packages.append(package)
+                security_package_versions.append(security_version)
+
+        self.composite_logger.log_verbose("[APM] Classified security updates from package lists. [Path={0}][Count={1}]".format(lists_dir, str(len(security_packages))))
+        return security_packages + output_parser.esm_packages, security_package_versions + [Constants.UA_ESM_REQUIRED] * len(output_parser.esm_packages)
+
     def get_security_esm_updates(self):
         """Get missing security-esm updates."""
         ubuntu_pro_client_security_esm_updates_query_success = False
@@ -387,17 +516,12 @@ class AptitudePackageManager(PackageManager):
         ubuntu_pro_client_other_updates_query_success = False
         ubuntu_pro_client_other_packages = []
         ubuntu_pro_client_other_package_versions = []
-        other_packages = []
-        other_package_versions = []
 
         self.composite_logger.log_verbose("[APM] Discovering 'other' packages...")
         all_packages, all_package_versions = self.get_all_updates(True)
         security_packages, security_package_versions = self.get_security_updates()
 
-        for index, package in enumerate(all_packages):
-            if package not in security_packages:
-                other_packages.append(package)
-                other_package_versions.append(all_package_versions[index])
+        other_packages, other_package_versions = PackageSet(all_packages, all_package_versions).difference(security_packages).get_packages_and_versions()
 
         if self.__pro_client_prereq_met:
             ubuntu_pro_client_other_updates_query_success, ubuntu_pro_client_other_packages, ubuntu_pro_client_other_package_versions = self.ubuntu_pro_client.get_other_updates()
@@ -415,46 +539,62 @@ class AptitudePackageManager(PackageManager):
 
     # region Output Parser(s)
     def extract_packages_and_versions(self, output):
+        """ Returns packages and versions from complete apt simulation output. Prefer streaming output to a SimulationOutputParser while the command runs. """
+        output_parser = self.SimulationOutputParser(self.ESM_MARKER)
+        for line in output.split('\n'):
+            output_parser.parse_line(line)
+        return self.get_parsed_packages_and_versions(output_parser)
+
+    def get_parsed_packages_and_versions(self, output_parser):
+        """ Returns packages and versions collected by a SimulationOutputParser, with ESM packages last """
+        packages, versions = output_parser.get_packages_and_versions()
+        self.composite_logger.log_verbose("[APM] Extracted package and version data for " + str(len(output_parser.packages)) + " packages [BASIC].")
+        self.composite_logger.log_verbose("[APM] Extracted package and version data for " + str(len(packages)) + " packages [TOTAL].")
+        return packages, versions
+
+    class SimulationOutputParser(object):
+        """ Extracts packages and versions from apt simulation output one line at a time, as the output is produced """
         # sample output format
         # Inst coreutils [8.25-2ubuntu2] (8.25-2ubuntu3~16.10 Ubuntu:16.10/yakkety-updates [amd64])
         # Inst python3-update-manager [1:16.10.7] (1:16.10.8 Ubuntu:16.10/yakkety-updates [all]) [update-manager-core:amd64 ]
         # Inst update-manager-core [1:16.10.7] (1:16.10.8 Ubuntu:16.10/yakkety-updates [all])
-
-        self.composite_logger.log_verbose("[APM] Extracting package and version data...")
-        packages = []
-        versions = []
-
-        search_text = r'Inst[ ](.*?)[ ].*?[(](.*?)[ ](.*?)[ ]\[(.*?)\]'
-        search = re.compile(search_text, re.M | re.S)
-        package_list = search.findall(str(output))
-
-        for package in package_list:
-            packages.append(package[0])
-            versions.append(package[1])
-
-        self.composite_logger.log_verbose("[APM] Extracted package and version data for " + str(len(packages)) + " packages [BASIC].")
-
-        # Discovering ESM packages - Distro versions with extended security maintenance
-        lines = output.strip().split('\n')
-        esm_marker_found = False
-        esm_packages = []
-        for line_index in range(0, len(lines)-1):
-            line = lines[line_index].strip()
-
-            if not esm_marker_found:
-                if self.ESM_MARKER in line:
-                   esm_marker_found = True
-                continue
-
-            esm_packages = line.split()
-            break
-
-        for package in esm_packages:
-            packages.append(package)
-            versions.append(Constants.UA_ESM_REQUIRED)
-        self.composite_logger.log_verbose("[APM] Extracted package and version data for " + str(len(packages)) + " packages [TOTAL].")
-
-        return packages, versions
+        INST_LINE_PATTERN = re.compile(r'Inst[ ](.*?)[ ](?:\[(.*?)\][ ])?.*?[(](.*?)[ ](.*?)[ ]\[(.*?)\]')
+
+        def __init__(self, esm_marker):
+            self.esm_marker = esm_marker
+            self.packages = []
+            self.versions = []
+            self.installed_versions = []    # empty for packages newly installed
+            self.architectures = []
+            self.esm_packages = []
+            self.__esm_marker_found = False
+            self.__esm_packages_line_seen = False
+            self.__esm_packages_line = None  # first line after the ESM marker, only accepted once more output follows it
+
+        def reset(self):
+            self.__init__(self.esm_marker)
+
+        def parse_line(self, line):
+            if self.__esm_packages_line is not None and line.strip() != str():
+                self.esm_packages = self.__esm_packages_line.split()
+                self.__esm_packages_line = None
+
+            if 'Inst ' in line:
+                for package in self.INST_LINE_PATTERN.findall(line):
+                    self.packages.append(package[0])
+                    self.installed_versions.append(package[1])
+                    self.versions.append(package[2])
+                    self.architectures.append(package[4])
+
+            # Discovering ESM packages - Distro versions with extended security maintenance
+            if not self.__esm_marker_found:
+                self.__esm_marker_found = self.esm_marker in line
+            elif not self.__esm_packages_line_seen:
+                self.__esm_packages_line = line.strip()
+                self.__esm_packages_line_seen = True
+
+        def get_packages_and_versions(self):
+            return self.packages + self.esm_packages, self.versions + [Constants.UA_ESM_REQUIRED] * len(self.esm_packages)
     # endregion
     # endregion
 
@@ -480,6 +620,12 @@ class AptitudePackageManager(PackageManager):
         #      bash | 4.3-14ubuntu1.2 | http://security.ubuntu.com/ubuntu xenial-security/main amd64 Packages
         #      bash | 4.3-14ubuntu1 | http://us.archive.ubuntu.com/ubuntu xenial/main amd64 Packages
 
+        # PREFERRED METHOD - in-process lookup against the package lists apt-cache reads, no process spawned
+        package_versions = self.__get_available_versions_from_apt_lists_index(package_name)
+        if package_versions is not None:
+            return package_versions
+
+        # DEFAULT METHOD
         package_versions = []
 
         cmd = self.cmd_single_package_check_versions_template.replace('<PACKAGE-NAME>', package_name)
@@ -496,11 +642,98 @@ class AptitudePackageManager(PackageManager):
 
         return package_versions
 
+    def __get_available_versions_from_apt_lists_index(self, package_name):
+        # type: (str) -> list or None
+        """ Returns the available versions of the package in the package lists, latest first as with apt-cache madison, or None if the lists could not be indexed """
+        apt_lists_index = self.__get_apt_lists_index(self.APT_LISTS_DIR_PATH)
+        if apt_lists_index is None:
+            return None
+
+        name, architecture = package_name.split(':', 1) if ':' in package_name else (package_name, None)
+        package_versions = []
+        for discovered_version, discovered_architecture, is_security_pocket in apt_lists_index.get(name, []):
+            if architecture is not None and discovered_architecture not in (architecture, 'all'):
+                continue
+            if discovered_version not in package_versions:
+                package_versions.append(discovered_version)
+
+        package_versions.sort(key=functools.cmp_to_key(VersionComparator.compare_debian_versions), reverse=True)
+        self.composite_logger.log_verbose(" - Available versions found in package lists: " + str(package_versions))
+        return package_versions
+
+    def __get_apt_lists_index(self, lists_dir):
+        # type: (str) -> dict or None
+        """ Returns the index of the Packages files in a package lists directory, re-built only when any of them is added, removed, replaced or modified """
+        try:
+            file_names = os.listdir(lists_dir)
+            packages_file_paths = sorted(os.path.join(lists_dir, file_name) for file_name in file_names if file_name.endswith('_Packages'))
+            if len(packages_file_paths) == 0 or any(file_name.endswith(self.COMPRESSED_PACKAGES_FILE_EXTENSIONS) for file_name in file_names):
+                return None     # no package lists, or package lists kept compressed (Acquire::GzipIndexes)
+
+            signature = tuple((path, file_stat.st_ino, file_stat.st_mtime, file_stat.st_size) for path, file_stat in ((path, os.stat(path)) for path in packages_file_paths))
+            if lists_dir in self.__apt_lists_indexes and self.__apt_lists_indexes[lists_dir][0] == signature:
+                return self.__apt_lists_indexes[lists_dir][1]
+
+            apt_lists_index = {}
+            for packages_file_path in packages_file_paths:
+                self.__index_packages_file(packages_file_path, apt_lists_index)
+        except (IOError, OSError, ValueError) as error:
+            self.composite_logger.log_debug("[APM] Unable to index package lists. [Path={0}][Error={1}]".format(lists_dir, repr(error)))
+            return None
+
+        self.__apt_lists_indexes[lists_dir] = (signature, apt_lists_index)
+        self.composite_logger.log_verbose("[APM] Indexed package lists. [Path={0}][FileCount={1}][PackageCount={2}]".format(lists_dir, str(len(packages_file_paths)), str(len(apt_lists_index))))
+        return apt_lists_index
+
+    @staticmethod
+    def __index_packages_file(packages_file_path, apt_lists_index):
+        # type: (str, dict) -> None
+        """ Adds (version, architecture, is_security_pocket) of every stanza in a Packages file to the index. The file is memory-mapped and only scanned for the fields needed,
+            so lists of hundreds of MB are never read into memory. Reference: man deb822, /var/lib/apt/lists/*_Packages """
+        # Sample stanza format ------------------------------------------
+        # Package: bash
+        # Architecture: amd64
+        # Version: 5.1-6ubuntu1.1
+        # Priority: required
+        # Description: GNU Bourne Again SHell
+        #  ------------------------------------------ --------------------
+        # the file name holds the source and suite it was downloaded for (e.g. azure.archive.ubuntu.com_ubuntu_dists_jammy-security_main_binary-amd64_Packages),
+        # and is told apart as a security pocket the same way security sources are selected for a security-only refresh
+        is_security_pocket = "security" in os.path.basename(packages_file_path)
+
+        def add_to_index(fields):
+            if b'Package' in fields and b'Version' in fields:
+                apt_lists_index.setdefault(to_str(fields[b'Package']), []).append((to_str(fields[b'Version']), to_str(fields.get(b'Architecture', b'')), is_security_pocket))
+
+        def to_str(value):
+            return value if isinstance(value, str) else value.decode('utf-8')
+
+        with open(packages_file_path, 'rb') as packages_file:
+            if os.fstat(packages_file.fileno()).st_size == 0:
+                return
+            packages_file_map = mmap.mmap(packages_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                fields = {}
+                first_line_match = AptitudePackageManager.PACKAGES_FILE_FIELD_PATTERN.match(packages_file_map)
+                for match in itertools.chain([first_line_match] if first_line_match is not None else [], AptitudePackageManager.PACKAGES_FILE_NEXT_LINE_FIELD_PATTERN.finditer(packages_file_map)):
+                    if match.group(1) == b'Package':    # start of the next stanza
+                        add_to_index(fields)
+                        fields = {}
+                    fields[match.group(1)] = match.group(2)
+                add_to_index(fields)
+            finally:
+                packages_file_map.close()
+
     def is_package_version_installed(self, package_name, package_version):
         """ Returns true if the specific package version is installed """
 
         self.composite_logger.log_verbose("\nCHECKING PACKAGE INSTALL STATUS FOR: " + str(package_name) + " (" + str(package_version) + ")")
 
+        # PREFERRED METHOD - in-process lookup against the dpkg status database, no process spawned
+        is_installed = self.__is_package_version_installed_from_dpkg_status_index(package_name, package_version)
+        if is_installed is not None:
+            return is_installed
+
         # DEFAULT METHOD
         self.composite_logger.log_verbose(" - [1/2] Verifying install status with Dpkg.")
         cmd = self.cmd_single_package_find_install_dpkg_template.replace('<PACKAGE-NAME>', package_name)
@@ -601,6 +834,71 @@ class AptitudePackageManager(PackageManager):
         self.composite_logger.log_verbose("   - Package version specified was determined to NOT be installed.")
         return False
 
+    def __is_package_version_installed_from_dpkg_status_index(self, package_name, package_version):
+        # type: (str, str) -> bool or None
+        """ Returns whether the package version is installed as per the dpkg status database, or None if the database could not be read """
+        dpkg_status_index = self.__get_dpkg_status_index()
+        if dpkg_status_index is None:
+            return None
+
+        name, architecture = package_name.split(':', 1) if ':' in package_name else (package_name, None)
+        for discovered_architecture, (discovered_version, discovered_status) in dpkg_status_index.get(name, {}).items():
+            if architecture is not None and discovered_architecture not in (architecture, 'all'):
+                continue
+            if discovered_version == package_version and discovered_status.endswith(' ok installed'):   # whatever the selection state, e.g. 'hold ok installed' for held packages
+                self.composite_logger.log_verbose(" - Package, Version and Status matched in dpkg status database. Package is detected as 'Installed'. [Architecture={0}]".format(str(discovered_architecture)))
+                return True
+
+        self.composite_logger.log_verbose(" - Package version specified was determined to NOT be installed from dpkg status database. [Entries={0}]".format(str(dpkg_status_index.get(name, {}))))
+        return False
+
+    def __get_dpkg_status_index(self):
+        # type: () -> dict or None
+        """ Returns the index of the dpkg status database, re-parsed only when the database file is replaced or modified """
+        try:
+            file_stat = os.stat(self.dpkg_status_file_path)
+        except (IOError, OSError):
+            return None
+
+        signature = (file_stat.st_ino, file_stat.st_mtime, file_stat.st_size)
+        if self.__dpkg_status_index is not None and self.__dpkg_status_index_signature == signature:
+            return self.__dpkg_status_index
+
+        dpkg_status_content = self.env_layer.file_system.read_with_retry(self.dpkg_status_file_path, raise_if_not_found=False)
+        if dpkg_status_content is None:
+            return None
+
+        self.__dpkg_status_index = self.__parse_dpkg_status_content(dpkg_status_content)
+        self.__dpkg_status_index_signature = signature
+        self.composite_logger.log_verbose("[APM] Indexed dpkg status database. [FilePath={0}][PackageCount={1}]".format(self.dpkg_status_file_path, str(len(self.__dpkg_status_index))))
+        return self.__dpkg_status_index
+
+    @staticmethod
+    def __parse_dpkg_status_content(dpkg_status_content):
+        # type: (str) -> dict
+        """ Builds package name -> {architecture: (version, status)} from dpkg status database content. Reference: man dpkg-query, /var/lib/dpkg/status """
+        # Sample stanza format ------------------------------------------
+        # Package: mysql-server
+        # Status: install ok installed
+        # Priority: optional
+        # Architecture: all
+        # Version: 5.7.25-0ubuntu0.16.04.2
+        # Description: MySQL database server (metapackage depending on the latest version)
+        #  This is an empty package that depends on the current "best" version
+        #  ------------------------------------------ --------------------
+        dpkg_status_index = {}
+        fields = {}
+        for line in dpkg_status_content.splitlines() + [str()]:
+            if line.strip() == str():   # end of stanza
+                if 'Package' in fields:
+                    dpkg_status_index.setdefault(fields['Package'], {})[fields.get('Architecture', str())] = (fields.get('Version', str()), fields.get('Status', str()))
+                fields = {}
+            elif not line[0].isspace() and ':' in line:   # continuation lines of multi-line fields start with whitespace and are not needed
+                field_name, field_value = line.split(':', 1)
+                if field_name in ('Package', 'Status', 'Architecture', 'Version'):
+                    fields[field_name] = field_value.strip()
+        return dpkg_status_index
+
     def get_dependent_list(self, packages):
         """Returns dependent List for the list of packages"""
         package_names = ""
@@ -612,9 +910,10 @@ class AptitudePackageManager(PackageManager):
         cmd = self.single_package_dependency_resolution_template.replace('<PACKAGE-NAME>', package_names)
 
         self.composite_logger.log_verbose("\nRESOLVING DEPENDENCIES USING COMMAND: " + str(cmd))
-        output = self.invoke_package_manager(cmd)
+        output_parser = self.SimulationOutputParser(self.ESM_MARKER)
+        self.invoke_package_manager(cmd, output_parser)
 
-        dependencies, dependency_versions = self.extract_packages_and_versions(output)
+        dependencies, dependency_versions = self.get_parsed_packages_and_versions(output_parser)
         
         for package in packages:
             if package in dependencies:
@@ -851,9 +1150,9 @@ class AptitudePackageManager(PackageManager):
         """check if python version is at least 3.5"""
         return sys.version_info >= Constants.UbuntuProClientSettings.MINIMUM_PYTHON_VERSION_REQUIRED
 
-    def add_arch_dependencies(self, package_manager, package, version, packages, package_versions, package_and_dependencies, package_and_dependency_versions):
+    def add_arch_dependencies(self, package_manager, package, version, selected_updates, package_and_dependencies, package_and_dependency_versions):
         """
-        Add the packages with same name as that of input parameter package but with different architectures from packages list to the list package_and_dependencies.
+        Add the packages with same name as that of input parameter package but with different architectures from selected_updates to the list package_and_dependencies.
         Only required for yum. No-op for apt and zypper.
         """
         return
@@ -884,7 +1183,3 @@ class AptitudePackageManager(PackageManager):
 
         self.composite_logger.log_debug("[APM] Filter esm packages : [TotalPackagesCount={0}][EsmPackagesCount={1}]".format(len(packages), len(ua_esm_required_packages)))
         return non_esm_packages, non_esm_package_versions, ua_esm_required_packages, ua_esm_required_package_versions, ua_esm_required_packages_found
-
-    def get_package_install_expected_avg_time_in_seconds(self):
-        return self.package_install_expected_avg_time_in_seconds
-
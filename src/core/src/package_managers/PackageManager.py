@@ -19,6 +19,9 @@ import json
 import os
 from abc import ABCMeta, abstractmethod
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.InstallTimeModel import InstallTimeModel
+from core.src.core_logic.PackageSet import PackageSet
+from core.src.core_logic.RepoFreshnessTracker import RepoFreshnessTracker
 import time
 
 
@@ -32,6 +35,7 @@ class PackageManager(object):
         self.status_handler = status_handler
         self.single_package_upgrade_cmd = ''
         self.single_package_upgrade_simulation_cmd = 'simulate-install'
+        self.single_package_download_cmd = ''  # download-only variant of the install command, used to prefetch packages into the local package cache
         self.package_manager_settings = {}
         self.force_reboot = False
 
@@ -39,6 +43,11 @@ class PackageManager(object):
         self.all_updates_cached = []
         self.all_update_versions_cached = []
 
+        # Install times learned from past runs on the machine, for maintenance window admission and batch planning. Package managers set the static average
+        # install time in self.package_install_expected_avg_time_in_seconds, used until there is enough history on the machine.
+        self.install_time_model = InstallTimeModel(env_layer, composite_logger, os.path.join(execution_config.config_folder, Constants.INSTALL_TIME_MODEL_FILE))
+        self.package_install_expected_avg_time_in_seconds = Constants.PACKAGE_INSTALL_EXPECTED_MAX_TIME_IN_MINUTES * 60
+
         # auto OS updates
         self.image_default_patch_configuration_backup_path = os.path.join(execution_config.config_folder, Constants.IMAGE_DEFAULT_PATCH_CONFIGURATION_BACKUP_PATH)
 
@@ -54,6 +63,24 @@ class PackageManager(object):
         # Primarily for debian-based but generalizing for back-compat on customer-driven scenarios
         self.REBOOT_PENDING_FILE_PATH = '/var/run/reboot-required'
 
+        # Package inventory snapshot, produced by assessment and reused by installation in the same run while nothing it was derived from has changed
+        self.inventory_fingerprint_paths = []  # repository configuration and lists of the package manager, glob patterns allowed
+        self.inventory_package_database_paths = []  # installed package database of the package manager, glob patterns allowed
+        self.inventory_snapshot = None
+        self.inventory_snapshot_version = 0
+
+        # Read/write classification of package manager queries (by method name) for the query scheduler. Unlisted queries are writes.
+        self.query_access = {}
+
+        # Refreshes of the package index in this run, for package managers to skip refreshing sources that are still fresh
+        self.repo_freshness_tracker = RepoFreshnessTracker(env_layer, composite_logger)
+
+        # Installed package snapshot for rpm-based package managers, re-queried only when the rpm database changes
+        self.cmd_rpm_installed_packages_query_template = "sudo rpm -qa --queryformat '<PACKAGE-NAME-FORMAT> %{EPOCH}:%{VERSION}-%{RELEASE}\\n'"
+        self.RPM_DB_FILE_PATHS = ['/var/lib/rpm/Packages', '/var/lib/rpm/rpmdb.sqlite', '/usr/lib/sysimage/rpm/Packages.db', '/usr/lib/sysimage/rpm/rpmdb.sqlite']
+        self.__rpm_installed_package_versions = None  # package name (in the requested format) -> set of installed versions
+        self.__rpm_installed_package_versions_signature = None  # name format and (path, mtime, size) of rpm database files the snapshot was taken against
+
     __metaclass__ = ABCMeta  # For Python 3.0+, it changes to class Abstract(metaclass=ABCMeta)
 
     @abstractmethod
@@ -68,15 +95,27 @@ class PackageManager(object):
         except Exception as error:
             self.composite_logger.log_debug("[PM] Error in refreshing cache from machine sources. [Error={0}]".format(repr(error)))
 
+    def get_query_access(self, query_name):
+        """ Returns whether a package manager query only reads machine state and can run concurrently with other reads """
+        return self.query_access.get(query_name, Constants.QueryAccess.WRITE)
+
     # region Get Available Updates
     @abstractmethod
-    def invoke_package_manager_advanced(self, command, raise_on_exception=True):
+    def invoke_package_manager_advanced(self, command, raise_on_exception=True, output_parser=None):
         pass
 
-    def invoke_package_manager(self, command):
-        out, code = self.invoke_package_manager_advanced(command, raise_on_exception=True)
+    def invoke_package_manager(self, command, output_parser=None):
+        out, code = self.invoke_package_manager_advanced(command, raise_on_exception=True, output_parser=output_parser)
         return out
 
+    def run_command_output_with_parser(self, command, output_parser=None):
+        """ Runs a package manager command, streaming its output to the output parser line by line while the command runs.
+            Output parsers have reset() and parse_line(line). The parser is reset first, as commands may be re-run on retries or after mitigations. """
+        if output_parser is None:
+            return self.env_layer.run_command_output(command, False, False)
+        output_parser.reset()
+        return self.env_layer.run_command_output(command, False, False, output_consumers=[output_parser.parse_line])
+
     def get_available_updates(self, package_filter):
         """Returns List of all installed packages with available updates."""
         class_packages, class_versions = self.get_updates_for_classification(package_filter)
@@ -96,12 +135,13 @@ class PackageManager(object):
             self.status_handler.add_error_to_status(error_msg, Constants.PatchOperationErrorCodes.PACKAGE_MANAGER_FAILURE)
             raise Exception(error_msg, "[{0}]".format(Constants.ERROR_ADDED_TO_STATUS))
 
+        inventory_snapshot = self.get_inventory_snapshot()
         if package_filter.is_msft_critsec_classification_only():
-            return self.get_security_updates()
+            return self.get_security_updates() if inventory_snapshot is None else inventory_snapshot['security_updates']
         elif package_filter.is_msft_other_classification_only():
             return self.get_other_updates()
         elif package_filter.is_msft_all_classification_included():
-            return self.get_all_updates()
+            return self.get_all_updates() if inventory_snapshot is None else inventory_snapshot['all_updates']
         else:
             return [], []  # happens when nothing was selected, and inclusions are present
 
@@ -124,6 +164,78 @@ class PackageManager(object):
         pass
     # endregion
 
+    # region Package inventory snapshot
+    def take_inventory_snapshot(self, all_packages, all_package_versions, security_packages, security_package_versions):
+        """ Records the outcome of an assessment so that installation can skip refreshing and re-querying while the machine's repositories and packages are unchanged """
+        fingerprint = self.get_inventory_fingerprint()
+        if fingerprint is None:
+            self.composite_logger.log_debug("[PM] Package inventory snapshot not taken as its validity cannot be tracked on this machine.")
+            self.inventory_snapshot = None
+            return
+
+        self.inventory_snapshot_version += 1
+        self.inventory_snapshot = {
+            'version': self.inventory_snapshot_version,
+            'fingerprint': fingerprint,
+            'repository_fingerprint': self.get_inventory_fingerprint(include_package_database=False),
+            'max_patch_publish_date': self.max_patch_publish_date,
+            'all_updates': (list(all_packages), list(all_package_versions)),
+            'security_updates': (list(security_packages), list(security_package_versions))
+        }
+        self.composite_logger.log_debug("[PM] Package inventory snapshot taken. [Version={0}][AllUpdatesCount={1}][SecurityUpdatesCount={2}]".format(str(self.inventory_snapshot_version), str(len(all_packages)), str(len(security_packages))))
+
+    def get_inventory_snapshot(self):
+        """ Returns the last package inventory snapshot if it is still valid, else None. A snapshot is not valid once repository lists, the package database or the max patch publish date change. """
+        if self.inventory_snapshot is None:
+            return None
+
+        if self.inventory_snapshot['fingerprint'] != self.get_inventory_fingerprint() or self.inventory_snapshot['max_patch_publish_date'] != self.max_patch_publish_date:
+            self.composite_logger.log_debug("[PM] Package inventory snapshot is no longer valid. [Version={0}]".format(str(self.inventory_snapshot['version'])))
+            return None
+
+        return self.inventory_snapshot
+
+    def get_post_installation_inventory(self, installed_packages, installed_package_versions):
+        """ Derives available updates after installation from the pre-installation snapshot, while only the package database has changed since it was taken.
+            Updates reported installed are dropped, the rest are re-checked against the package database in bulk as they may have come in as dependencies.
+            Returns ((packages, package_versions), (security_packages, security_package_versions)), or None if a full assessment is required. """
+        if self.inventory_snapshot is None:
+            return None
+
+        if self.inventory_snapshot['repository_fingerprint'] is None or self.inventory_snapshot['repository_fingerprint'] != self.get_inventory_fingerprint(include_package_database=False) \
+                or self.inventory_snapshot['max_patch_publish_date'] != self.max_patch_publish_date:
+            self.composite_logger.log_debug("[PM] Package inventory snapshot cannot be reconciled after installation as repositories may have changed. [Version={0}]".format(str(self.inventory_snapshot['version'])))
+            return None
+
+        all_packages, all_package_versions = self.inventory_snapshot['all_updates']
+        security_packages, security_package_versions = self.inventory_snapshot['security_updates']
+
+        # only updates without a known install outcome need to be checked against the package database
+        known_installed = set(zip(installed_packages, installed_package_versions))
+        uncertain_updates = []
+        updates_seen = set(known_installed)
+        for update in list(zip(all_packages, all_package_versions)) + list(zip(security_packages, security_package_versions)):
+            if update not in updates_seen:
+                updates_seen.add(update)
+                uncertain_updates.append(update)
+        install_check_results = self.are_package_versions_installed([package for package, version in uncertain_updates], [version for package, version in uncertain_updates]) if len(uncertain_updates) > 0 else []
+        pending_updates = set(update for update, is_installed in zip(uncertain_updates, install_check_results) if not is_installed)
+
+        # a security update is only still available if the package still has an update available at all
+        reconciled_all_updates = [update for update in zip(all_packages, all_package_versions) if update in pending_updates]
+        pending_packages = set(package for package, version in reconciled_all_updates)
+        reconciled_security_updates = [update for update in zip(security_packages, security_package_versions) if update in pending_updates and update[0] in pending_packages]
+
+        self.composite_logger.log_debug("[PM] Package inventory reconciled after installation. [Version={0}][KnownInstalledCount={1}][CheckedCount={2}][AllUpdatesCount={3}][SecurityUpdatesCount={4}]".format(
+            str(self.inventory_snapshot['version']), str(len(known_installed)), str(len(uncertain_updates)), str(len(reconciled_all_updates)), str(len(reconciled_security_updates))))
+        return ([package for package, version in reconciled_all_updates], [version for package, version in reconciled_all_updates]), \
+               ([package for package, version in reconciled_security_updates], [version for package, version in reconciled_security_updates])
+
+    def get_inventory_fingerprint(self, include_package_database=True):
+        """ Returns (path, mtime, size) of the repository lists and, optionally, the package database, or None if none of them are present """
+        return RepoFreshnessTracker.get_fingerprint(self.inventory_fingerprint_paths + (self.inventory_package_database_paths if include_package_database else []))
+    # endregion
+
     def get_updates_for_inclusions(self, package_filter):
         """Get missing updates for inclusions"""
         self.composite_logger.log_verbose("[PM] Checking for inclusions...")
@@ -175,17 +287,7 @@ class PackageManager(object):
     @staticmethod
     def dedupe_update_packages(packages, package_versions):
         """Remove duplicate packages and returns"""
-        deduped_packages = []
-        deduped_package_versions = []
-
-        for index, package in enumerate(packages):
-            if package in deduped_packages:
-                continue  # Already included
-
-            deduped_packages.append(package)
-            deduped_package_versions.append(package_versions[index])
-
-        return deduped_packages, deduped_package_versions
+        return PackageSet(packages, package_versions).get_packages_and_versions()
     # endregion
 
     # region Install Update
@@ -236,11 +338,28 @@ class PackageManager(object):
         exec_cmd = str(self.get_install_command(cmd, package_and_dependencies, package_and_dependency_versions))
 
         self.composite_logger.log_debug("UPDATING PACKAGE (WITH DEPENDENCIES) USING COMMAND: " + exec_cmd)
+        start_time = time.time()
         out, code = self.invoke_package_manager_advanced(exec_cmd, raise_on_exception=False)
         self.composite_logger.log_debug("\n<PackageInstallOutput>\n" + out + "\n</PackageInstallOutput>")  # wrapping multi-line for readability
 
+        if simulate is False and code == 0:
+            self.install_time_model.record_install_outcome(package_and_dependencies, self.get_package_size(out), time.time() - start_time)
+
         return code, out, exec_cmd
 
+    def download_updates(self, packages, package_versions):
+        """ Best-effort prefetch of packages (and the dependencies the package manager resolves for them) into the local package cache, so that
+            installation does not wait on the network. Failures are not errors - installation downloads whatever is missing. Returns the exit code. """
+        if not self.single_package_download_cmd or len(packages) == 0:
+            return None
+
+        exec_cmd = str(self.get_install_command(self.single_package_download_cmd, packages, package_versions))
+        self.composite_logger.log_debug("[PM] Prefetching packages. [PackageCount={0}][Command={1}]".format(str(len(packages)), exec_cmd))
+        code, out = self.env_layer.run_command_output(exec_cmd, False, False)
+        if code != 0:
+            self.composite_logger.log_debug("[PM] Package prefetch did not complete; installation will download the remaining packages. [Code={0}][Output={1}]".format(str(code), out))
+        return code
+
     def get_installation_status(self, code, out, exec_cmd, package, version, simulate=False):
         """
         Returns result of the package installation
@@ -274,7 +393,7 @@ class PackageManager(object):
                 self.composite_logger.log_debug("[PM]    > Evidence of package no longer required NOT detected.")
 
         if not package_no_longer_required:
-            if not self.is_package_version_installed(package, version):
+            if not self.are_package_versions_installed([package], [version])[0]:
                 if code == 0 and self.STR_ONLY_UPGRADES.replace('<PACKAGE>', package) in out:
                     # It is premature to fail this package. In the *unlikely* case it never gets picked up, it'll remain NotStarted.
                     # The NotStarted status must not be written again in the calling function (it's not at the time of this writing).
@@ -360,6 +479,65 @@ class PackageManager(object):
         """ Returns true if the specific package version is installed """
         pass
 
+    def are_package_versions_installed(self, package_names, package_versions):
+        """ Returns, in order, whether each specific package version is installed. Package managers that can answer this for many packages at once override it. """
+        return [self.is_package_version_installed(package_name, package_version) for package_name, package_version in zip(package_names, package_versions)]
+
+    def are_package_versions_installed_as_per_rpm(self, package_names, package_versions, package_name_format):
+        """ Bulk install check for rpm-based package managers, answered from a single snapshot of all installed packages.
+            package_name_format is the rpm query format that yields package names the way this package manager reports them (e.g. %{NAME}.%{ARCH}) """
+        installed_package_versions = self.__get_rpm_installed_package_versions(package_name_format)
+        if installed_package_versions is None:
+            return PackageManager.are_package_versions_installed(self, package_names, package_versions)
+
+        install_check_results = []
+        for package_name, package_version in zip(package_names, package_versions):
+            is_installed = package_version in installed_package_versions.get(package_name, ())
+            self.composite_logger.log_verbose("[PM] Install check from rpm snapshot. [PackageName={0}][PackageVersion={1}][IsInstalled={2}][InstalledVersions={3}]".format(str(package_name), str(package_version), str(is_installed), str(sorted(installed_package_versions.get(package_name, ())))))
+            install_check_results.append(is_installed)
+        return install_check_results
+
+    def __get_rpm_installed_package_versions(self, package_name_format):
+        # type: (str) -> dict or None
+        """ Returns package name -> set of installed versions, from one 'rpm -qa' query. None if the query did not yield a usable snapshot. """
+        signature = (package_name_format, self.__get_rpm_db_signature())
+        if self.__rpm_installed_package_versions is not None and signature[1] is not None and self.__rpm_installed_package_versions_signature == signature:
+            return self.__rpm_installed_package_versions
+
+        # Sample output format (%{NAME}.%{ARCH} %{EPOCH}:%{VERSION}-%{RELEASE})
+        # kernel.x86_64 (none):3.10.0-514.el7
+        # tar.x86_64 2:1.26-34.el7
+        cmd = self.cmd_rpm_installed_packages_query_template.replace('<PACKAGE-NAME-FORMAT>', package_name_format)
+        code, output = self.env_layer.run_command_output(cmd, False, False)
+        installed_package_versions = {}
+        for line in output.strip().splitlines() if code == 0 and output is not None else []:
+            package_details = line.split()
+            if len(package_details) != 2 or ':' not in package_details[1]:
+                self.composite_logger.log_verbose("[PM] > Inapplicable line: " + str(line))
+                continue
+            epoch, version = package_details[1].split(':', 1)
+            # epoch is only part of the version package managers report when it is set to something other than 0
+            installed_package_versions.setdefault(package_details[0], set()).add(version if epoch in ('(none)', '0') else epoch + ':' + version)
+
+        if len(installed_package_versions) == 0:
+            self.composite_logger.log_debug("[PM] Installed package snapshot from rpm is not available. [Code={0}][Output={1}]".format(str(code), str(output)))
+            return None
+
+        self.__rpm_installed_package_versions = installed_package_versions
+        self.__rpm_installed_package_versions_signature = signature
+        return installed_package_versions
+
+    def __get_rpm_db_signature(self):
+        """ Returns (path, mtime, size) of the rpm database files present, or None if none are present and the database cannot be tracked """
+        signature = []
+        for rpm_db_file_path in self.RPM_DB_FILE_PATHS:
+            try:
+                file_stat = os.stat(rpm_db_file_path)
+                signature.append((rpm_db_file_path, file_stat.st_mtime, file_stat.st_size))
+            except (IOError, OSError):
+                continue
+        return tuple(signature) if len(signature) > 0 else None
+
     @abstractmethod
     def get_dependent_list(self, package_name):
         """Retrieve available updates. Expect an array being returned"""
@@ -453,17 +631,16 @@ class PackageManager(object):
         pass
 
     @abstractmethod
-    def add_arch_dependencies(self, package_manager, package, version, packages, package_versions, package_and_dependencies, package_and_dependency_versions):
+    def add_arch_dependencies(self, package_manager, package, version, selected_updates, package_and_dependencies, package_and_dependency_versions):
         """
-        Add the packages with same name as that of input parameter package but with different architectures from packages list to the list package_and_dependencies.
+        Add the packages with same name as that of input parameter package but with different architectures from selected_updates to the list package_and_dependencies.
         Only required for yum. No-op for apt and zypper.
 
         Parameters:
         package_manager (PackageManager): Package manager used.
         package (string): Input package for which same package name but different architecture need to be added in the list package_and_dependencies.
         version (string): version of the package.
-        packages (List of strings): List of all packages selected by user to install.
-        package_versions (List of strings): Versions of packages in packages list.
+        selected_updates (PackageSet): All packages selected by user to install, with their versions.
         package_and_dependencies (List of strings): List of packages along with dependencies. This function adds packages with same name as input parameter package
                                                     but different architecture in this list.
         package_and_dependency_versions (List of strings): Versions of packages in package_and_dependencies.
@@ -478,8 +655,7 @@ class PackageManager(object):
     def separate_out_esm_packages(self, packages, package_versions):
         pass
     
-    @abstractmethod
-    def get_package_install_expected_avg_time_in_seconds(self):
-        """Retrieves average time to install package in seconds."""
-        pass
+    def get_package_install_expected_avg_time_in_seconds(self, packages=None):
+        """Retrieves expected average time to install a package (or the given packages) in seconds, as learned on the machine."""
+        return self.install_time_model.get_expected_avg_time_in_seconds(packages, self.package_install_expected_avg_time_in_seconds)
 
@@ -37,7 +37,7 @@ class UbuntuProClient:
         run_command_success = False
         try:
             # Install Ubuntu Pro Client.
-            code, output = self.env_layer.run_command_output(self.ubuntu_pro_client_install_cmd, False, False)
+            code, output = self.env_layer.run_outside_command_deadline(self.env_layer.run_command_output, self.ubuntu_pro_client_install_cmd, False, False)
             if code == 0:
                 run_command_success = True
         except Exception as error:
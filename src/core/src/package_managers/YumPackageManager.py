@@ -20,6 +20,8 @@ import os
 import re
 from core.src.package_managers.PackageManager import PackageManager
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.PackageSet import PackageSet
+from core.src.package_managers.YumRepodataReader import YumRepodataReader
 
 
 class YumPackageManager(PackageManager):
@@ -29,6 +31,8 @@ class YumPackageManager(PackageManager):
         super(YumPackageManager, self).__init__(env_layer, execution_config, composite_logger, telemetry_writer, status_handler)
         # Repo refresh
         # There is no command as this is a no op.
+        self.inventory_fingerprint_paths = ['/etc/yum.conf', '/etc/dnf/dnf.conf', '/etc/yum.repos.d/*', '/var/cache/yum/*/*/*/repomd.xml', '/var/cache/dnf/*/repodata/repomd.xml']
+        self.inventory_package_database_paths = self.RPM_DB_FILE_PATHS
 
         # Support to get updates and their dependencies
         self.yum_check = 'sudo yum -q check-update'
@@ -37,9 +41,11 @@ class YumPackageManager(PackageManager):
         self.single_package_check_versions = 'sudo yum list available <PACKAGE-NAME> --showduplicates'
         self.single_package_check_installed = 'sudo yum list installed <PACKAGE-NAME>'
         self.single_package_upgrade_simulation_cmd = 'LANG=en_US.UTF8 sudo yum install --assumeno --skip-broken '
+        self.repodata_reader = YumRepodataReader(env_layer, composite_logger)
 
         # Install update
         self.single_package_upgrade_cmd = 'sudo yum -y install --skip-broken '
+        self.single_package_download_cmd = 'sudo yum -y install --skip-broken --downloadonly '
         self.all_but_excluded_upgrade_cmd = 'sudo yum -y update --exclude='
 
         # Package manager exit code(s)
@@ -103,12 +109,12 @@ class YumPackageManager(PackageManager):
         pass  # Refresh the repo is no ops in YUM
 
     # region Get Available Updates
-    def invoke_package_manager_advanced(self, command, raise_on_exception=True):
+    def invoke_package_manager_advanced(self, command, raise_on_exception=True, output_parser=None):
         """Get missing updates using the command input"""
         self.composite_logger.log_verbose("[YPM] Invoking package manager. [Command={0}]".format(str(command)))
-        code, out = self.env_layer.run_command_output(command, False, False)
+        code, out = self.run_command_output_with_parser(command, output_parser)
 
-        code, out = self.try_mitigate_issues_if_any(command, code, out)
+        code, out = self.try_mitigate_issues_if_any(command, code, out, output_parser)
 
         if code not in [self.yum_exitcode_ok, self.yum_exitcode_no_applicable_packages, self.yum_exitcode_updates_available]:
             self.composite_logger.log_warning('[ERROR] Customer environment error. [Command={0}][Code={1}][Output={2}]'.format(command, str(code), str(out)))
@@ -129,8 +135,9 @@ class YumPackageManager(PackageManager):
             self.composite_logger.log_debug("[YPM] Get all updates : [Cached={0}][PackagesCount={1}]]".format(str(cached), len(self.all_updates_cached)))
             return self.all_updates_cached, self.all_update_versions_cached  # allows for high performance reuse in areas of the code explicitly aware of the cache
 
-        out = self.invoke_package_manager(self.yum_check)
-        self.all_updates_cached, self.all_update_versions_cached = self.extract_packages_and_versions(out)
+        output_parser = self.UpdateListOutputParser(self.get_product_name, self.composite_logger)
+        self.invoke_package_manager(self.yum_check, output_parser)
+        self.all_updates_cached, self.all_update_versions_cached = self.dedupe_update_packages(*output_parser.get_packages_and_versions())
 
         self.composite_logger.log_debug("[YPM] Get all updates : [Cached={0}][PackagesCount={1}]]".format(str(False), len(self.all_updates_cached)))
         return self.all_updates_cached, self.all_update_versions_cached
@@ -142,8 +149,9 @@ class YumPackageManager(PackageManager):
         if not self.__is_image_rhel8_or_higher():
             self.install_yum_security_prerequisite()
 
-        out = self.invoke_package_manager(self.yum_check_security)
-        security_packages, security_package_versions = self.extract_packages_and_versions(out)
+        output_parser = self.UpdateListOutputParser(self.get_product_name, self.composite_logger)
+        self.invoke_package_manager(self.yum_check_security, output_parser)
+        security_packages, security_package_versions = self.dedupe_update_packages(*output_parser.get_packages_and_versions())
 
         if len(security_packages) == 0 and 'CentOS' in str(self.env_layer.platform.linux_distribution()):   # deliberately non-terminal
             self.composite_logger.log_warning("Classification-based patching is only supported on YUM if the machine is independently configured to receive classification information.")
@@ -154,9 +162,6 @@ class YumPackageManager(PackageManager):
     def get_other_updates(self):
         """Get missing other updates"""
         self.composite_logger.log_verbose("[YPM] Discovering 'other' packages...")
-        other_packages = []
-        other_package_versions = []
-
         all_packages, all_package_versions = self.get_all_updates(True)
         security_packages, security_package_versions = self.get_security_updates()
         if len(security_packages) == 0 and 'CentOS' in str(self.env_layer.platform.linux_distribution()):  # deliberately terminal - erring on the side of caution to avoid dissat in uninformed customers
@@ -166,10 +171,7 @@ class YumPackageManager(PackageManager):
             self.status_handler.add_error_to_status(error_msg, Constants.PatchOperationErrorCodes.PACKAGE_MANAGER_FAILURE)
             raise Exception(error_msg, "[{0}]".format(Constants.ERROR_ADDED_TO_STATUS))
 
-        for index, package in enumerate(all_packages):
-            if package not in security_packages:
-                other_packages.append(package)
-                other_package_versions.append(all_package_versions[index])
+        other_packages, other_package_versions = PackageSet(all_packages, all_package_versions).difference(security_packages).get_packages_and_versions()
 
         self.composite_logger.log_debug("[YPM] Discovered 'other' packages. [Count={0}]".format(len(other_packages)))
         return other_packages, other_package_versions
@@ -190,7 +192,7 @@ class YumPackageManager(PackageManager):
 
     def install_yum_security_prerequisite(self):
         """Not installed by default in versions prior to RHEL 7. This step is idempotent and fast, so we're not writing more complex code."""
-        code, out = self.env_layer.run_command_output(self.yum_check_security_prerequisite, False, False)
+        code, out = self.env_layer.run_outside_command_deadline(self.env_layer.run_command_output, self.yum_check_security_prerequisite, False, False)
         self.composite_logger.log_verbose("[YPM] Ensuring RHEL yum-plugin-security is present. [Code={0}][Out={1}]".format(str(code), out))
     # endregion
 
@@ -204,45 +206,76 @@ class YumPackageManager(PackageManager):
     def extract_packages_and_versions_including_duplicates(self, output):
         """Returns packages and versions from given output"""
         self.composite_logger.log_verbose("[YPM] Extracting package and version data...")
-        packages = []
-        versions = []
-        package_extensions = Constants.SUPPORTED_PACKAGE_ARCH
-
-        def is_package(chunk):
-            # Using a list comprehension to determine if chunk is a package
-            return len([p for p in package_extensions if p in chunk]) == 1
-
-        lines = output.strip().split('\n')
+        output_parser = self.UpdateListOutputParser(self.get_product_name, self.composite_logger)
+        for line in output.strip().split('\n'):
+            output_parser.parse_line(line)
+        return output_parser.get_packages_and_versions()
+
+    class UpdateListOutputParser(object):
+        """ Extracts packages and versions from yum package listings one line at a time, as the output is produced. Entries may wrap onto a second line. """
+        def __init__(self, get_product_name, composite_logger):
+            self.get_product_name = get_product_name
+            self.composite_logger = composite_logger
+            self.packages = []
+            self.versions = []
+            self.__line_count = 0
+            self.__previous_line = None         # a line is evaluated once the next one is known
+            self.__blank_lines_pending = 0      # trailing blank lines are not part of the output
+            self.__obsoleting_packages_reached = False
+
+        def reset(self):
+            self.__init__(self.get_product_name, self.composite_logger)
+
+        def parse_line(self, line):
+            if self.__obsoleting_packages_reached:
+                return
+
+            line = line.strip()
+            if line == str():
+                self.__blank_lines_pending += 1
+                return
+
+            for pending_line in [str()] * self.__blank_lines_pending + [line]:
+                self.__evaluate_previous_line(pending_line)
+            self.__blank_lines_pending = 0
 
-        for line_index in range(0, len(lines)):
             # Do not install Obsoleting Packages. The obsoleting packages list comes towards end in the output.
-            if lines[line_index].strip().startswith("Obsoleting Packages"):
-                break
+            if line.startswith("Obsoleting Packages"):
+                self.__obsoleting_packages_reached = True
+                self.__previous_line = None
 
-            line = re.split(r'\s+', lines[line_index].strip())
-            next_line = []
+        def get_packages_and_versions(self):
+            self.__evaluate_previous_line(None)
+            return self.packages, self.versions
 
-            if line_index < len(lines) - 1:
-                next_line = re.split(r'\s+', lines[line_index + 1].strip())
+        def __evaluate_previous_line(self, next_line):
+            previous_line = self.__previous_line
+            self.__previous_line = next_line
+            if previous_line is None:
+                return
+
+            line = previous_line.split() or [str()]
+            next_line = (next_line.split() or [str()]) if next_line is not None else []
 
             # If we run into a length of 3, we'll accept it and continue
-            if len(line) == 3 and is_package(line[0]):
-                packages.append(self.get_product_name(line[0]))
-                versions.append(line[1])
+            if len(line) == 3 and self.__is_package(line[0]):
+                self.packages.append(self.get_product_name(line[0]))
+                self.versions.append(line[1])
             # We will handle these two edge cases where the output is on
             # two different lines and treat them as one line
-            elif len(line) == 1 and len(next_line) == 2 and is_package(line[0]):
-                packages.append(self.get_product_name(line[0]))
-                versions.append(next_line[0])
-                line_index += 1
-            elif len(line) == 2 and len(next_line) == 1 and is_package(line[0]):
-                packages.append(self.get_product_name(line[0]))
-                versions.append(line[1])
-                line_index += 1
+            elif len(line) == 1 and len(next_line) == 2 and self.__is_package(line[0]):
+                self.packages.append(self.get_product_name(line[0]))
+                self.versions.append(next_line[0])
+            elif len(line) == 2 and len(next_line) == 1 and self.__is_package(line[0]):
+                self.packages.append(self.get_product_name(line[0]))
+                self.versions.append(line[1])
             else:
-                self.composite_logger.log_verbose("[YPM] > Inapplicable line (" + str(line_index) + "): " + lines[line_index])
+                self.composite_logger.log_verbose("[YPM] > Inapplicable line (" + str(self.__line_count) + "): " + previous_line)
+            self.__line_count += 1
 
-        return packages, versions
+        @staticmethod
+        def __is_package(chunk):
+            return len([p for p in Constants.SUPPORTED_PACKAGE_ARCH if p in chunk]) == 1
     # endregion
     # endregion
 
@@ -275,9 +308,39 @@ class YumPackageManager(PackageManager):
         # kernel.x86_64                                                                                    3.10.0-862.el7                                                                                         base
         # kernel.x86_64                                                                                    3.10.0-862.2.3.el7                                                                                     updates
         # kernel.x86_64                                                                                    3.10.0-862.3.2.el7                                                                                     updates
+
+        # PREFERRED METHOD - in-memory lookup against the repository metadata yum/dnf cached, no process spawned
+        package_versions = self.__get_available_versions_from_repodata(package_name)
+        if package_versions is not None:
+            return package_versions
+
+        # DEFAULT METHOD
         cmd = self.single_package_check_versions.replace('<PACKAGE-NAME>', package_name)
-        output = self.invoke_package_manager(cmd)
-        packages, package_versions = self.extract_packages_and_versions_including_duplicates(output)
+        output_parser = self.UpdateListOutputParser(self.get_product_name, self.composite_logger)
+        self.invoke_package_manager(cmd, output_parser)
+        packages, package_versions = output_parser.get_packages_and_versions()
+        return package_versions
+
+    def __get_available_versions_from_repodata(self, package_name):
+        # type: (str) -> list or None
+        """ Returns the available versions of the package in the cached repository metadata, lowest first as with yum list, or None if the cache cannot answer for it """
+        product_name, product_arch = self.get_product_name_and_arch(package_name)
+        available_packages = self.repodata_reader.get_available_versions(product_name)
+        if available_packages is None:
+            return None
+
+        available_packages = [(arch, version) for arch, version in available_packages if product_arch is None or '.' + arch == product_arch]
+        if len(available_packages) == 0:
+            return []
+
+        # as with yum list available, versions already installed are not included
+        install_check_results = self.are_package_versions_installed([product_name + '.' + arch for arch, version in available_packages], [version for arch, version in available_packages])
+        package_versions = []
+        for (arch, version), is_installed in zip(available_packages, install_check_results):
+            if not is_installed and version not in package_versions:
+                package_versions.append(version)
+
+        self.composite_logger.log_verbose("[YPM] Available versions found in cached repository metadata. [Package={0}][Versions={1}]".format(package_name, str(package_versions)))
         return package_versions
 
     def is_package_version_installed(self, package_name, package_version):
@@ -302,6 +365,10 @@ class YumPackageManager(PackageManager):
         self.composite_logger.log_debug("[YPM] > Installed version match NOT found. [PackageName={0}][PackageVersion={1}]".format(str(package_name), str(package_version)))
         return False
 
+    def are_package_versions_installed(self, package_names, package_versions):
+        """ Returns, in order, whether each specific package version is installed, from one snapshot of the rpm database """
+        return self.are_package_versions_installed_as_per_rpm(package_names, package_versions, package_name_format='%{NAME}.%{ARCH}')
+
     def extract_dependencies(self, output, packages):
         # Extracts dependent packages from output. Refer yum_update_output_expected_formats.txt for examples of supported output formats.
 
@@ -848,14 +915,14 @@ class YumPackageManager(PackageManager):
     # endregion
 
     # region Handling known errors
-    def try_mitigate_issues_if_any(self, command, code, out):
+    def try_mitigate_issues_if_any(self, command, code, out, output_parser=None):
         """ Attempt to fix the errors occurred while executing a command. Repeat check until no issues found """
         if "Error" in out or "Errno" in out:
             issue_mitigated = self.check_known_issues_and_attempt_fix(out)
             if issue_mitigated:
                 self.composite_logger.log_debug('Post mitigation, invoking package manager again using: ' + command)
-                code_after_fix_attempt, out_after_fix_attempt = self.env_layer.run_command_output(command, False, False)
-                return self.try_mitigate_issues_if_any(command, code_after_fix_attempt, out_after_fix_attempt)
+                code_after_fix_attempt, out_after_fix_attempt = self.run_command_output_with_parser(command, output_parser)
+                return self.try_mitigate_issues_if_any(command, code_after_fix_attempt, out_after_fix_attempt, output_parser)
         return code, out
 
     def check_known_issues_and_attempt_fix(self, output):
@@ -901,7 +968,7 @@ class YumPackageManager(PackageManager):
         """Signals whether processes require a restart due to updates"""
         self.composite_logger.log_verbose("[YPM] Checking if process requires reboot")
         # Checking using yum-utils
-        code, out = self.env_layer.run_command_output(self.yum_utils_prerequisite, False, False)  # idempotent, doesn't install if already present
+        code, out = self.env_layer.run_outside_command_deadline(self.env_layer.run_command_output, self.yum_utils_prerequisite, False, False)  # idempotent, doesn't install if already present
         self.composite_logger.log_verbose("[YPM] Idempotent yum-utils existence check. [Code={0}][Out={1}]".format(str(code), out))
 
         # Checking for restart for distros with -r flag such as RHEL 7+
@@ -924,7 +991,7 @@ class YumPackageManager(PackageManager):
                 return True
 
         # Double-checking using yum ps (where available)
-        code, out = self.env_layer.run_command_output(self.yum_ps_prerequisite, False, False)  # idempotent, doesn't install if already present
+        code, out = self.env_layer.run_outside_command_deadline(self.env_layer.run_command_output, self.yum_ps_prerequisite, False, False)  # idempotent, doesn't install if already present
         if out.find("Unable to find a match: yum-plugin-security") < 0:
             self.composite_logger.log_debug("[YPM][Info] yum-plugin-ps is not present. This is okay on RHEL8+. [Code={0}][Out={1}]".format(str(code), out))
         else:
@@ -968,24 +1035,22 @@ class YumPackageManager(PackageManager):
         return process_count != 0  # True if there were any
     # endregion Reboot Management
 
-    def add_arch_dependencies(self, package_manager, package, version, packages, package_versions, package_and_dependencies, package_and_dependency_versions):
+    def add_arch_dependencies(self, package_manager, package, version, selected_updates, package_and_dependencies, package_and_dependency_versions):
         """
-        Add the packages with same name as that of input parameter package but with different architectures from packages list to the list package_and_dependencies.
+        Add the packages with same name as that of input parameter package but with different architectures from selected_updates to the list package_and_dependencies.
         Parameters:
         package_manager (PackageManager): Package manager used.
         package (string): Input package for which same package name but different architecture need to be added in the list package_and_dependencies.
         version (string): version of the package.
-        packages (List of strings): List of all packages selected by user to install.
-        package_versions (List of strings): Versions of packages in packages list.
+        selected_updates (PackageSet): All packages selected by user to install, with their versions.
         package_and_dependencies (List of strings): List of packages along with dependencies. This function adds packages with same name as input parameter package
-                                                    but different architecture in this list.
+                                                    but different architecture in this list. Duplicates are removed by the caller.
         package_and_dependency_versions (List of strings): Versions of packages in package_and_dependencies.
         """
-        package_name_without_arch = package_manager.get_product_name_without_arch(package)
-        for possible_arch_dependency, possible_arch_dependency_version in zip(packages, package_versions):
-            if package_manager.get_product_name_without_arch(possible_arch_dependency) == package_name_without_arch and possible_arch_dependency not in package_and_dependencies and possible_arch_dependency_version == version:
-                package_and_dependencies.append(possible_arch_dependency)
-                package_and_dependency_versions.append(possible_arch_dependency_version)
+        for possible_arch_dependency in selected_updates.get_arch_siblings(package, package_manager.get_product_name_without_arch):
+            if possible_arch_dependency.package != package and possible_arch_dependency.version == version:
+                package_and_dependencies.append(possible_arch_dependency.package)
+                package_and_dependency_versions.append(possible_arch_dependency.version)
 
     def set_security_esm_package_status(self, operation, packages):
         """
@@ -1003,7 +1068,3 @@ class YumPackageManager(PackageManager):
         esm_packages_found = False
 
         return packages, package_versions, esm_packages, esm_package_versions, esm_packages_found
-
-    def get_package_install_expected_avg_time_in_seconds(self):
-        return self.package_install_expected_avg_time_in_seconds
-
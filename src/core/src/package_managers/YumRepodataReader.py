@@ -0,0 +1,288 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+"""Reader of the repository metadata (repodata) cached by yum and dnf"""
+import bz2
+import functools
+import glob
+import gzip
+import os
+import re
+import time
+from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.RepoFreshnessTracker import RepoFreshnessTracker
+from core.src.core_logic.VersionComparator import VersionComparator
+
+
+class YumRepodataReader(object):
+    """ Answers available package version queries in memory, from the primary metadata yum/dnf already cached for the enabled repositories,
+        instead of starting a package manager process that loads all repository metadata again for every query. The cache is only used while every
+        enabled repository has its current primary metadata cached within the expiry, and no package filtering is configured that yum would apply. """
+
+    REPOMD_NAMESPACE = '{http://linux.duke.edu/metadata/repo}'
+    PRIMARY_NAMESPACE = '{http://linux.duke.edu/metadata/common}'
+    MODULAR_RELEASE_PATTERN = re.compile(r'\.module[+_]')    # e.g. 1.module+el8.4.0+10713+4d2d6ff7, 1.module_f34+11431+c43f6a4e
+    ENABLED_VALUES = ('1', 'yes', 'true', 'on')
+    PACKAGE_FILTER_OPTIONS = ('exclude', 'excludepkgs', 'includepkgs')
+
+    def __init__(self, env_layer, composite_logger):
+        self.env_layer = env_layer
+        self.composite_logger = composite_logger
+
+        self.main_config_paths = ['/etc/yum.conf', '/etc/dnf/dnf.conf']
+        self.repo_config_patterns = ['/etc/yum.repos.d/*.repo']
+        self.versionlock_list_paths = ['/etc/yum/pluginconf.d/versionlock.list', '/etc/dnf/plugins/versionlock.list']
+        self.yum_repomd_pattern = '/var/cache/yum/*/*/*/repomd.xml'             # repository cache of yum: /var/cache/yum/<basearch>/<releasever>/<repo id>
+        self.dnf_repomd_pattern = '/var/cache/dnf/*/repodata/repomd.xml'        # repository cache of dnf: /var/cache/dnf/<repo id>-<hash>
+        self.max_age_in_hours = Constants.REPODATA_CACHE_MAX_AGE_IN_HOURS
+
+        self.__index = None                 # package name -> [(architecture, version)], from the primary metadata of all enabled repositories
+        self.__modular_package_names = set()  # names of packages that are built for module streams, which yum filters by the streams enabled
+        self.__index_signature = None       # (path, mtime, size) of the configuration and repository metadata files the index was built from
+        self.__index_expiry_time = None     # time at which the repository metadata the index was built from expires
+
+    def get_available_versions(self, package_name):
+        # type: (str) -> list or None
+        """ Returns (architecture, version) of the packages in the enabled repositories with the name, lowest version first as listed by yum.
+            Returns None if the cached repository metadata cannot answer for the package, in which case the package manager is to be queried. """
+        index = self.__get_index()
+        if index is None:
+            return None
+        if package_name in self.__modular_package_names:
+            self.composite_logger.log_verbose("[RDR] Package is built for module streams, which are not evaluated from cached repository metadata. [Package={0}]".format(package_name))
+            return None
+
+        return sorted(index.get(package_name, []), key=functools.cmp_to_key(lambda package_a, package_b: VersionComparator.compare_rpm_versions(package_a[1], package_b[1])))
+
+    # region Index
+    def __get_index(self):
+        # type: () -> dict or None
+        """ Returns the index of the cached primary metadata, built once and re-built only when the configuration or repository metadata changes """
+        signature = RepoFreshnessTracker.get_fingerprint(self.main_config_paths + self.repo_config_patterns + self.versionlock_list_paths +
+                                                         [self.yum_repomd_pattern, os.path.join(os.path.dirname(self.yum_repomd_pattern), 'cachecookie'), self.dnf_repomd_pattern])
+        if signature is None:
+            return None
+
+        if signature != self.__index_signature:
+            self.__index, self.__index_expiry_time = self.__build_index()
+            self.__index_signature = signature
+
+        if self.__index is not None and time.time() >= self.__index_expiry_time:
+            self.composite_logger.log_debug("[RDR] Cached repository metadata has expired since it was read.")
+            return None
+        return self.__index
+
+    def __build_index(self):
+        # type: () -> (dict or None, float or None)
+        """ Reads the cached primary metadata of all enabled repositories. Returns the index and its expiry time, or (None, None) if the cache cannot be used. """
+        try:
+            repo_configs = self.__read_repo_configs()
+            if any(option in options and options[option].strip() != str() for options in repo_configs.values() for option in self.PACKAGE_FILTER_OPTIONS):
+                self.composite_logger.log_debug("[RDR] Package exclusions or inclusions are configured. Cached repository metadata will not be used.")
+                return None, None
+            if any(self.__has_entries(path) for path in self.versionlock_list_paths):
+                self.composite_logger.log_debug("[RDR] Package versions are locked. Cached repository metadata will not be used.")
+                return None, None
+
+            enabled_repo_ids = [repo_id for repo_id, options in repo_configs.items() if repo_id != 'main' and options.get('enabled', '1').strip().lower() in self.ENABLED_VALUES]
+            if len(enabled_repo_ids) == 0:
+                return None, None
+
+            repo_caches = self.__get_repo_caches()
+            index = {}
+            modular_package_names = set()
+            oldest_check_time = time.time()
+            for repo_id in sorted(enabled_repo_ids):
+                if repo_id not in repo_caches:
+                    self.composite_logger.log_debug("[RDR] No cached metadata for enabled repository. Cached repository metadata will not be used. [RepoId={0}]".format(repo_id))
+                    return None, None
+
+                repo_dir, repomd_path, check_time = repo_caches[repo_id]
+                if time.time() - check_time >= self.max_age_in_hours * 3600:
+                    self.composite_logger.log_debug("[RDR] Cached metadata of repository has expired. Cached repository metadata will not be used. [RepoId={0}][RepomdPath={1}]".format(repo_id, repomd_path))
+                    return None, None
+                if not self.__read_primary_metadata(repo_dir, repomd_path, index, modular_package_names):
+                    self.composite_logger.log_debug("[RDR] No current primary metadata cached for repository. Cached repository metadata will not be used. [RepoId={0}][RepoDir={1}]".format(repo_id, repo_dir))
+                    return None, None
+                oldest_check_time = min(oldest_check_time, check_time)
+        except Exception as error:
+            self.composite_logger.log_debug("[RDR] Unable to read cached repository metadata. [Error={0}]".format(repr(error)))
+            return None, None
+
+        self.__modular_package_names = modular_package_names
+        self.composite_logger.log_debug("[RDR] Read cached repository metadata. [Repos={0}][PackageCount={1}][ModularPackageCount={2}]".format(str(sorted(enabled_repo_ids)), str(len(index)), str(len(modular_package_names))))
+        return index, oldest_check_time + self.max_age_in_hours * 3600
+
+    def __add_to_index(self, index, modular_package_names, name, arch, epoch, version, release):
+        # type: (dict, set, str, str, str, str, str) -> None
+        if arch in ('src', 'nosrc'):
+            return
+        if self.MODULAR_RELEASE_PATTERN.search(release):
+            modular_package_names.add(name)
+        # epoch is only part of the version yum reports when it is set to something other than 0
+        index.setdefault(name, []).append((arch, "{0}-{1}".format(version, release) if epoch in (None, str(), '0') else "{0}:{1}-{2}".format(epoch, version, release)))
+    # endregion
+
+    # region Repository configuration and cache
+    def __read_repo_configs(self):
+        # type: () -> dict
+        """ Returns section -> {option: value} of the main configuration and the repository configuration files. Reference: man yum.conf, man dnf.conf """
+        repo_configs = {}
+        config_paths = [path for path in self.main_config_paths if os.path.isfile(path)]
+        for repo_config_pattern in self.repo_config_patterns:
+            config_paths += sorted(glob.glob(repo_config_pattern))
+
+        for config_path in config_paths:
+            options, option = None, None
+            for line in self.env_layer.file_system.read_with_retry(config_path).splitlines():
+                if line.strip() == str() or line.lstrip().startswith(('#', ';')):
+                    continue
+                if line[0].isspace() and options is not None and option is not None:   # continuation of a multi-line value
+                    options[option] += ' ' + line.strip()
+                elif line.strip().startswith('[') and line.strip().endswith(']'):
+                    options, option = repo_configs.setdefault(line.strip()[1:-1].strip(), {}), None
+                elif '=' in line and options is not None:
+                    option, value = line.split('=', 1)
+                    option = option.strip().lower()
+                    options[option] = value.strip()
+        return repo_configs
+
+    def __has_entries(self, path):
+        # type: (str) -> bool
+        if not os.path.isfile(path):
+            return False
+        return any(line.strip() != str() and not line.strip().startswith('#') for line in self.env_layer.file_system.read_with_retry(path).splitlines())
+
+    def __get_repo_caches(self):
+        # type: () -> dict
+        """ Returns repo id -> (repository cache directory, repomd.xml path, last metadata check time) of the most recently checked cache of each repository """
+        repo_caches = {}
+        cached_repomd_paths = [(os.path.dirname(path), path, os.path.basename(os.path.dirname(path))) for path in glob.glob(self.yum_repomd_pattern)] + \
+                              [(os.path.dirname(os.path.dirname(path)), path, os.path.basename(os.path.dirname(os.path.dirname(path))).rsplit('-', 1)[0]) for path in glob.glob(self.dnf_repomd_pattern)]  # dnf suffixes the repo id with a hash
+        for repo_dir, repomd_path, repo_id in cached_repomd_paths:
+
+            # yum touches the cachecookie file when it finds the repository metadata current, without rewriting repomd.xml
+            cache_cookie_path = os.path.join(repo_dir, 'cachecookie')
+            check_time = max(os.path.getmtime(repomd_path), os.path.getmtime(cache_cookie_path) if os.path.isfile(cache_cookie_path) else 0)
+            if repo_id not in repo_caches or check_time > repo_caches[repo_id][2]:
+                repo_caches[repo_id] = (repo_dir, repomd_path, check_time)
+        return repo_caches
+    # endregion
+
+    # region Primary metadata
+    def __read_primary_metadata(self, repo_dir, repomd_path, index, modular_package_names):
+        # type: (str, str, dict, set) -> bool
+        """ Adds the packages in the primary metadata of the repository to the index. Returns False if the primary metadata that repomd.xml refers to is not cached. """
+        # Sample repomd.xml format ------------------------------------------
+        # <repomd xmlns="http://linux.duke.edu/metadata/repo">
+        #   <data type="primary">
+        #     <location href="repodata/6e1d...-primary.xml.gz"/>
+        #     <size>3216541</size>
+        #   </data>
+        #   <data type="primary_db">
+        #     <location href="repodata/4d5a...-primary.sqlite.bz2"/>
+        #     <size>6563215</size>
+        #   </data>
+        #  ------------------------------------------ --------------------
+        primary_metadata = {}     # data type -> local path of the file, if cached in full
+        for data_element in self.__get_element_tree().parse(repomd_path).getroot().findall(self.REPOMD_NAMESPACE + 'data'):
+            location_element = data_element.find(self.REPOMD_NAMESPACE + 'location')
+            if data_element.get('type') not in ('primary', 'primary_db') or location_element is None:
+                continue
+            href = location_element.get('href', str())
+            size = data_element.findtext(self.REPOMD_NAMESPACE + 'size')
+            for path in (os.path.join(repo_dir, href), os.path.join(repo_dir, os.path.basename(href))):     # dnf keeps the repodata layout, yum keeps the files flat
+                if os.path.isfile(path) and (size is None or str(os.path.getsize(path)) == size.strip()):
+                    primary_metadata[data_element.get('type')] = path
+                    break
+
+        # yum decompresses the primary sqlite database under gen/ after downloading it
+        primary_db_path = os.path.join(repo_dir, 'gen', 'primary_db.sqlite')
+        if 'primary_db' in primary_metadata and os.path.isfile(primary_db_path) and os.path.getmtime(primary_db_path) >= os.path.getmtime(primary_metadata['primary_db']):
+            return self.__read_primary_db(primary_db_path, index, modular_package_names)
+        if 'primary' in primary_metadata:
+            return self.__read_primary_xml(primary_metadata['primary'], index, modular_package_names)
+        return False
+
+    def __read_primary_db(self, primary_db_path, index, modular_package_names):
+        # type: (str, dict, set) -> bool
+        try:
+            import sqlite3
+        except ImportError:
+            return False
+
+        connection = sqlite3.connect(primary_db_path)
+        try:
+            for name, arch, epoch, version, release in connection.execute('SELECT name, arch, epoch, version, release FROM packages'):
+                self.__add_to_index(index, modular_package_names, str(name), str(arch), str(epoch), str(version), str(release))
+        finally:
+            connection.close()
+        return True
+
+    def __read_primary_xml(self, primary_path, index, modular_package_names):
+        # type: (str, dict, set) -> bool
+        """ Streams the primary metadata, so only one package is held in memory in full at a time. Reference: createrepo_c, primary.xml """
+        # Sample primary.xml format ------------------------------------------
+        # <metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="1">
+        #   <package type="rpm">
+        #     <name>kernel</name>
+        #     <arch>x86_64</arch>
+        #     <version epoch="0" ver="4.18.0" rel="553.el8_10"/>
+        #     <format>...</format>
+        #   </package>
+        #  ------------------------------------------ --------------------
+        primary_file = self.__open_compressed_file(primary_path)
+        if primary_file is None:
+            return False
+
+        try:
+            for event, element in self.__get_element_tree().iterparse(primary_file, events=('end',)):
+                if element.tag != self.PRIMARY_NAMESPACE + 'package':
+                    continue
+                version_element = element.find(self.PRIMARY_NAMESPACE + 'version')
+                if version_element is not None:
+                    self.__add_to_index(index, modular_package_names, element.findtext(self.PRIMARY_NAMESPACE + 'name'), element.findtext(self.PRIMARY_NAMESPACE + 'arch'),
+                                        version_element.get('epoch'), version_element.get('ver'), version_element.get('rel'))
+                element.clear()     # only an empty element per package is retained
+        finally:
+            primary_file.close()
+        return True
+
+    @staticmethod
+    def __open_compressed_file(path):
+        """ Opens the file for reading with the decompression its extension calls for. Returns None for compression that is not available. """
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        if path.endswith('.bz2'):
+            return bz2.BZ2File(path)
+        if path.endswith('.xz'):
+            try:
+                import lzma
+            except ImportError:
+                return None
+            return lzma.open(path, 'rb')
+        if path.endswith('.xml'):
+            return open(path, 'rb')
+        return None     # e.g. zstd or zchunk
+
+    @staticmethod
+    def __get_element_tree():
+        try:
+            import xml.etree.cElementTree as ElementTree    # much faster on Python 2, and an alias of ElementTree where it is deprecated
+        except ImportError:
+            import xml.etree.ElementTree as ElementTree
+        return ElementTree
+    # endregion
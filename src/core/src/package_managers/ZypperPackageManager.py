@@ -21,6 +21,7 @@ import re
 import time
 from core.src.package_managers.PackageManager import PackageManager
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.PackageSet import PackageSet
 
 
 class ZypperPackageManager(PackageManager):
@@ -41,6 +42,8 @@ class ZypperPackageManager(PackageManager):
         self.repo_clean = 'sudo zypper clean -a'
         self.repo_refresh = 'sudo zypper refresh'
         self.repo_refresh_services = 'sudo zypper refresh --services'
+        self.inventory_fingerprint_paths = ['/etc/zypp/repos.d/*', '/etc/zypp/services.d/*', '/var/cache/zypp/solv/*/solv']
+        self.inventory_package_database_paths = self.RPM_DB_FILE_PATHS
 
         # Support to get updates and their dependencies
         self.zypper_check = 'sudo LANG=en_US.UTF8 zypper list-updates'
@@ -51,6 +54,7 @@ class ZypperPackageManager(PackageManager):
 
         # Install update
         self.single_package_upgrade_cmd = 'sudo zypper --non-interactive update '
+        self.single_package_download_cmd = 'sudo zypper --non-interactive update --download-only '
         self.zypper_install_security_patches = 'sudo zypper --non-interactive patch --category security'
 
         # Package manager exit code(s)
@@ -90,10 +94,15 @@ class ZypperPackageManager(PackageManager):
         self.package_install_expected_avg_time_in_seconds = 240  # As per telemetry data, the average time to install package is around 232 seconds for zypper.
 
     def refresh_repo(self):
+        if self.repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, self.inventory_fingerprint_paths):
+            self.composite_logger.log_debug("[ZPM] Skipping local repo refresh, as it is still fresh.")
+            return
+
         self.composite_logger.log_debug("[ZPM] Refreshing local repo...")
         # self.invoke_package_manager(self.repo_clean)  # purges local metadata for rebuild - addresses a possible customer environment error
         try:
             self.invoke_package_manager(self.repo_refresh)
+            self.repo_freshness_tracker.record_refresh(Constants.MACHINE_SOURCES, self.inventory_fingerprint_paths)
         except Exception as error:
             # Reboot if not already done
             if self.status_handler.get_installation_reboot_status() == Constants.RebootStatus.COMPLETED:
@@ -118,14 +127,14 @@ class ZypperPackageManager(PackageManager):
                 self.force_reboot = True
 
     # region Get Available Updates
-    def invoke_package_manager_advanced(self, command, raise_on_exception=True):
+    def invoke_package_manager_advanced(self, command, raise_on_exception=True, output_parser=None):
         """Get missing updates using the command input"""
         self.composite_logger.log_verbose("[ZPM] Invoking package manager. [Command={0}]".format(str(command)))
         repo_refresh_services_attempted = False
 
         for i in range(1, self.package_manager_max_retries + 1):
             self.set_lock_timeout_and_backup_original()
-            code, out = self.env_layer.run_command_output(command, False, False)
+            code, out = self.run_command_output_with_parser(command, output_parser)
             self.restore_original_lock_timeout()
 
             if code not in self.zypper_success_exit_codes:  # more known return codes should be added as appropriate
@@ -288,8 +297,9 @@ class ZypperPackageManager(PackageManager):
             self.composite_logger.log_debug("[ZPM] > Returning cached package data.")
             return self.all_updates_cached, self.all_update_versions_cached  # allows for high performance reuse in areas of the code explicitly aware of the cache
 
-        out = self.invoke_package_manager(self.zypper_check)
-        self.all_updates_cached, self.all_update_versions_cached = self.extract_packages_and_versions(out)
+        output_parser = self.UpdateListOutputParser(self.composite_logger)
+        self.invoke_package_manager(self.zypper_check, output_parser)
+        self.all_updates_cached, self.all_update_versions_cached = output_parser.packages, output_parser.versions
         self.composite_logger.log_debug("[ZPM] Discovered " + str(len(self.all_updates_cached)) + " package entries.")
         return self.all_updates_cached, self.all_update_versions_cached
 
@@ -300,8 +310,9 @@ class ZypperPackageManager(PackageManager):
         security_package_versions = []
 
         # Get all security packages
-        out = self.invoke_package_manager(self.zypper_install_security_patches_simulate)
-        packages_from_patch_data = self.extract_packages_from_patch_data(out)
+        output_parser = self.PatchDataOutputParser(self.composite_logger)
+        self.invoke_package_manager(self.zypper_install_security_patches_simulate, output_parser)
+        packages_from_patch_data = output_parser.get_packages()
 
         # Correlate and enrich with versions from all package data
         all_packages, all_package_versions = self.get_all_updates(True)
@@ -318,12 +329,11 @@ class ZypperPackageManager(PackageManager):
     def get_other_updates(self):
         """Get missing other updates"""
         self.composite_logger.log_debug("[ZPM] Discovering 'other' packages...")
-        other_packages = []
-        other_package_versions = []
 
         # Get all security packages
-        out = self.invoke_package_manager(self.zypper_install_security_patches_simulate)
-        packages_from_patch_data = self.extract_packages_from_patch_data(out)
+        output_parser = self.PatchDataOutputParser(self.composite_logger)
+        self.invoke_package_manager(self.zypper_install_security_patches_simulate, output_parser)
+        packages_from_patch_data = output_parser.get_packages()
 
         # SPECIAL CONDITION IF ZYPPER UPDATE IS DETECTED - UNAVOIDABLE SECURITY UPDATE(S) WILL BE INSTALLED AND THE RUN REPEATED FOR 'OTHER".
         if self.get_package_manager_setting(Constants.PACKAGE_MGR_SETTING_REPEAT_PATCH_OPERATION, True):
@@ -335,11 +345,10 @@ class ZypperPackageManager(PackageManager):
         # Subtract from all package data
         all_packages, all_package_versions = self.get_all_updates(True)
 
-        for index, package in enumerate(all_packages):
-            if package not in packages_from_patch_data:
-                other_packages.append(package)
-                other_package_versions.append(all_package_versions[index])
-                self.composite_logger.log_verbose("[ZPM]  - " + str(package) + " [" + str(all_package_versions[index]) + "]")
+        other_updates = PackageSet(all_packages, all_package_versions).difference(packages_from_patch_data)
+        for entry in other_updates:
+            self.composite_logger.log_verbose("[ZPM]  - " + str(entry.package) + " [" + str(entry.version) + "]")
+        other_packages, other_package_versions = other_updates.get_packages_and_versions()
 
         self.composite_logger.log_debug("[ZPM] Discovered " + str(len(other_packages)) + " 'other' package entries.\n")
         return other_packages, other_package_versions
@@ -351,7 +360,22 @@ class ZypperPackageManager(PackageManager):
     # region Output Parser(s)
     def extract_packages_and_versions(self, output):
         """Returns packages and versions from given output"""
+        self.composite_logger.log_verbose("\nExtracting package and version data...")
+        output_parser = self.UpdateListOutputParser(self.composite_logger)
+        for line in output.strip().split('\n'):
+            output_parser.parse_line(line)
+        return output_parser.packages, output_parser.versions
+
+    def extract_packages_from_patch_data(self, output):
+        """Returns packages (sometimes with version information embedded) from patch data"""
+        self.composite_logger.log_debug("[ZPM] Extracting package entries from security patch data...")
+        output_parser = self.PatchDataOutputParser(self.composite_logger)
+        for line in output.strip().split('\n'):
+            output_parser.parse_line(line)
+        return output_parser.get_packages()
 
+    class UpdateListOutputParser(object):
+        """ Extracts packages and versions from the 'zypper list-updates' table one line at a time, as the output is produced """
         # Sample output for the cmd 'zypper list-updates' is :
         # Loading repository data...
         # Reading installed packages...
@@ -359,55 +383,60 @@ class ZypperPackageManager(PackageManager):
         # --+--------------------+--------------------+-----------------+-------------------+-------#
         # v | SLES12-SP2-Updates | kernel-default     | 4.4.38-93.1     | 4.4.49-92.11.1    | x86_64
         # v | SLES12-SP2-Updates | libgoa-1_0-0       | 3.20.4-7.2      | 3.20.5-9.6        | x86_64
+        def __init__(self, composite_logger):
+            self.composite_logger = composite_logger
+            self.packages = []
+            self.versions = []
 
-        self.composite_logger.log_verbose("\nExtracting package and version data...")
-        packages = []
-        versions = []
+        def reset(self):
+            self.__init__(self.composite_logger)
 
-        lines = output.strip().split('\n')
-        for line in lines:
+        def parse_line(self, line):
+            line = line.rstrip('\r\n')
             line_split = line.split(' | ')
             if len(line_split) == 6 and line_split[1].strip() != 'Repository':
                 package = line_split[2].strip()
-                packages.append(package)
+                self.packages.append(package)
                 version = line_split[4].strip()
-                versions.append(version)
+                self.versions.append(version)
                 self.composite_logger.log_verbose("[ZPM] > Applicable line: " + line + ". Package: " + package + ". Version: " + version + ".")
             else:
                 self.composite_logger.log_verbose("[ZPM] > Inapplicable line: " + line)
 
-        return packages, versions
+    class PatchDataOutputParser(object):
+        """ Extracts packages (sometimes with version information embedded) from zypper security patch data one line at a time, as the output is produced """
+        def __init__(self, composite_logger):
+            self.composite_logger = composite_logger
+            self.packages = []
+            self.__seeing_packages = False
 
-    def extract_packages_from_patch_data(self, output):
-        """Returns packages (sometimes with version information embedded) from patch data"""
-        self.composite_logger.log_debug("[ZPM] Extracting package entries from security patch data...")
-        packages = []
-        parser_seeing_packages_flag = False
+        def reset(self):
+            self.__init__(self.composite_logger)
 
-        lines = output.strip().split('\n')
-        for line in lines:
-            if not parser_seeing_packages_flag:
+        def parse_line(self, line):
+            line = line.rstrip('\r\n')
+            if not self.__seeing_packages:
                 if 'package is going to be installed' in line or 'package is going to be upgraded' in line or \
                         'packages are going to be installed:' in line or 'packages are going to be upgraded:' in line:
                     self.composite_logger.log_verbose("[ZPM] > Start marker line: " + line)
-                    parser_seeing_packages_flag = True  # Start -- Next line contains information we need
+                    self.__seeing_packages = True  # Start -- Next line contains information we need
                 else:
                     self.composite_logger.log_verbose("[ZPM] > Inapplicable line: " + line)
-                continue
+                return
 
             if not line or line.isspace():
                 self.composite_logger.log_verbose("[ZPM] > End marker line: " + line)
-                parser_seeing_packages_flag = False
-                continue  # End -- We're past a package information block
+                self.__seeing_packages = False
+                return  # End -- We're past a package information block
 
-            line_parts = line.strip().split(' ')
             self.composite_logger.log_verbose("[ZPM] > Package list line: " + line)
-            for line_part in line_parts:
-                packages.append(line_part)
+            for line_part in line.strip().split(' '):
+                self.packages.append(line_part)
                 self.composite_logger.log_verbose("    - Package: " + line_part)
 
-        self.composite_logger.log_verbose("[ZPM] Extracted " + str(len(packages)) + " prospective package entries from security patch data.\n")
-        return packages
+        def get_packages(self):
+            self.composite_logger.log_verbose("[ZPM] Extracted " + str(len(self.packages)) + " prospective package entries from security patch data.\n")
+            return self.packages
     # endregion
     # endregion
 
@@ -441,6 +470,10 @@ class ZypperPackageManager(PackageManager):
         self.composite_logger.log_debug("[ZPM] > Installed version match NOT found for: " + str(package_name) + "(" + str(package_version) + ")")
         return False
 
+    def are_package_versions_installed(self, package_names, package_versions):
+        """ Returns, in order, whether each specific package version is installed, from one snapshot of the rpm database """
+        return self.are_package_versions_installed_as_per_rpm(package_names, package_versions, package_name_format='%{NAME}')
+
     def get_all_available_versions_of_package_ex(self, package_name, include_installed=False, include_available=True):
         """ Returns a list of all the available versions of a package """
         # Sample output format
@@ -812,9 +845,9 @@ class ZypperPackageManager(PackageManager):
         return process_count != 0  # True if there were any
     # endregion Reboot Management
 
-    def add_arch_dependencies(self, package_manager, package, version, packages, package_versions, package_and_dependencies, package_and_dependency_versions):
+    def add_arch_dependencies(self, package_manager, package, version, selected_updates, package_and_dependencies, package_and_dependency_versions):
         """
-        Add the packages with same name as that of input parameter package but with different architectures from packages list to the list package_and_dependencies.
+        Add the packages with same name as that of input parameter package but with different architectures from selected_updates to the list package_and_dependencies.
         Only required for yum. No-op for apt and zypper.
         """
         return
@@ -835,7 +868,3 @@ class ZypperPackageManager(PackageManager):
         esm_packages_found = False
 
         return packages, package_versions, esm_packages, esm_package_versions, esm_packages_found
-
-    def get_package_install_expected_avg_time_in_seconds(self):
-        return self.package_install_expected_avg_time_in_seconds
-
@@ -13,14 +13,15 @@
 # limitations under the License.
 #
 # Requires Python 2.7+
+import bisect
 import collections
-import copy
 import datetime
 import glob
 import json
 import os
 import re
 import shutil
+import threading
 import time
 from core.src.bootstrap.Constants import Constants
 
@@ -54,6 +55,9 @@ class StatusHandler(object):
         self.__installation_substatus_msg_copy = None  # store copy of message json for truncation and avoid reference modification
         self.__installation_patches_copy = []  # store copy of installation patches for truncation and avoid reference modification
         self.__installation_patches_removed = []  # store truncated patches for tombstone and logging
+        self.__installation_patch_json_cache = {}  # serialized json of each patch by patchId, dropped whenever the patch record changes
+        self.__installation_packages_buckets = {}  # (classification order, state order) -> [(insertion sequence, patchId)], kept sorted
+        self.__installation_packages_sort_keys = {}  # patchId -> ((classification order, state order), insertion sequence)
 
         # Internal in-memory representation of Patch Assessment data
         self.__assessment_substatus_json = None
@@ -65,6 +69,9 @@ class StatusHandler(object):
         self.__assessment_substatus_msg_copy = None  # store copy of message json for truncation and avoid reference modification
         self.__assessment_patches_copy = []    # store copy of assessment patches for truncation and avoid reference modification
         self.__assessment_patches_removed = []   # store truncated patches for tombstone and logging
+        self.__assessment_patch_json_cache = {}  # serialized json of each patch by patchId, dropped whenever the patch record changes
+        self.__assessment_packages_buckets = {}  # (classification order, state order) -> [(insertion sequence, patchId)], kept sorted
+        self.__assessment_packages_sort_keys = {}  # patchId -> ((classification order, state order), insertion sequence)
 
         # Internal in-memory representation of Patch Metadata for HealthStore
         self.__metadata_for_healthstore_substatus_json = None
@@ -80,6 +87,12 @@ class StatusHandler(object):
         self.__configure_patching_auto_assessment_errors = []
         self.__configure_patching_auto_assessment_error_count = 0  # All errors relating to auto-assessment configuration.
 
+        # Write-behind state. Transitioning substatus updates are coalesced into at most one status file write per latency window
+        self.__status_file_write_lock = threading.RLock()
+        self.__is_status_file_write_pending = False
+        self.__last_status_file_write_time = None
+        self.__status_file_write_timer = None
+
         # Load the currently persisted status file into memory
         self.load_status_file_components(initial_load=True)
 
@@ -112,106 +125,133 @@ class StatusHandler(object):
     # region - Package Data
     def reset_assessment_data(self):
         """ Externally available method to wipe out any assessment package records in memory. """
-        self.__assessment_substatus_json = None
-        self.__assessment_summary_json = None
-        self.__assessment_packages = []
-        self.__assessment_errors = []
-        self.__assessment_total_error_count = 0
-        self.__assessment_packages_map = collections.OrderedDict()
-        self.__assessment_patches_copy = []    # Reset the assessment patch copy
-        self.__assessment_substatus_msg_copy = None  # Reset the message json
-        self.__assessment_patches_removed = []   # Reset list
+        with self.__status_file_write_lock:
+            self.__assessment_substatus_json = None
+            self.__assessment_summary_json = None
+            self.__assessment_packages = []
+            self.__assessment_errors = []
+            self.__assessment_total_error_count = 0
+            self.__assessment_packages_map = collections.OrderedDict()
+            self.__assessment_patches_copy = []    # Reset the assessment patch copy
+            self.__assessment_substatus_msg_copy = None  # Reset the message json
+            self.__assessment_patches_removed = []   # Reset list
+            self.__assessment_patch_json_cache = {}
+            self.__assessment_packages_buckets = {}
+            self.__assessment_packages_sort_keys = {}
 
     def set_package_assessment_status(self, package_names, package_versions, classification="Other", status="Available"):
         """ Externally available method to set assessment status for one or more packages of the **SAME classification and status** """
-        self.composite_logger.log_debug("Setting package assessment status in bulk. [Count={0}]".format(str(len(package_names))))
-
-        for package_name, package_version in zip(package_names, package_versions):
-            patch_already_saved = False
-            patch_id = self.__get_patch_id(package_name, package_version)
-
-            # Match patch_id in map and update existing patch's classification i.e from other -> security
-            if len(self.__assessment_packages_map) > 0 and patch_id in self.__assessment_packages_map:
-                self.__assessment_packages_map.setdefault(patch_id, {})['classifications'] = [classification]
-                # self.__assessment_packages_map.setdefault(patch_id, {})['patchState'] = status
-                patch_already_saved = True
-
-            if patch_already_saved is False:
-                record = {
-                    "patchId": str(patch_id),
-                    "name": str(package_name),
-                    "version": str(package_version),
-                    "classifications": [classification]
-                    # "patchState": str(status) # Allows for capturing 'Installed' packages in addition to 'Available', when commented out, if spec changes
-                }
-                # Add new patch to map
-                self.__assessment_packages_map[patch_id] = record
-
-        self.__assessment_packages = list(self.__assessment_packages_map.values())
-        self.__assessment_packages = self.sort_packages_by_classification_and_state(self.__assessment_packages)
-        self.set_assessment_substatus_json()
+        with self.__status_file_write_lock:
+            self.composite_logger.log_debug("Setting package assessment status in bulk. [Count={0}]".format(str(len(package_names))))
+
+            for package_name, package_version in zip(package_names, package_versions):
+                patch_already_saved = False
+                patch_id = self.__get_patch_id(package_name, package_version)
+
+                # Match patch_id in map and update existing patch's classification i.e from other -> security
+                if len(self.__assessment_packages_map) > 0 and patch_id in self.__assessment_packages_map:
+                    self.__assessment_packages_map.setdefault(patch_id, {})['classifications'] = [classification]
+                    # self.__assessment_packages_map.setdefault(patch_id, {})['patchState'] = status
+                    self.__assessment_patch_json_cache.pop(patch_id, None)
+                    self.__index_package_by_classification_and_state(self.__assessment_packages_buckets, self.__assessment_packages_sort_keys, patch_id, self.__assessment_packages_map[patch_id])
+                    patch_already_saved = True
+
+                if patch_already_saved is False:
+                    record = {
+                        "patchId": str(patch_id),
+                        "name": str(package_name),
+                        "version": str(package_version),
+                        "classifications": [classification]
+                        # "patchState": str(status) # Allows for capturing 'Installed' packages in addition to 'Available', when commented out, if spec changes
+                    }
+                    # Add new patch to map
+                    self.__assessment_packages_map[patch_id] = record
+                    self.__index_package_by_classification_and_state(self.__assessment_packages_buckets, self.__assessment_packages_sort_keys, patch_id, record)
+
+            self.__assessment_packages = self.__get_packages_from_buckets(self.__assessment_packages_buckets, self.__assessment_packages_map)
+            self.set_assessment_substatus_json()
 
     def sort_packages_by_classification_and_state(self, packages_list):
         """ Sorts a list of packages (usually either self.__assessment_packages or self.__installation_packages) by classification and patchState properties.
             (sorting order from highest priority to lowest):
             1. Classification: Critical, Security, Other, Unclassified
             2. Patch Installation State: Failed, Installed, Available, Pending, Excluded, NotSelected
+            Status updates do not call this, they read packages in the same order from buckets maintained as each package changes.
         """
-        def sort_patch_state_key(x):
-            # Only for installation result packages
-            if "patchInstallationState" in x.keys():
-                return Constants.PatchStateOrderInStatusReporting[x["patchInstallationState"]]
-            else:
-                return 0
+        return sorted(packages_list, key=self.__get_classification_and_state_sort_key)
+
+    @staticmethod
+    def __get_classification_and_state_sort_key(package):
+        """ Combined sort key of a package record: highest priority classification first, then patch installation state (only for installation result packages) """
+        classification_order = min(Constants.PackageClassificationOrderInStatusReporting[classification] for classification in package["classifications"])
+        patch_state_order = Constants.PatchStateOrderInStatusReporting[package["patchInstallationState"]] if "patchInstallationState" in package else 0
+        return classification_order, patch_state_order
+
+    def __index_package_by_classification_and_state(self, packages_buckets, packages_sort_keys, patch_id, package):
+        """ Files a new or updated package record under its (classification, state) bucket. Within a bucket, packages keep the order they were first added in. """
+        sort_key = self.__get_classification_and_state_sort_key(package)
+        if patch_id in packages_sort_keys:
+            previous_sort_key, sequence = packages_sort_keys[patch_id]
+            if previous_sort_key == sort_key:
+                return
+            previous_bucket = packages_buckets[previous_sort_key]
+            del previous_bucket[bisect.bisect_left(previous_bucket, (sequence, patch_id))]
+            if len(previous_bucket) == 0:
+                del packages_buckets[previous_sort_key]
+        else:
+            sequence = len(packages_sort_keys)
 
-        def sort_classification_key(x):
-            lowest_classification = Constants.PackageClassificationOrderInStatusReporting[x["classifications"][0]]
-            for i in range(1, len(x["classifications"])):
-                lowest_classification = min(lowest_classification, Constants.PackageClassificationOrderInStatusReporting[x["classifications"][i]])
-            return lowest_classification
+        bisect.insort(packages_buckets.setdefault(sort_key, []), (sequence, patch_id))
+        packages_sort_keys[patch_id] = (sort_key, sequence)
 
-        # Sort by patch state first then sort by classification so each type of classification is already sorted at the end
-        list_sorted_by_patch_state = sorted(packages_list, key=sort_patch_state_key)
-        list_sorted_by_classification = sorted(list_sorted_by_patch_state, key=sort_classification_key)
-        # COMMENT: these sort calls can be combined into one by separating the value ranges in the tables above, such as classification_order to 100, 200, 300, etc
-        # and having one key function that combines the result of classification_order and patch_state_order
-        return list_sorted_by_classification
+    @staticmethod
+    def __get_packages_from_buckets(packages_buckets, packages_map):
+        """ Concatenates the buckets in priority order, which yields the same list as sort_packages_by_classification_and_state on the whole map """
+        return [packages_map[patch_id] for sort_key in sorted(packages_buckets) for sequence, patch_id in packages_buckets[sort_key]]
 
     def set_package_install_status(self, package_names, package_versions, status="Pending", classification=None):
         """ Externally available method to set installation status for one or more packages of the **SAME classification and status** """
-        self.composite_logger.log_debug("Setting package installation status in bulk. [Count={0}]".format(str(len(package_names))))
-        package_names, package_versions = self.validate_packages_being_installed(package_names, package_versions)
-        package_install_status_summary = ""
-
-        for package_name, package_version in zip(package_names, package_versions):
-            patch_already_saved = False
-            patch_id = self.__get_patch_id(package_name, package_version)
-            # Match patch_id in map and update existing patch's classification i.e from None -> security and update pending status
-            if len(self.__installation_packages_map) > 0 and patch_id in self.__installation_packages_map:
-                if classification is not None:
-                    self.__installation_packages_map.setdefault(patch_id, {})['classifications'] = [classification]
-                self.__installation_packages_map.setdefault(patch_id, {})['patchInstallationState'] = status
-                patch_already_saved = True
-
-            if patch_already_saved is False:
-                if classification is None:
-                    classification = Constants.PackageClassification.OTHER
-                record = {
-                    "patchId": str(patch_id),
-                    "name": str(package_name),
-                    "version": str(package_version),
-                    "classifications": [classification],
-                    "patchInstallationState": str(status)
-                }
-                # Add new patch to ordered map
-                self.__installation_packages_map[patch_id] = record
-
-            package_install_status_summary += "[P={0},V={1}] ".format(str(package_name), str(package_version))
-
-        self.composite_logger.log_debug("Package install status summary [Status= " + status + "] : " + package_install_status_summary)
-        self.__installation_packages = list(self.__installation_packages_map.values())
-        self.__installation_packages = self.sort_packages_by_classification_and_state(self.__installation_packages)
-        self.set_installation_substatus_json()
+        with self.__status_file_write_lock:
+            self.composite_logger.log_debug("Setting package installation status in bulk. [Count={0}]".format(str(len(package_names))))
+            package_names, package_versions = self.validate_packages_being_installed(package_names, package_versions)
+            package_install_status_summary = ""
+
+            for package_name, package_version in zip(package_names, package_versions):
+                patch_already_saved = False
+                patch_id = self.__get_patch_id(package_name, package_version)
+                # Match patch_id in map and update existing patch's classification i.e from None -> security and update pending status
+                if len(self.__installation_packages_map) > 0 and patch_id in self.__installation_packages_map:
+                    if classification is not None:
+                        self.__installation_packages_map.setdefault(patch_id, {})['classifications'] = [classification]
+                    self.__installation_packages_map.setdefault(patch_id, {})['patchInstallationState'] = status
+                    self.__installation_patch_json_cache.pop(patch_id, None)
+                    self.__index_package_by_classification_and_state(self.__installation_packages_buckets, self.__installation_packages_sort_keys, patch_id, self.__installation_packages_map[patch_id])
+                    patch_already_saved = True
+
+                if patch_already_saved is False:
+                    if classification is None:
+                        classification = Constants.PackageClassification.OTHER
+                    record = {
+                        "patchId": str(patch_id),
+                        "name": str(package_name),
+                        "version": str(package_version),
+                        "classifications": [classification],
+                        "patchInstallationState": str(status)
+                    }
+                    # Add new patch to ordered map
+                    self.__installation_packages_map[patch_id] = record
+                    self.__index_package_by_classification_and_state(self.__installation_packages_buckets, self.__installation_packages_sort_keys, patch_id, record)
+
+                package_install_status_summary += "[P={0},V={1}] ".format(str(package_name), str(package_version))
+
+            self.composite_logger.log_debug("Package install status summary [Status= " + status + "] : " + package_install_status_summary)
+            self.__installation_packages = self.__get_packages_from_buckets(self.__installation_packages_buckets, self.__installation_packages_map)
+            self.set_installation_substatus_json()
+
+    def get_installation_packages_by_state(self, status):
+        """ Returns names and versions of packages in installation status that are in the given installation state """
+        packages = [package for package in self.__installation_packages_map.values() if package['patchInstallationState'] == status]
+        return [package['name'] for package in packages], [package['version'] for package in packages]
 
     @staticmethod
     def validate_packages_being_installed(package_names, package_versions):
@@ -226,28 +266,30 @@ class StatusHandler(object):
 
     def set_package_install_status_classification(self, package_names, package_versions, classification=None):
         """ Externally available method to set classification for one or more packages being installed """
-        if classification is None:
-            self.composite_logger.log_debug("Classification not provided for the set of packages being installed. [Package Count={0}]".format(str(len(package_names))))
-            return
-
-        self.validate_packages_being_installed(package_names, package_versions)
-
-        self.composite_logger.log_debug("Setting package installation classification in bulk. [Count={0}]".format(str(len(package_names))))
-        package_classification_summary = ""
-        for package_name, package_version in zip(package_names, package_versions):
-            classification_matching_package_found = False
-            patch_id = self.__get_patch_id(package_name, package_version)
-            # Match patch_id in map and update existing patch's classification i.e from None -> security
-            if len(self.__installation_packages_map) > 0 and patch_id in self.__installation_packages_map:
-                self.__installation_packages_map.setdefault(patch_id, {})['classifications'] = [classification]
-                classification_matching_package_found = True
+        with self.__status_file_write_lock:
+            if classification is None:
+                self.composite_logger.log_debug("Classification not provided for the set of packages being installed. [Package Count={0}]".format(str(len(package_names))))
+                return
+
+            self.validate_packages_being_installed(package_names, package_versions)
+
+            self.composite_logger.log_debug("Setting package installation classification in bulk. [Count={0}]".format(str(len(package_names))))
+            package_classification_summary = ""
+            for package_name, package_version in zip(package_names, package_versions):
+                classification_matching_package_found = False
+                patch_id = self.__get_patch_id(package_name, package_version)
+                # Match patch_id in map and update existing patch's classification i.e from None -> security
+                if len(self.__installation_packages_map) > 0 and patch_id in self.__installation_packages_map:
+                    self.__installation_packages_map.setdefault(patch_id, {})['classifications'] = [classification]
+                    self.__installation_patch_json_cache.pop(patch_id, None)
+                    self.__index_package_by_classification_and_state(self.__installation_packages_buckets, self.__installation_packages_sort_keys, patch_id, self.__installation_packages_map[patch_id])
+                    classification_matching_package_found = True
 
-            package_classification_summary += "[P={0},V={1},C={2}] ".format(str(package_name), str(package_version), str(classification if classification is not None and classification_matching_package_found else "-"))
+                package_classification_summary += "[P={0},V={1},C={2}] ".format(str(package_name), str(package_version), str(classification if classification is not None and classification_matching_package_found else "-"))
 
-        self.composite_logger.log_debug("Package install status summary (classification): " + package_classification_summary)
-        self.__installation_packages = list(self.__installation_packages_map.values())
-        self.__installation_packages = self.sort_packages_by_classification_and_state(self.__installation_packages)
-        self.set_installation_substatus_json()
+            self.composite_logger.log_debug("Package install status summary (classification): " + package_classification_summary)
+            self.__installation_packages = self.__get_packages_from_buckets(self.__installation_packages_buckets, self.__installation_packages_map)
+            self.set_installation_substatus_json()
 
     def __get_patch_id(self, package_name, package_version):
         """ Returns normalized patch id """
@@ -271,22 +313,24 @@ class StatusHandler(object):
 
     def set_installation_reboot_status(self, new_reboot_status):
         """ Valid reboot statuses: NotNeeded, Required, Started, Failed, Completed """
-        if new_reboot_status not in [Constants.RebootStatus.NOT_NEEDED, Constants.RebootStatus.REQUIRED, Constants.RebootStatus.STARTED, Constants.RebootStatus.FAILED, Constants.RebootStatus.COMPLETED]:
-            raise "Invalid reboot status specified. [Status={0}]".format(str(new_reboot_status))
-
-        # State transition validation
-        if (new_reboot_status == Constants.RebootStatus.NOT_NEEDED and self.__installation_reboot_status not in [Constants.RebootStatus.NOT_NEEDED])\
-                or (new_reboot_status == Constants.RebootStatus.REQUIRED and self.__installation_reboot_status not in [Constants.RebootStatus.NOT_NEEDED, Constants.RebootStatus.REQUIRED, Constants.RebootStatus.COMPLETED])\
-                or (new_reboot_status == Constants.RebootStatus.STARTED and self.__installation_reboot_status not in [Constants.RebootStatus.NOT_NEEDED, Constants.RebootStatus.REQUIRED, Constants.RebootStatus.STARTED])\
-                or (new_reboot_status == Constants.RebootStatus.FAILED and self.__installation_reboot_status not in [Constants.RebootStatus.STARTED, Constants.RebootStatus.FAILED])\
-                or (new_reboot_status == Constants.RebootStatus.COMPLETED and self.__installation_reboot_status not in [Constants.RebootStatus.STARTED, Constants.RebootStatus.COMPLETED]):
-            self.composite_logger.log_error("Invalid reboot status transition attempted. [CurrentRebootStatus={0}] [NewRebootStatus={1}]".format(self.__installation_reboot_status, str(new_reboot_status)))
-            return
-
-        # Persisting new reboot status (with machine state incorporation)
-        self.composite_logger.log_debug("Setting new installation reboot status. [NewRebootStatus={0}] [CurrentRebootStatus={1}]".format(str(new_reboot_status), self.__installation_reboot_status))
-        self.__installation_reboot_status = new_reboot_status
-        self.set_installation_substatus_json()
+        with self.__status_file_write_lock:
+            if new_reboot_status not in [Constants.RebootStatus.NOT_NEEDED, Constants.RebootStatus.REQUIRED, Constants.RebootStatus.STARTED, Constants.RebootStatus.FAILED, Constants.RebootStatus.COMPLETED]:
+                raise "Invalid reboot status specified. [Status={0}]".format(str(new_reboot_status))
+
+            # State transition validation
+            if (new_reboot_status == Constants.RebootStatus.NOT_NEEDED and self.__installation_reboot_status not in [Constants.RebootStatus.NOT_NEEDED])\
+                    or (new_reboot_status == Constants.RebootStatus.REQUIRED and self.__installation_reboot_status not in [Constants.RebootStatus.NOT_NEEDED, Constants.RebootStatus.REQUIRED, Constants.RebootStatus.COMPLETED])\
+                    or (new_reboot_status == Constants.RebootStatus.STARTED and self.__installation_reboot_status not in [Constants.RebootStatus.NOT_NEEDED, Constants.RebootStatus.REQUIRED, Constants.RebootStatus.STARTED])\
+                    or (new_reboot_status == Constants.RebootStatus.FAILED and self.__installation_reboot_status not in [Constants.RebootStatus.STARTED, Constants.RebootStatus.FAILED])\
+                    or (new_reboot_status == Constants.RebootStatus.COMPLETED and self.__installation_reboot_status not in [Constants.RebootStatus.STARTED, Constants.RebootStatus.COMPLETED]):
+                self.composite_logger.log_error("Invalid reboot status transition attempted. [CurrentRebootStatus={0}] [NewRebootStatus={1}]".format(self.__installation_reboot_status, str(new_reboot_status)))
+                return
+
+            # Persisting new reboot status (with machine state incorporation)
+            self.composite_logger.log_debug("Setting new installation reboot status. [NewRebootStatus={0}] [CurrentRebootStatus={1}]".format(str(new_reboot_status), self.__installation_reboot_status))
+            self.__installation_reboot_status = new_reboot_status
+            self.set_installation_substatus_json()
+            self.flush_status_file()    # reboot status is always persisted right away, as the machine may be rebooted next
 
     def __refresh_installation_reboot_status(self):
         """ Discovers if the system needs a reboot. Never allows going back to NotNeeded (deliberate). ONLY called internally. """
@@ -325,24 +369,26 @@ class StatusHandler(object):
 
     # region - Substatus generation
     def set_maintenance_window_exceeded(self, maintenance_windows_exceeded):
-        self.__maintenance_window_exceeded = maintenance_windows_exceeded
-        self.set_installation_substatus_json()
+        with self.__status_file_write_lock:
+            self.__maintenance_window_exceeded = maintenance_windows_exceeded
+            self.set_installation_substatus_json()
 
     def set_assessment_substatus_json(self, status=Constants.STATUS_TRANSITIONING, code=0):
         """ Prepare the assessment substatus json including the message containing assessment summary """
-        self.composite_logger.log_debug("Setting assessment substatus. [Substatus={0}]".format(str(status)))
+        with self.__status_file_write_lock:
+            self.composite_logger.log_debug("Setting assessment substatus. [Substatus={0}]".format(str(status)))
 
-        # Wrap patches into assessment summary
-        self.__assessment_summary_json = self.__new_assessment_summary_json(self.__assessment_packages, status, code)
+            # Wrap patches into assessment summary
+            self.__assessment_summary_json = self.__new_assessment_summary_json(self.__assessment_packages, status, code)
 
-        # Wrap assessment summary into assessment substatus
-        self.__assessment_substatus_json = self.__new_substatus_json_for_operation(Constants.PATCH_ASSESSMENT_SUMMARY, status, code, json.dumps(self.__assessment_summary_json))
+            # Wrap assessment summary into assessment substatus
+            self.__assessment_substatus_json = self.__new_substatus_json_for_operation(Constants.PATCH_ASSESSMENT_SUMMARY, status, code, self.__get_summary_json_dumps(self.__assessment_summary_json, self.__assessment_patch_json_cache))
 
-        # Set force truncation true when final status is success or error
-        self.__set_force_truncation_on_terminal_status(substatus_status=status)
+            # Set force truncation true when final status is success or error
+            self.__set_force_truncation_on_terminal_status(substatus_status=status)
 
-        # Update complete status on disk
-        self.__write_status_file()
+            # Update complete status on disk, coalescing transitioning updates
+            self.__write_status_file_coalesced(substatus_status=status)
 
     def __new_assessment_summary_json(self, assessment_packages_json, status, code):
         """ Called by: set_assessment_substatus_json
@@ -382,19 +428,20 @@ class StatusHandler(object):
 
     def set_installation_substatus_json(self, status=Constants.STATUS_TRANSITIONING, code=0):
         """ Prepare the deployment substatus json including the message containing deployment summary """
-        self.composite_logger.log_debug("Setting installation substatus. [Substatus={0}]".format(str(status)))
+        with self.__status_file_write_lock:
+            self.composite_logger.log_debug("Setting installation substatus. [Substatus={0}]".format(str(status)))
 
-        # Wrap patches into installation summary
-        self.__installation_summary_json = self.__new_installation_summary_json(self.__installation_packages)
+            # Wrap patches into installation summary
+            self.__installation_summary_json = self.__new_installation_summary_json(self.__installation_packages)
 
-        # Wrap deployment summary into installation substatus
-        self.__installation_substatus_json = self.__new_substatus_json_for_operation(Constants.PATCH_INSTALLATION_SUMMARY, status, code, json.dumps(self.__installation_summary_json))
+            # Wrap deployment summary into installation substatus
+            self.__installation_substatus_json = self.__new_substatus_json_for_operation(Constants.PATCH_INSTALLATION_SUMMARY, status, code, self.__get_summary_json_dumps(self.__installation_summary_json, self.__installation_patch_json_cache))
 
-        # Set force truncation true when final status is success or error
-        self.__set_force_truncation_on_terminal_status(substatus_status=status)
+            # Set force truncation true when final status is success or error
+            self.__set_force_truncation_on_terminal_status(substatus_status=status)
 
-        # Update complete status on disk
-        self.__write_status_file()
+            # Update complete status on disk, coalescing transitioning updates
+            self.__write_status_file_coalesced(substatus_status=status)
 
     def __new_installation_summary_json(self, installation_packages_json):
         """ Called by: set_installation_substatus_json
@@ -444,22 +491,23 @@ class StatusHandler(object):
 
     def set_patch_metadata_for_healthstore_substatus_json(self, status=Constants.STATUS_SUCCESS, code=0, patch_version=Constants.PATCH_VERSION_UNKNOWN, report_to_healthstore=False, wait_after_update=False):
         """ Prepare the healthstore substatus json including message containing summary to be sent to healthstore """
-        if self.execution_config.exec_auto_assess_only:
-            raise Exception("Auto-assessment mode. Unexpected attempt to update healthstore status.")
+        with self.__status_file_write_lock:
+            if self.execution_config.exec_auto_assess_only:
+                raise Exception("Auto-assessment mode. Unexpected attempt to update healthstore status.")
 
-        self.composite_logger.log_debug("Setting patch metadata for healthstore substatus. [Substatus={0}] [Report to HealthStore={1}]".format(str(status), str(report_to_healthstore)))
+            self.composite_logger.log_debug("Setting patch metadata for healthstore substatus. [Substatus={0}] [Report to HealthStore={1}]".format(str(status), str(report_to_healthstore)))
 
-        # Wrap patch metadata into healthstore summary
-        self.__metadata_for_healthstore_summary_json = self.__new_patch_metadata_for_healthstore_json(patch_version, report_to_healthstore)
+            # Wrap patch metadata into healthstore summary
+            self.__metadata_for_healthstore_summary_json = self.__new_patch_metadata_for_healthstore_json(patch_version, report_to_healthstore)
 
-        # Wrap healthstore summary into healthstore substatus
-        self.__metadata_for_healthstore_substatus_json = self.__new_substatus_json_for_operation(Constants.PATCH_METADATA_FOR_HEALTHSTORE, status, code, json.dumps(self.__metadata_for_healthstore_summary_json))
+            # Wrap healthstore summary into healthstore substatus
+            self.__metadata_for_healthstore_substatus_json = self.__new_substatus_json_for_operation(Constants.PATCH_METADATA_FOR_HEALTHSTORE, status, code, json.dumps(self.__metadata_for_healthstore_summary_json))
 
-        # Set force truncation true when final status is success or error
-        self.__set_force_truncation_on_terminal_status(substatus_status=status)
+            # Set force truncation true when final status is success or error
+            self.__set_force_truncation_on_terminal_status(substatus_status=status)
 
-        # Update complete status on disk
-        self.__write_status_file()
+            # Update complete status on disk
+            self.__write_status_file()
 
         # wait period required in cases where we need to ensure HealthStore reads the status from GA
         if wait_after_update:
@@ -480,22 +528,23 @@ class StatusHandler(object):
                                               automatic_os_patch_state=Constants.AutomaticOSPatchStates.UNKNOWN,
                                               auto_assessment_state=Constants.AutoAssessmentStates.UNKNOWN):
         """ Prepare the configure patching substatus json including the message containing configure patching summary """
-        if self.execution_config.exec_auto_assess_only:
-            raise Exception("Auto-assessment mode. Unexpected attempt to update configure patching status.")
+        with self.__status_file_write_lock:
+            if self.execution_config.exec_auto_assess_only:
+                raise Exception("Auto-assessment mode. Unexpected attempt to update configure patching status.")
 
-        self.composite_logger.log_debug("Setting configure patching substatus. [Substatus={0}]".format(str(status)))
+            self.composite_logger.log_debug("Setting configure patching substatus. [Substatus={0}]".format(str(status)))
 
-        # Wrap default automatic OS patch state on the machine, at the time of this request, into configure patching summary
-        self.__configure_patching_summary_json = self.__new_configure_patching_summary_json(automatic_os_patch_state, auto_assessment_state, status, code)
+            # Wrap default automatic OS patch state on the machine, at the time of this request, into configure patching summary
+            self.__configure_patching_summary_json = self.__new_configure_patching_summary_json(automatic_os_patch_state, auto_assessment_state, status, code)
 
-        # Wrap configure patching summary into configure patching substatus
-        self.__configure_patching_substatus_json = self.__new_substatus_json_for_operation(Constants.CONFIGURE_PATCHING_SUMMARY, status, code, json.dumps(self.__configure_patching_summary_json))
+            # Wrap configure patching summary into configure patching substatus
+            self.__configure_patching_substatus_json = self.__new_substatus_json_for_operation(Constants.CONFIGURE_PATCHING_SUMMARY, status, code, json.dumps(self.__configure_patching_summary_json))
 
-        # Set force truncation true when final status is success or error
-        self.__set_force_truncation_on_terminal_status(substatus_status=status)
+            # Set force truncation true when final status is success or error
+            self.__set_force_truncation_on_terminal_status(substatus_status=status)
 
-        # Update complete status on disk
-        self.__write_status_file()
+            # Update complete status on disk
+            self.__write_status_file()
 
     def __new_configure_patching_summary_json(self, automatic_os_patch_state, auto_assessment_state, status, code):
         """ Called by: set_configure_patching_substatus_json
@@ -531,6 +580,21 @@ class StatusHandler(object):
                 "message": str(message)
             }
         }
+
+    @staticmethod
+    def __get_summary_json_dumps(summary_json, patch_json_cache):
+        """ Serializes an assessment or installation summary. Only patches that changed since they were last serialized are encoded again, all others are taken from the cache """
+        patches_json = []
+        for patch in summary_json["patches"]:
+            patch_json = patch_json_cache.get(patch["patchId"])
+            if patch_json is None:
+                patch_json = patch_json_cache[patch["patchId"]] = json.dumps(patch)
+            patches_json.append(patch_json)
+
+        # the patch list is spliced in, in place of a placeholder, so the rest of the summary keeps its regular serialization
+        summary_json_without_patches = dict(summary_json)
+        summary_json_without_patches["patches"] = Constants.STATUS_PATCHES_PLACEHOLDER
+        return json.dumps(summary_json_without_patches).replace(json.dumps(Constants.STATUS_PATCHES_PLACEHOLDER), "[{0}]".format(", ".join(patches_json)), 1)
     # endregion
 
     # region - Status generation
@@ -574,97 +638,111 @@ class StatusHandler(object):
         :return: None
         """
 
-        # Initializing records safely
-        self.__installation_substatus_json = None
-        self.__installation_summary_json = None
-        self.__installation_packages = []
-        self.__installation_errors = []
-        self.__installation_packages_map = collections.OrderedDict()
-        self.__installation_substatus_msg_copy = None
-        self.__installation_patches_copy = []
-        self.__installation_patches_removed = []
-
-        self.__assessment_substatus_json = None
-        self.__assessment_summary_json = None
-        self.__assessment_packages = []
-        self.__assessment_errors = []
-        self.__assessment_packages_map = collections.OrderedDict()
-        self.__assessment_substatus_msg_copy = None
-        self.__assessment_patches_copy = []
-        self.__assessment_patches_removed = []
-
-        self.__metadata_for_healthstore_substatus_json = None
-        self.__metadata_for_healthstore_summary_json = None
-
-        self.__configure_patching_substatus_json = None
-        self.__configure_patching_summary_json = None
-        self.__configure_patching_errors = []
-        self.__configure_patching_auto_assessment_errors = []
-
-        self.__truncation_timestamp = datetime.datetime(1971, 1, 1, 0, 0, 0)
-        self.__truncated_status_file_json_dumps = None
-        self.__force_truncation_on = False
-
-        self.composite_logger.log_debug("Loading status file components [InitialLoad={0}].".format(str(initial_load)))
-
-        # Retain 10 complete status files, and remove older files
-        self.__removed_older_complete_status_files(self.execution_config.status_folder)
-
-        # Verify the status file exists - if not, reset status file
-        if not os.path.exists(self.complete_status_file_path) and initial_load:
-            self.composite_logger.log_warning("Status file not found at initial load. Resetting status file to defaults.")
-            self.__reset_status_file()
-            return
-
-        # Load status data and sanity check structure - raise exception if data loss risk is detected on corrupt data
-        complete_status_file_data = self.__load_complete_status_file_data(self.complete_status_file_path)
-        if 'status' not in complete_status_file_data or 'substatus' not in complete_status_file_data['status']:
-            self.composite_logger.log_error("Malformed status file. Resetting status file for safety.")
-            self.__reset_status_file()
-            return
-
-        # Load portions of data that need to be built on for next write - raise exception if corrupt data is encountered
-        # todo: refactor
-        self.__high_level_status_message = complete_status_file_data['status']['formattedMessage']['message']
-        for i in range(0, len(complete_status_file_data['status']['substatus'])):
-            name = complete_status_file_data['status']['substatus'][i]['name']
-            if name == Constants.PATCH_INSTALLATION_SUMMARY:     # if it exists, it must be to spec, or an exception will get thrown
-                if self.execution_config.exec_auto_assess_only:
-                    self.__installation_substatus_json = complete_status_file_data['status']['substatus'][i]
-                else:
-                    self.__installation_summary_json = self.__get_substatus_message(complete_status_file_data, i)
-                    # Reload patches into installation ordered map for fast look up
-                    self.__installation_packages_map = collections.OrderedDict((package["patchId"], package) for package in self.__installation_summary_json['patches'])
-                    self.__installation_packages = list(self.__installation_packages_map.values())
-                    self.__maintenance_window_exceeded = bool(self.__installation_summary_json['maintenanceWindowExceeded'])
-                    self.__installation_reboot_status = self.__installation_summary_json['rebootStatus']
-                    errors = self.__installation_summary_json['errors']
+        with self.__status_file_write_lock:
+            # Persist any coalesced update before in-memory data is replaced with what is on disk
+            self.flush_status_file()
+
+            # Initializing records safely
+            self.__installation_substatus_json = None
+            self.__installation_summary_json = None
+            self.__installation_packages = []
+            self.__installation_errors = []
+            self.__installation_packages_map = collections.OrderedDict()
+            self.__installation_substatus_msg_copy = None
+            self.__installation_patches_copy = []
+            self.__installation_patches_removed = []
+            self.__installation_patch_json_cache = {}
+            self.__installation_packages_buckets = {}
+            self.__installation_packages_sort_keys = {}
+
+            self.__assessment_substatus_json = None
+            self.__assessment_summary_json = None
+            self.__assessment_packages = []
+            self.__assessment_errors = []
+            self.__assessment_packages_map = collections.OrderedDict()
+            self.__assessment_substatus_msg_copy = None
+            self.__assessment_patches_copy = []
+            self.__assessment_patches_removed = []
+            self.__assessment_patch_json_cache = {}
+            self.__assessment_packages_buckets = {}
+            self.__assessment_packages_sort_keys = {}
+
+            self.__metadata_for_healthstore_substatus_json = None
+            self.__metadata_for_healthstore_summary_json = None
+
+            self.__configure_patching_substatus_json = None
+            self.__configure_patching_summary_json = None
+            self.__configure_patching_errors = []
+            self.__configure_patching_auto_assessment_errors = []
+
+            self.__truncation_timestamp = datetime.datetime(1971, 1, 1, 0, 0, 0)
+            self.__truncated_status_file_json_dumps = None
+            self.__force_truncation_on = False
+
+            self.composite_logger.log_debug("Loading status file components [InitialLoad={0}].".format(str(initial_load)))
+
+            # Retain 10 complete status files, and remove older files
+            self.__removed_older_complete_status_files(self.execution_config.status_folder)
+
+            # Verify the status file exists - if not, reset status file
+            if not os.path.exists(self.complete_status_file_path) and initial_load:
+                self.composite_logger.log_warning("Status file not found at initial load. Resetting status file to defaults.")
+                self.__reset_status_file()
+                return
+
+            # Load status data and sanity check structure - raise exception if data loss risk is detected on corrupt data
+            complete_status_file_data = self.__load_complete_status_file_data(self.complete_status_file_path)
+            if 'status' not in complete_status_file_data or 'substatus' not in complete_status_file_data['status']:
+                self.composite_logger.log_error("Malformed status file. Resetting status file for safety.")
+                self.__reset_status_file()
+                return
+
+            # Load portions of data that need to be built on for next write - raise exception if corrupt data is encountered
+            # todo: refactor
+            self.__high_level_status_message = complete_status_file_data['status']['formattedMessage']['message']
+            for i in range(0, len(complete_status_file_data['status']['substatus'])):
+                name = complete_status_file_data['status']['substatus'][i]['name']
+                if name == Constants.PATCH_INSTALLATION_SUMMARY:     # if it exists, it must be to spec, or an exception will get thrown
+                    if self.execution_config.exec_auto_assess_only:
+                        self.__installation_substatus_json = complete_status_file_data['status']['substatus'][i]
+                    else:
+                        self.__installation_summary_json = self.__get_substatus_message(complete_status_file_data, i)
+                        # Reload patches into installation ordered map for fast look up
+                        self.__installation_packages_map = collections.OrderedDict((package["patchId"], package) for package in self.__installation_summary_json['patches'])
+                        self.__installation_packages = list(self.__installation_packages_map.values())
+                        for patch_id, record in self.__installation_packages_map.items():
+                            self.__index_package_by_classification_and_state(self.__installation_packages_buckets, self.__installation_packages_sort_keys, patch_id, record)
+                        self.__maintenance_window_exceeded = bool(self.__installation_summary_json['maintenanceWindowExceeded'])
+                        self.__installation_reboot_status = self.__installation_summary_json['rebootStatus']
+                        errors = self.__installation_summary_json['errors']
+                        if errors is not None and errors['details'] is not None:
+                            self.__installation_errors = errors['details']
+                            self.__installation_total_error_count = self.__get_total_error_count_from_prev_status(errors['message'])
+                if name == Constants.PATCH_ASSESSMENT_SUMMARY:     # if it exists, it must be to spec, or an exception will get thrown
+                    self.__assessment_summary_json = self.__get_substatus_message(complete_status_file_data, i)
+                    # Reload patches into assessment ordered map for fast look up
+                    self.__assessment_packages_map = collections.OrderedDict((package["patchId"], package) for package in self.__assessment_summary_json['patches'])
+                    self.__assessment_packages = list(self.__assessment_packages_map.values())
+                    for patch_id, record in self.__assessment_packages_map.items():
+                        self.__index_package_by_classification_and_state(self.__assessment_packages_buckets, self.__assessment_packages_sort_keys, patch_id, record)
+                    errors = self.__assessment_summary_json['errors']
                     if errors is not None and errors['details'] is not None:
-                        self.__installation_errors = errors['details']
-                        self.__installation_total_error_count = self.__get_total_error_count_from_prev_status(errors['message'])
-            if name == Constants.PATCH_ASSESSMENT_SUMMARY:     # if it exists, it must be to spec, or an exception will get thrown
-                self.__assessment_summary_json = self.__get_substatus_message(complete_status_file_data, i)
-                # Reload patches into assessment ordered map for fast look up
-                self.__assessment_packages_map = collections.OrderedDict((package["patchId"], package) for package in self.__assessment_summary_json['patches'])
-                self.__assessment_packages = list(self.__assessment_packages_map.values())
-                errors = self.__assessment_summary_json['errors']
-                if errors is not None and errors['details'] is not None:
-                    self.__assessment_errors = errors['details']
-                    self.__assessment_total_error_count = self.__get_total_error_count_from_prev_status(errors['message'])
-            if name == Constants.PATCH_METADATA_FOR_HEALTHSTORE:     # if it exists, it must be to spec, or an exception will get thrown
-                if self.execution_config.exec_auto_assess_only:
-                    self.__metadata_for_healthstore_substatus_json = complete_status_file_data['status']['substatus'][i]
-                else:
-                    self.__metadata_for_healthstore_summary_json = self.__get_substatus_message(complete_status_file_data, i)
-            if name == Constants.CONFIGURE_PATCHING_SUMMARY:     # if it exists, it must be to spec, or an exception will get thrown
-                if self.execution_config.exec_auto_assess_only:
-                    self.__configure_patching_substatus_json = complete_status_file_data['status']['substatus'][i]
-                else:
-                    self.__configure_patching_summary_json = self.__get_substatus_message(complete_status_file_data, i)
-                    errors = self.__configure_patching_summary_json['errors']
-                    if errors is not None and errors['details'] is not None:
-                        self.__configure_patching_errors = errors['details']
-                        self.__configure_patching_top_level_error_count = self.__get_total_error_count_from_prev_status(errors['message'])
+                        self.__assessment_errors = errors['details']
+                        self.__assessment_total_error_count = self.__get_total_error_count_from_prev_status(errors['message'])
+                if name == Constants.PATCH_METADATA_FOR_HEALTHSTORE:     # if it exists, it must be to spec, or an exception will get thrown
+                    if self.execution_config.exec_auto_assess_only:
+                        self.__metadata_for_healthstore_substatus_json = complete_status_file_data['status']['substatus'][i]
+                    else:
+                        self.__metadata_for_healthstore_summary_json = self.__get_substatus_message(complete_status_file_data, i)
+                if name == Constants.CONFIGURE_PATCHING_SUMMARY:     # if it exists, it must be to spec, or an exception will get thrown
+                    if self.execution_config.exec_auto_assess_only:
+                        self.__configure_patching_substatus_json = complete_status_file_data['status']['substatus'][i]
+                    else:
+                        self.__configure_patching_summary_json = self.__get_substatus_message(complete_status_file_data, i)
+                        errors = self.__configure_patching_summary_json['errors']
+                        if errors is not None and errors['details'] is not None:
+                            self.__configure_patching_errors = errors['details']
+                            self.__configure_patching_top_level_error_count = self.__get_total_error_count_from_prev_status(errors['message'])
 
     def __get_substatus_message(self, status_file_data, index):
         return json.loads(status_file_data['status']['substatus'][index]['formattedMessage']['message'])
@@ -683,7 +761,50 @@ class StatusHandler(object):
                     raise
         return complete_status_file_data
 
+    def flush_status_file(self):
+        """ Writes out any status update still pending from write coalescing. Expected at phase boundaries and before the process exits. """
+        with self.__status_file_write_lock:
+            self.__cancel_status_file_write_timer()
+            if self.__is_status_file_write_pending:
+                self.__write_status_file()
+
+    def __write_status_file_coalesced(self, substatus_status):
+        """ Writes the status file right away for terminal states, or if the last write is older than the latency window.
+            Transitioning updates within the window are coalesced into a single write at the end of the window. """
+        with self.__status_file_write_lock:
+            self.__is_status_file_write_pending = True
+            latency_window_in_secs = Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS
+            time_since_last_write_in_secs = None if self.__last_status_file_write_time is None else time.time() - self.__last_status_file_write_time
+
+            if str(substatus_status).lower() != Constants.STATUS_TRANSITIONING.lower() or time_since_last_write_in_secs is None \
+                    or time_since_last_write_in_secs < 0 or time_since_last_write_in_secs >= latency_window_in_secs:
+                self.flush_status_file()
+            elif self.__status_file_write_timer is None:
+                self.__status_file_write_timer = threading.Timer(latency_window_in_secs - time_since_last_write_in_secs, self.__flush_status_file_on_timer)
+                self.__status_file_write_timer.daemon = True
+                self.__status_file_write_timer.start()
+
+    def __flush_status_file_on_timer(self):
+        try:
+            self.flush_status_file()
+        except Exception as error:
+            self.composite_logger.log_debug("Unable to write coalesced status update. It will be written with the next update. [Error={0}]".format(repr(error)))
+
+    def __cancel_status_file_write_timer(self):
+        if self.__status_file_write_timer is not None:
+            self.__status_file_write_timer.cancel()
+            self.__status_file_write_timer = None
+
     def __write_status_file(self):
+        """ Writes the status file right away, superseding any coalesced update that is pending. The update stays pending until it is written. """
+        with self.__status_file_write_lock:
+            self.__cancel_status_file_write_timer()
+            self.__is_status_file_write_pending = True
+            self.__last_status_file_write_time = time.time()
+            self.__compose_and_write_status_file()
+            self.__is_status_file_write_pending = False
+
+    def __compose_and_write_status_file(self):
         """ Composes and writes the status file from **already up-to-date** in-memory data.
             This is usually the final call to compose and persist after an in-memory data update in a specialized method.
 
@@ -741,7 +862,7 @@ class StatusHandler(object):
 
         if Constants.StatusTruncationConfig.TURN_ON_TRUNCATION:
             self.composite_logger.log_verbose("Perform truncation on status file if applicable")
-            status_file_payload_json_dumps = self.__get_status_payload_with_truncated_patches(status_file_payload_json_dumps)
+            status_file_payload_json_dumps = self.__get_status_payload_with_truncated_patches(status_file_payload_json_dumps, complete_status_payload)
 
         # Write status file <seq.no>.status
         self.env_layer.file_system.write_with_retry_using_temp_file(self.status_file_path, '[{0}]'.format(status_file_payload_json_dumps), mode='w+')
@@ -751,6 +872,8 @@ class StatusHandler(object):
     def set_current_operation(self, operation):
         if self.execution_config.exec_auto_assess_only and operation != Constants.ASSESSMENT:
             raise Exception("Status reporting for a non-assessment operation was attempted when executing in auto-assessment mode. [Operation={0}]".format(str(operation)))
+        if operation != self.__current_operation:
+            self.flush_status_file()    # phase boundary, the previous operation's status is persisted in full
         self.__current_operation = operation
 
     def get_current_operation(self):
@@ -765,50 +888,54 @@ class StatusHandler(object):
 
     def add_error_to_status(self, message, error_code=Constants.PatchOperationErrorCodes.DEFAULT_ERROR, current_operation_override_for_error=Constants.DEFAULT_UNSPECIFIED_VALUE):
         """ Add error to the respective error objects """
-        if not message or Constants.ERROR_ADDED_TO_STATUS in message:
-            return
-
-        # Compose error detail
-        error_detail = self.__set_error_detail(error_code, message)
-
-        # determine if a current operation override has been requested
-        current_operation = self.__current_operation if current_operation_override_for_error == Constants.DEFAULT_UNSPECIFIED_VALUE else current_operation_override_for_error
-
-        if current_operation == Constants.ASSESSMENT:
-            if self.__try_add_error(self.__assessment_errors, error_detail):
-                self.__assessment_total_error_count += 1
-                # retain previously set status and code for assessment substatus
-                if self.__assessment_substatus_json is not None:
-                    self.set_assessment_substatus_json(status=self.__assessment_substatus_json["status"], code=self.__assessment_substatus_json["code"])
+        with self.__status_file_write_lock:
+            if not message or Constants.ERROR_ADDED_TO_STATUS in message:
+                return
+
+            # Compose error detail
+            error_detail = self.__set_error_detail(error_code, message)
+
+            # determine if a current operation override has been requested
+            current_operation = self.__current_operation if current_operation_override_for_error == Constants.DEFAULT_UNSPECIFIED_VALUE else current_operation_override_for_error
+
+            if current_operation == Constants.ASSESSMENT:
+                if self.__try_add_error(self.__assessment_errors, error_detail):
+                    self.__assessment_total_error_count += 1
+                    # retain previously set status and code for assessment substatus
+                    if self.__assessment_substatus_json is not None:
+                        self.set_assessment_substatus_json(status=self.__assessment_substatus_json["status"], code=self.__assessment_substatus_json["code"])
+                    else:
+                        self.set_assessment_substatus_json()
+            elif current_operation == Constants.INSTALLATION:
+                if self.__try_add_error(self.__installation_errors, error_detail):
+                    self.__installation_total_error_count += 1
+                    # retain previously set status and code for installation substatus
+                    if self.__installation_substatus_json is not None:
+                        self.set_installation_substatus_json(status=self.__installation_substatus_json["status"], code=self.__installation_substatus_json["code"])
+                    else:
+                        self.set_installation_substatus_json()
+            elif current_operation == Constants.CONFIGURE_PATCHING or current_operation == Constants.CONFIGURE_PATCHING_AUTO_ASSESSMENT:
+                if current_operation == Constants.CONFIGURE_PATCHING_AUTO_ASSESSMENT:
+                    if self.__try_add_error(self.__configure_patching_auto_assessment_errors, error_detail):
+                        self.__configure_patching_auto_assessment_error_count += 1
                 else:
-                    self.set_assessment_substatus_json()
-        elif current_operation == Constants.INSTALLATION:
-            if self.__try_add_error(self.__installation_errors, error_detail):
-                self.__installation_total_error_count += 1
-                # retain previously set status and code for installation substatus
-                if self.__installation_substatus_json is not None:
-                    self.set_installation_substatus_json(status=self.__installation_substatus_json["status"], code=self.__installation_substatus_json["code"])
+                    if self.__try_add_error(self.__configure_patching_errors, error_detail):
+                        self.__configure_patching_top_level_error_count += 1
+
+                # retain previously set status, code, patchMode and assessmentMode for configure patching substatus
+                if self.__configure_patching_substatus_json is not None:
+                    automatic_os_patch_state = json.loads(self.__configure_patching_substatus_json["formattedMessage"]["message"])["automaticOSPatchState"]
+                    auto_assessment_status = self.__json_try_get_key_value(self.__configure_patching_substatus_json["formattedMessage"]["message"],"autoAssessmentStatus","{}")
+                    auto_assessment_state = self.__json_try_get_key_value(json.dumps(auto_assessment_status), "autoAssessmentState", Constants.AutoAssessmentStates.UNKNOWN)
+                    self.set_configure_patching_substatus_json(status=self.__configure_patching_substatus_json["status"], code=self.__configure_patching_substatus_json["code"],
+                                                               automatic_os_patch_state=automatic_os_patch_state, auto_assessment_state=auto_assessment_state)
                 else:
-                    self.set_installation_substatus_json()
-        elif current_operation == Constants.CONFIGURE_PATCHING or current_operation == Constants.CONFIGURE_PATCHING_AUTO_ASSESSMENT:
-            if current_operation == Constants.CONFIGURE_PATCHING_AUTO_ASSESSMENT:
-                if self.__try_add_error(self.__configure_patching_auto_assessment_errors, error_detail):
-                    self.__configure_patching_auto_assessment_error_count += 1
+                    self.set_configure_patching_substatus_json()
             else:
-                if self.__try_add_error(self.__configure_patching_errors, error_detail):
-                    self.__configure_patching_top_level_error_count += 1
-
-            # retain previously set status, code, patchMode and assessmentMode for configure patching substatus
-            if self.__configure_patching_substatus_json is not None:
-                automatic_os_patch_state = json.loads(self.__configure_patching_substatus_json["formattedMessage"]["message"])["automaticOSPatchState"]
-                auto_assessment_status = self.__json_try_get_key_value(self.__configure_patching_substatus_json["formattedMessage"]["message"],"autoAssessmentStatus","{}")
-                auto_assessment_state = self.__json_try_get_key_value(json.dumps(auto_assessment_status), "autoAssessmentState", Constants.AutoAssessmentStates.UNKNOWN)
-                self.set_configure_patching_substatus_json(status=self.__configure_patching_substatus_json["status"], code=self.__configure_patching_substatus_json["code"],
-                                                           automatic_os_patch_state=automatic_os_patch_state, auto_assessment_state=auto_assessment_state)
-            else:
-                self.set_configure_patching_substatus_json()
-        else:
-            return
+                return
+
+            # errors are surfaced right away instead of waiting out the write coalescing window
+            self.flush_status_file()
 
     def __ensure_error_message_restriction_compliance(self, full_message):
         """ Removes line breaks, tabs and restricts message to a character limit """
@@ -881,7 +1008,7 @@ class StatusHandler(object):
         """ Set force truncation to overwrite MIN_TRUNCATION_INTERVAL_IN_SEC time frame when terminal state (success or error) and if status file has been truncated conditions are met """
         self.__force_truncation_on = substatus_status == Constants.STATUS_SUCCESS or substatus_status == Constants.STATUS_ERROR
 
-    def __get_status_payload_with_truncated_patches(self, status_file_payload_json_dumps):
+    def __get_status_payload_with_truncated_patches(self, status_file_payload_json_dumps, status_file_payload_json):
         """ Get truncated status file payload when status file byte size is more than 126kb """
         status_file_size_in_bytes = self.__calc_status_size_on_disk(status_file_payload_json_dumps)  # calc complete_status_file_payload_json byte size on disk
 
@@ -891,7 +1018,7 @@ class StatusHandler(object):
             if is_truncation_allowed or self.__force_truncation_on:
                 self.composite_logger.log_verbose("[IsTruncationAllowed={0}] [IsForceTruncationOn={1}]".format(str(is_truncation_allowed), str(self.__force_truncation_on)))
                 self.__truncation_timestamp = datetime.datetime.now()  # Set timestamp to newer time for upcoming operations
-                self.__truncated_status_file_json_dumps = json.dumps(self.__create_truncated_status_file(status_file_size_in_bytes, status_file_payload_json_dumps))
+                self.__truncated_status_file_json_dumps = json.dumps(self.__create_truncated_status_file(status_file_size_in_bytes, status_file_payload_json))
                 status_file_payload_json_dumps = self.__truncated_status_file_json_dumps
 
             # To ensure all newly status file remain in truncated state when complete statusfile > 126kb and timestamp < 60 sec
@@ -911,21 +1038,25 @@ class StatusHandler(object):
         """ Truncate substatus message patches when complete status file size is greater than 126kb """
         self.composite_logger.log_verbose("Begin patches truncation: [StatusFileSizeInBytes={0}] [InternalFileSizeLimitInBytes={1}]".format(str(status_file_size_in_bytes), str(Constants.StatusTruncationConfig.INTERNAL_FILE_SIZE_LIMIT_IN_BYTES)))
 
-        truncated_status_file = json.loads(complete_status_file_payload_json)  # reload payload into python object
+        truncated_status_file = self.__copy_status_payload_for_truncation(complete_status_file_payload_json)
         low_pri_index = None
+        assessment_patch_sizes_in_bytes = []
+        installation_patch_sizes_in_bytes = []
         assessment_substatus_index, assessment_substatus_status = self.__get_substatus_index_and_status(Constants.PATCH_ASSESSMENT_SUMMARY, truncated_status_file['status']['substatus'])
         installation_substatus_index, installation_substatus_status = self.__get_substatus_index_and_status(Constants.PATCH_INSTALLATION_SUMMARY, truncated_status_file['status']['substatus'])
 
         if assessment_substatus_index is not None:      # If assessment data exists
             self.__assessment_substatus_msg_copy = self.__get_substatus_message(truncated_status_file, assessment_substatus_index)
             self.__assessment_patches_copy = self.__assessment_substatus_msg_copy['patches']
+            assessment_patch_sizes_in_bytes = self.__calc_patch_sizes_on_disk(self.__assessment_patches_copy)
 
         if installation_substatus_index is not None:    # If installation data exists
             self.__installation_substatus_msg_copy = self.__get_substatus_message(truncated_status_file, installation_substatus_index)
             self.__installation_patches_copy = self.__installation_substatus_msg_copy['patches']
+            installation_patch_sizes_in_bytes = self.__calc_patch_sizes_on_disk(self.__installation_patches_copy)
             low_pri_index = self.__get_installation_low_pri_index(self.__installation_patches_copy)
 
-        status_file_without_patches_size_in_bytes = self.__size_of_constant_status_data(copy.deepcopy(truncated_status_file), assessment_substatus_index, installation_substatus_index)  # Deepcopy, fully copies the object to avoid reference modifications
+        status_file_without_patches_size_in_bytes = self.__size_of_constant_status_data(self.__copy_status_payload_for_truncation(truncated_status_file), assessment_substatus_index, installation_substatus_index)  # Copy, to avoid modifying the payload being truncated
 
         max_allowed_patches_size_in_bytes = Constants.StatusTruncationConfig.INTERNAL_FILE_SIZE_LIMIT_IN_BYTES - status_file_without_patches_size_in_bytes
         self.composite_logger.log_verbose("Status file limits evaluated. [FileSizeWithoutPatchesInBytes={0}] [MaxAllowedPatchesSizeInBytes={1}]".format(str(status_file_without_patches_size_in_bytes), str(max_allowed_patches_size_in_bytes)))
@@ -933,7 +1064,7 @@ class StatusHandler(object):
         while status_file_size_in_bytes > Constants.StatusTruncationConfig.INTERNAL_FILE_SIZE_LIMIT_IN_BYTES:
             # Start truncation process
             patches_retained_in_assessment, self.__assessment_patches_removed, patches_retained_in_installation, self.__installation_patches_removed = \
-                self.__start_truncation_process(self.__assessment_patches_copy, self.__installation_patches_copy, max_allowed_patches_size_in_bytes, low_pri_index)
+                self.__start_truncation_process(self.__assessment_patches_copy, assessment_patch_sizes_in_bytes, self.__installation_patches_copy, installation_patch_sizes_in_bytes, max_allowed_patches_size_in_bytes, low_pri_index)
 
             if len(self.__assessment_patches_removed) > 0:
                 assessment_tombstone_list = self.__create_assessment_tombstones_by_classification(self.__assessment_patches_removed)
@@ -960,24 +1091,26 @@ class StatusHandler(object):
             if len(assessment_patches) > min_patches_count else (assessment_patches, [])
         return min_assessment_patches_to_retain, remaining_assessment_patches
 
-    def __start_truncation_process(self, assessment_patches, installation_patches, max_allowed_patches_size_in_bytes, low_pri_index=None):
-        """ Function truncates patches from assessment and installation substatus's while always retaining a required minimum count of assessment patches """
-        installation_low_pri = []
-        installation_high_pri = installation_patches
+    def __start_truncation_process(self, assessment_patches, assessment_patch_sizes_in_bytes, installation_patches, installation_patch_sizes_in_bytes, max_allowed_patches_size_in_bytes, low_pri_index=None):
+        """ Function truncates patches from assessment and installation substatus's while always retaining a required minimum count of assessment patches.
+        Patch sizes, as computed by __calc_patch_sizes_on_disk, are split along with the patches they belong to. """
+        installation_low_pri, installation_low_pri_sizes = [], []
+        installation_high_pri, installation_high_pri_sizes = installation_patches, installation_patch_sizes_in_bytes
         # Cut assessment patches into [:5], [5:]
         min_assessment_patches_to_retain, remaining_assessment_patches = self.__split_assessment_patches(assessment_patches)
+        min_assessment_patch_sizes, remaining_assessment_patch_sizes = self.__split_assessment_patches(assessment_patch_sizes_in_bytes)
 
         if len(min_assessment_patches_to_retain) > 0:
-            max_allowed_patches_size_in_bytes = max_allowed_patches_size_in_bytes - self.__calc_patches_payload_size_on_disk(min_assessment_patches_to_retain)
+            max_allowed_patches_size_in_bytes = max_allowed_patches_size_in_bytes - self.__calc_patches_payload_size_on_disk(min_assessment_patch_sizes)
 
         # Split installation patches into high priority (Failed, Installed) and low priority (Pending, Excluded, Not_Selected)
         if low_pri_index is not None:
-            installation_high_pri = installation_patches[:low_pri_index]
-            installation_low_pri = installation_patches[low_pri_index:]
+            installation_high_pri, installation_high_pri_sizes = installation_patches[:low_pri_index], installation_patch_sizes_in_bytes[:low_pri_index]
+            installation_low_pri, installation_low_pri_sizes = installation_patches[low_pri_index:], installation_patch_sizes_in_bytes[low_pri_index:]
 
-        patches_retained_in_install_high_pri, patches_removed_from_install_high_pri, remaining_patches_size_available_in_bytes = self.__truncate_patches(installation_high_pri, max_allowed_patches_size_in_bytes)
-        patches_retained_in_assessment, patches_removed_from_assessment, remaining_patches_size_available_in_bytes = self.__truncate_patches(remaining_assessment_patches, remaining_patches_size_available_in_bytes)
-        patches_retained_in_install_low_pri, patches_removed_from_install_low_pri, remaining_patches_size_available_in_bytes = self.__truncate_patches(installation_low_pri, remaining_patches_size_available_in_bytes)
+        patches_retained_in_install_high_pri, patches_removed_from_install_high_pri, remaining_patches_size_available_in_bytes = self.__truncate_patches(installation_high_pri, installation_high_pri_sizes, max_allowed_patches_size_in_bytes)
+        patches_retained_in_assessment, patches_removed_from_assessment, remaining_patches_size_available_in_bytes = self.__truncate_patches(remaining_assessment_patches, remaining_assessment_patch_sizes, remaining_patches_size_available_in_bytes)
+        patches_retained_in_install_low_pri, patches_removed_from_install_low_pri, remaining_patches_size_available_in_bytes = self.__truncate_patches(installation_low_pri, installation_low_pri_sizes, remaining_patches_size_available_in_bytes)
         self.composite_logger.log_verbose("Remaining patches size available in bytes after truncation: [RemainingPatchListSizeInBytes={0}]".format(remaining_patches_size_available_in_bytes))
 
         truncated_installation_patches = patches_retained_in_install_high_pri + patches_retained_in_install_low_pri
@@ -993,37 +1126,31 @@ class StatusHandler(object):
                 return low_pri_index
         return None
 
-    def __truncate_patches(self, patches, max_allowed_patches_size_in_bytes):
-        """ Binary search
-        Instead of checking patches[mid_index] >= target, check byte_size(patches[:mid_index]),
-        as byte_size[patches[:i]] is monotonically increasing, i.e.
+    def __truncate_patches(self, patches, patch_sizes_in_bytes, max_allowed_patches_size_in_bytes):
+        """ Prefix sum lookup
+        byte_size(patches[:i]) is derived from the running sum of the individual patch sizes, and is monotonically increasing, i.e.
         byte_size[patches[:1]] < byte_size[patches[:2]] < byte_size[patches[:3]] ...
+        so the cut point is found with a binary search over the prefix sizes, without serializing any candidate list.
         return truncated_patches, patches_removed_from_patches, and remaining max_patches_byte_size
         """
-        left_index = 0
-        right_index = len(patches) - 1
-
         # no truncation on empty list, return [],[]
         if len(patches) == 0:
             return [], [], max_allowed_patches_size_in_bytes
+
+        prefix_sizes_in_bytes = self.__calc_prefix_payload_sizes_on_disk(patch_sizes_in_bytes)
         # if patches byte size <= max list patches byte size, then returns it (no truncation needed)
-        if self.__calc_patches_payload_size_on_disk(patches) <= max_allowed_patches_size_in_bytes:
-            return patches, [], max_allowed_patches_size_in_bytes - self.__calc_patches_payload_size_on_disk(patches)
+        if prefix_sizes_in_bytes[-1] <= max_allowed_patches_size_in_bytes:
+            return patches, [], max_allowed_patches_size_in_bytes - prefix_sizes_in_bytes[-1]
         # if first element byte size > max patches byte size, then add patches to patches_removed
-        if self.__calc_patches_payload_size_on_disk(patches[0]) > max_allowed_patches_size_in_bytes:
+        if len(json.dumps("")) + patch_sizes_in_bytes[0] > max_allowed_patches_size_in_bytes:
             return [], patches, max_allowed_patches_size_in_bytes
 
-        while left_index < right_index:
-            mid_index = left_index + int((right_index - left_index) / 2)
-            if self.__calc_patches_payload_size_on_disk(patches[:mid_index]) >= max_allowed_patches_size_in_bytes:
-                right_index = mid_index
-            else:
-                left_index = mid_index + 1
+        # first prefix, short of the full list, that reaches the size available. One patch fewer is retained, so the payload stays within it
+        left_index = bisect.bisect_left(prefix_sizes_in_bytes, max_allowed_patches_size_in_bytes, 0, len(patches) - 1)
 
         truncated_patches = patches[:left_index - 1]
         patches_removed = patches[left_index - 1:]
-        truncated_patches_size_in_bytes = self.__calc_patches_payload_size_on_disk(truncated_patches)
-        return truncated_patches, patches_removed, max_allowed_patches_size_in_bytes - truncated_patches_size_in_bytes
+        return truncated_patches, patches_removed, max_allowed_patches_size_in_bytes - prefix_sizes_in_bytes[left_index - 1]
 
     def __removed_older_complete_status_files(self, status_folder):
         """ Retain 10 latest status complete file and remove other .complete.status files """
@@ -1047,10 +1174,37 @@ class StatusHandler(object):
         """ Calculate status file size in bytes on disk """
         return len(status_file_dumps.encode("utf-8"))
 
-    def __calc_patches_payload_size_on_disk(self, patches):
-        """ Calculate patches size in bytes accounting for escape chars """
-        first_json_dump = json.dumps(patches)
-        return len(json.dumps(first_json_dump).encode("utf-8"))
+    @staticmethod
+    def __calc_patch_sizes_on_disk(patches):
+        """ Calculate the size in bytes of each patch accounting for escape chars, i.e. as it is written within the substatus message string.
+        Escaping is per character, so the size of a list of patches is the sum of these, plus the list delimiters """
+        return [len(json.dumps(json.dumps(patch)).encode("utf-8")) - len(json.dumps("")) for patch in patches]
+
+    def __calc_patches_payload_size_on_disk(self, patch_sizes_in_bytes):
+        """ Calculate the size in bytes of a list of patches accounting for escape chars, from the individual patch sizes """
+        return self.__calc_prefix_payload_sizes_on_disk(patch_sizes_in_bytes)[-1]
+
+    @staticmethod
+    def __calc_prefix_payload_sizes_on_disk(patch_sizes_in_bytes):
+        """ Returns the size in bytes, accounting for escape chars, of every prefix of a list of patches. i.e. item i is the size of patches[:i] """
+        prefix_size_in_bytes = len(json.dumps(json.dumps([])))     # quotes and brackets
+        prefix_sizes_in_bytes = [prefix_size_in_bytes]
+        for index, patch_size_in_bytes in enumerate(patch_sizes_in_bytes):
+            prefix_size_in_bytes += patch_size_in_bytes + (len(", ") if index > 0 else 0)
+            prefix_sizes_in_bytes.append(prefix_size_in_bytes)
+        return prefix_sizes_in_bytes
+
+    @staticmethod
+    def __copy_status_payload_for_truncation(status_payload_json):
+        """ Copies the parts of the status payload that truncation modifies (substatus status and message), sharing everything else with the original """
+        status_payload_copy = dict(status_payload_json)
+        status_payload_copy['status'] = dict(status_payload_json['status'])
+        status_payload_copy['status']['substatus'] = []
+        for substatus in status_payload_json['status']['substatus']:
+            substatus_copy = dict(substatus)
+            substatus_copy['formattedMessage'] = dict(substatus['formattedMessage'])
+            status_payload_copy['status']['substatus'].append(substatus_copy)
+        return status_payload_copy
 
     def __size_of_constant_status_data(self, status_payload_json, assessment_status_index, installation_status_index):
         """ Get the size in bytes of the status payload without patches data """
@@ -20,6 +20,7 @@ import os
 import re
 import shutil
 import tempfile
+import threading
 import time
 
 from core.src.bootstrap.Constants import Constants
@@ -41,10 +42,29 @@ class TelemetryWriter(object):
         self.start_time_for_event_count_throttle_check = datetime.datetime.utcnow()
         self.event_count = 1
 
+        # Bounded in-memory queue of (event level, serialized event) awaiting a flush to a new event file. It is drained by a background flusher, within the event rate budget, so callers never block on telemetry
+        self.__event_queue = []
+        self.__event_queue_size_in_chars = 0
+        self.__event_queue_condition = threading.Condition()
+        self.__event_flush_lock = threading.Lock()
+        self.__event_flusher = None
+        self.__is_event_flusher_stop_requested = False
+        self.__is_event_rate_budget_exhausted = False
+        self.__last_event_file_timestamp = 0
+        self.dropped_event_count = 0  # events dropped, over the lifetime of the writer, as the queue or event rate budget was exhausted
+        self.__dropped_event_count_not_reported = 0
+
+        # Running size ledger for the events folder, seeded from disk once and kept current on own writes and deletes
+        self.__events_dir_size = None
+        self.__events_dir_mtime = None
+
         if self.__get_events_folder_path_exists(events_folder_path):
             self.events_folder_path = events_folder_path
+            self.__seed_events_dir_size()
 
         self.__is_telemetry_supported = telemetry_supported and self.events_folder_path is not None
+        if self.__is_telemetry_supported:
+            self.__start_event_flusher()
 
         self.write_event('Started Linux patch core operation.', Constants.TelemetryEventLevel.Informational)
         self.machine_info = None
@@ -153,13 +173,20 @@ class TelemetryWriter(object):
                 chars_dropped = len(formatted_message) - message_size_limit_in_chars + Constants.TELEMETRY_BUFFER_FOR_DROPPED_COUNT_MSG_IN_CHARS + Constants.TELEMETRY_EVENT_COUNTER_MSG_SIZE_LIMIT_IN_CHARS
                 formatted_message = formatted_message[:message_size_limit_in_chars - Constants.TELEMETRY_BUFFER_FOR_DROPPED_COUNT_MSG_IN_CHARS - Constants.TELEMETRY_EVENT_COUNTER_MSG_SIZE_LIMIT_IN_CHARS].decode('utf-8', errors='replace') + '. [{0} chars dropped]'.format(chars_dropped)
 
-            formatted_message += " [TC={0}]".format(self.__telemetry_event_counter)
+            formatted_message += " [TC={0}]".format(self.__take_telemetry_event_counter())
             return formatted_message
 
         except Exception as e:
             self.composite_logger.log_telemetry_module_error("Error occurred while formatting message for a telemetry event. [Error={0}]".format(repr(e)))
             raise
 
+    def __take_telemetry_event_counter(self):
+        """ Returns the counter for a new event and advances it. Events are created on the caller threads and on the background flusher, so the counter is taken under the event queue lock. """
+        with self.__event_queue_condition:
+            telemetry_event_counter = self.__telemetry_event_counter
+            self.__telemetry_event_counter += 1
+            return telemetry_event_counter
+
     def write_event_with_buffer(self, message, event_level, buffer_msg):
         if buffer_msg == Constants.BufferMessage.TRUE and (event_level == self.last_telemetry_event_level or self.last_telemetry_event_level is None):
             if self.telemetry_buffer_store != "":
@@ -187,34 +214,194 @@ class TelemetryWriter(object):
             self.last_telemetry_event_level = None
             self.telemetry_buffer_store = ""
 
-    def write_event(self, message, event_level=Constants.TelemetryEventLevel.Informational, task_name=Constants.TelemetryTaskName.UNKNOWN, is_event_file_throttling_needed=True):
-        """ Creates and writes event to event file after validating none of the telemetry size restrictions are breached
-        NOTE: is_event_file_throttling_needed is used to determine if event file throttling is required and as such should always be True.
-        The only scenario where this is False is when throttling is taking place and we write to telemetry about it. i.e. only from within __throttle_telemetry_writes_if_required()"""
+    def write_event(self, message, event_level=Constants.TelemetryEventLevel.Informational, task_name=Constants.TelemetryTaskName.UNKNOWN):
+        """ Creates an event, after validating none of the telemetry size restrictions are breached, and queues it to be written to an event file by the background flusher.
+        This never waits on disk or on the event rate budget. """
         try:
             if not self.is_telemetry_supported() or not Constants.TELEMETRY_ENABLED_AT_EXTENSION:
                 return
 
-            # ensure file throttle limit is reached
-            self.__throttle_telemetry_writes_if_required(is_event_file_throttling_needed)
-
-            self.__delete_older_events_if_dir_size_limit_not_met()
-
             # use established task name if the input is defaulted
             if task_name == Constants.TelemetryTaskName.UNKNOWN:
                 task_name = self.__task_name
 
             event = self.__new_event_json(event_level, message, task_name)
-            if len(json.dumps(event)) > Constants.TELEMETRY_EVENT_SIZE_LIMIT_IN_CHARS:
+            event_json = json.dumps(event)
+            if len(event_json) > Constants.TELEMETRY_EVENT_SIZE_LIMIT_IN_CHARS:
                 self.composite_logger.log_telemetry_module_error("Cannot send data to telemetry as it exceeded the acceptable data size. [Data not sent={0}]".format(json.dumps(message)))
             else:
-                file_path, all_events = self.__get_file_and_content_to_write(self.events_folder_path, event)
-                self.__write_event_using_temp_file(file_path, all_events)
+                self.__enqueue_event(event_level, event_json)
+
+                if self.__event_flusher is None:
+                    # the flusher has been stopped, so there is nothing left to write this event out later
+                    self.__flush_event_queue()
 
         except Exception as e:
             self.composite_logger.log_telemetry_module_error("Error occurred while writing telemetry events. [Error={0}]".format(repr(e)))
             raise Exception("Internal reporting error. Execution could not complete.")
 
+    def flush(self):
+        """ Writes events pending in memory to event files, within the event rate budget. Events beyond the budget stay queued for the background flusher. """
+        try:
+            if not self.is_telemetry_supported() or not Constants.TELEMETRY_ENABLED_AT_EXTENSION:
+                return
+
+            self.__flush_event_queue()
+
+        except Exception as e:
+            self.composite_logger.log_telemetry_module_error("Error occurred while flushing telemetry events. [Error={0}]".format(repr(e)))
+            raise Exception("Internal reporting error. Execution could not complete.")
+
+    def stop(self):
+        """ Stops the background flusher and writes out all events still pending in memory. Expected to be called before the process exits.
+        Events beyond the event rate budget are dropped at this point, with the exception of errors. """
+        try:
+            self.__stop_event_flusher()
+
+            if not self.is_telemetry_supported() or not Constants.TELEMETRY_ENABLED_AT_EXTENSION:
+                return
+
+            self.__flush_event_queue(is_final_flush=True)
+
+        except Exception as e:
+            self.composite_logger.log_telemetry_module_error("Error occurred while stopping telemetry writer. [Error={0}]".format(repr(e)))
+            raise Exception("Internal reporting error. Execution could not complete.")
+
+    # region Event queue and background flusher
+    def __enqueue_event(self, event_level, event_json):
+        """ Adds an event to the in-memory queue. When the queue is full, an error event takes the place of the oldest non-error event, and any other event is dropped """
+        with self.__event_queue_condition:
+            if len(self.__event_queue) >= Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT:
+                droppable_event_index = self.__get_oldest_droppable_event_index() if self.__is_error_event_level(event_level) else None
+                self.__record_dropped_events(1)
+                if droppable_event_index is None:
+                    return
+                self.__event_queue_size_in_chars -= len(self.__event_queue.pop(droppable_event_index)[1])
+
+            self.__event_queue.append((event_level, event_json))
+            self.__event_queue_size_in_chars += len(event_json)
+
+            if self.__is_event_batch_flush_required():
+                self.__event_queue_condition.notify()
+
+    def __get_oldest_droppable_event_index(self):
+        """ Returns the index of the oldest non-error event in the queue, or None if there isn't one """
+        for index, (event_level, event_json) in enumerate(self.__event_queue):
+            if not self.__is_error_event_level(event_level):
+                return index
+        return None
+
+    @staticmethod
+    def __is_error_event_level(event_level):
+        return event_level in (Constants.TelemetryEventLevel.Critical, Constants.TelemetryEventLevel.Error)
+
+    def __record_dropped_events(self, count):
+        self.dropped_event_count += count
+        self.__dropped_event_count_not_reported += count
+
+    def __is_event_batch_flush_required(self):
+        """ Events are held in memory until the batch is large enough to be written out to a new event file, unless the event rate budget is already used up. The flusher otherwise writes them out periodically """
+        return not self.__is_event_rate_budget_exhausted \
+            and (len(self.__event_queue) >= Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT or self.__event_queue_size_in_chars >= Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS)
+
+    def __start_event_flusher(self):
+        self.__event_flusher = threading.Thread(target=self.__run_event_flusher, name="TelemetryEventFlusher")
+        self.__event_flusher.daemon = True  # never holds up process exit, stop() is expected to write out pending events
+        self.__event_flusher.start()
+
+    def __stop_event_flusher(self):
+        if self.__event_flusher is None:
+            return
+
+        with self.__event_queue_condition:
+            self.__is_event_flusher_stop_requested = True
+            self.__event_queue_condition.notify()
+        self.__event_flusher.join()
+        self.__event_flusher = None
+
+    def __run_event_flusher(self):
+        """ Writes out queued events whenever a batch fills up, and at least every TELEMETRY_EVENT_BATCH_MAX_AGE_IN_SECONDS otherwise, until a stop is requested """
+        while True:
+            with self.__event_queue_condition:
+                if not self.__is_event_flusher_stop_requested and not self.__is_event_batch_flush_required():
+                    self.__event_queue_condition.wait(Constants.TELEMETRY_EVENT_BATCH_MAX_AGE_IN_SECONDS)
+                if self.__is_event_flusher_stop_requested:
+                    return
+
+            try:
+                self.__flush_event_queue()
+            except Exception as e:
+                self.composite_logger.log_telemetry_module_error("Error occurred while flushing telemetry events in the background. [Error={0}]".format(repr(e)))
+
+    def __flush_event_queue(self, is_final_flush=False):
+        """ Writes queued events, up to the remaining event rate budget, to new event files. Events beyond the budget stay queued until the next throttle window,
+        unless this is the final flush, in which case only errors are written out and all other events are dropped """
+        with self.__event_flush_lock:
+            with self.__event_queue_condition:
+                event_rate_budget = self.__get_remaining_event_rate_budget()
+                events_to_write = self.__event_queue[:event_rate_budget]
+                events_over_budget = self.__event_queue[event_rate_budget:]
+
+                if is_final_flush:
+                    events_to_write.extend([event for event in events_over_budget if self.__is_error_event_level(event[0])])
+                    self.__record_dropped_events(len([event for event in events_over_budget if not self.__is_error_event_level(event[0])]))
+                    events_over_budget = []
+
+                self.__event_queue = events_over_budget
+                self.__event_queue_size_in_chars = sum([len(event_json) for event_level, event_json in events_over_budget])
+
+                if len(events_over_budget) > 0 and not self.__is_event_rate_budget_exhausted:
+                    self.__is_event_rate_budget_exhausted = True
+                    self.composite_logger.log_telemetry_module("Max telemetry event count reached for the current window. Queued events will be written once the window ends. [QueuedEventCount={0}]".format(str(len(events_over_budget))))
+
+                if self.__dropped_event_count_not_reported > 0:
+                    # the report is the one event held back from the budget in every window
+                    dropped_events_msg = "Telemetry events were dropped as the event queue or event rate limit was exceeded. [DroppedEventCount={0}][TotalDroppedEventCount={1}]".format(str(self.__dropped_event_count_not_reported), str(self.dropped_event_count))
+                    self.composite_logger.log_telemetry_module(dropped_events_msg)
+                    events_to_write.append((Constants.TelemetryEventLevel.Warning, json.dumps(self.__new_event_json(Constants.TelemetryEventLevel.Warning, dropped_events_msg, self.__task_name))))
+                    self.__dropped_event_count_not_reported = 0
+
+                self.event_count += len(events_to_write)
+
+            self.__write_events_to_new_files([event_json for event_level, event_json in events_to_write])
+
+    def __get_remaining_event_rate_budget(self):
+        """ Returns the number of events that can still be written in the current throttle window, starting a new window if the previous one has ended. One event per window is held back to report dropped events """
+        time_from_event_count_throttle_check_start = (datetime.datetime.utcnow() - self.start_time_for_event_count_throttle_check)
+        # Computing seconds as per: https://docs.python.org/2/library/datetime.html#datetime.timedelta.total_seconds, since total_seconds() is not supported in python 2.6
+        time_from_throttle_start_check_total_seconds = ((time_from_event_count_throttle_check_start.microseconds + (time_from_event_count_throttle_check_start.seconds + time_from_event_count_throttle_check_start.days * 24 * 3600) * 10 ** 6) / 10 ** 6)
+
+        if time_from_throttle_start_check_total_seconds >= Constants.TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE:
+            self.start_time_for_event_count_throttle_check = datetime.datetime.utcnow()
+            self.event_count = 1
+            self.__is_event_rate_budget_exhausted = False
+
+        return max(0, Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE - 1 - self.event_count)
+
+    def __write_events_to_new_files(self, events_json):
+        """ Writes serialized events to one or more new event files, rolling over to a new file when the event file size limit would be exceeded.
+        Each file is a complete JSON array of events, as expected by the guest agent. Existing event files are never read or rewritten. """
+        file_events = []
+        file_size_in_chars = len("[]")
+        for event_json in events_json:
+            # events in a file are separated by ", "
+            if len(file_events) > 0 and file_size_in_chars + len(", ") + len(event_json) > Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS:
+                self.__write_events_to_new_file(file_events)
+                file_events = []
+                file_size_in_chars = len("[]")
+
+            file_size_in_chars += (len(", ") if len(file_events) > 0 else 0) + len(event_json)
+            file_events.append(event_json)
+
+        if len(file_events) > 0:
+            self.__write_events_to_new_file(file_events)
+    # endregion
+
+    def __write_events_to_new_file(self, events_json):
+        """ Writes a set of serialized events, as a JSON array, to a new event file after ensuring the events directory size restrictions are met """
+        self.__delete_older_events_if_dir_size_limit_not_met()
+        self.__write_event_using_temp_file(self.__get_event_file_path(self.events_folder_path), "[{0}]".format(", ".join(events_json)))
+
     def __delete_older_events_if_dir_size_limit_not_met(self):
         """ Delete older events until the at least one new event file can be added as per the size restrictions """
         try:
@@ -222,23 +409,30 @@ class TelemetryWriter(object):
                 # Not deleting any existing event files as the event directory does not exceed max limit. At least one new event file can be added. Not printing this statement as it will add repetitive logs
                 return
 
+            # The ledger can run ahead of the disk if files were picked up in between, so confirm against the folder before deleting anything
+            self.__reconcile_events_dir_size()
+            if self.__events_dir_size < Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS - Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS:
+                return
+
             self.composite_logger.log_telemetry_module("Events directory size exceeds maximum limit. Deleting older event files until at least one new event file can be added.")
             event_files = [os.path.join(self.events_folder_path, event_file) for event_file in os.listdir(self.events_folder_path) if (event_file.lower().endswith(".json"))]
             event_files.sort(key=os.path.getmtime, reverse=True)
 
             for event_file in event_files:
                 try:
-                    if self.__get_events_dir_size() < Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS - Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS:
+                    if self.__events_dir_size < Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS - Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS:
                         # Not deleting any more event files as the event directory has sufficient space to add at least one new event file. Not printing this statement as it will add repetitive logs
                         break
 
                     if os.path.exists(event_file):
+                        event_file_size = self.get_file_size(event_file)
                         os.remove(event_file)
+                        self.__update_events_dir_size(-event_file_size)
                         self.composite_logger.log_telemetry_module("Deleted event file. [File={0}]".format(repr(event_file)))
                 except Exception as e:
                     self.composite_logger.log_telemetry_module_error("Error deleting event file. [File={0}] [Exception={1}]".format(repr(event_file), repr(e)))
 
-            if self.__get_events_dir_size() >= Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS:
+            if self.__events_dir_size >= Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS:
                 self.composite_logger.log_telemetry_module_error("Older event files were not deleted. Current event will not be sent to telemetry as events directory size exceeds maximum limit")
                 raise
 
@@ -246,72 +440,36 @@ class TelemetryWriter(object):
             self.composite_logger.log_telemetry_module_error("Error occurred while deleting older telemetry events. [Error={0}]".format(repr(e)))
             raise
 
-    def __get_file_and_content_to_write(self, folder_path, data):
-        """ Identifies the file where the event is to be written. Can be an existing event file or a new one depending upon the size restrictions. If event is to be written to an existing file, fetches retains it's content """
-        try:
-            file_path = self.__get_event_file_path(folder_path)
-            all_events = []
-            if os.path.exists(file_path):
-                file_size = self.get_file_size(file_path)
-                # if file_size exceeds max limit, sleep for 1 second, so the event can be written to a new file since the event file name is a timestamp
-                if file_size >= Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS:
-                    time.sleep(1)
-                    file_path = self.__get_event_file_path(folder_path)
-                else:
-                    all_events = self.__fetch_events_from_previous_file(file_path)  # fetches existing content within the file
-            all_events.append(data)
-            return file_path, all_events
-        except Exception as e:
-            self.composite_logger.log_telemetry_module_error("Error occurred while fetching event file to write the event to. [Error={0}]")
-            raise
-
-    def __throttle_telemetry_writes_if_required(self, is_event_file_throttling_needed=True):
-        """ Ensures the # of event files that can be written per time unit restriction is met. Returns False if the any updates are required after the restriction enforcement. For eg: file_name is a timestamp and should be modified if a wait is added here.
-        NOTE: is_event_file_throttling_needed is used to determine if event file throttling is required and as such should always be True.
-        The only scenario where this is False is when throttling is taking place and we write to telemetry about it. i.e. while writing event_write_throttled_msg """
-        try:
-            if not is_event_file_throttling_needed:
-                return
-
-            time_from_event_count_throttle_check_start = (datetime.datetime.utcnow() - self.start_time_for_event_count_throttle_check)
-            # Computing seconds as per: https://docs.python.org/2/library/datetime.html#datetime.timedelta.total_seconds, since total_seconds() is not supported in python 2.6
-            time_from_throttle_start_check_total_seconds = ((time_from_event_count_throttle_check_start.microseconds + (time_from_event_count_throttle_check_start.seconds + time_from_event_count_throttle_check_start.days * 24 * 3600) * 10 ** 6) / 10 ** 6)
-
-            if time_from_throttle_start_check_total_seconds < Constants.TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE:
-                # If event count limit reached before time period, wait out the remaining time. Checking against one less than max limit to allow room for writing a throttling msg to telemetry
-                if self.event_count >= Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE - 1:
-                    end_time_for_event_count_throttle_check = self.start_time_for_event_count_throttle_check + datetime.timedelta(seconds=Constants.TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE)
-                    time_to_wait = (end_time_for_event_count_throttle_check - datetime.datetime.utcnow())
-                    time_to_wait_in_secs = ((time_to_wait.microseconds + (time_to_wait.seconds + time_to_wait.days * 24 * 3600) * 10 ** 6) / 10 ** 6)  # Computing seconds as per: https://docs.python.org/2/library/datetime.html#datetime.timedelta.total_seconds, since total_seconds() is not supported in python 2.6
-                    event_write_throttled_msg = "Max telemetry event file limit reached. Extension will wait until a telemetry event file can be written again. [WaitTimeInSecs={0}]".format(str(time_to_wait_in_secs))
-                    self.composite_logger.log_telemetry_module(event_write_throttled_msg)
-                    self.write_event(message=event_write_throttled_msg, event_level=Constants.TelemetryEventLevel.Informational, is_event_file_throttling_needed=False)
-                    time.sleep(time_to_wait_in_secs)
-                    self.start_time_for_event_count_throttle_check = datetime.datetime.utcnow()
-                    self.event_count = 1
-
-            else:
-                self.start_time_for_event_count_throttle_check = datetime.datetime.utcnow()
-                self.event_count = 1
-        except Exception as e:
-            self.composite_logger.log_telemetry_module_error("Error occurred while throttling telemetry events. [Error={0}]".format(repr(e)))
-            raise
-
-    def __write_event_using_temp_file(self, file_path, all_events, mode='w'):
-        """ Writes to a temp file in a single operation and then moves/overrides the original file with the temp """
+    def __write_event_using_temp_file(self, file_path, content, mode='w'):
+        """ Writes to a temp file in a single operation and then moves it to the event file path, so the guest agent never reads a partial file """
         try:
             with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(file_path), delete=False) as tf:
-                json.dump(all_events, tf, default=all_events.__str__())
+                tf.write(content)
                 tempname = tf.name
             shutil.move(tempname, file_path)
-            self.__telemetry_event_counter += 1
-            self.event_count += 1
+            self.__update_events_dir_size(self.get_file_size(file_path))
         except Exception as error:
             self.composite_logger.log_telemetry_module_error("Unable to write to telemetry. [Event File={0}] [Error={1}].".format(str(file_path), repr(error)))
             raise
 
     def __get_events_dir_size(self):
-        """ Returns total size, in bytes, of the events folder """
+        """ Returns total size, in bytes, of the events folder as tracked by the running ledger.
+        The folder is only re-scanned if the ledger is not seeded yet or the folder was modified by someone else since it was last accounted for, i.e. Guest Agent picked up event files """
+        if self.__events_dir_size is None or self.__get_events_dir_mtime() != self.__events_dir_mtime:
+            self.__reconcile_events_dir_size()
+        return self.__events_dir_size
+
+    def __seed_events_dir_size(self):
+        """ Seeds the events folder size ledger at startup. On failure, the ledger is left unseeded and is built on first use """
+        try:
+            self.__reconcile_events_dir_size()
+        except Exception as error:
+            self.__events_dir_size = None
+            self.composite_logger.log_telemetry_module_error("Unable to compute initial event directory size. [Error={0}].".format(repr(error)))
+
+    def __reconcile_events_dir_size(self):
+        """ Rebuilds the events folder size ledger by listing the folder and fetching the size of every file in it """
+        events_dir_mtime = self.__get_events_dir_mtime()
         total_dir_size = 0
         for f in os.listdir(self.events_folder_path):
             try:
@@ -324,31 +482,34 @@ class TelemetryWriter(object):
                 else:
                     self.composite_logger.log_telemetry_module_error("Error occurred while fetching event directory size. [Error={0}].".format(repr(error)))
                     raise
-        return total_dir_size
-
-    @staticmethod
-    def __get_event_file_path(folder_path):
-        """ Returns the filename, generated from current timestamp in seconds, to be used to write an event. Eg: 1614111606855.json"""
-        return os.path.join(folder_path, str(int(round(time.time() * 1000))) + ".json")
+        self.__events_dir_size = total_dir_size
+        self.__events_dir_mtime = events_dir_mtime
+
+    def __update_events_dir_size(self, size_delta):
+        """ Accounts for a file written or deleted by this writer, without re-scanning the folder """
+        if self.__events_dir_size is None:
+            return
+        self.__events_dir_size = max(0, self.__events_dir_size + size_delta)
+        self.__events_dir_mtime = self.__get_events_dir_mtime()
+
+    def __get_events_dir_mtime(self):
+        """ Returns the last modified time of the events folder, which changes whenever a file is added to or removed from it """
+        return os.stat(self.events_folder_path).st_mtime
+
+    def __get_event_file_path(self, folder_path):
+        """ Returns a new filename, generated from current timestamp in milliseconds, to be used to write an event file. Eg: 1614111606855.json
+        Timestamps are never reused, so files written within the same millisecond get the next free timestamp instead of overwriting each other. """
+        file_timestamp = max(int(round(time.time() * 1000)), self.__last_event_file_timestamp + 1)
+        while os.path.exists(os.path.join(folder_path, str(file_timestamp) + ".json")):
+            file_timestamp += 1
+        self.__last_event_file_timestamp = file_timestamp
+        return os.path.join(folder_path, str(file_timestamp) + ".json")
 
     @staticmethod
     def get_file_size(file_path):
         """ Returns the size of a file. Extracted out for mocking in unit test """
         return os.path.getsize(file_path)
 
-    def __fetch_events_from_previous_file(self, file_path):
-        """ Fetch contents from the file, return empty if file doesn't exist """
-        try:
-            with open(file_path, 'r') as file_handle:
-                file_contents = file_handle.read()
-                return json.loads(file_contents)
-        except OSError as error:
-            if error.errno == errno.ENOENT:
-                return []
-            else:
-                self.composite_logger.log_telemetry_module_error("Error occurred while fetching contents from existing event file. [File={0}] [Error={1}].".format(repr(file_path), repr(error)))
-                raise
-
     def set_operation_id(self, operation_id):
         self.__operation_id = operation_id
 
@@ -15,6 +15,8 @@
 # Requires Python 2.7+
 import json
 import os
+import shutil
+import time
 import unittest
 from core.src.bootstrap.Constants import Constants
 from core.src.core_logic.ExecutionConfig import ExecutionConfig
@@ -35,6 +37,13 @@ class TestAptitudePackageManager(unittest.TestCase):
         self.runtime.stop()
 
     #region Mocks
+    @staticmethod
+    def __write_dpkg_status_file(file_path, content):
+        # written to a new file and moved in place, the same way dpkg replaces its status database
+        with open(file_path + "-new", 'w') as file_handle:
+            file_handle.write(content)
+        os.rename(file_path + "-new", file_path)
+
     def mock_read_with_retry_raise_exception(self):
         raise Exception
 
@@ -112,6 +121,92 @@ class TestAptitudePackageManager(unittest.TestCase):
         self.assertEqual(package_versions[1], '4.3-14ubuntu1.2')
         self.assertEqual(package_versions[2], '4.3-14ubuntu1')
 
+    def test_get_all_updates_parses_output_as_it_streams(self):
+        package_manager = self.container.get('package_manager')
+        command_outputs = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def streaming_only_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            # output lines only reach the consumers, as if the retained output had been dropped
+            code, output = run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+            command_outputs.append(output)
+            return code, str()
+
+        self.runtime.env_layer.run_command_output = streaming_only_run_command_output
+        packages, package_versions = package_manager.get_all_updates()
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+        self.assertEqual(len(packages), 3)
+        self.assertEqual((packages, package_versions), package_manager.extract_packages_and_versions(command_outputs[-1]))
+
+        # esm packages are listed on the line after the marker, and only count if more output follows
+        esm_output = "Inst python3 [3.8.2] (3.8.10 Ubuntu:20.04/focal-updates [amd64])\n" + package_manager.ESM_MARKER + "\n  git-man git\n"
+        self.assertEqual(package_manager.extract_packages_and_versions(esm_output + "Learn more about UA Infra: ESM service\n"),
+                         (["python3", "git-man", "git"], ["3.8.10", Constants.UA_ESM_REQUIRED, Constants.UA_ESM_REQUIRED]))
+        self.assertEqual(package_manager.extract_packages_and_versions(esm_output + "\n\n"), (["python3"], ["3.8.10"]))
+
+    def test_security_updates_classified_from_package_lists(self):
+        package_manager = self.container.get('package_manager')
+        package_manager.inventory_fingerprint_paths = [os.path.join(self.runtime.execution_config.config_folder, "sources.list")]
+        self.runtime.write_to_file(package_manager.inventory_fingerprint_paths[0], "deb http://azure.archive.ubuntu.com/ubuntu/ jammy main")
+        security_source_list = os.path.join(self.runtime.execution_config.config_folder, "security.list")
+        self.runtime.write_to_file(security_source_list, "deb http://azure.archive.ubuntu.com/ubuntu/ jammy-security main")
+        package_manager._AptitudePackageManager__get_custom_sources_to_spec = lambda max_patch_published_date=str(), base_classification=str(): \
+            (str(), security_source_list) if base_classification == Constants.PackageClassification.SECURITY else (str(), str())
+
+        os.makedirs(package_manager.APT_LISTS_DIR_PATH)
+        lists_path_prefix = os.path.join(package_manager.APT_LISTS_DIR_PATH, "azure.archive.ubuntu.com_ubuntu_dists_")
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy-updates_main_binary-amd64_Packages",
+                                      "Package: libssl3\nArchitecture: amd64\nVersion: 3.0.2-0ubuntu1.15\n\nPackage: python3\nArchitecture: amd64\nVersion: 3.10.6-1~22.04.1\n\n"
+                                      "Package: git\nArchitecture: amd64\nVersion: 1:2.34.1-1ubuntu1.11\n\nPackage: zlib1g\nArchitecture: amd64\nVersion: 1:1.2.11.dfsg-2ubuntu9.2\n\n"
+                                      "Package: tzdata\nArchitecture: all\nVersion: 2024a-0ubuntu0.22.04.1\n")
+        # python3 has a security fix, though its candidate is a newer version from -updates only; the security fix of git is already installed,
+        # the one of zlib1g is for another architecture, and the one of tzdata is newer than its candidate
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy-security_main_binary-amd64_Packages",
+                                      "Package: libssl3\nArchitecture: amd64\nVersion: 3.0.2-0ubuntu1.15\n\nPackage: python3\nArchitecture: amd64\nVersion: 3.10.6-1~22.04.0.1\n\n"
+                                      "Package: python3\nArchitecture: amd64\nVersion: 3.10.6-1~22.04\n\nPackage: git\nArchitecture: amd64\nVersion: 1:2.34.1-1ubuntu1.10\n\n"
+                                      "Package: tzdata\nArchitecture: all\nVersion: 2024b-0ubuntu0.22.04\n")
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy-security_main_binary-i386_Packages", "Package: zlib1g\nArchitecture: i386\nVersion: 1:1.2.11.dfsg-2ubuntu9.2\n")
+
+        simulation_commands = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def simulation_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            if cmd.find("dist-upgrade") < 0:
+                return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+            simulation_commands.append(cmd)
+            if cmd.find(security_source_list) > -1:
+                output = "Inst libssl3 [3.0.2-0ubuntu1.14] (3.0.2-0ubuntu1.15 Ubuntu:22.04/jammy-security [amd64])\n" + \
+                         "Inst python3 [3.10.6-1~22.04] (3.10.6-1~22.04.0.1 Ubuntu:22.04/jammy-security [amd64])\n"
+            else:
+                output = "Inst libssl3 [3.0.2-0ubuntu1.14] (3.0.2-0ubuntu1.15 Ubuntu:22.04/jammy-updates, Ubuntu:22.04/jammy-security [amd64])\n" + \
+                         "Inst python3 [3.10.6-1~22.04] (3.10.6-1~22.04.1 Ubuntu:22.04/jammy-updates [amd64])\n" + \
+                         "Inst git [1:2.34.1-1ubuntu1.10] (1:2.34.1-1ubuntu1.11 Ubuntu:22.04/jammy-updates [amd64])\n" + \
+                         "Inst zlib1g [1:1.2.11.dfsg-2ubuntu9] (1:1.2.11.dfsg-2ubuntu9.2 Ubuntu:22.04/jammy-updates [amd64])\n" + \
+                         "Inst tzdata [2023c-0ubuntu0.22.04.2] (2024a-0ubuntu0.22.04.1 Ubuntu:22.04/jammy-updates [all])\n"
+            for output_consumer in output_consumers or []:
+                for line in output.splitlines():
+                    output_consumer(line)
+            return 0, output
+
+        self.runtime.env_layer.run_command_output = simulation_run_command_output
+        self.assertEqual(package_manager.get_all_updates()[0], ["libssl3", "python3", "git", "zlib1g", "tzdata"])
+        self.assertEqual(package_manager.get_security_updates(), (["libssl3", "python3"], ["3.0.2-0ubuntu1.15", "3.10.6-1~22.04.0.1"]))
+        self.assertEqual(package_manager.get_other_updates(), (["git", "zlib1g", "tzdata"], ["1:2.34.1-1ubuntu1.11", "1:1.2.11.dfsg-2ubuntu9.2", "2024a-0ubuntu0.22.04.1"]))
+        self.assertEqual(len(simulation_commands), 1)
+
+        # the all updates simulation is run again once what it read changes
+        self.runtime.write_to_file(package_manager.inventory_fingerprint_paths[0], "deb http://azure.archive.ubuntu.com/ubuntu/ jammy main universe")
+        self.assertEqual(package_manager.get_security_updates()[0], ["libssl3", "python3"])
+        self.assertEqual(len(simulation_commands), 2)
+
+        # package lists kept compressed cannot be indexed, so security updates are left to a security-only simulation
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy_universe_binary-amd64_Packages.lz4", "")
+        package_manager.get_all_updates()
+        self.assertEqual(package_manager.get_security_updates(), (["libssl3", "python3"], ["3.0.2-0ubuntu1.15", "3.10.6-1~22.04.0.1"]))
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+        self.assertEqual(len(simulation_commands), 4)
+        self.assertTrue(simulation_commands[-1].find(security_source_list) > -1)
+
     def test_install_package_success(self):
         self.runtime.set_legacy_test_type('SuccessInstallPath')
 
@@ -131,6 +226,158 @@ class TestAptitudePackageManager(unittest.TestCase):
         self.assertEqual(package_manager.is_package_version_installed('mysql-server', '5.7.25-0ubuntu0.16.04.2'), True)
         self.assertEqual(package_manager.is_package_version_installed('mysql-client', '5.7.25-0ubuntu0.16.04.2'), False)
 
+    def test_is_installed_check_with_dpkg_status_database(self):
+        package_manager = self.container.get('package_manager')
+        os.makedirs(os.path.dirname(package_manager.dpkg_status_file_path))
+        self.__write_dpkg_status_file(package_manager.dpkg_status_file_path,
+                                      "Package: mysql-server\nStatus: install ok installed\nPriority: optional\nArchitecture: all\nVersion: 5.7.25-0ubuntu0.16.04.2\n"
+                                      "Description: MySQL database server\n This is an empty package that depends on the current version\n Version: 1.0\n\n"
+                                      "Package: libc6\nStatus: install ok installed\nArchitecture: amd64\nVersion: 2.27-3ubuntu1\n\n"
+                                      "Package: libc6\nStatus: install ok installed\nArchitecture: i386\nVersion: 2.27-3ubuntu1.2\n\n"
+                                      "Package: mysql-client\nStatus: deinstall ok config-files\nArchitecture: amd64\nVersion: 5.7.25-0ubuntu0.16.04.2\n\n"
+                                      "Package: linux-azure\nStatus: hold ok installed\nArchitecture: amd64\nVersion: 5.15.0.1057.55\n\n"
+                                      "Package: openssl\nStatus: install ok half-configured\nArchitecture: amd64\nVersion: 3.0.2-0ubuntu1.15\n")
+
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = tracking_run_command_output
+        self.assertTrue(package_manager.is_package_version_installed('mysql-server', '5.7.25-0ubuntu0.16.04.2'))
+        self.assertFalse(package_manager.is_package_version_installed('mysql-server', '1.0'))
+        self.assertFalse(package_manager.is_package_version_installed('mysql-client', '5.7.25-0ubuntu0.16.04.2'))
+        self.assertFalse(package_manager.is_package_version_installed('mysql-common', '5.7.25-0ubuntu0.16.04.2'))
+        self.assertTrue(package_manager.is_package_version_installed('libc6', '2.27-3ubuntu1'))
+        self.assertTrue(package_manager.is_package_version_installed('libc6:i386', '2.27-3ubuntu1.2'))
+        self.assertFalse(package_manager.is_package_version_installed('libc6:amd64', '2.27-3ubuntu1.2'))
+        self.assertTrue(package_manager.is_package_version_installed('linux-azure', '5.15.0.1057.55'))     # held
+        self.assertFalse(package_manager.is_package_version_installed('openssl', '3.0.2-0ubuntu1.15'))
+        self.assertEqual(len(commands_run), 0)
+
+        # a replaced status database is re-indexed
+        self.__write_dpkg_status_file(package_manager.dpkg_status_file_path, "Package: mysql-server\nStatus: install ok installed\nArchitecture: all\nVersion: 5.7.26-0ubuntu0.16.04.1\n")
+        self.assertFalse(package_manager.is_package_version_installed('mysql-server', '5.7.25-0ubuntu0.16.04.2'))
+        self.assertTrue(package_manager.is_package_version_installed('mysql-server', '5.7.26-0ubuntu0.16.04.1'))
+        self.assertFalse(package_manager.is_package_version_installed('libc6', '2.27-3ubuntu1'))
+        self.assertEqual(len(commands_run), 0)
+
+        # falls back to dpkg and apt commands when the status database is not readable
+        os.remove(package_manager.dpkg_status_file_path)
+        self.runtime.set_legacy_test_type('SuccessInstallPath')
+        self.assertTrue(package_manager.is_package_version_installed('mysql-server', '5.7.25-0ubuntu0.16.04.2'))
+        self.assertEqual(len(commands_run), 1)
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
+    def test_is_installed_check_with_dpkg_status_database_performance(self):
+        """ Verifies 5000 packages against a synthetic dpkg status database with one parse, compared to one dpkg (and apt) query per package """
+        package_manager = self.container.get('package_manager')
+        os.makedirs(os.path.dirname(package_manager.dpkg_status_file_path))
+        package_count = 5000
+        self.__write_dpkg_status_file(package_manager.dpkg_status_file_path, "\n".join(
+            "Package: package{0}\nStatus: install ok installed\nPriority: optional\nSection: libs\nInstalled-Size: 107\nArchitecture: amd64\nVersion: 1.{0}-0ubuntu1\n"
+            "Depends: libc6 (>= 2.14)\nDescription: synthetic package {0}\n Long description of synthetic package {0}\n".format(str(i)) for i in range(0, package_count)))
+
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = tracking_run_command_output
+        start_time = time.time()
+        for i in range(0, package_count):
+            self.assertTrue(package_manager.is_package_version_installed("package" + str(i), "1.{0}-0ubuntu1".format(str(i))))
+        time_taken_with_dpkg_status_database = time.time() - start_time
+        self.assertEqual(len(commands_run), 0)
+
+        os.remove(package_manager.dpkg_status_file_path)
+        start_time = time.time()
+        for i in range(0, package_count):
+            package_manager.is_package_version_installed("package" + str(i), "1.{0}-0ubuntu1".format(str(i)))
+        time_taken_with_queries = time.time() - start_time
+        self.assertTrue(len(commands_run) >= package_count)
+
+        self.runtime.composite_logger.log_debug("Install check performance. [Packages={0}][WithDpkgStatusDatabase={1}s][WithQueries={2}s][QueriesRun={3}]".format(str(package_count), str(time_taken_with_dpkg_status_database), str(time_taken_with_queries), str(len(commands_run))))
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
+    def test_get_all_available_versions_of_package_from_apt_lists(self):
+        package_manager = self.container.get('package_manager')
+        os.makedirs(package_manager.APT_LISTS_DIR_PATH)
+        lists_path_prefix = os.path.join(package_manager.APT_LISTS_DIR_PATH, "azure.archive.ubuntu.com_ubuntu_dists_")
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy_main_binary-amd64_Packages",
+                                      "Package: bash\nArchitecture: amd64\nVersion: 5.1-6ubuntu1\nDescription: GNU Bourne Again SHell\n Version: 9.9 is not a field\n\n"
+                                      "Package: libc6\nArchitecture: amd64\nVersion: 2.35-0ubuntu3\n\n"
+                                      "Package: tzdata\nArchitecture: all\nVersion: 2022a-0ubuntu1\n")
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy-updates_main_binary-amd64_Packages",
+                                      "Package: bash\nArchitecture: amd64\nVersion: 5.1-6ubuntu1.1\n\nPackage: libc6\nArchitecture: amd64\nVersion: 2.35-0ubuntu3.10\n\n"
+                                      "Package: libc6\nArchitecture: amd64\nVersion: 2.35-0ubuntu3.7\n")
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy-updates_main_binary-i386_Packages", "Package: libc6\nArchitecture: i386\nVersion: 2.35-0ubuntu3.8\n")
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy_InRelease", "Suite: jammy\n")
+
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = tracking_run_command_output
+        self.assertEqual(package_manager.get_all_available_versions_of_package("bash"), ["5.1-6ubuntu1.1", "5.1-6ubuntu1"])
+        self.assertEqual(package_manager.get_all_available_versions_of_package("libc6"), ["2.35-0ubuntu3.10", "2.35-0ubuntu3.8", "2.35-0ubuntu3.7", "2.35-0ubuntu3"])
+        self.assertEqual(package_manager.get_all_available_versions_of_package("libc6:i386"), ["2.35-0ubuntu3.8"])
+        self.assertEqual(package_manager.get_all_available_versions_of_package("tzdata:amd64"), ["2022a-0ubuntu1"])
+        self.assertEqual(package_manager.get_all_available_versions_of_package("not-available"), [])
+        self.assertEqual(len(commands_run), 0)
+
+        # the index is rebuilt once the package lists are refreshed
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy-security_main_binary-amd64_Packages", "Package: bash\nArchitecture: amd64\nVersion: 5.1-6ubuntu1.2\n")
+        self.assertEqual(package_manager.get_all_available_versions_of_package("bash"), ["5.1-6ubuntu1.2", "5.1-6ubuntu1.1", "5.1-6ubuntu1"])
+
+        # package lists kept compressed are left to apt-cache
+        self.__write_dpkg_status_file(lists_path_prefix + "jammy_universe_binary-amd64_Packages.lz4", "")
+        self.assertEqual(package_manager.get_all_available_versions_of_package("bash"), ['4.3-14ubuntu1.3', '4.3-14ubuntu1.2', '4.3-14ubuntu1'])
+        self.assertEqual(len(commands_run), 1)
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
+    def test_get_all_available_versions_of_package_from_apt_lists_performance(self):
+        """ Looks up available versions of 5000 packages in synthetic package lists with one pass over them, compared to one apt-cache query per package """
+        package_manager = self.container.get('package_manager')
+        os.makedirs(package_manager.APT_LISTS_DIR_PATH)
+        package_count = 5000
+        for pocket in ["jammy", "jammy-updates", "jammy-security"]:
+            self.__write_dpkg_status_file(os.path.join(package_manager.APT_LISTS_DIR_PATH, "azure.archive.ubuntu.com_ubuntu_dists_{0}_main_binary-amd64_Packages".format(pocket)), "\n".join(
+                "Package: package{0}\nArchitecture: amd64\nVersion: 1.{0}-0ubuntu1~{1}\nPriority: optional\nSection: libs\nInstalled-Size: 107\nDepends: libc6 (>= 2.14)\n"
+                "Filename: pool/main/p/package{0}/package{0}_1.{0}-0ubuntu1~{1}_amd64.deb\nSize: 45678\nSHA256: {2}\nDescription: synthetic package {0}\n"
+                " Long description of synthetic package {0}\n".format(str(i), pocket, "0" * 64) for i in range(0, package_count)))
+
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = tracking_run_command_output
+        start_time = time.time()
+        for i in range(0, package_count):
+            self.assertEqual(len(package_manager.get_all_available_versions_of_package("package" + str(i))), 3)
+        time_taken_with_apt_lists = time.time() - start_time
+        self.assertEqual(len(commands_run), 0)
+
+        shutil.rmtree(package_manager.APT_LISTS_DIR_PATH)
+        start_time = time.time()
+        for i in range(0, package_count):
+            package_manager.get_all_available_versions_of_package("package" + str(i))
+        time_taken_with_queries = time.time() - start_time
+        self.assertTrue(len(commands_run) >= package_count)
+
+        self.runtime.composite_logger.log_debug("Available versions lookup performance. [Packages={0}][WithAptLists={1}s][WithQueries={2}s][QueriesRun={3}]".format(str(package_count), str(time_taken_with_apt_lists), str(time_taken_with_queries), str(len(commands_run))))
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
     def test_install_package_failure(self):
         self.runtime.set_legacy_test_type('FailInstallPath')
 
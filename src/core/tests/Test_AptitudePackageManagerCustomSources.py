@@ -34,9 +34,11 @@ class TestAptitudePackageManagerCustomSources(unittest.TestCase):
         self.runtime.stop()
 
     def test_custom_source_invocation_for_security(self):
+        base_classifications_requested = []
+
         def get_custom_sources_to_spec_for_sec(max_patch_published_date=str(), base_classification=str()):
             assert max_patch_published_date is str()
-            assert base_classification == Constants.PackageClassification.SECURITY
+            base_classifications_requested.append(base_classification)
             return str(), str()
 
         def get_custom_sources_to_spec_for_sec_date(max_patch_published_date=str(), base_classification=str()):
@@ -46,8 +48,10 @@ class TestAptitudePackageManagerCustomSources(unittest.TestCase):
 
         package_manager = AptitudePackageManager.AptitudePackageManager(self.runtime.env_layer, self.runtime.execution_config, self.runtime.composite_logger, self.runtime.telemetry_writer, self.runtime.status_handler)
         package_manager._AptitudePackageManager__get_custom_sources_to_spec = get_custom_sources_to_spec_for_sec
-        package_manager.get_security_updates()
+        package_manager.get_security_updates()     # classified from the all updates simulation, with the security sources only used as the package lists cannot be indexed here
+        self.assertEqual(base_classifications_requested, [str(), Constants.PackageClassification.SECURITY])
         package_manager.install_security_updates_azgps_coordinated()
+        self.assertEqual(base_classifications_requested[-1], Constants.PackageClassification.SECURITY)
 
         package_manager._AptitudePackageManager__get_custom_sources_to_spec = get_custom_sources_to_spec_for_sec_date
         package_manager.set_max_patch_publish_date("2025-03-12T00:00:00Z")
@@ -83,6 +87,42 @@ class TestAptitudePackageManagerCustomSources(unittest.TestCase):
                                                             include_source_parts_debstyle=include_source_parts_debstyle,
                                                             include_max_patch_publish_date=include_max_patch_publish_date)
 
+    def test_custom_sources_state_reused_across_formulas_and_runs(self):
+        mock_sources_path = self.__prep_scratch_with_sources(include_sources_list=True, include_source_parts_list=True, include_source_parts_debstyle=True)
+        refresh_commands = []
+
+        def get_package_manager():
+            package_manager = AptitudePackageManager.AptitudePackageManager(self.runtime.env_layer, self.runtime.execution_config, self.runtime.composite_logger, self.runtime.telemetry_writer, self.runtime.status_handler)
+            self.__adapt_package_manager_for_mock_sources(package_manager, mock_sources_path)
+            package_manager.invoke_package_manager = lambda command: refresh_commands.append(command)
+            return package_manager
+
+        # each formula gets a state directory with package lists of its own, and switching back to a formula in the same run does not refresh again
+        package_manager = get_package_manager()
+        sources_dir, sources_list = package_manager._AptitudePackageManager__get_custom_sources_to_spec("20240401T160000Z")
+        security_sources_dir, security_sources_list = package_manager._AptitudePackageManager__get_custom_sources_to_spec("20240401T160000Z", "Security")
+        self.assertEqual(package_manager._AptitudePackageManager__get_custom_sources_to_spec("20240401T160000Z"), (sources_dir, sources_list))
+        self.assertNotEqual(os.path.dirname(sources_list), os.path.dirname(security_sources_list))
+        self.assertEqual(len(refresh_commands), 2)
+        self.assertTrue("-oDir::State::Lists={0}/".format(os.path.join(os.path.dirname(sources_list), "lists")) in refresh_commands[0])
+        self.assertTrue(os.path.isdir(os.path.join(os.path.dirname(sources_list), "lists", "partial")))
+
+        # snapshot package lists are downloaded only once across runs, while sources without a max patch publish date are refreshed once per run
+        package_manager = get_package_manager()
+        self.assertEqual(package_manager._AptitudePackageManager__get_custom_sources_to_spec("20240401T160000Z"), (sources_dir, sources_list))
+        self.assertEqual(len(refresh_commands), 2)
+        package_manager._AptitudePackageManager__get_custom_sources_to_spec(base_classification="Security")
+        package_manager = get_package_manager()
+        package_manager._AptitudePackageManager__get_custom_sources_to_spec(base_classification="Security")
+        self.assertEqual(len(refresh_commands), 4)
+
+        # changed sources get a state of their own, and least recently used states are removed
+        for date in ["20240501T160000Z", "20240601T160000Z", "20240701T160000Z", "20240801T160000Z"]:
+            package_manager._AptitudePackageManager__get_custom_sources_to_spec(date)
+        self.assertEqual(len(os.listdir(package_manager.custom_source_state_root_dir)), package_manager.max_custom_source_states_retained)
+
+        self.__clear_mock_sources_path(mock_sources_path)
+
     def __lib_test_custom_sources_with(self, include_sources_list=False, include_source_parts_list=False, include_source_parts_debstyle=False,
                                        include_max_patch_publish_date=str()):
         # type: (bool, bool, bool, str) -> None
@@ -0,0 +1,52 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import unittest
+
+from core.src.core_logic.BatchSizeController import BatchSizeController
+from core.tests.library.ArgumentComposer import ArgumentComposer
+from core.tests.library.RuntimeCompositor import RuntimeCompositor
+
+
+class TestBatchSizeController(unittest.TestCase):
+    def setUp(self):
+        self.runtime = RuntimeCompositor(ArgumentComposer().get_composed_arguments(), legacy_mode=True)
+
+    def tearDown(self):
+        self.runtime.stop()
+
+    def test_batch_size_follows_observed_outcomes(self):
+        batch_size_controller = BatchSizeController(self.runtime.composite_logger, 90)
+        self.assertEqual(batch_size_controller.get_batch_size(300), 300)
+
+        # per-package install time moves towards the observed time
+        batch_size_controller.record_batch_outcome(100, 1000, 100, 0)
+        self.assertEqual(batch_size_controller.package_install_time_in_secs, 50)
+        self.assertEqual(batch_size_controller.get_batch_size(300), 300)
+
+        # retries of failed packages do not count as new attempts, and only isolated failures count as failures
+        batch_size_controller.record_batch_outcome(50, 500, 0, 0)
+        batch_size_controller.record_batch_outcome(1, 10, 0, 1)
+        self.assertEqual(batch_size_controller.get_package_failure_rate(), 0.01)
+        self.assertEqual(batch_size_controller.get_batch_size(300), 100)
+        self.assertEqual(batch_size_controller.get_batch_size(20), 20)
+
+        batch_size_controller.record_batch_outcome(2, 10, 2, 2)
+        self.assertEqual(batch_size_controller.get_batch_size(300), 34)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from core.src.bootstrap.Constants import Constants
+from core.src.bootstrap.EnvLayer import EnvLayer
+
+
+@unittest.skipIf(os.name == 'nt', "Runs real shell commands")
+class TestEnvLayer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.env_layer = EnvLayer(real_record_path=os.path.join(self.temp_dir, "record"))
+        self.max_retained_command_output_size_in_bytes_backup = Constants.EnvLayer.MAX_RETAINED_COMMAND_OUTPUT_SIZE_IN_BYTES
+
+    def tearDown(self):
+        Constants.EnvLayer.MAX_RETAINED_COMMAND_OUTPUT_SIZE_IN_BYTES = self.max_retained_command_output_size_in_bytes_backup
+        shutil.rmtree(self.temp_dir)
+
+    def test_run_command_output_streams_lines_to_consumers(self):
+        lines = []
+        code, output = self.env_layer.run_command_output("echo first; echo second >&2; exit 3", output_consumers=[lines.append])
+        self.assertEqual(code, 3)
+        self.assertEqual(lines, ["first\n", "second\n"])
+        self.assertEqual(output, "first\nsecond\n")
+
+        code, output = self.env_layer.run_command_output("echo quiet", no_output=True)
+        self.assertEqual(code, 0)
+        self.assertTrue(output is None)
+
+    def test_run_command_output_terminates_commands_at_deadline(self):
+        self.env_layer.set_command_deadline(time.time() + 1)
+        start = time.time()
+        code, output = self.env_layer.run_within_command_deadline(self.env_layer.run_command_output, "echo started; sleep 60; echo finished")
+        self.assertTrue(time.time() - start < 30)
+        self.assertEqual(code, Constants.EnvLayer.COMMAND_DEADLINE_EXCEEDED_CODE)
+        self.assertTrue(output.startswith("started\n"))
+        self.assertTrue("finished" not in output)
+        self.assertTrue("deadline" in output)
+
+        self.env_layer.set_command_deadline(None)
+        code, output = self.env_layer.run_within_command_deadline(self.env_layer.run_command_output, "echo finished")
+        self.assertEqual(code, 0)
+        self.assertEqual(output, "finished\n")
+
+    def test_run_command_output_only_bounds_commands_within_deadline(self):
+        # commands not run within the deadline, such as installs, are left to complete past it
+        self.env_layer.set_command_deadline(time.time() + 1)
+        code, output = self.env_layer.run_command_output("echo started; sleep 2; echo finished")
+        self.assertEqual(code, 0)
+        self.assertEqual(output, "started\nfinished\n")
+
+        # once the deadline has passed, commands within it are not started instead of being terminated right away
+        commands_run = []
+        try:
+            self.env_layer.run_within_command_deadline(commands_run.append, "echo started")
+            self.fail("Commands were run within a passed deadline.")
+        except Exception as error:
+            self.assertTrue(Constants.EnvLayer.COMMAND_DEADLINE_PASSED in repr(error))
+        self.assertEqual(commands_run, [])
+
+        # prerequisites installed by a query run within the deadline are left to complete as well
+        self.env_layer.set_command_deadline(time.time() + 1)
+        code, output = self.env_layer.run_within_command_deadline(lambda: self.env_layer.run_outside_command_deadline(self.env_layer.run_command_output, "sleep 2; echo installed"))
+        self.assertEqual(code, 0)
+        self.assertEqual(output, "installed\n")
+
+    def test_run_command_output_outside_deadline_leaves_other_threads_bounded(self):
+        # a prerequisite install run outside the deadline on one thread does not lift the deadline for a query running alongside on another
+        self.env_layer.set_command_deadline(time.time() + 2)
+        install_started = threading.Event()
+        install_results = []
+
+        def install_prerequisite():
+            install_started.set()
+            install_results.append(self.env_layer.run_command_output("sleep 4; echo installed"))
+
+        def query_alongside_install():
+            install_thread = threading.Thread(target=self.env_layer.run_outside_command_deadline, args=(install_prerequisite,))
+            install_thread.start()
+            install_started.wait(10)
+            query_result = self.env_layer.run_command_output("echo started; sleep 60; echo finished")
+            install_thread.join()
+            return query_result
+
+        start = time.time()
+        code, output = self.env_layer.run_within_command_deadline(query_alongside_install)
+        self.assertTrue(time.time() - start < 30)
+        self.assertEqual(code, Constants.EnvLayer.COMMAND_DEADLINE_EXCEEDED_CODE)
+        self.assertTrue("finished" not in output)
+        self.assertEqual(install_results, [(0, "installed\n")])
+        self.assertFalse(self.env_layer.is_within_command_deadline())
+
+    def test_run_command_output_retains_only_most_recent_output(self):
+        Constants.EnvLayer.MAX_RETAINED_COMMAND_OUTPUT_SIZE_IN_BYTES = 1000
+        lines = []
+        code, output = self.env_layer.run_command_output("for i in $(seq 1 5000); do echo line$i; done", output_consumers=[lines.append])
+        self.assertEqual(code, 0)
+        self.assertEqual(len(lines), 5000)
+        self.assertTrue(len(output) < 1100)
+        self.assertTrue(output.startswith("Earlier command output dropped"))
+        self.assertTrue(output.endswith("line5000\n"))
+        self.assertTrue("line1\n" not in output)
+
+
+if __name__ == '__main__':
+    unittest.main()
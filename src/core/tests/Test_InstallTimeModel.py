@@ -0,0 +1,82 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import os
+import unittest
+
+from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.InstallTimeModel import InstallTimeModel
+from core.tests.library.ArgumentComposer import ArgumentComposer
+from core.tests.library.RuntimeCompositor import RuntimeCompositor
+
+
+class TestInstallTimeModel(unittest.TestCase):
+    def setUp(self):
+        self.runtime = RuntimeCompositor(ArgumentComposer().get_composed_arguments(), legacy_mode=True)
+        self.model_file_path = os.path.join(self.runtime.execution_config.config_folder, Constants.INSTALL_TIME_MODEL_FILE)
+
+    def tearDown(self):
+        self.runtime.stop()
+
+    def __get_model(self):
+        return InstallTimeModel(self.runtime.env_layer, self.runtime.composite_logger, self.model_file_path)
+
+    def test_get_size_in_mb(self):
+        self.assertEqual(InstallTimeModel.get_size_in_mb("0 B"), 0)
+        self.assertEqual(InstallTimeModel.get_size_in_mb("512 kB"), 0.5)
+        self.assertEqual(InstallTimeModel.get_size_in_mb("1,024 kB"), 1)
+        self.assertEqual(InstallTimeModel.get_size_in_mb("15 M"), 15)
+        self.assertEqual(InstallTimeModel.get_size_in_mb("1.5 GiB"), 1536)
+        self.assertTrue(InstallTimeModel.get_size_in_mb(Constants.UNKNOWN_PACKAGE_SIZE) is None)
+
+    def test_fallback_without_history(self):
+        install_time_model = self.__get_model()
+        self.assertFalse(install_time_model.has_history())
+        self.assertEqual(install_time_model.get_expected_avg_time_in_seconds(None, 90), 90)
+
+        install_time_model.record_install_outcome(["git", "curl"], "10 MB", 20)
+        self.assertEqual(install_time_model.get_expected_avg_time_in_seconds(["git"], 90), 90)
+
+        # the package manager falls back to its static average install time
+        self.assertEqual(self.runtime.package_manager.get_package_install_expected_avg_time_in_seconds(), self.runtime.package_manager.package_install_expected_avg_time_in_seconds)
+
+    def test_predictions_follow_download_size(self):
+        install_time_model = self.__get_model()
+        for i in range(0, 10):
+            install_time_model.record_install_outcome(["small-package-" + str(i)], "1 MB", 2)
+            install_time_model.record_install_outcome(["large-package-" + str(i)], "100 MB", 20)
+        self.assertTrue(install_time_model.has_history())
+
+        small_package_time = install_time_model.get_expected_avg_time_in_seconds(["small-package-0"] * 100, 90)
+        large_package_time = install_time_model.get_expected_avg_time_in_seconds(["large-package-0"] * 100, 90)
+        unknown_package_time = install_time_model.get_expected_avg_time_in_seconds(["unknown-package"] * 100, 90)
+        self.assertTrue(2 <= small_package_time < 3)
+        self.assertTrue(20 <= large_package_time < 21)
+        self.assertTrue(small_package_time < unknown_package_time < large_package_time)
+        self.assertTrue(install_time_model.get_expected_avg_time_in_seconds(["small-package-0"], 90) > small_package_time)    # wider margin for fewer packages
+
+        # history is carried over to the next runs
+        self.assertEqual(self.__get_model().get_expected_avg_time_in_seconds(["large-package-0"] * 100, 90), large_package_time)
+
+    def test_unreadable_history_is_reset(self):
+        self.runtime.write_to_file(self.model_file_path, "{\"installTimeModel\": {\"observedPackageCount\": ")
+        install_time_model = self.__get_model()
+        self.assertFalse(install_time_model.has_history())
+        self.assertEqual(install_time_model.get_expected_avg_time_in_seconds(["git"], 90), 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
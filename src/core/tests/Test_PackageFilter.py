@@ -145,6 +145,26 @@ class TestPackageFilter(unittest.TestCase):
         self.assertEqual(runtime.package_filter.check_for_inclusion(["firefox", "ssh-client"]), True)
         runtime.stop()
 
+    def test_inclusions_with_versions_check_every_matching_mask(self):
+        argument_composer = ArgumentComposer()
+        argument_composer.classifications_to_include = []
+        argument_composer.patches_to_include = ["kernel*=5.*", "kernel-default=6.1", "bash.x86_64", "lib[ab]c?"]
+        argument_composer.patches_to_exclude = []
+        runtime = RuntimeCompositor(argument_composer.get_composed_arguments(), True)
+
+        package_filter = runtime.package_filter
+        self.assertEqual(package_filter.installation_included_package_matcher.get_matching_mask_indices("kernel-default"), [0, 1])
+        self.assertEqual(package_filter.check_for_inclusion("kernel-default", "5.4"), True)
+        self.assertEqual(package_filter.check_for_inclusion("kernel-default", "6.1"), True)     # second matching mask
+        self.assertEqual(package_filter.check_for_inclusion("kernel-default", "7.0"), False)
+        self.assertEqual(package_filter.check_for_inclusion("kernel-tools.x86_64", "5.4"), True)
+        self.assertEqual(package_filter.check_for_inclusion("bash.x86_64"), True)
+        self.assertEqual(package_filter.check_for_inclusion("bash"), False)
+        self.assertEqual(package_filter.check_for_inclusion("libac1"), True)
+        self.assertEqual(package_filter.check_for_inclusion("libdc1"), False)
+        self.assertEqual(package_filter.check_for_inclusion(["firefox", "libbc2.noarch"], ["1.0", "2.0"]), True)
+        runtime.stop()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import unittest
+
+from core.src.core_logic.PackageFilter import PackageFilter
+from core.src.core_logic.PackageSet import PackageSet
+
+
+class TestPackageSet(unittest.TestCase):
+
+    def test_membership_and_removal(self):
+        package_set = PackageSet(["git", "curl", "git", "vim"], ["2.0", "7.1", "1.0", "9.0"])
+        self.assertEqual(len(package_set), 3)
+        self.assertEqual(package_set.get_packages_and_versions(), (["git", "curl", "vim"], ["2.0", "7.1", "9.0"]))   # first record for a package is kept
+        self.assertTrue("curl" in package_set)
+        self.assertEqual(package_set.get_version("git"), "2.0")
+        self.assertEqual(package_set.get_version("nano", "default"), "default")
+
+        self.assertEqual(package_set.remove("curl").version, "7.1")
+        self.assertTrue(package_set.remove("curl") is None)
+        self.assertFalse("curl" in package_set)
+        self.assertTrue(package_set.add("curl", "7.2"))
+        self.assertFalse(package_set.add("curl", "7.3"))
+        self.assertEqual(package_set.get_packages_and_versions(), (["git", "vim", "curl"], ["2.0", "9.0", "7.2"]))
+
+    def test_difference(self):
+        package_set = PackageSet(["git", "curl", "vim"], ["2.0", "7.1", "9.0"])
+        self.assertEqual(package_set.difference(["curl", "nano"]).get_packages_and_versions(), (["git", "vim"], ["2.0", "9.0"]))
+        self.assertEqual(package_set.difference(PackageSet(["git"], ["1.0"])).get_packages_and_versions(), (["curl", "vim"], ["7.1", "9.0"]))
+        self.assertEqual(len(package_set), 3)
+
+    def test_get_arch_siblings(self):
+        package_set = PackageSet(["libgcc.i686", "libgcc.x86_64", "tar.x86_64"], ["1.0", "1.0", "2.0"])
+        siblings = package_set.get_arch_siblings("libgcc.x86_64", PackageFilter.get_product_name_without_arch)
+        self.assertEqual([entry.package for entry in siblings], ["libgcc.i686", "libgcc.x86_64"])
+
+        package_set.remove("libgcc.i686")
+        package_set.add("libgcc.noarch", "1.0")
+        siblings = package_set.get_arch_siblings("libgcc.i686", PackageFilter.get_product_name_without_arch)
+        self.assertEqual([entry.package for entry in siblings], ["libgcc.x86_64", "libgcc.noarch"])
+        self.assertEqual(package_set.get_arch_siblings("bash.x86_64", PackageFilter.get_product_name_without_arch), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -38,6 +38,55 @@ class TestPatchAssessor(unittest.TestCase):
     def test_assessment_success(self):
         self.assertTrue(self.runtime.patch_assessor.start_assessment())
 
+    def test_post_installation_assessment_reconciles_inventory_with_install_outcomes(self):
+        repo_list_path = os.path.join(self.runtime.execution_config.temp_folder, "lists")
+        package_db_path = os.path.join(self.runtime.execution_config.temp_folder, "status")
+        self.runtime.write_to_file(repo_list_path, "repository lists")
+        self.runtime.write_to_file(package_db_path, "package database")
+        self.runtime.package_manager.inventory_fingerprint_paths = [repo_list_path]
+        self.runtime.package_manager.inventory_package_database_paths = [package_db_path]
+        self.assertTrue(self.runtime.patch_assessor.start_assessment())
+        all_packages, all_package_versions = self.runtime.package_manager.get_inventory_snapshot()['all_updates']
+        self.assertTrue(len(all_packages) > 2)
+
+        # first update installed as requested, second one came in as a dependency, the rest is still pending
+        self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
+        self.runtime.status_handler.set_package_install_status(all_packages[:1], all_package_versions[:1], Constants.INSTALLED)
+        self.runtime.status_handler.set_package_install_status(all_packages[1:], all_package_versions[1:], Constants.FAILED)
+        self.runtime.write_to_file(package_db_path, "package database after installation")
+
+        checked_packages = []
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+        are_package_versions_installed_backup = self.runtime.package_manager.are_package_versions_installed
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        def mock_are_package_versions_installed(package_names, package_versions):
+            checked_packages.extend(package_names)
+            return [package_name == all_packages[1] for package_name in package_names]
+
+        self.runtime.env_layer.run_command_output = tracking_run_command_output
+        self.runtime.package_manager.are_package_versions_installed = mock_are_package_versions_installed
+        self.assertTrue(self.runtime.patch_assessor.start_assessment(post_installation=True))
+        self.assertEqual(len([cmd for cmd in commands_run if cmd.find("apt-get -q update") > -1 or cmd.find("dist-upgrade") > -1]), 0)
+        self.assertTrue(all_packages[0] not in checked_packages)
+        self.assertTrue(all_packages[1] in checked_packages)
+        reconciled_packages, reconciled_package_versions = self.runtime.package_manager.get_inventory_snapshot()['all_updates']
+        self.assertEqual(reconciled_packages, all_packages[2:])
+        self.assertEqual(reconciled_package_versions, all_package_versions[2:])
+
+        # repositories changed since, so a full assessment is run instead
+        self.runtime.write_to_file(repo_list_path, "repository lists changed")
+        del commands_run[:]
+        self.assertTrue(self.runtime.patch_assessor.start_assessment(post_installation=True))
+        self.assertTrue(len([cmd for cmd in commands_run if cmd.find("apt-get -q update") > -1]) > 0)
+        self.assertEqual(self.runtime.package_manager.get_inventory_snapshot()['all_updates'][0], all_packages)
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+        self.runtime.package_manager.are_package_versions_installed = are_package_versions_installed_backup
+
     def test_assessment_fail(self):
         self.runtime.set_legacy_test_type('UnalignedPath')
         self.assertRaises(Exception, self.runtime.patch_assessor.start_assessment)
@@ -19,8 +19,10 @@ import json
 import math
 import os
 import sys
+import time
 import unittest
 from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.PackageSet import PackageSet
 from core.tests.Test_UbuntuProClient import MockUpdatesResult, MockVersionResult
 from core.tests.library.ArgumentComposer import ArgumentComposer
 from core.tests.library.RuntimeCompositor import RuntimeCompositor
@@ -48,6 +50,115 @@ class TestPatchInstaller(unittest.TestCase):
         self.assertTrue(maintenance_window_exceeded)
         runtime.stop()
 
+    def test_install_updates_reuses_assessment_inventory_while_unchanged(self):
+        current_time = datetime.datetime.utcnow()
+        td = datetime.timedelta(hours=0, minutes=20)
+        job_start_time = (current_time - td).strftime("%Y-%m-%dT%H:%M:%S.9999Z")
+        argument_composer = ArgumentComposer()
+        argument_composer.maximum_duration = 'PT1H'
+        argument_composer.start_time = job_start_time
+        runtime = RuntimeCompositor(argument_composer.get_composed_arguments(), True, Constants.APT)
+        runtime.set_legacy_test_type('SuccessInstallPath')
+        package_db_path = os.path.join(runtime.execution_config.temp_folder, "status")
+        runtime.write_to_file(package_db_path, "package database")
+        runtime.package_manager.inventory_fingerprint_paths = [package_db_path]
+
+        commands_run = []
+        run_command_output_backup = runtime.env_layer.run_command_output
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        runtime.env_layer.run_command_output = tracking_run_command_output
+        self.assertTrue(runtime.patch_assessor.start_assessment())
+        assessment_snapshot = runtime.package_manager.get_inventory_snapshot()
+        self.assertIsNotNone(assessment_snapshot)
+
+        # nothing changed since assessment, so no repo refresh and no update queries
+        del commands_run[:]
+        installed_update_count, update_run_successful, maintenance_window_exceeded = runtime.patch_installer.install_updates(runtime.maintenance_window, runtime.package_manager, simulate=True)
+        self.assertTrue(update_run_successful)
+        commands_run_before_installs = commands_run[:[index for index, cmd in enumerate(commands_run) if cmd.find("--only-upgrade true") > -1][0]]
+        self.assertEqual(len([cmd for cmd in commands_run_before_installs if cmd.find("apt-get -q update") > -1 or cmd.find("dist-upgrade") > -1]), 0)
+        self.assertEqual(assessment_snapshot['version'], 1)
+
+        # package database changed, so the snapshot is dropped and the installation queries again
+        runtime.write_to_file(package_db_path, "package database changed")
+        del commands_run[:]
+        runtime.patch_installer.install_updates(runtime.maintenance_window, runtime.package_manager, simulate=True)
+        self.assertIsNone(runtime.package_manager.get_inventory_snapshot())
+        self.assertTrue(len([cmd for cmd in commands_run if cmd.find("apt-get -q update") > -1]) > 0)
+        self.assertTrue(len([cmd for cmd in commands_run if cmd.find("dist-upgrade") > -1]) > 0)
+        runtime.env_layer.run_command_output = run_command_output_backup
+        runtime.stop()
+
+    def test_install_updates_bounds_only_queries_by_maintenance_window(self):
+        current_time = datetime.datetime.utcnow()
+        td = datetime.timedelta(hours=0, minutes=20)
+        job_start_time = (current_time - td).strftime("%Y-%m-%dT%H:%M:%S.9999Z")
+        argument_composer = ArgumentComposer()
+        argument_composer.maximum_duration = 'PT1H'
+        argument_composer.start_time = job_start_time
+        runtime = RuntimeCompositor(argument_composer.get_composed_arguments(), True, Constants.APT)
+        runtime.set_legacy_test_type('SuccessInstallPath')
+
+        commands_run = []   # (command, whether run within the command deadline)
+        queries_within_deadline = []
+        run_command_output_backup = runtime.env_layer.run_command_output
+        run_within_command_deadline_backup = runtime.env_layer.run_within_command_deadline
+
+        def tracking_run_within_command_deadline(function, *args):
+            queries_within_deadline.append(function)
+            try:
+                return run_within_command_deadline_backup(function, *args)
+            finally:
+                queries_within_deadline.pop()
+
+        def tracking_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append((cmd, len(queries_within_deadline) > 0))
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        runtime.env_layer.run_command_output = tracking_run_command_output
+        runtime.env_layer.run_within_command_deadline = tracking_run_within_command_deadline
+        runtime.env_layer.set_command_deadline(time.time() + 40 * 60)
+        installed_update_count, update_run_successful, maintenance_window_exceeded = runtime.patch_installer.install_updates(runtime.maintenance_window, runtime.package_manager, simulate=True)
+        self.assertTrue(update_run_successful)
+        self.assertFalse(maintenance_window_exceeded)
+        self.assertTrue(len([cmd for cmd, within_deadline in commands_run if cmd.find("dist-upgrade") > -1 and within_deadline]) > 0)
+        install_commands = [(cmd, within_deadline) for cmd, within_deadline in commands_run if cmd.find("--only-upgrade true install") > -1]
+        self.assertTrue(len(install_commands) > 0)
+        self.assertEqual([cmd for cmd, within_deadline in install_commands if within_deadline], [])
+
+        # an install overrunning the maintenance window completes, and the queries after it report the window as exceeded instead of being terminated
+        def overrunning_install_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            if cmd.find("--only-upgrade true install") > -1:
+                runtime.env_layer.set_command_deadline(time.time() - 1)
+            return tracking_run_command_output(cmd, no_output, chk_err, output_consumers)
+
+        runtime.env_layer.run_command_output = overrunning_install_run_command_output
+        runtime.env_layer.set_command_deadline(time.time() + 40 * 60)
+        del commands_run[:]
+        try:
+            runtime.patch_installer.install_updates(runtime.maintenance_window, runtime.package_manager, simulate=True)
+            self.fail("Patch installation continued past the maintenance window.")
+        except Exception as error:
+            self.assertTrue("maintenance window was exceeded" in repr(error))
+            self.assertTrue(Constants.ERROR_ADDED_TO_STATUS in repr(error))
+        install_command_indexes = [index for index, (cmd, within_deadline) in enumerate(commands_run) if cmd.find("--only-upgrade true install") > -1]
+        self.assertEqual(len(install_command_indexes), 1)
+        self.assertEqual([cmd for cmd, within_deadline in commands_run[install_command_indexes[0] + 1:] if within_deadline], [])
+
+        runtime.status_handler.flush_status_file()
+        with runtime.env_layer.file_system.open(runtime.execution_config.status_file_path, 'r') as file_handle:
+            substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
+        self.assertTrue(json.loads(substatus_file_data["formattedMessage"]["message"])["maintenanceWindowExceeded"])
+
+        runtime.env_layer.set_command_deadline(None)
+        runtime.env_layer.run_within_command_deadline = run_within_command_deadline_backup
+        runtime.env_layer.run_command_output = run_command_output_backup
+        runtime.stop()
+
     def test_yum_install_success(self):
         current_time = datetime.datetime.utcnow()
         td = datetime.timedelta(hours=0, minutes=20)
@@ -196,6 +307,45 @@ class TestPatchInstaller(unittest.TestCase):
         self.assertFalse(maintenance_window_exceeded)
         runtime.stop()
 
+    def test_packages_prefetched_before_installation(self):
+        argument_composer = ArgumentComposer()
+        argument_composer.maximum_duration = 'PT1H'
+        argument_composer.start_time = (datetime.datetime.utcnow() - datetime.timedelta(minutes=20)).strftime("%Y-%m-%dT%H:%M:%S.9999Z")
+        runtime = RuntimeCompositor(argument_composer.get_composed_arguments(), True, Constants.APT)
+        runtime.set_legacy_test_type('SuccessInstallPath')
+
+        commands_run = []
+        run_command_output_backup = runtime.env_layer.run_command_output
+
+        def failing_download_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            if cmd.find("--download-only") > -1:
+                return 100, "E: Failed to fetch packages"
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        # all selected packages are downloaded in one pass ahead of the install batches, and a failed download does not fail the installation
+        runtime.env_layer.run_command_output = failing_download_run_command_output
+        installed_update_count, update_run_successful, maintenance_window_exceeded = runtime.patch_installer.install_updates(runtime.maintenance_window, runtime.package_manager, simulate=True)
+        self.assertEqual(3, installed_update_count)
+        self.assertTrue(update_run_successful)
+        download_command_indices = [index for index, cmd in enumerate(commands_run) if cmd.find("--download-only") > -1]
+        install_command_indices = [index for index, cmd in enumerate(commands_run) if cmd.find("-s install") > -1]
+        self.assertEqual(len(download_command_indices), 1)
+        self.assertTrue(len(install_command_indices) > 0 and download_command_indices[0] < install_command_indices[0])
+        self.assertEqual(len(commands_run[download_command_indices[0]].split(runtime.package_manager.single_package_download_cmd)[1].split()), 3)
+        self.assertEqual(len(runtime.status_handler.get_installation_packages_by_state(Constants.FAILED)[0]), 0)
+
+        # no prefetch when disabled
+        del commands_run[:]
+        Constants.PackageBatchConfig.PREFETCH_PACKAGES_BEFORE_INSTALLATION = False
+        try:
+            runtime.patch_installer.install_updates(runtime.maintenance_window, runtime.package_manager, simulate=True)
+        finally:
+            Constants.PackageBatchConfig.PREFETCH_PACKAGES_BEFORE_INSTALLATION = True
+        self.assertEqual(len([cmd for cmd in commands_run if cmd.find("--download-only") > -1]), 0)
+        runtime.env_layer.run_command_output = run_command_output_backup
+        runtime.stop()
+
     def test_apt_install_skips_esm_packages(self):
         obj = MockUpdatesResult()
         obj.mock_import_uaclient_update_module('updates', 'mock_update_list_with_one_esm_update')
@@ -409,7 +559,7 @@ class TestPatchInstaller(unittest.TestCase):
         self.assertTrue("git" in package_and_dependencies)
         self.assertTrue("grub-efi-amd64-signed" in package_and_dependencies)
         self.assertTrue("grub-efi-amd64-bin" not in package_and_dependencies)
-        runtime.patch_installer.include_dependencies(runtime.package_manager, packages_in_batch, package_versions_in_batch, all_packages, all_packages_version, packages, package_versions, package_and_dependencies, package_and_dependency_versions)
+        runtime.patch_installer.include_dependencies(runtime.package_manager, packages_in_batch, package_versions_in_batch, PackageSet(all_packages, all_packages_version), PackageSet(packages, package_versions), package_and_dependencies, package_and_dependency_versions)
         self.assertEqual(4, len(package_and_dependencies))
         self.assertEqual(4, len(package_and_dependency_versions))
         self.assertTrue("git-man" in package_and_dependencies)
@@ -434,7 +584,7 @@ class TestPatchInstaller(unittest.TestCase):
         package_versions_in_batch = ["3.13.1-102.el7_3.16"]
         package_and_dependencies = list(packages_in_batch)
         package_and_dependency_versions = list(package_versions_in_batch)
-        runtime.patch_installer.include_dependencies(runtime.package_manager, packages_in_batch, package_versions_in_batch, all_packages, all_packages_version, packages, package_versions, package_and_dependencies, package_and_dependency_versions)
+        runtime.patch_installer.include_dependencies(runtime.package_manager, packages_in_batch, package_versions_in_batch, PackageSet(all_packages, all_packages_version), PackageSet(packages, package_versions), package_and_dependencies, package_and_dependency_versions)
         self.assertEqual(2, len(package_and_dependencies))
         self.assertEqual(2, len(package_and_dependency_versions))
         self.assertTrue(package_and_dependencies[0] == "selinux-policy.noarch")
@@ -459,13 +609,47 @@ class TestPatchInstaller(unittest.TestCase):
         package_versions_in_batch = ["5.60.7-8.1"]
         package_and_dependencies = list(packages_in_batch)
         package_and_dependency_versions = list(package_versions_in_batch)
-        runtime.patch_installer.include_dependencies(runtime.package_manager, packages_in_batch, package_versions_in_batch, all_packages, all_packages_version, packages, package_versions, package_and_dependencies, package_and_dependency_versions)
+        runtime.patch_installer.include_dependencies(runtime.package_manager, packages_in_batch, package_versions_in_batch, PackageSet(all_packages, all_packages_version), PackageSet(packages, package_versions), package_and_dependencies, package_and_dependency_versions)
         self.assertEqual(1, len(package_and_dependencies))
         self.assertEqual(1, len(package_and_dependency_versions))
         self.assertTrue(package_and_dependencies[0] == "libgcc")
         self.assertTrue(package_and_dependency_versions[0] == "5.60.7-8.1")
         runtime.stop()
 
+    def test_dependency_exclusion_resolves_dependencies_in_groups(self):
+        # 200 packages, of which package7 and package150 depend on the excluded package-excluded
+        argument_composer = ArgumentComposer()
+        argument_composer.patches_to_exclude = ["package-excluded"]
+        runtime = RuntimeCompositor(argument_composer.get_composed_arguments(), True, Constants.APT)
+        packages = ["package" + str(i) for i in range(0, 200)] + ["package-excluded"]
+        package_versions = ["1.0"] * len(packages)
+        dependency_graph = {"package7": ["package8", "package-excluded"], "package8": ["package9"], "package150": ["package-excluded"], "package20": ["package21"]}
+
+        dependency_resolutions = []
+
+        def mock_get_dependent_list(packages_to_resolve):
+            dependency_resolutions.append(list(packages_to_resolve))
+            dependencies = []
+            for package in packages_to_resolve:
+                dependencies += [dependency for dependency in dependency_graph.get(package, []) if dependency not in packages_to_resolve and dependency not in dependencies]
+            return dependencies
+
+        runtime.package_manager.get_dependent_list = mock_get_dependent_list
+        excluded_packages, excluded_package_versions = runtime.patch_installer.get_excluded_updates(runtime.package_manager, packages, package_versions)
+        self.assertEqual(excluded_packages, ["package7", "package150", "package-excluded"])
+        self.assertEqual(excluded_package_versions, ["1.0", "1.0", "1.0"])
+        self.assertTrue(len(dependency_resolutions) < 40)
+
+        # dependencies resolved for a package alone are reused when installing it
+        self.assertTrue("package8" in runtime.patch_installer.dependency_graph)
+        runtime.patch_installer.last_still_needed_updates = PackageSet(packages, package_versions)
+        package_and_dependencies, package_and_dependency_versions = ["package8"], ["1.0"]
+        dependency_resolution_count = len(dependency_resolutions)
+        runtime.patch_installer.include_dependencies(runtime.package_manager, ["package8"], ["1.0"], PackageSet(packages, package_versions), PackageSet(packages, package_versions), package_and_dependencies, package_and_dependency_versions)
+        self.assertEqual(package_and_dependencies, ["package8", "package9"])
+        self.assertEqual(len(dependency_resolutions), dependency_resolution_count)
+        runtime.stop()
+
     def test_skip_package_version_UA_ESM_REQUIRED(self):
         current_time = datetime.datetime.utcnow()
         td = datetime.timedelta(hours=0, minutes=20)
@@ -691,6 +875,39 @@ class TestPatchInstaller(unittest.TestCase):
         sys.version_info = original_version
         runtime.stop()
 
+    def test_batch_patching_bisects_failed_batches(self):
+        runtime = RuntimeCompositor(ArgumentComposer().get_composed_arguments(), True, Constants.APT)
+        packages = ["package" + str(i) for i in range(0, 40)]
+        packages[23] = "bad-package"
+        package_versions = ["1.0"] * len(packages)
+        install_invocations = []
+
+        def mock_install_update_and_dependencies(package_and_dependencies, package_and_dependency_versions, simulate=False):
+            install_invocations.append(list(package_and_dependencies))
+            return (100 if "bad-package" in package_and_dependencies else 0), "", "install"   # a bad package fails the whole transaction
+
+        runtime.package_manager.install_update_and_dependencies = mock_install_update_and_dependencies
+        runtime.package_manager.get_installation_status = lambda code, out, exec_cmd, package, version, simulate=False: Constants.FAILED if code != 0 else Constants.INSTALLED
+        runtime.package_manager.get_dependent_list = lambda packages_to_resolve: []
+        runtime.package_manager.get_all_updates = lambda cached=False: (["bad-package"], ["1.0"])
+        runtime.patch_installer.last_still_needed_updates = PackageSet(packages, package_versions)
+
+        remaining_packages, remaining_package_versions, installed_update_count, patch_installation_successful = runtime.patch_installer.batch_patching(
+            PackageSet(packages, package_versions), packages, package_versions, runtime.maintenance_window, runtime.package_manager)
+
+        # one bad package among 40 is isolated in a logarithmic number of installs, and is not retried one by one afterwards
+        self.assertEqual(len(install_invocations[0]), 40)
+        self.assertTrue(len(install_invocations) <= 1 + 2 * math.ceil(math.log(40, 2)))
+        self.assertTrue(["bad-package"] in install_invocations)
+        self.assertEqual(remaining_packages, [])
+        self.assertEqual(installed_update_count, 39)
+        self.assertFalse(patch_installation_successful)
+        self.assertEqual(runtime.patch_installer.failed_parent_package_install_count, 1)
+        self.assertEqual(runtime.patch_installer.successful_parent_package_install_count, 39)
+        self.assertEqual(runtime.patch_installer.attempted_parent_package_install_count, 40)
+        self.assertEqual(runtime.status_handler.get_installation_packages_by_state(Constants.FAILED)[0], ["bad-package"])
+        runtime.stop()
+
     def test_get_max_batch_size(self):
         argument_composer = ArgumentComposer()
         argument_composer.maximum_duration = "PT1H"
@@ -0,0 +1,97 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import threading
+import unittest
+
+from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.QueryScheduler import QueryScheduler
+from core.tests.library.ArgumentComposer import ArgumentComposer
+from core.tests.library.RuntimeCompositor import RuntimeCompositor
+
+
+class TestQueryScheduler(unittest.TestCase):
+    def setUp(self):
+        self.runtime = RuntimeCompositor(ArgumentComposer().get_composed_arguments(), legacy_mode=True)
+        self.container = self.runtime.container
+
+    def tearDown(self):
+        self.runtime.stop()
+
+    def test_read_queries_run_concurrently(self):
+        first_started = threading.Event()
+        second_started = threading.Event()
+
+        def first_query():
+            first_started.set()
+            return second_started.wait(10)     # only completes in time if the second query runs alongside
+
+        def second_query(value):
+            second_started.set()
+            return first_started.wait(10) and value
+
+        query_scheduler = QueryScheduler(self.runtime.env_layer, self.runtime.composite_logger)
+        first = query_scheduler.schedule("First", Constants.QueryAccess.READ, first_query)
+        second = query_scheduler.schedule("Second", Constants.QueryAccess.READ, second_query, "done")
+        self.assertTrue(query_scheduler.get_result(first))
+        self.assertEqual(query_scheduler.get_result(second), "done")
+
+    def test_write_queries_wait_for_read_queries(self):
+        events = []
+        read_may_finish = threading.Event()
+
+        def read_query():
+            read_may_finish.wait(10)
+            events.append("read")
+
+        def write_query():
+            events.append("write")
+            return True
+
+        query_scheduler = QueryScheduler(self.runtime.env_layer, self.runtime.composite_logger)
+        read = query_scheduler.schedule("Read", Constants.QueryAccess.READ, read_query)
+        write = query_scheduler.schedule("Write", Constants.QueryAccess.WRITE, write_query)
+        self.assertEqual(events, [])    # write queries are deferred until their result is requested
+        read_may_finish.set()
+        self.assertTrue(query_scheduler.get_result(write))
+        self.assertEqual(events, ["read", "write"])
+        query_scheduler.get_result(read)
+
+    def test_query_errors_are_raised_to_caller(self):
+        def failing_query():
+            raise ValueError("query failed")
+
+        query_scheduler = QueryScheduler(self.runtime.env_layer, self.runtime.composite_logger)
+        read = query_scheduler.schedule("Failing read", Constants.QueryAccess.READ, failing_query)
+        write = query_scheduler.schedule("Failing write", Constants.QueryAccess.WRITE, failing_query)
+        self.assertRaises(ValueError, query_scheduler.get_result, read)
+        self.assertRaises(ValueError, query_scheduler.get_result, write)
+
+    def test_read_queries_run_within_command_deadline_of_caller(self):
+        query_scheduler = QueryScheduler(self.runtime.env_layer, self.runtime.composite_logger)
+        bounded = self.runtime.env_layer.run_within_command_deadline(query_scheduler.schedule, "Bounded", Constants.QueryAccess.READ, self.runtime.env_layer.is_within_command_deadline)
+        unbounded = query_scheduler.schedule("Unbounded", Constants.QueryAccess.READ, self.runtime.env_layer.is_within_command_deadline)
+        self.assertTrue(query_scheduler.get_result(bounded))
+        self.assertFalse(query_scheduler.get_result(unbounded))
+
+    def test_query_access_classification(self):
+        package_manager = self.container.get('package_manager')
+        self.assertEqual(package_manager.get_query_access('is_reboot_pending'), Constants.QueryAccess.READ)
+        self.assertEqual(package_manager.get_query_access('refresh_repo'), Constants.QueryAccess.WRITE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import datetime
+import os
+import unittest
+
+from core.src.bootstrap.Constants import Constants
+from core.src.core_logic.RepoFreshnessTracker import RepoFreshnessTracker
+from core.tests.library.ArgumentComposer import ArgumentComposer
+from core.tests.library.RuntimeCompositor import RuntimeCompositor
+
+
+class TestRepoFreshnessTracker(unittest.TestCase):
+    def setUp(self):
+        self.runtime = RuntimeCompositor(ArgumentComposer().get_composed_arguments(), legacy_mode=True)
+        self.sources_path = os.path.join(self.runtime.execution_config.config_folder, "sources.list")
+        self.runtime.write_to_file(self.sources_path, "deb http://azure.archive.ubuntu.com/ubuntu/ focal main")
+        self.current_time = datetime.datetime(2025, 1, 1, 0, 0, 0)
+        self.backup_datetime_utcnow = self.runtime.env_layer.datetime.datetime_utcnow
+        self.runtime.env_layer.datetime.datetime_utcnow = lambda: self.current_time
+
+    def tearDown(self):
+        self.runtime.env_layer.datetime.datetime_utcnow = self.backup_datetime_utcnow
+        self.runtime.stop()
+
+    def test_source_set_freshness(self):
+        repo_freshness_tracker = RepoFreshnessTracker(self.runtime.env_layer, self.runtime.composite_logger, ttl_in_minutes=30)
+        self.assertFalse(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [self.sources_path]))
+
+        repo_freshness_tracker.record_refresh(Constants.MACHINE_SOURCES, [self.sources_path])
+        self.assertTrue(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [self.sources_path]))
+        self.assertFalse(repo_freshness_tracker.is_fresh("custom", [self.sources_path]))
+
+        self.current_time += datetime.timedelta(minutes=29)
+        self.assertTrue(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [self.sources_path]))
+        self.current_time += datetime.timedelta(minutes=1)
+        self.assertFalse(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [self.sources_path]))
+
+        repo_freshness_tracker.record_refresh(Constants.MACHINE_SOURCES, [self.sources_path])
+        repo_freshness_tracker.invalidate()
+        self.assertFalse(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [self.sources_path]))
+
+    def test_source_set_is_stale_once_files_change(self):
+        repo_freshness_tracker = RepoFreshnessTracker(self.runtime.env_layer, self.runtime.composite_logger)
+        repo_freshness_tracker.record_refresh(Constants.MACHINE_SOURCES, [self.sources_path])
+        self.runtime.write_to_file(self.sources_path, "deb http://azure.archive.ubuntu.com/ubuntu/ focal main universe")
+        self.assertFalse(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [self.sources_path]))
+
+        # refreshes whose files cannot be fingerprinted are not tracked
+        missing_path = os.path.join(self.runtime.execution_config.config_folder, "missing.list")
+        repo_freshness_tracker.record_refresh(Constants.MACHINE_SOURCES, [missing_path])
+        self.assertFalse(repo_freshness_tracker.is_fresh(Constants.MACHINE_SOURCES, [missing_path]))
+
+    def test_apt_refresh_repo_skipped_while_fresh(self):
+        package_manager = self.runtime.package_manager
+        package_manager.inventory_fingerprint_paths = [self.sources_path]
+        refresh_commands = []
+        package_manager.invoke_package_manager = lambda command: refresh_commands.append(command)
+
+        package_manager.refresh_repo()
+        package_manager.refresh_repo_safely()
+        self.assertEqual(len(refresh_commands), 1)
+
+        # custom sources are tracked as a source set of their own
+        custom_source_list = os.path.join(self.runtime.execution_config.config_folder, "custom.list")
+        self.runtime.write_to_file(custom_source_list, "deb http://snapshot.ubuntu.com/ubuntu/20250101T000000Z focal main")
+        package_manager.refresh_repo(source_list=custom_source_list)
+        package_manager.refresh_repo(source_list=custom_source_list)
+        self.assertEqual(len(refresh_commands), 2)
+
+        # machine sources are refreshed again once their files change, as a refresh from custom sources does with the package lists
+        self.runtime.write_to_file(self.sources_path, "deb http://azure.archive.ubuntu.com/ubuntu/ focal main universe")
+        package_manager.refresh_repo_safely()
+        self.assertEqual(len(refresh_commands), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
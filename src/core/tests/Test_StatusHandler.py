@@ -17,6 +17,7 @@ import datetime
 import glob
 import json
 import os
+import threading
 import unittest
 from core.src.bootstrap.Constants import Constants
 from core.src.service_interfaces.StatusHandler import StatusHandler
@@ -94,23 +95,132 @@ class TestStatusHandler(unittest.TestCase):
     def test_set_package_install_status_extended(self):
         packages, package_versions = self.runtime.package_manager.get_all_updates()
         self.runtime.status_handler.set_package_install_status(packages, package_versions)
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
         self.assertEqual(substatus_file_data["name"], Constants.PATCH_INSTALLATION_SUMMARY)
         self.assertEqual(json.loads(substatus_file_data["formattedMessage"]["message"])["patches"][1]["name"], "samba-common-bin")
         self.assertEqual(json.loads(substatus_file_data["formattedMessage"]["message"])["patches"][1]["patchInstallationState"], Constants.PENDING)
         self.runtime.status_handler.set_package_install_status("samba-common-bin", "2:4.4.5+dfsg-2ubuntu5.4", Constants.INSTALLED)
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
         self.assertEqual(json.loads(substatus_file_data["formattedMessage"]["message"])["patches"][0]["name"], "samba-common-bin")
         self.assertEqual(json.loads(substatus_file_data["formattedMessage"]["message"])["patches"][0]["patchInstallationState"], Constants.INSTALLED)
 
+    def test_set_package_install_status_writes_coalesced_within_latency_window(self):
+        latency_window_backup = Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS
+        Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = 600
+        self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
+        self.runtime.status_handler.set_package_install_status("package0", "1.0")
+        self.runtime.status_handler.flush_status_file()
+
+        status_file_writes = []
+        write_with_retry_using_temp_file_backup = self.runtime.env_layer.file_system.write_with_retry_using_temp_file
+
+        def counting_write_with_retry_using_temp_file(file_path, data, mode='w'):
+            status_file_writes.append(file_path)
+            write_with_retry_using_temp_file_backup(file_path, data, mode)
+
+        self.runtime.env_layer.file_system.write_with_retry_using_temp_file = counting_write_with_retry_using_temp_file
+        for i in range(1, 50):
+            self.runtime.status_handler.set_package_install_status("package" + str(i), "1.0")
+        self.assertEqual(len(status_file_writes), 0)
+
+        # terminal state is written right away, with all coalesced updates
+        self.runtime.status_handler.set_installation_substatus_json(status=Constants.STATUS_SUCCESS)
+        self.runtime.env_layer.file_system.write_with_retry_using_temp_file = write_with_retry_using_temp_file_backup
+        Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = latency_window_backup
+
+        self.assertEqual(sorted(status_file_writes), sorted([self.runtime.execution_config.complete_status_file_path, self.runtime.execution_config.status_file_path]))
+        with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
+            substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
+        self.assertEqual(substatus_file_data["status"], Constants.STATUS_SUCCESS.lower())
+        self.assertEqual(len(json.loads(substatus_file_data["formattedMessage"]["message"])["patches"]), 50)
+
+    def test_set_package_install_status_coalesced_write_at_end_of_latency_window(self):
+        latency_window_backup = Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS
+        Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = 0.2
+        self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
+        self.runtime.status_handler.set_package_install_status("package0", "1.0")
+        self.runtime.status_handler.flush_status_file()
+        self.runtime.status_handler.set_package_install_status("package1", "1.0")
+
+        # written out without any further update or flush. time.sleep is mocked in tests, so waiting on an Event instead
+        waiter = threading.Event()
+        patch_count = 0
+        for i in range(0, 60):
+            with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
+                patch_count = len(json.loads(json.load(file_handle)[0]["status"]["substatus"][0]["formattedMessage"]["message"])["patches"])
+            if patch_count == 2:
+                break
+            waiter.wait(0.05)
+        Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = latency_window_backup
+        self.assertEqual(patch_count, 2)
+
+    def test_coalesced_write_failed_at_end_of_latency_window_is_written_at_flush(self):
+        latency_window_backup = Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS
+        Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = 0.2
+        self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
+        self.runtime.status_handler.set_package_install_status("package0", "1.0")
+        self.runtime.status_handler.flush_status_file()
+
+        timer_write_failed = threading.Event()
+        write_with_retry_using_temp_file_backup = self.runtime.env_layer.file_system.write_with_retry_using_temp_file
+
+        def failing_write_with_retry_using_temp_file(file_path, data, mode='w'):
+            timer_write_failed.set()
+            raise Exception("Status file could not be written")
+
+        self.runtime.env_layer.file_system.write_with_retry_using_temp_file = failing_write_with_retry_using_temp_file
+        self.runtime.status_handler.set_package_install_status("package1", "1.0")
+        self.assertTrue(timer_write_failed.wait(10))
+        self.runtime.env_layer.file_system.write_with_retry_using_temp_file = write_with_retry_using_temp_file_backup
+        Constants.STATUS_FILE_WRITE_LATENCY_WINDOW_IN_SECS = latency_window_backup
+
+        # the update that failed to be written is still pending for the flush before the process exits
+        self.runtime.status_handler.flush_status_file()
+        with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
+            substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
+        self.assertEqual(len(json.loads(substatus_file_data["formattedMessage"]["message"])["patches"]), 2)
+
+    def test_set_package_install_status_only_reserializes_changed_patches(self):
+        packages = ["package" + str(i) for i in range(0, 50)]
+        self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
+        self.runtime.status_handler.set_package_install_status(packages, ["1.0"] * len(packages))
+
+        patches_serialized = []
+        json_dumps_backup = json.dumps
+
+        def counting_json_dumps(obj, *args, **kwargs):
+            if isinstance(obj, dict) and "patchId" in obj:
+                patches_serialized.append(obj["name"])
+            return json_dumps_backup(obj, *args, **kwargs)
+
+        json.dumps = counting_json_dumps
+        self.runtime.status_handler.set_package_install_status("package7", "1.0", Constants.INSTALLED)
+        self.runtime.status_handler.set_package_install_status_classification(["package9"], ["1.0"], Constants.PackageClassification.SECURITY)
+        json.dumps = json_dumps_backup
+        self.assertEqual(patches_serialized, ["package7", "package9"])
+
+        self.runtime.status_handler.flush_status_file()
+        with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
+            substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
+        patches = json.loads(substatus_file_data["formattedMessage"]["message"])["patches"]
+        self.assertEqual(len(patches), 50)
+        self.assertEqual(patches[0]["name"], "package9")
+        self.assertEqual(patches[0]["classifications"], [Constants.PackageClassification.SECURITY])
+        self.assertEqual(patches[1]["name"], "package7")
+        self.assertEqual(patches[1]["patchInstallationState"], Constants.INSTALLED)
+        self.assertEqual(json.loads(substatus_file_data["formattedMessage"]["message"])["installedPatchCount"], 1)
+
     def test_set_package_install_status_classification(self):
         packages, package_versions = self.runtime.package_manager.get_all_updates()
         self.runtime.status_handler.set_package_install_status(packages, package_versions)
         sec_packages, sec_package_versions = self.runtime.package_manager.get_security_updates()
         self.runtime.status_handler.set_package_install_status_classification(sec_packages, sec_package_versions, "Security")
         substatus_file_data = []
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
         self.assertEqual(substatus_file_data["name"], Constants.PATCH_INSTALLATION_SUMMARY)
@@ -159,6 +269,7 @@ class TestStatusHandler(unittest.TestCase):
     def test_set_maintenance_window_exceeded(self):
         self.runtime.status_handler.set_installation_substatus_json()
         self.runtime.status_handler.set_maintenance_window_exceeded(True)
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
         self.assertTrue(json.loads(substatus_file_data["formattedMessage"]["message"])["maintenanceWindowExceeded"])
@@ -171,6 +282,7 @@ class TestStatusHandler(unittest.TestCase):
         self.runtime.status_handler.add_error_to_status(None)
         self.runtime.status_handler.set_assessment_substatus_json()
         substatus_file_data = []
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
         self.assertEqual(len(json.loads(substatus_file_data["formattedMessage"]["message"])["errors"]["details"]), 0)
@@ -192,6 +304,7 @@ class TestStatusHandler(unittest.TestCase):
         self.runtime.status_handler.add_error_to_status("a"*130, Constants.PatchOperationErrorCodes.DEFAULT_ERROR)
 
         substatus_file_data = []
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
 
@@ -209,6 +322,7 @@ class TestStatusHandler(unittest.TestCase):
         self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
         self.runtime.status_handler.add_error_to_status("installexception1", Constants.PatchOperationErrorCodes.DEFAULT_ERROR)
         substatus_file_data = []
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][1]
         self.assertNotEqual(json.loads(substatus_file_data["formattedMessage"]["message"])["errors"], None)
@@ -325,6 +439,7 @@ class TestStatusHandler(unittest.TestCase):
         self.assertEqual(substatus_file_data["status"].lower(), Constants.STATUS_SUCCESS.lower())
 
     def get_status_handler_substatus_maintenance_run_id(self):
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"]
             return json.loads(substatus_file_data[0]['formattedMessage']['message'])['maintenanceRunId']
@@ -414,6 +529,31 @@ class TestStatusHandler(unittest.TestCase):
             self.assertEqual(installation_patches_sorted[12]["name"], "test-package-2")  # | Other              | Excluded    |
             self.assertEqual(installation_patches_sorted[13]["name"], "test-package-1")  # | Other              | NotSelected |
 
+    def test_package_status_updates_keep_patches_sorted_by_classification_and_state(self):
+        self.runtime.status_handler.set_current_operation(Constants.INSTALLATION)
+        package_names = ["package" + str(i) for i in range(0, 30)]
+        package_versions = ["1.0"] * 30
+        self.runtime.status_handler.set_package_install_status(package_names, package_versions)
+        self.runtime.status_handler.set_package_install_status_classification(package_names[5:15], package_versions[5:15], Constants.PackageClassification.SECURITY)
+        self.runtime.status_handler.set_package_install_status_classification(package_names[20:25], package_versions[20:25], Constants.PackageClassification.CRITICAL)
+        self.runtime.status_handler.set_package_install_status(package_names[::3], package_versions[::3], Constants.INSTALLED)
+        self.runtime.status_handler.set_package_install_status(package_names[::7], package_versions[::7], Constants.FAILED)
+        self.runtime.status_handler.set_package_install_status(package_names[::3], package_versions[::3], Constants.PENDING)
+        self.runtime.status_handler.set_package_install_status(["package30", "package31"], ["1.0", "1.0"], Constants.EXCLUDED, Constants.PackageClassification.CRITICAL)
+        self.runtime.status_handler.set_package_install_status_classification(package_names[10:12], package_versions[10:12], Constants.PackageClassification.OTHER)
+        self.runtime.status_handler.flush_status_file()
+
+        with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
+            substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
+        patches = json.loads(substatus_file_data["formattedMessage"]["message"])["patches"]
+        self.assertEqual(len(patches), 32)
+        self.assertEqual(patches[0]["name"], "package20")
+        self.assertEqual(patches[-1]["name"], "package29")
+
+        # same order as a full stable sort of the patches in the order they were first added
+        patches_in_insertion_order = sorted(patches, key=lambda patch: int(patch["name"].replace("package", "")))
+        self.assertEqual(patches, self.runtime.status_handler.sort_packages_by_classification_and_state(patches_in_insertion_order))
+
     def test_sequence_number_changed_termination_configure_patching_only(self):
         """ Test sequence number change for configure patching throws newer operation superseded error message """
         self.__assert_sequence_num_changed_termination(config=Constants.CONFIGURE_PATCHING, summary=Constants.CONFIGURE_PATCHING_SUMMARY, status=Constants.STATUS_ERROR)
@@ -493,6 +633,7 @@ class TestStatusHandler(unittest.TestCase):
         test_packages, test_package_versions = self.__set_up_packages_func(patch_count_for_test)
 
         self.runtime.status_handler.set_package_install_status(test_packages, test_package_versions, 'Installed', 'Other')
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
 
@@ -505,6 +646,7 @@ class TestStatusHandler(unittest.TestCase):
 
         # Update the classification from Other to Critical
         self.runtime.status_handler.set_package_install_status_classification(test_packages, test_package_versions, 'Critical')
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(self.runtime.execution_config.status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]["status"]["substatus"][0]
 
@@ -112,6 +112,32 @@ class TestStatusHandlerTruncation(unittest.TestCase):
         # Assert 3 tombstones details
         self.__assert_assessment_tombstone_record(truncated_substatus_file_data, tombstone_count=3)
 
+    def test_only_assessment_patches_over_size_limit_truncated_without_serializing_patch_lists(self):
+        """ Perform truncation on assessment patches and check the cut point is found from patch sizes, without serializing any candidate patch list """
+        self.__test_scenario = 'assessment_only'
+        self.__patch_count_assessment = 2000
+        self.__write_assessment_to_status_file(config_operation=Constants.ASSESSMENT, patch_count_other=self.__patch_count_assessment)
+
+        patch_lists_serialized = []
+        json_dumps_backup = json.dumps
+
+        def tracking_json_dumps(obj, *args, **kwargs):
+            if isinstance(obj, list) and len(obj) > 0 and isinstance(obj[0], dict) and "patchId" in obj[0]:
+                patch_lists_serialized.append(len(obj))
+            return json_dumps_backup(obj, *args, **kwargs)
+
+        json.dumps = tracking_json_dumps
+        self.runtime.status_handler.set_assessment_substatus_json(status=Constants.STATUS_SUCCESS)
+        json.dumps = json_dumps_backup
+
+        # retained patches are only serialized as part of the substatus message, never as a standalone candidate list
+        self.assertEqual(len(patch_lists_serialized), 0)
+
+        complete_substatus_file_data = self.__get_substatus_file_json(self.runtime.execution_config.complete_status_file_path)
+        truncated_substatus_file_data = self.__get_substatus_file_json(self.runtime.execution_config.status_file_path)
+        self.__assert_patch_summary_from_status(truncated_substatus_file_data, Constants.ASSESSMENT, Constants.PATCH_ASSESSMENT_SUMMARY, Constants.STATUS_WARNING, self.__patch_count_assessment + 1, errors_count=1, errors_code=Constants.PatchOperationTopLevelErrorCode.WARNING, complete_substatus_file_data=complete_substatus_file_data, is_under_internal_size_limit=True, is_truncated=True)
+        self.__assert_assessment_tombstone_record(truncated_substatus_file_data, tombstone_count=1)
+
     def test_only_assessment_patches_over_size_limit_with_status_error_truncated(self):
         """ Perform truncation on assessment patches and substatus status is set to Error (not warning) due to per-existing patching errors
         Before truncation: 1000 assessment patches in status, 6 exceptions
@@ -909,6 +935,7 @@ class TestStatusHandlerTruncation(unittest.TestCase):
         self.runtime.status_handler.set_package_install_status(test_patches, test_patches_version, package_status)
 
     def __get_substatus_file_json(self, status_file_path):
+        self.runtime.status_handler.flush_status_file()
         with self.runtime.env_layer.file_system.open(status_file_path, 'r') as file_handle:
             substatus_file_data = json.load(file_handle)[0]
         return substatus_file_data
@@ -17,6 +17,8 @@ import datetime
 import json
 import os
 import re
+import sys
+import threading
 import time
 import unittest
 from core.src.bootstrap.Constants import Constants
@@ -46,9 +48,20 @@ class TestTelemetryWriter(unittest.TestCase):
     def mock_os_listdir(self, file_path):
         return ['testevent1.json', 'testevent2.json', 'testevent3.json', 'testevent4.json']
 
+    def wait_for_new_event_files(self, event_files_before_write, timeout_in_secs=5):
+        """ Waits for the background flusher to write out new event files. time.sleep is mocked in tests, so waiting on an Event instead """
+        waiter = threading.Event()
+        for i in range(0, int(timeout_in_secs / 0.05)):
+            new_event_files = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json) and pos_json not in event_files_before_write])
+            if len(new_event_files) > 0:
+                return new_event_files
+            waiter.wait(0.05)
+        return []
+
     def test_write_event(self):
         self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task")
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)])[-1]
         telemetry_event_counter_in_first_test_event = None
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
@@ -59,7 +72,8 @@ class TestTelemetryWriter(unittest.TestCase):
             f.close()
 
         self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task2")
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)])[-1]
         telemetry_event_counter_in_second_test_event = None
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
@@ -78,7 +92,8 @@ class TestTelemetryWriter(unittest.TestCase):
         time.time = self.mock_time
         self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task")
         self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task2")
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^' + str(self.mock_time()) + '0+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^' + str(self.mock_time()) + '0+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -87,11 +102,121 @@ class TestTelemetryWriter(unittest.TestCase):
             f.close()
         time.time = time_backup
 
+    def test_write_event_held_in_memory_until_flush(self):
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task")
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task2")
+        event_files_after_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+        self.assertEqual(len(event_files_before_write), len(event_files_after_write))
+
+        self.runtime.telemetry_writer.flush()
+        new_event_files = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json) and pos_json not in event_files_before_write]
+        self.assertEqual(len(new_event_files), 1)
+        with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, new_event_files[0]), 'r') as f:
+            events = json.load(f)
+            self.assertEqual(len(events), 2)
+            self.assertEqual(events[0]["TaskName"], "Test Task")
+            self.assertEqual(events[1]["TaskName"], "Test Task2")
+
+        # nothing pending, so no new file is written
+        self.runtime.telemetry_writer.flush()
+        self.assertEqual(len(event_files_before_write) + 1, len([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]))
+
+    def test_write_event_batch_flushed_when_max_count_reached(self):
+        event_batch_max_count_backup = Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT
+        Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT = 3
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task")
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task2")
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task3")
+
+        # written out by the background flusher, without an explicit flush
+        new_event_files = self.wait_for_new_event_files(event_files_before_write)
+        self.assertEqual(len(new_event_files), 1)
+        with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, new_event_files[0]), 'r') as f:
+            self.assertEqual([event["TaskName"] for event in json.load(f)], ["Test Task", "Test Task2", "Test Task3"])
+
+        Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT = event_batch_max_count_backup
+
+    def test_flush_rolls_over_to_new_files_when_event_file_size_limit_reached(self):
+        # all files are requested within the same millisecond, and still must not overwrite each other
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+        time_backup = time.time
+        time.time = self.mock_time
+        event_file_size_limit_backup = Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS
+        Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS = 1024
+
+        for i in range(0, 10):
+            self.runtime.telemetry_writer.write_event("testing telemetry write to file " + "a" * 200, Constants.TelemetryEventLevel.Informational, "Test Task" + str(i))
+        self.runtime.telemetry_writer.flush()
+
+        Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS = event_file_size_limit_backup
+        time.time = time_backup
+
+        new_event_files = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json) and pos_json not in event_files_before_write])
+        self.assertTrue(len(new_event_files) > 1)
+        task_names = []
+        for event_file in new_event_files:
+            self.assertTrue(os.path.getsize(os.path.join(self.runtime.telemetry_writer.events_folder_path, event_file)) <= 1024)
+            with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, event_file), 'r') as f:
+                task_names.extend([event["TaskName"] for event in json.load(f)])
+        self.assertEqual(task_names, ["Test Task" + str(i) for i in range(0, 10)])
+
+    def test_events_dir_not_rescanned_for_own_writes(self):
+        self.runtime.telemetry_writer.flush()
+        listdir_calls = []
+        os_listdir_backup = os.listdir
+
+        def counting_listdir(path):
+            listdir_calls.append(path)
+            return os_listdir_backup(path)
+
+        os.listdir = counting_listdir
+        for i in range(0, 5):
+            self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task" + str(i))
+            self.runtime.telemetry_writer.flush()
+        os.listdir = os_listdir_backup
+
+        self.assertEqual(len(listdir_calls), 0)
+
+    def test_events_dir_size_reconciled_when_files_removed_outside_of_extension(self):
+        self.runtime.telemetry_writer.flush()
+        events_folder_path = self.runtime.telemetry_writer.events_folder_path
+        dir_size_limit_backup = Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS
+        event_file_size_limit_backup = Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS
+        Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS = 4096
+        Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS = 1024
+
+        # folder is kept within the limit by deleting older files
+        for i in range(0, 10):
+            self.runtime.telemetry_writer.write_event("testing telemetry write to file " + "a" * 400, Constants.TelemetryEventLevel.Informational, "Test Task" + str(i))
+            self.runtime.telemetry_writer.flush()
+        event_files = [os.path.join(events_folder_path, f) for f in os.listdir(events_folder_path)]
+        self.assertTrue(sum([os.path.getsize(f) for f in event_files]) < Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS)
+
+        # files picked up by the agent free up space, so nothing written after is deleted
+        for event_file in event_files:
+            os.remove(event_file)
+        os.utime(events_folder_path, (time.time() + 10, time.time() + 10))
+        for i in range(0, 3):
+            self.runtime.telemetry_writer.write_event("testing telemetry write to file " + "a" * 400, Constants.TelemetryEventLevel.Informational, "Test Task" + str(i))
+            self.runtime.telemetry_writer.flush()
+
+        Constants.TELEMETRY_DIR_SIZE_LIMIT_IN_CHARS = dir_size_limit_backup
+        Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS = event_file_size_limit_backup
+        self.assertEqual(len(os.listdir(events_folder_path)), 3)
+
     def test_write_event_msg_size_limit(self):
         # Assuming 1 char is 1 byte
         message = "a"*3074
         self.runtime.telemetry_writer.write_event(message, Constants.TelemetryEventLevel.Error, "Test Task")
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -108,7 +233,8 @@ class TestTelemetryWriter(unittest.TestCase):
         min_msg_limit_in_bytes = Constants.TELEMETRY_MSG_SIZE_LIMIT_IN_CHARS - Constants.TELEMETRY_BUFFER_FOR_DROPPED_COUNT_MSG_IN_CHARS - Constants.TELEMETRY_EVENT_COUNTER_MSG_SIZE_LIMIT_IN_CHARS
         max_msg_limit_in_bytes = Constants.TELEMETRY_MSG_SIZE_LIMIT_IN_CHARS
         self.runtime.telemetry_writer.write_event(message, Constants.TelemetryEventLevel.Error, "Test Task")
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -192,46 +318,123 @@ class TestTelemetryWriter(unittest.TestCase):
     #     Constants.TELEMETRY_EVENT_FILE_SIZE_LIMIT_IN_CHARS = telemetry_event_size_backup
     #     os.remove = os_remove_backup
 
+    def mock_sleep_not_expected(self, seconds):
+        raise Exception("Writing telemetry events is not expected to wait")
+
+    def get_events_in_new_event_files(self, event_files_before_write):
+        events = []
+        for event_file in sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json) and pos_json not in event_files_before_write]):
+            with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, event_file), 'r') as f:
+                events.extend(json.load(f))
+        return events
+
     def test_write_event_max_event_count_throttle_reached(self):
         event_count_max_throttle_backup = Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE
         Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE = 5
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
         self.runtime.telemetry_writer.event_count = 1
         self.runtime.telemetry_writer.start_time_for_event_count_throttle_check = datetime.datetime.utcnow()
+        time_sleep_backup = time.sleep
+        time.sleep = self.mock_sleep_not_expected
 
-        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task")
-        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task2")
-        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task3")
-        event_file_task3 = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)][-1]
-        with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, event_file_task3), 'r+') as f:
-            events = json.load(f)
-            self.assertTrue(events is not None)
-            self.assertTrue("Test Task3" in events[-1]['TaskName'])
-            f.close()
-
-        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task4")
-        event_file_task4 = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)][-1]
-        with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, event_file_task4), 'r+') as f:
-            events = json.load(f)
-            self.assertTrue(events is not None)
-            self.assertTrue("Test Task4" in events[-1]['TaskName'])
-            f.close()
-        self.assertTrue(self.runtime.telemetry_writer.event_count == 2)
+        # events beyond the budget do not block the caller
+        for i in range(1, 5):
+            self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task" + str(i))
+        self.runtime.telemetry_writer.flush()
+        self.assertEqual([event["TaskName"] for event in self.get_events_in_new_event_files(event_files_before_write)], ["Test Task1", "Test Task2", "Test Task3"])
+        self.assertEqual(self.runtime.telemetry_writer.event_count, 4)
 
-        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task5")
-        self.assertTrue(self.runtime.telemetry_writer.event_count == 3)
+        # they stay queued until the budget is available again
+        self.runtime.telemetry_writer.flush()
+        self.assertEqual(len(self.get_events_in_new_event_files(event_files_before_write)), 3)
 
         max_time_for_event_count_throttle_backup = Constants.TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE
         Constants.TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE = 0
-        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task6")
-        self.assertTrue(self.runtime.telemetry_writer.event_count == 2)
+        self.runtime.telemetry_writer.flush()
         Constants.TELEMETRY_MAX_TIME_IN_SECONDS_FOR_EVENT_COUNT_THROTTLE = max_time_for_event_count_throttle_backup
+        self.assertEqual([event["TaskName"] for event in self.get_events_in_new_event_files(event_files_before_write)], ["Test Task1", "Test Task2", "Test Task3", "Test Task4"])
+        self.assertEqual(self.runtime.telemetry_writer.event_count, 2)
+        self.assertEqual(self.runtime.telemetry_writer.dropped_event_count, 0)
 
+        time.sleep = time_sleep_backup
         Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE = event_count_max_throttle_backup
 
+    def test_write_event_dropped_when_event_queue_is_full(self):
+        event_queue_max_count_backup = Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT
+        Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT = 3
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+
+        for i in range(1, 5):
+            self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task" + str(i))
+        # an error takes the place of the oldest non-error event
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Error Task")
+        self.assertEqual(self.runtime.telemetry_writer.dropped_event_count, 2)
+
+        self.runtime.telemetry_writer.flush()
+        Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT = event_queue_max_count_backup
+
+        events = self.get_events_in_new_event_files(event_files_before_write)
+        self.assertEqual([event["TaskName"] for event in events[:-1]], ["Test Task2", "Test Task3", "Test Error Task"])
+        self.assertEqual(events[-1]["EventLevel"], Constants.TelemetryEventLevel.Warning)
+        self.assertTrue("[DroppedEventCount=2]" in events[-1]["Message"])
+
+    def test_telemetry_event_counter_unique_across_threads(self):
+        event_batch_max_count_backup = Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT
+        event_queue_max_count_backup = Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT
+        Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT = 5       # the background flusher runs, and reports dropped events, while events are written
+        Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT = 500
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+
+        def write_events(thread_index):
+            for i in range(0, 250):
+                self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task" + str(thread_index))
+
+        switch_interval_backup = sys.getswitchinterval() if hasattr(sys, 'getswitchinterval') else None
+        if switch_interval_backup is not None:
+            sys.setswitchinterval(1e-6)     # threads switch often enough to interleave within event creation
+        threads = [threading.Thread(target=write_events, args=(thread_index,)) for thread_index in range(0, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if switch_interval_backup is not None:
+            sys.setswitchinterval(switch_interval_backup)
+        self.runtime.telemetry_writer.stop()
+        Constants.TELEMETRY_EVENT_BATCH_MAX_COUNT = event_batch_max_count_backup
+        Constants.TELEMETRY_EVENT_QUEUE_MAX_COUNT = event_queue_max_count_backup
+
+        telemetry_event_counters = [int(re.search('TC=([0-9]+)', event['Message']).group(1)) for event in self.get_events_in_new_event_files(event_files_before_write)]
+        self.assertTrue(len(telemetry_event_counters) > 0)
+        self.assertEqual(len(telemetry_event_counters), len(set(telemetry_event_counters)))
+
+    def test_stop_writes_out_errors_and_drops_other_events_beyond_budget(self):
+        event_count_max_throttle_backup = Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE
+        Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE = 4
+        self.runtime.telemetry_writer.flush()
+        event_files_before_write = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if re.search('^[0-9]+.json$', pos_json)]
+        self.runtime.telemetry_writer.event_count = 1
+        self.runtime.telemetry_writer.start_time_for_event_count_throttle_check = datetime.datetime.utcnow()
+
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task1")
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task2")
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Error Task")
+        self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Informational, "Test Task3")
+        self.runtime.telemetry_writer.stop()
+        Constants.TELEMETRY_MAX_EVENT_COUNT_THROTTLE = event_count_max_throttle_backup
+
+        events = self.get_events_in_new_event_files(event_files_before_write)
+        self.assertEqual([event["TaskName"] for event in events[:-1]], ["Test Task1", "Test Task2", "Test Error Task"])
+        self.assertTrue("[DroppedEventCount=1]" in events[-1]["Message"])
+        self.assertEqual(self.runtime.telemetry_writer.dropped_event_count, 1)
+
     def test_events_deleted_outside_of_extension_while_extension_is_running(self):
         backup_os_listdir = os.listdir
         os.listdir = self.mock_os_listdir
         self.runtime.telemetry_writer.write_event("testing telemetry write to file", Constants.TelemetryEventLevel.Error, "Test Task")
+        self.runtime.telemetry_writer.flush()
         os.listdir = backup_os_listdir
 
     def test_write_event_with_buffer_true_and_then_flush(self):
@@ -242,8 +445,9 @@ class TestTelemetryWriter(unittest.TestCase):
         self.runtime.telemetry_writer.write_event_with_buffer("Message 3", Constants.TelemetryEventLevel.Verbose,
                                                               Constants.BufferMessage.FLUSH)
 
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
-                             re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
+                                    re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -255,8 +459,9 @@ class TestTelemetryWriter(unittest.TestCase):
         self.runtime.telemetry_writer.write_event_with_buffer("Message 1", Constants.TelemetryEventLevel.Verbose,
                                                               Constants.BufferMessage.FLUSH)
 
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
-                             re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
+                                    re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -268,8 +473,9 @@ class TestTelemetryWriter(unittest.TestCase):
         self.runtime.telemetry_writer.write_event_with_buffer("Message 1", Constants.TelemetryEventLevel.Verbose,
                                                               Constants.BufferMessage.FALSE)
 
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
-                             re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
+                                    re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -286,8 +492,9 @@ class TestTelemetryWriter(unittest.TestCase):
 
         # As the messages are with different TelemetryEventLevel, they will be written separately
         # even though flush is used.
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
-                             re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
+                                    re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -302,8 +509,9 @@ class TestTelemetryWriter(unittest.TestCase):
         self.runtime.telemetry_writer.write_event_with_buffer("Message 1", Constants.TelemetryEventLevel.Verbose,
                                                               Constants.BufferMessage.FLUSH)
 
-        latest_event_file = [pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
-                             re.search('^[0-9]+.json$', pos_json)][-1]
+        self.runtime.telemetry_writer.flush()
+        latest_event_file = sorted([pos_json for pos_json in os.listdir(self.runtime.telemetry_writer.events_folder_path) if
+                                    re.search('^[0-9]+.json$', pos_json)])[-1]
         with open(os.path.join(self.runtime.telemetry_writer.events_folder_path, latest_event_file), 'r+') as f:
             events = json.load(f)
             self.assertTrue(events is not None)
@@ -54,5 +54,27 @@ class TestVersionComparator(unittest.TestCase):
         self.assertEqual(self.version_comparator.compare_versions(test_extracted_bad_version, "34.13.4"), -1)  # less "" < 34.13.4
 
 
+    def test_debian_version_comparison(self):
+        """ Test compare versions logic on Debian package versions, as ordered by dpkg """
+        self.assertEqual(VersionComparator.compare_debian_versions("2.35-0ubuntu3.10", "2.35-0ubuntu3.7"), 1)    # numeric runs compare as numbers
+        self.assertEqual(VersionComparator.compare_debian_versions("1:1.0-1", "2.0-1"), 1)                      # epoch first
+        self.assertEqual(VersionComparator.compare_debian_versions("1.0~rc1-1", "1.0-1"), -1)                   # '~' sorts before the end of the part
+        self.assertEqual(VersionComparator.compare_debian_versions("1.0~~", "1.0~"), -1)
+        self.assertEqual(VersionComparator.compare_debian_versions("1.0a", "1.0+"), -1)                         # letters sort before other characters
+        self.assertEqual(VersionComparator.compare_debian_versions("1.0", "1.0a"), -1)
+        self.assertEqual(VersionComparator.compare_debian_versions("1.01-0", "1.1"), 0)                         # leading zeros and a '0' revision do not count
+        self.assertEqual(VersionComparator.compare_debian_versions("5.1-6ubuntu1.1", "5.1-6ubuntu1.1"), 0)
+
+    def test_rpm_version_comparison(self):
+        """ Test compare versions logic on rpm package versions, as ordered by rpm """
+        self.assertEqual(VersionComparator.compare_rpm_versions("3.10.0-862.11.6.el7", "3.10.0-862.9.1.el7"), 1)    # numeric segments compare as numbers
+        self.assertEqual(VersionComparator.compare_rpm_versions("1:1.0-1", "2.0-1"), 1)                              # epoch first
+        self.assertEqual(VersionComparator.compare_rpm_versions("1.0~rc1-1", "1.0-1"), -1)                           # '~' sorts before the end of the part
+        self.assertEqual(VersionComparator.compare_rpm_versions("1.0^git1-1", "1.0-1"), 1)                           # '^' sorts after the end of the part
+        self.assertEqual(VersionComparator.compare_rpm_versions("1.0^git1-1", "1.0.1-1"), -1)                        # but before anything else
+        self.assertEqual(VersionComparator.compare_rpm_versions("1.0a-1", "1.0.1-1"), -1)                            # numeric segments are newer than alphabetic ones
+        self.assertEqual(VersionComparator.compare_rpm_versions("1_01-1", "1.1-1"), 0)                               # separators and leading zeros do not count
+        self.assertEqual(VersionComparator.compare_rpm_versions("4.18.0-553.el8_10", "4.18.0"), 0)                   # a missing release matches any
+
 if __name__ == '__main__':
     unittest.main()
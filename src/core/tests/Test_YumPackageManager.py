@@ -194,6 +194,28 @@ class TestYumPackageManager(unittest.TestCase):
         else:
             self.assertFalse(1 != 2, 'Exception did not occur and test failed.')
 
+    def test_update_list_parsed_as_it_streams(self):
+        package_manager = self.container.get('package_manager')
+        output = "Loaded plugins: langpacks, product-id\n\n" + \
+                 "selinux-policy.noarch                3.13.1-102.el7_3.16                 rhui-rhel-7-server-rhui-rpms\n" + \
+                 "python-perf.x86_64\n" + \
+                 "                                     3.10.0-514.10.2.el7                 rhui-rhel-7-server-rhui-rpms\n" + \
+                 "kernel.x86_64                        3.10.0-514.10.2.el7\n" + \
+                 "                                     rhui-rhel-7-server-rhui-rpms\n" + \
+                 "Obsoleting Packages\n" + \
+                 "grub2.x86_64                         1:2.02-0.44.el7                     rhui-rhel-7-server-rhui-rpms\n\n"
+
+        output_parser = package_manager.UpdateListOutputParser(package_manager.get_product_name, self.runtime.composite_logger)
+        output_parser.parse_line("stale.x86_64    1.0-1.el7    stale-repo\n")
+        output_parser.reset()   # commands may be re-run, e.g. after mitigations
+        for line in output.splitlines(True):
+            output_parser.parse_line(line)
+
+        packages, package_versions = output_parser.get_packages_and_versions()
+        self.assertEqual(packages, ["selinux-policy.noarch", "python-perf.x86_64", "kernel.x86_64"])
+        self.assertEqual(package_versions, ["3.13.1-102.el7_3.16", "3.10.0-514.10.2.el7", "3.10.0-514.10.2.el7"])
+        self.assertEqual((packages, package_versions), package_manager.extract_packages_and_versions_including_duplicates(output))
+
     def test_install_package_success(self):
         """Unit test for install package success"""
         self.runtime.set_legacy_test_type('HappyPath')
@@ -206,6 +228,49 @@ class TestYumPackageManager(unittest.TestCase):
         # test for successfully installing a package
         self.assertEqual(package_manager.install_update_and_dependencies_and_get_status('selinux-policy.noarch', '3.13.1-102.el7_3.16', simulate=True), Constants.INSTALLED)
 
+    def test_install_check_with_rpm_snapshot(self):
+        """Unit test for checking install state of many packages from one rpm query"""
+        self.runtime.set_legacy_test_type('HappyPath')
+        package_manager = self.container.get('package_manager')
+        rpm_db_file_path = os.path.join(self.runtime.execution_config.temp_folder, "rpmdb.sqlite")
+        self.runtime.write_to_file(rpm_db_file_path, "rpmdb")
+        package_manager.RPM_DB_FILE_PATHS = [rpm_db_file_path]
+
+        commands_run = []
+        rpm_output = ["kernel.x86_64 (none):3.10.0-514.el7\n" +
+                      "kernel.x86_64 (none):3.10.0-862.el7\n" +
+                      "selinux-policy.noarch (none):3.13.1-102.el7_3.16\n" +
+                      "tar.x86_64 2:1.26-34.el7\n" +
+                      "bash.x86_64 0:4.2.46-34.el7\n"]
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def mock_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            if cmd.find("rpm -qa") > -1:
+                return 0, rpm_output[0]
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = mock_run_command_output
+        self.assertEqual(package_manager.are_package_versions_installed(['selinux-policy.noarch', 'tar.x86_64', 'tar.x86_64', 'bash.x86_64', 'kernel.x86_64', 'kernel', 'sudo.x86_64'],
+                                                                        ['3.13.1-102.el7_3.16', '2:1.26-34.el7', '1.26-34.el7', '4.2.46-34.el7', '3.10.0-862.el7', '3.10.0-862.el7', '1.8.23-4.el7']),
+                         [True, True, False, True, True, False, False])
+        self.assertEqual(package_manager.install_update_and_dependencies_and_get_status('selinux-policy.noarch', '3.13.1-102.el7_3.16', simulate=True), Constants.INSTALLED)
+        self.assertEqual(len([cmd for cmd in commands_run if cmd.find("rpm -qa") > -1]), 1)
+        self.assertEqual(len([cmd for cmd in commands_run if cmd.find("list installed") > -1]), 0)
+
+        # snapshot is taken again once the rpm database changes
+        rpm_output[0] += "sudo.x86_64 (none):1.8.23-4.el7\n"
+        self.runtime.write_to_file(rpm_db_file_path, "rpmdb changed")
+        self.assertEqual(package_manager.are_package_versions_installed(['sudo.x86_64'], ['1.8.23-4.el7']), [True])
+        self.assertEqual(len([cmd for cmd in commands_run if cmd.find("rpm -qa") > -1]), 2)
+
+        # falls back to checking packages one at a time when no snapshot is available
+        rpm_output[0] = str()
+        self.runtime.write_to_file(rpm_db_file_path, "rpmdb changed again")
+        self.assertEqual(package_manager.are_package_versions_installed(['selinux-policy.noarch', 'kernel.x86_64'], ['3.13.1-102.el7_3.16', '3.10.0-862.el7']), [True, False])
+        self.assertEqual(len([cmd for cmd in commands_run if cmd.find("list installed") > -1]), 2)
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
     def test_install_package_failure(self):
         """Unit test for install package failure"""
         self.runtime.set_legacy_test_type('FailInstallPath')
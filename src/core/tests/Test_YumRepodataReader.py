@@ -0,0 +1,138 @@
+# Copyright 2025 Microsoft Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Requires Python 2.7+
+
+import bz2
+import gzip
+import os
+import sqlite3
+import time
+import unittest
+
+from core.src.bootstrap.Constants import Constants
+from core.tests.library.ArgumentComposer import ArgumentComposer
+from core.tests.library.RuntimeCompositor import RuntimeCompositor
+
+
+class TestYumRepodataReader(unittest.TestCase):
+    def setUp(self):
+        self.runtime = RuntimeCompositor(ArgumentComposer().get_composed_arguments(), True, Constants.YUM)
+        self.repodata_reader = self.runtime.package_manager.repodata_reader
+        self.yum_folder = os.path.dirname(self.repodata_reader.main_config_paths[0])
+        os.makedirs(os.path.join(self.yum_folder, "yum.repos.d"))
+        self.runtime.write_to_file(os.path.join(self.yum_folder, "yum.repos.d", "rhel.repo"), "[baseos]\nname=BaseOS\nbaseurl=https://rhui.microsoft.com/baseos\nenabled=1\n\n"
+                                   "[appstream]\nname=AppStream\nbaseurl=https://rhui.microsoft.com/appstream\n\n[debug]\nname=Debug\nenabled=0\n")
+
+    def tearDown(self):
+        self.runtime.stop()
+
+    def __write_dnf_repo_cache(self, repo_id, packages):
+        """ Caches primary.xml.gz of the repository the way dnf does. packages: [(name, arch, epoch, version, release)] """
+        repodata_dir = os.path.join(self.yum_folder, "cache", "dnf", repo_id + "-0123456789abcdef", "repodata")
+        os.makedirs(repodata_dir)
+        primary_path = os.path.join(repodata_dir, "6e1d-primary.xml.gz")
+        with gzip.open(primary_path, 'wb') as primary_file:
+            primary_file.write(('<?xml version="1.0" encoding="UTF-8"?>\n<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="{0}">\n'.format(len(packages)) +
+                                "".join('<package type="rpm"><name>{0}</name><arch>{1}</arch><version epoch="{2}" ver="{3}" rel="{4}"/><summary>Package {0}</summary>'
+                                        '<format><rpm:license>GPLv2</rpm:license><rpm:requires><rpm:entry name="glibc"/></rpm:requires><file>/usr/bin/{0}</file></format></package>\n'.format(*package) for package in packages) +
+                                '</metadata>\n').encode('utf-8'))
+        self.__write_repomd(os.path.join(repodata_dir, "repomd.xml"), "primary", "repodata/6e1d-primary.xml.gz", os.path.getsize(primary_path))
+
+    def __write_yum_repo_cache(self, repo_id, packages):
+        """ Caches the primary sqlite database of the repository the way yum does, compressed and decompressed under gen/ """
+        repo_dir = os.path.join(self.yum_folder, "cache", "yum", "x86_64", "7", repo_id)
+        os.makedirs(os.path.join(repo_dir, "gen"))
+        connection = sqlite3.connect(os.path.join(repo_dir, "gen", "primary_db.sqlite"))
+        connection.execute("CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, name TEXT, arch TEXT, version TEXT, epoch TEXT, release TEXT, summary TEXT)")
+        connection.executemany("INSERT INTO packages (name, arch, epoch, version, release) VALUES (?, ?, ?, ?, ?)", packages)
+        connection.commit()
+        connection.close()
+        primary_db_path = os.path.join(repo_dir, "4d5a-primary.sqlite.bz2")
+        with open(primary_db_path, 'wb') as primary_db_file:
+            primary_db_file.write(bz2.compress(b"compressed primary database"))
+        os.utime(primary_db_path, (time.time() - 60, time.time() - 60))
+        self.__write_repomd(os.path.join(repo_dir, "repomd.xml"), "primary_db", "repodata/4d5a-primary.sqlite.bz2", os.path.getsize(primary_db_path))
+
+    def __write_repomd(self, repomd_path, data_type, href, size):
+        self.runtime.write_to_file(repomd_path, '<?xml version="1.0" encoding="UTF-8"?>\n<repomd xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm">\n'
+                                   '  <revision>1700000000</revision>\n  <data type="{0}">\n    <checksum type="sha256">4d5a</checksum>\n    <location href="{1}"/>\n    <size>{2}</size>\n  </data>\n'
+                                   '</repomd>\n'.format(data_type, href, str(size)))
+
+    def test_available_versions_from_cached_repodata(self):
+        self.__write_dnf_repo_cache("baseos", [("kernel", "x86_64", "0", "4.18.0", "553.el8_10"), ("kernel", "x86_64", "0", "4.18.0", "513.5.1.el8_9"), ("kernel", "src", "0", "4.18.0", "553.el8_10"),
+                                               ("tar", "x86_64", "2", "1.30", "9.el8")])
+        self.__write_yum_repo_cache("appstream", [("kernel", "x86_64", "0", "4.18.0", "553.16.1.el8_10"), ("glibc", "i686", "0", "2.28", "251.el8"), ("glibc", "x86_64", "0", "2.28", "251.el8"),
+                                                  ("nodejs", "x86_64", "1", "18.20.2", "1.module+el8.10.0+21760+f4a4a4f6")])
+
+        self.assertEqual(self.repodata_reader.get_available_versions("kernel"), [("x86_64", "4.18.0-513.5.1.el8_9"), ("x86_64", "4.18.0-553.el8_10"), ("x86_64", "4.18.0-553.16.1.el8_10")])
+        self.assertEqual(self.repodata_reader.get_available_versions("tar"), [("x86_64", "2:1.30-9.el8")])
+        self.assertEqual(sorted(self.repodata_reader.get_available_versions("glibc")), [("i686", "2.28-251.el8"), ("x86_64", "2.28-251.el8")])
+        self.assertEqual(self.repodata_reader.get_available_versions("not-available"), [])
+        self.assertTrue(self.repodata_reader.get_available_versions("nodejs") is None)     # filtered by the module streams enabled, so left to yum
+
+        # the package manager only reports versions not installed, for the architecture asked for, without starting yum
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def rpm_only_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            if cmd.find("rpm -qa") > -1:
+                return 0, "kernel.x86_64 (none):4.18.0-513.5.1.el8_9\nglibc.x86_64 (none):2.28-251.el8\n"
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = rpm_only_run_command_output
+        package_manager = self.runtime.package_manager
+        self.assertEqual(package_manager.get_all_available_versions_of_package("kernel.x86_64"), ["4.18.0-553.el8_10", "4.18.0-553.16.1.el8_10"])
+        self.assertEqual(package_manager.get_all_available_versions_of_package("glibc.i686"), ["2.28-251.el8"])
+        self.assertEqual(package_manager.get_all_available_versions_of_package("glibc.x86_64"), [])
+        self.assertEqual([cmd for cmd in commands_run if cmd.find("yum") > -1], [])
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
+    def test_cached_repodata_not_used_when_incomplete_or_stale(self):
+        self.__write_dnf_repo_cache("baseos", [("kernel", "x86_64", "0", "4.18.0", "553.el8_10")])
+        self.assertTrue(self.repodata_reader.get_available_versions("kernel") is None)      # no cache for appstream
+
+        self.__write_yum_repo_cache("appstream", [("glibc", "x86_64", "0", "2.28", "251.el8")])
+        self.assertEqual(self.repodata_reader.get_available_versions("kernel"), [("x86_64", "4.18.0-553.el8_10")])
+
+        # packages excluded in the configuration are left to yum
+        self.runtime.write_to_file(self.repodata_reader.main_config_paths[0], "[main]\ngpgcheck=1\nexclude=kernel*\n")
+        self.assertTrue(self.repodata_reader.get_available_versions("kernel") is None)
+        self.runtime.write_to_file(self.repodata_reader.main_config_paths[0], "[main]\ngpgcheck=1\n")
+        self.assertEqual(self.repodata_reader.get_available_versions("kernel"), [("x86_64", "4.18.0-553.el8_10")])
+        self.runtime.write_to_file(self.repodata_reader.versionlock_list_paths[0], "# locked versions\nkernel-0:4.18.0-553.el8_10.*\n")
+        self.assertTrue(self.repodata_reader.get_available_versions("kernel") is None)
+        os.remove(self.repodata_reader.versionlock_list_paths[0])
+
+        # metadata that has not been checked within the expiry is left to yum, which refreshes it
+        repomd_path = os.path.join(self.yum_folder, "cache", "yum", "x86_64", "7", "appstream", "repomd.xml")
+        expired_time = time.time() - Constants.REPODATA_CACHE_MAX_AGE_IN_HOURS * 3600 - 60
+        os.utime(repomd_path, (expired_time, expired_time))
+        self.assertTrue(self.repodata_reader.get_available_versions("kernel") is None)
+        self.runtime.write_to_file(os.path.join(os.path.dirname(repomd_path), "cachecookie"), "")
+        self.assertEqual(self.repodata_reader.get_available_versions("kernel"), [("x86_64", "4.18.0-553.el8_10")])
+
+        # primary metadata other than the one repomd.xml refers to, e.g. from an interrupted download, is not read
+        with open(os.path.join(os.path.dirname(repomd_path), "4d5a-primary.sqlite.bz2"), 'ab') as primary_db_file:
+            primary_db_file.write(b"partial")
+        os.utime(repomd_path, None)
+        self.assertTrue(self.repodata_reader.get_available_versions("kernel") is None)
+
+        # the package manager falls back to yum
+        self.assertEqual(len(self.runtime.package_manager.get_all_available_versions_of_package("kernel")), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
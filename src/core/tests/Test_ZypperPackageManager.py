@@ -229,6 +229,28 @@ class TestZypperPackageManager(unittest.TestCase):
         # test for successfully installing a package
         self.assertEqual(package_manager.install_update_and_dependencies_and_get_status('selinux-policy', '3.13.1-102.el7_3.16', simulate=True), Constants.INSTALLED)
 
+    def test_install_check_with_rpm_snapshot(self):
+        self.runtime.set_legacy_test_type('HappyPath')
+        package_manager = self.container.get('package_manager')
+
+        commands_run = []
+        run_command_output_backup = self.runtime.env_layer.run_command_output
+
+        def mock_run_command_output(cmd, no_output=False, chk_err=True, output_consumers=None):
+            commands_run.append(cmd)
+            if cmd.find("rpm -qa") > -1:
+                return 0, "warning: Generating 12 missing index(es), please wait...\n" + \
+                          "kernel-default (none):4.4.49-92.11.1\n" + \
+                          "libgcc_s1 (none):6.2.1+r239768-2.4\n" + \
+                          "libgcc_s1 (none):5.60.7-8.1\n"
+            return run_command_output_backup(cmd, no_output, chk_err, output_consumers)
+
+        self.runtime.env_layer.run_command_output = mock_run_command_output
+        self.assertEqual(package_manager.are_package_versions_installed(['kernel-default', 'libgcc_s1', 'libgcc_s1', 'libgcc_s1', 'bash'], ['4.4.49-92.11.1', '5.60.7-8.1', '6.2.1+r239768-2.4', '6.2.1', '4.3-83.5.2']),
+                         [True, True, True, False, False])
+        self.assertEqual(len(commands_run), 1)
+        self.runtime.env_layer.run_command_output = run_command_output_backup
+
     def test_install_package_failure(self):
         self.runtime.set_legacy_test_type('FailInstallPath')
 
@@ -441,14 +463,14 @@ class TestZypperPackageManager(unittest.TestCase):
         counter = [0]
         backup_mocked_method = package_manager.env_layer.run_command_output
 
-        def mock_run_command_output(cmd, no_output=False, chk_err=False):
+        def mock_run_command_output(cmd, no_output=False, chk_err=False, output_consumers=None):
             # Only check for refresh cmd - otherwise, it may pick up other commands like ps tree
             if cmd == 'sudo zypper refresh':
                 counter[0] += 1
                 if counter[0] == package_manager.package_manager_max_retries - 1:
                     # Right before it runs out of retries, allow it to succeed
                     self.runtime.set_legacy_test_type('HappyPath')
-            return backup_mocked_method(cmd, no_output, chk_err)
+            return backup_mocked_method(cmd, no_output, chk_err, output_consumers)
 
         package_manager.env_layer.run_command_output = mock_run_command_output
 
@@ -526,14 +548,14 @@ class TestZypperPackageManager(unittest.TestCase):
         counter = [0]
         backup_mocked_method = package_manager.env_layer.run_command_output
 
-        def mock_run_command_output(cmd, no_output=False, chk_err=False):
+        def mock_run_command_output(cmd, no_output=False, chk_err=False, output_consumers=None):
             # Only check for refresh services cmd
             if cmd == 'sudo zypper refresh --services':
                 # After refreshing, allow it to succeed
                 self.runtime.set_legacy_test_type('HappyPath')
             elif cmd == 'sudo zypper refresh':
                 counter[0] += 1
-            return backup_mocked_method(cmd, no_output, chk_err)
+            return backup_mocked_method(cmd, no_output, chk_err, output_consumers)
 
         package_manager.env_layer.run_command_output = mock_run_command_output
 
@@ -558,11 +580,11 @@ class TestZypperPackageManager(unittest.TestCase):
         # AnotherSadPath uses return code 6
         self.runtime.set_legacy_test_type('AnotherSadPath')
 
-        def mock_run_command_output(cmd, no_output=False, chk_err=False):
+        def mock_run_command_output(cmd, no_output=False, chk_err=False, output_consumers=None):
             # Only count the number of command invocations and do not change to HappyPath
             if cmd == 'sudo zypper refresh':
                 counter[0] += 1
-            return backup_mocked_method(cmd, no_output, chk_err)
+            return backup_mocked_method(cmd, no_output, chk_err, output_consumers)
 
         package_manager.env_layer.run_command_output = mock_run_command_output
 
@@ -597,7 +619,7 @@ class TestZypperPackageManager(unittest.TestCase):
         replacefiles_counter = [0]
         backup_mocked_method = package_manager.env_layer.run_command_output
 
-        def mock_run_command_output(cmd, no_output=False, chk_err=False):
+        def mock_run_command_output(cmd, no_output=False, chk_err=False, output_consumers=None):
             # Only check for refresh services cmd
             if cmd == 'sudo zypper --non-interactive update --replacefiles samba-libs=4.15.4+git.327.37e0a40d45f-3.57.1':
                 # After refreshing, allow it to succeed
@@ -605,7 +627,7 @@ class TestZypperPackageManager(unittest.TestCase):
                 self.runtime.set_legacy_test_type('HappyPath')
             elif cmd == 'sudo zypper --non-interactive update samba-libs=4.15.4+git.327.37e0a40d45f-3.57.1':
                 counter[0] += 1
-            return backup_mocked_method(cmd, no_output, chk_err)
+            return backup_mocked_method(cmd, no_output, chk_err, output_consumers)
 
         package_manager.env_layer.run_command_output = mock_run_command_output
 
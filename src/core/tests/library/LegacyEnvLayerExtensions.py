@@ -55,7 +55,15 @@ class LegacyEnvLayerExtensions():
             return sys.version_info[0]  # python 2.6 doesn't have attributes like 'major' within sys.version_info
 
     # To be deprecated over time
-    def run_command_output(self, cmd, no_output=False, chk_err=True):
+    def run_command_output(self, cmd, no_output=False, chk_err=True, output_consumers=None):
+        code, output = self.__run_command_output(cmd, no_output, chk_err)
+        if output is not None:
+            for line in output.splitlines(True):
+                for output_consumer in output_consumers or []:
+                    output_consumer(line)
+        return code, output
+
+    def __run_command_output(self, cmd, no_output=False, chk_err=True):
         if no_output:
             return 0, None
         else:
@@ -1018,7 +1026,8 @@ class LegacyEnvLayerExtensions():
                                  "(1.187.3~18.04.1+2.06-2ubuntu14.1 Ubuntu:18.04/bionic-updates [amd64]) []" \
                                  "Inst grub-efi-amd64-bin [2.06-2ubuntu14] " \
                                  "(2.06-2ubuntu14.1 Ubuntu:18.04/bionic-updates [amd64])"
-                    elif cmd.find("apt-get -y --only-upgrade true -s install grub-efi-amd64-signed") > -1:
+                    elif cmd.find("apt-get -y --only-upgrade true -s install") > -1 and "grub-efi-amd64-signed" in cmd.split():
+                        # dependency resolution for any set of packages that includes grub-efi-amd64-signed
                         code = 0
                         output = "Inst grub-efi-amd64-signed [1.187.2~18.04.1+2.06-2ubuntu14] " \
                                  "(1.187.3~18.04.1+2.06-2ubuntu14.1 Ubuntu:18.04/bionic-updates [amd64]) []" \
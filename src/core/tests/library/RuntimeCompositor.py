@@ -92,6 +92,7 @@ class RuntimeCompositor(object):
         self.composite_logger = self.bootstrapper.composite_logger
 
         # re-initializing telemetry_writer, outside of Bootstrapper, to correctly set the env_layer configured for tests
+        self.bootstrapper.telemetry_writer.stop()
         self.telemetry_writer = TelemetryWriter(self.env_layer, self.composite_logger, self.bootstrapper.telemetry_writer.events_folder_path, self.bootstrapper.telemetry_supported)
         self.bootstrapper.telemetry_writer = self.telemetry_writer
         self.bootstrapper.composite_logger.telemetry_writer = self.telemetry_writer
@@ -129,6 +130,8 @@ class RuntimeCompositor(object):
         self.configure_patching_processor.auto_assess_timer_manager.remove_timer = self.mock_remove_timer
 
     def stop(self):
+        self.status_handler.flush_status_file()
+        self.telemetry_writer.stop()
         self.file_logger.close(message_at_close="<Runtime stopped>")
         self.container.reset()
         Bootstrapper.check_sudo_status = self.original_check_sudo_status
@@ -172,6 +175,22 @@ class RuntimeCompositor(object):
     def reconfigure_package_manager(self):
         self.backup_get_current_auto_os_patch_state = self.package_manager.get_current_auto_os_patch_state
         self.package_manager.get_current_auto_os_patch_state = self.get_current_auto_os_patch_state
+        self.package_manager.inventory_fingerprint_paths = []  # assessment results are not reused across package manager mocks unless a test opts in
+        self.package_manager.inventory_package_database_paths = []
+        if hasattr(self.package_manager, 'dpkg_status_file_path'):
+            # keep install checks on the mocked dpkg/apt command outputs instead of the dpkg status database of the machine running the tests
+            self.package_manager.dpkg_status_file_path = os.path.join(self.execution_config.temp_folder, "dpkg", "status")
+        if hasattr(self.package_manager, 'APT_LISTS_DIR_PATH'):
+            # likewise, keep available version lookups on the mocked apt-cache command outputs instead of the package lists of the machine
+            self.package_manager.APT_LISTS_DIR_PATH = os.path.join(self.execution_config.temp_folder, "apt", "lists")
+        if hasattr(self.package_manager, 'repodata_reader'):
+            # likewise, keep available version lookups on the mocked yum command outputs instead of the repository metadata cached on the machine
+            repodata_reader = self.package_manager.repodata_reader
+            repodata_reader.main_config_paths = [os.path.join(self.execution_config.temp_folder, "yum", "yum.conf")]
+            repodata_reader.repo_config_patterns = [os.path.join(self.execution_config.temp_folder, "yum", "yum.repos.d", "*.repo")]
+            repodata_reader.versionlock_list_paths = [os.path.join(self.execution_config.temp_folder, "yum", "versionlock.list")]
+            repodata_reader.yum_repomd_pattern = os.path.join(self.execution_config.temp_folder, "yum", "cache", "yum", "*", "*", "*", "repomd.xml")
+            repodata_reader.dnf_repomd_pattern = os.path.join(self.execution_config.temp_folder, "yum", "cache", "dnf", "*", "repodata", "repomd.xml")
 
     def mock_sleep(self, seconds):
         pass